@@ -22,6 +22,8 @@ class Bindings(object):
         self.profile = consumer.ProfilesAPI(pulp_connection)
         self.consumer = consumer.ConsumerAPI(pulp_connection)
         self.consumer_content = consumer.ConsumerContentAPI(pulp_connection)
+        self.consumer_content_applicability = \
+            consumer.ConsumerContentApplicabilityAPI(pulp_connection)
         self.consumer_content_schedules = consumer.ConsumerContentSchedulesAPI(pulp_connection)
         self.consumer_group = consumer_groups.ConsumerGroupAPI(pulp_connection)
         self.consumer_group_search = consumer_groups.ConsumerGroupSearchAPI(pulp_connection)
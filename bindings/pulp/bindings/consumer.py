@@ -79,6 +79,48 @@ class ConsumerContentAPI(PulpAPI):
         return self.server.POST(path, data)
 
 
+class ConsumerContentApplicabilityAPI(PulpAPI):
+    """
+    Connection class to query the content applicability of consumers
+    """
+    PATH = '/v2/consumers/content/applicability/'
+
+    # Number of consumers the server reports on in one response
+    PAGE_SIZE = 1000
+
+    def query(self, criteria, content_types=None, page_size=PAGE_SIZE):
+        """
+        Iterate over the applicability reports of the consumers matched by the criteria. The
+        server is asked for the reports of page_size consumers at a time, and the next page is
+        only requested once the reports of the previous one have been consumed.
+
+        Reports collate the consumers of one page, so consumers that have the same applicability
+        may appear in more than one report.
+
+        :param criteria:      consumer criteria, as accepted by the search APIs. Its limit and
+                              skip options may not be used.
+        :type  criteria:      dict
+        :param content_types: content types to limit the applicability reports to, or None for
+                              all types
+        :type  content_types: list
+        :param page_size:     number of consumers to report on in each response
+        :type  page_size:     int
+        :return:              generator of applicability reports, each a dict with the keys
+                              'consumers' and 'applicability'
+        :rtype:               generator
+        """
+        body = {'criteria': criteria, 'page_size': page_size, 'page_token': None}
+        if content_types is not None:
+            body['content_types'] = content_types
+        while True:
+            page = self.server.POST(self.PATH, body).response_body
+            for report in page['applicability']:
+                yield report
+            if page['next_page'] is None:
+                break
+            body['page_token'] = page['next_page']
+
+
 class ConsumerContentSchedulesAPI(PulpAPI):
     """
     Connection class to access consumer calls related to scheduled content install/uninstall/update
@@ -1,8 +1,11 @@
 from types import NoneType
 import base64
+import httplib
 import locale
 import logging
 import os
+import socket
+import threading
 import urllib
 try:
     import oauth2 as oauth
@@ -19,6 +22,10 @@ from pulp.common.constants import DEFAULT_CA_PATH
 from pulp.common.util import ensure_utf_8, encode_unicode
 
 
+# The HTTP methods of requests that do not change anything on the server.
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
 class PulpConnection(object):
     """
     Stub for invoking methods against the Pulp server. By default, the
@@ -46,7 +53,8 @@ class PulpConnection(object):
                  verify_ssl=True,
                  ca_path=DEFAULT_CA_PATH,
                  proxy_host=None,
-                 proxy_port=3128):
+                 proxy_port=3128,
+                 max_connections=4):
 
         self.host = host
         self.port = port
@@ -68,6 +76,9 @@ class PulpConnection(object):
         self.proxy_host = proxy_host
         self.proxy_port = proxy_port
 
+        # The most idle connections kept open to be reused by later requests
+        self.max_connections = max_connections
+
         # Locale
         default_locale = locale.getdefaultlocale()[0]
         if default_locale:
@@ -260,6 +271,11 @@ class HTTPSServerWrapper(object):
     This abstraction is used to simplify mocking. In this implementation, the
     intricacies (read: ugliness) of invoking and getting the response from
     the HTTPConnection class are hidden in favor of a simpler API to mock.
+
+    Connections are kept open and reused by later requests, up to the
+    max_connections of the Pulp connection, and all of them share one SSL
+    context. The wrapper can be used by several threads at once; each request
+    has a connection of its own. Connections through a proxy are not reused.
     """
 
     def __init__(self, pulp_connection):
@@ -268,12 +284,17 @@ class HTTPSServerWrapper(object):
         :type pulp_connection: PulpConnection
         """
         self.pulp_connection = pulp_connection
+        self._lock = threading.Lock()
+        self._idle = []
+        self._ssl_context = None
+        self._ssl_context_key = None
 
     def request(self, method, url, body):
         """
         Make the request against the Pulp server, returning a tuple of (status_code, respose_body).
-        This method creates a new connection each time since HTTPSConnection has problems
-        reusing a connection for multiple calls (as claimed by a prior comment in this module).
+        The request is made on an idle connection if there is one. If the server closed that
+        connection in the meantime, the request is made again on a new connection, unless the
+        server may have handled it already (see _can_retry()).
 
         :param method: The HTTP method to be used for the request (GET, POST, etc.)
         :type  method: str
@@ -289,34 +310,12 @@ class HTTPSServerWrapper(object):
         """
         headers = dict(self.pulp_connection.headers)  # copy so we don't affect the calling method
 
-        # Despite the confusing name, 'sslv23' configures m2crypto to use any available protocol in
-        # the underlying openssl implementation.
-        ssl_context = SSL.Context('sslv23')
-        # This restricts the protocols we are willing to do by configuring m2 not to do SSLv2.0 or
-        # SSLv3.0. EL 5 does not have support for TLS > v1.0, so we have to leave support for
-        # TLSv1.0 enabled.
-        ssl_context.set_options(m2.SSL_OP_NO_SSLv2 | m2.SSL_OP_NO_SSLv3)
-
-        if self.pulp_connection.verify_ssl:
-            ssl_context.set_verify(SSL.verify_peer, depth=100)
-            # We need to stat the ca_path to see if it exists (error if it doesn't), and if so
-            # whether it is a file or a directory. m2crypto has different directives depending on
-            # which type it is.
-            if os.path.isfile(self.pulp_connection.ca_path):
-                ssl_context.load_verify_locations(cafile=self.pulp_connection.ca_path)
-            elif os.path.isdir(self.pulp_connection.ca_path):
-                ssl_context.load_verify_locations(capath=self.pulp_connection.ca_path)
-            else:
-                # If it's not a file and it's not a directory, it's not a valid setting
-                raise exceptions.MissingCAPathException(self.pulp_connection.ca_path)
-        ssl_context.set_session_timeout(self.pulp_connection.timeout)
+        ssl_context = self._get_ssl_context()
 
         if self.pulp_connection.username and self.pulp_connection.password:
             raw = ':'.join((self.pulp_connection.username, self.pulp_connection.password))
             encoded = base64.b64encode(raw)
             headers['Authorization'] = 'Basic ' + encoded
-        elif self.pulp_connection.cert_filename:
-            ssl_context.load_cert(self.pulp_connection.cert_filename)
 
         # oauth configuration. This block is only True if oauth is not None, so it won't run on RHEL
         # 5.
@@ -337,27 +336,30 @@ class HTTPSServerWrapper(object):
             headers.update(oauth_header)
             headers['pulp-user'] = self.pulp_connection.oauth_user
 
-        proxy_requested = self.pulp_connection.proxy_host and self.pulp_connection.proxy_port
-
-        if proxy_requested:
-            connection = httpslib.ProxyHTTPSConnection(self.pulp_connection.proxy_host,
-                                                       self.pulp_connection.proxy_port,
-                                                       ssl_context=ssl_context)
+        if self._proxy_requested():
+            request_url = 'https://%s:%d%s' % (self.pulp_connection.host,
+                                               self.pulp_connection.port, url)
         else:
-            connection = httpslib.HTTPSConnection(self.pulp_connection.host,
-                                                  self.pulp_connection.port,
-                                                  ssl_context=ssl_context)
+            request_url = url
 
+        connection, reused = self._get_connection(ssl_context)
         try:
-            # Request against the server
-            if proxy_requested:
-                request_url = 'https://%s:%d%s' % (self.pulp_connection.host,
-                                                   self.pulp_connection.port, url)
-            else:
-                request_url = url
-            connection.request(method, request_url, body=body, headers=headers)
-            response = connection.getresponse()
+            sent = False
+            try:
+                # Request against the server
+                connection.request(method, request_url, body=body, headers=headers)
+                sent = True
+                response, response_body = self._receive(connection)
+            except (httplib.HTTPException, socket.error, SSL.SSLError), err:
+                self._close(connection)
+                if not (reused and self._can_retry(method, err, sent)):
+                    raise
+                # The server closed the idle connection; try again on a new one
+                connection, reused = self._connect(ssl_context), False
+                connection.request(method, request_url, body=body, headers=headers)
+                response, response_body = self._receive(connection)
         except SSL.SSLError, err:
+            self._close(connection)
             # Translate stale login certificate to an auth exception
             if 'sslv3 alert certificate expired' == str(err):
                 raise exceptions.ClientCertificateExpiredException(
@@ -366,12 +368,181 @@ class HTTPSServerWrapper(object):
                 raise exceptions.CertificateVerificationException()
             else:
                 raise exceptions.ConnectionException(None, str(err), None)
+        except Exception:
+            self._close(connection)
+            raise
 
-        # Attempt to deserialize the body (should pass unless the server is busted)
-        response_body = response.read()
+        self._release(connection, response)
 
+        # Attempt to deserialize the body (should pass unless the server is busted)
         try:
             response_body = json.loads(response_body)
         except Exception:
             pass
         return response.status, response_body
+
+    def _get_ssl_context(self):
+        """
+        Get the SSL context connections are made with. It is built once, and again when the
+        SSL settings of the Pulp connection or its client certificate file change. Idle
+        connections made with a previous context are closed.
+
+        :return: The SSL context.
+        :rtype:  M2Crypto.SSL.Context
+        """
+        cert_filename = None
+        cert_mtime = None
+        if not (self.pulp_connection.username and self.pulp_connection.password):
+            cert_filename = self.pulp_connection.cert_filename
+        if cert_filename:
+            try:
+                cert_mtime = os.path.getmtime(cert_filename)
+            except OSError:
+                pass
+        key = (self.pulp_connection.verify_ssl, self.pulp_connection.ca_path,
+               self.pulp_connection.timeout, cert_filename, cert_mtime)
+        with self._lock:
+            if self._ssl_context is not None and self._ssl_context_key == key:
+                return self._ssl_context
+
+        # Despite the confusing name, 'sslv23' configures m2crypto to use any available protocol in
+        # the underlying openssl implementation.
+        ssl_context = SSL.Context('sslv23')
+        # This restricts the protocols we are willing to do by configuring m2 not to do SSLv2.0 or
+        # SSLv3.0. EL 5 does not have support for TLS > v1.0, so we have to leave support for
+        # TLSv1.0 enabled.
+        ssl_context.set_options(m2.SSL_OP_NO_SSLv2 | m2.SSL_OP_NO_SSLv3)
+
+        if self.pulp_connection.verify_ssl:
+            ssl_context.set_verify(SSL.verify_peer, depth=100)
+            # We need to stat the ca_path to see if it exists (error if it doesn't), and if so
+            # whether it is a file or a directory. m2crypto has different directives depending on
+            # which type it is.
+            if os.path.isfile(self.pulp_connection.ca_path):
+                ssl_context.load_verify_locations(cafile=self.pulp_connection.ca_path)
+            elif os.path.isdir(self.pulp_connection.ca_path):
+                ssl_context.load_verify_locations(capath=self.pulp_connection.ca_path)
+            else:
+                # If it's not a file and it's not a directory, it's not a valid setting
+                raise exceptions.MissingCAPathException(self.pulp_connection.ca_path)
+        ssl_context.set_session_timeout(self.pulp_connection.timeout)
+
+        if cert_filename:
+            ssl_context.load_cert(cert_filename)
+
+        with self._lock:
+            self._ssl_context = ssl_context
+            self._ssl_context_key = key
+            idle = self._idle
+            self._idle = []
+        for connection in idle:
+            self._close(connection)
+        return ssl_context
+
+    def _proxy_requested(self):
+        """
+        :return: Whether requests are made through a proxy.
+        :rtype:  bool
+        """
+        return bool(self.pulp_connection.proxy_host and self.pulp_connection.proxy_port)
+
+    def _get_connection(self, ssl_context):
+        """
+        Get an idle connection, or a new one if there is none.
+
+        :param ssl_context: The SSL context of new connections.
+        :type  ssl_context: M2Crypto.SSL.Context
+        :return: A 2-tuple of the connection and whether it was idle.
+        :rtype:  tuple
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(ssl_context), False
+
+    def _connect(self, ssl_context):
+        """
+        Create a connection to the server.
+
+        :param ssl_context: The SSL context of the connection.
+        :type  ssl_context: M2Crypto.SSL.Context
+        :return: The (unconnected) connection.
+        :rtype:  M2Crypto.httpslib.HTTPSConnection
+        """
+        if self._proxy_requested():
+            return httpslib.ProxyHTTPSConnection(self.pulp_connection.proxy_host,
+                                                 self.pulp_connection.proxy_port,
+                                                 ssl_context=ssl_context)
+        return httpslib.HTTPSConnection(self.pulp_connection.host, self.pulp_connection.port,
+                                        ssl_context=ssl_context)
+
+    @staticmethod
+    def _receive(connection):
+        """
+        Read the whole response to the request made on a connection.
+
+        :param connection: The connection.
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        :return:           A 2-tuple of the response and its body.
+        :rtype:            tuple
+        """
+        response = connection.getresponse()
+        return response, response.read()
+
+    @staticmethod
+    def _can_retry(method, error, sent):
+        """
+        Determine whether a request that failed on an idle connection can be made again on
+        a new one, without the risk of the server handling it twice. It can when the request
+        could not be sent, or the server closed the connection without reading it. Requests
+        that do not change anything on the server can also be made again when the connection
+        broke while they were waiting for their response. Requests that timed out are never
+        made again.
+
+        :param method: The HTTP method of the request.
+        :type  method: str
+        :param error:  The error the request failed with.
+        :type  error:  Exception
+        :param sent:   Whether the request was sent.
+        :type  sent:   bool
+        :return:       Whether the request can be made again.
+        :rtype:        bool
+        """
+        if isinstance(error, socket.timeout):
+            return False
+        if not sent or method.upper() in SAFE_METHODS:
+            return True
+        return isinstance(error, httplib.BadStatusLine) and (
+            error.line == repr('') or error.line.startswith('No status line received'))
+
+    def _release(self, connection, response):
+        """
+        Keep a connection whose response has been read open for later requests, unless the
+        server is closing it, the connection is through a proxy or enough connections are
+        idle already.
+
+        :param connection: The connection.
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        :param response:   The response the connection received.
+        :type  response:   httplib.HTTPResponse
+        """
+        if not response.will_close and not self._proxy_requested():
+            with self._lock:
+                if len(self._idle) < self.pulp_connection.max_connections and \
+                        connection.ssl_ctx is self._ssl_context:
+                    self._idle.append(connection)
+                    return
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        """
+        Close a connection. M2Crypto's HTTPSConnection.close() leaves the socket open for
+        the response to read from, so the socket is closed here.
+
+        :param connection: The connection.
+        :type  connection: M2Crypto.httpslib.HTTPSConnection
+        """
+        if connection.sock is not None:
+            connection.sock.close()
+            connection.sock = None
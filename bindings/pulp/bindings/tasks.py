@@ -43,6 +43,30 @@ class TasksAPI(PulpAPI):
         response.response_body = Task(response.response_body)
         return response
 
+    def watch_tasks(self, tokens, timeout=None):
+        """
+        Waits until any of the given tasks changes or the timeout passes, and retrieves the
+        fields of each task that changed since its watch token was handed out. Servers that
+        do not support watching tasks raise NotFoundException or ApacheServerException.
+
+        :param tokens:  the watch token of each task by task ID; None for tasks that were not
+                        watched before
+        :type  tokens:  dict
+        :param timeout: the number of seconds to wait for a change; the server default when None
+        :type  timeout: float
+        :return:        response with a dict of the changed tasks by task ID in the
+                        response_body. Each is a dict with 'changes', the changed fields of the
+                        task report, and 'token', the new watch token of the task.
+        :rtype:         Response
+
+        :raise NotFoundException: if some of the tasks do not exist
+        """
+        path = '/v2/tasks/watch/'
+        body = {'tasks': tokens}
+        if timeout is not None:
+            body['timeout'] = timeout
+        return self.server.POST(path, body)
+
     def get_all_tasks(self, tags=()):
         """
         Retrieves all tasks in the system. If tags are specified, only tasks
@@ -130,6 +154,46 @@ class TasksAPI(PulpAPI):
         return self.get_all_tasks(tags=[repo_tag, publish_tag])
 
 
+class TaskWatcher(object):
+    """
+    Follows tasks with TasksAPI.watch_tasks(), keeping the whole report of each task up to
+    date with the changes the server returns.
+    """
+
+    def __init__(self, tasks_api, timeout=None):
+        """
+        :param tasks_api: the tasks API
+        :type  tasks_api: TasksAPI
+        :param timeout:   the number of seconds each call to the server waits for a change;
+                          the server default when None
+        :type  timeout:   float
+        """
+        self.tasks_api = tasks_api
+        self.timeout = timeout
+        self.reports = {}
+        self.tokens = {}
+
+    def wait(self, task_ids):
+        """
+        Waits until any of the given tasks changes or the timeout passes. The first call for
+        a task returns it right away.
+
+        :param task_ids: IDs of the tasks to watch
+        :type  task_ids: list
+        :return:         the changed tasks by task ID; empty if the timeout passed
+        :rtype:          dict of Task
+        """
+        tokens = dict((task_id, self.tokens.get(task_id)) for task_id in task_ids)
+        response = self.tasks_api.watch_tasks(tokens, self.timeout)
+        changed = {}
+        for task_id, update in response.response_body.items():
+            report = self.reports.setdefault(task_id, {})
+            report.update(update['changes'])
+            self.tokens[task_id] = update['token']
+            changed[task_id] = Task(report)
+        return changed
+
+
 class TaskSearchAPI(SearchAPI):
     """
     Search Tasks.
@@ -2,7 +2,7 @@ import unittest
 
 import mock
 
-from pulp.bindings.consumer import ConsumerSearchAPI
+from pulp.bindings.consumer import ConsumerContentApplicabilityAPI, ConsumerSearchAPI
 
 
 class TestConsumerSearchAPI(unittest.TestCase):
@@ -10,3 +10,47 @@ class TestConsumerSearchAPI(unittest.TestCase):
         api = ConsumerSearchAPI(mock.MagicMock())
         self.assertTrue(api.PATH is not None)
         self.assertTrue(len(api.PATH) > 0)
+
+
+class TestConsumerContentApplicabilityAPI(unittest.TestCase):
+    def setUp(self):
+        self.server = mock.MagicMock()
+        self.api = ConsumerContentApplicabilityAPI(self.server)
+
+    def test_query_pages(self):
+        pages = [
+            {'applicability': [{'consumers': ['c1'], 'applicability': {'rpm': ['a']}}],
+             'next_page': 'c1'},
+            {'applicability': [{'consumers': ['c2'], 'applicability': {'rpm': ['b']}}],
+             'next_page': None},
+        ]
+        bodies = []
+
+        def post(path, body):
+            # the API reuses the body, so record a copy of it
+            bodies.append(dict(body))
+            return mock.MagicMock(response_body=pages[len(bodies) - 1])
+
+        self.server.POST.side_effect = post
+
+        reports = list(self.api.query({'filters': {}}, ['rpm'], page_size=1))
+
+        self.assertEqual(reports, [pages[0]['applicability'][0], pages[1]['applicability'][0]])
+        self.assertEqual(self.server.POST.call_args[0][0], ConsumerContentApplicabilityAPI.PATH)
+        self.assertEqual(bodies, [
+            {'criteria': {'filters': {}}, 'content_types': ['rpm'], 'page_size': 1,
+             'page_token': None},
+            {'criteria': {'filters': {}}, 'content_types': ['rpm'], 'page_size': 1,
+             'page_token': 'c1'},
+        ])
+
+    def test_query_is_lazy(self):
+        self.server.POST.return_value.response_body = {'applicability': [], 'next_page': None}
+
+        reports = self.api.query({'filters': {}})
+
+        self.assertFalse(self.server.POST.called)
+        self.assertEqual(list(reports), [])
+        body = self.server.POST.call_args[0][1]
+        self.assertFalse('content_types' in body)
+        self.assertEqual(body['page_size'], ConsumerContentApplicabilityAPI.PAGE_SIZE)
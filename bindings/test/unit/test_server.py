@@ -1,8 +1,10 @@
 """
 This module contains tests for the pulp.bindings.server module.
 """
+import httplib
 import locale
 import logging
+import socket
 import unittest
 
 from M2Crypto import m2, SSL
@@ -76,6 +78,7 @@ class TestHTTPSServerWrapper(unittest.TestCase):
                 return '{}'
 
             status = 200
+            will_close = True
 
         getresponse.return_value = FakeResponse()
 
@@ -128,6 +131,7 @@ class TestHTTPSServerWrapper(unittest.TestCase):
                 return '{}'
 
             status = 200
+            will_close = True
 
         getresponse.return_value = FakeResponse()
 
@@ -161,6 +165,7 @@ class TestHTTPSServerWrapper(unittest.TestCase):
                 return '{"it": "worked!"}'
 
             status = 200
+            will_close = True
 
         getresponse.return_value = FakeResponse()
 
@@ -173,6 +178,241 @@ class TestHTTPSServerWrapper(unittest.TestCase):
         load_verify_locations.assert_called_once_with(cafile=ca_path)
 
 
+class TestHTTPSServerWrapperPool(unittest.TestCase):
+    """
+    This class contains tests for the reuse of connections by the HTTPSServerWrapper class.
+    """
+    def setUp(self):
+        self.connections = []
+        patcher = mock.patch('pulp.bindings.server.httpslib.HTTPSConnection',
+                             side_effect=self._connection)
+        self.HTTPSConnection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _connection(self, host, port, ssl_context):
+        """
+        Create a fake connection whose responses keep the connection open.
+        """
+        connection = mock.MagicMock(ssl_ctx=ssl_context)
+        connection.getresponse.return_value = mock.MagicMock(status=200, will_close=False)
+        connection.getresponse.return_value.read.return_value = '{"it": "worked!"}'
+        self.connections.append(connection)
+        return connection
+
+    def test_request_reuses_connection(self):
+        """
+        Assert that a connection is reused by the next requests.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+
+        for i in range(3):
+            status, body = wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {'it': 'worked!'})
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].request.call_count, 3)
+        self.assertEqual(wrapper._idle, self.connections)
+
+    def test_request_retries_stale_connection(self):
+        """
+        Assert that a request failing on an idle connection is made again on a new connection.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        wrapper.request('GET', '/awesome/api/', '')
+        stale = self.connections[0]
+        stale_socket = stale.sock
+        stale.getresponse.side_effect = httplib.BadStatusLine('')
+
+        status, body = wrapper.request('DELETE', '/awesome/api/', '')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.connections), 2)
+        stale_socket.close.assert_called_once_with()
+        self.assertEqual(wrapper._idle, [self.connections[1]])
+
+    def test_request_retries_unsent_post(self):
+        """
+        Assert that a POST that could not be sent on an idle connection is made again.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        wrapper.request('GET', '/awesome/api/', '')
+        self.connections[0].request.side_effect = socket.error('broken pipe')
+
+        status, body = wrapper.request('POST', '/awesome/api/', '{}')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.connections), 2)
+        self.connections[1].request.assert_called_once_with(
+            'POST', '/awesome/api/', body='{}', headers=mock.ANY)
+
+    def test_request_does_not_retry_timed_out_post(self):
+        """
+        Assert that a POST that timed out on an idle connection is not sent again.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        wrapper.request('GET', '/awesome/api/', '')
+        self.connections[0].getresponse.side_effect = socket.timeout('timed out')
+
+        self.assertRaises(socket.timeout, wrapper.request, 'POST', '/awesome/api/', '{}')
+
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].request.call_count, 2)
+        self.assertEqual(wrapper._idle, [])
+
+    def test_request_does_not_retry_reset_post(self):
+        """
+        Assert that a POST whose connection broke while waiting for the response is not
+        sent again, but a GET is.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        wrapper.request('GET', '/awesome/api/', '')
+        self.connections[0].getresponse.side_effect = socket.error('reset')
+
+        self.assertRaises(socket.error, wrapper.request, 'POST', '/awesome/api/', '{}')
+        self.assertEqual(len(self.connections), 1)
+
+        wrapper.request('GET', '/awesome/api/', '')
+        self.connections[1].getresponse.side_effect = socket.error('reset')
+        status, body = wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(self.connections), 3)
+
+    def test_request_does_not_retry_timed_out_get(self):
+        """
+        Assert that a GET that timed out on an idle connection is not made again.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        wrapper.request('GET', '/awesome/api/', '')
+        self.connections[0].getresponse.side_effect = socket.timeout('timed out')
+
+        self.assertRaises(socket.timeout, wrapper.request, 'GET', '/awesome/api/', '')
+
+        self.assertEqual(len(self.connections), 1)
+
+    def test_request_does_not_retry_new_connection(self):
+        """
+        Assert that a request failing on a new connection is not made again.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        self.HTTPSConnection.side_effect = None
+        self.HTTPSConnection.return_value.request.side_effect = socket.error('refused')
+
+        self.assertRaises(socket.error, wrapper.request, 'GET', '/awesome/api/', '')
+
+        self.assertEqual(self.HTTPSConnection.call_count, 1)
+        self.assertEqual(wrapper._idle, [])
+
+    def test_request_closing_response(self):
+        """
+        Assert that a connection the server is closing is not reused.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+        wrapper.request('GET', '/awesome/api/', '')
+        self.connections[0].getresponse.return_value.will_close = True
+
+        wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(wrapper._idle, [])
+        self.assertEqual(self.connections[0].sock, None)
+
+    def test_request_max_connections(self):
+        """
+        Assert that no more than max_connections connections are kept idle.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False, max_connections=1)
+        wrapper = server.HTTPSServerWrapper(conn)
+        first = self._connection('host', 443, wrapper._get_ssl_context())
+        second = self._connection('host', 443, wrapper._get_ssl_context())
+        response = first.getresponse.return_value
+
+        wrapper._release(first, response)
+        wrapper._release(second, response)
+
+        self.assertEqual(wrapper._idle, [first])
+        self.assertEqual(second.sock, None)
+
+    def test_request_max_connections_zero(self):
+        """
+        Assert that connections are not reused when max_connections is 0.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False, max_connections=0)
+        wrapper = server.HTTPSServerWrapper(conn)
+
+        wrapper.request('GET', '/awesome/api/', '')
+        wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(wrapper._idle, [])
+
+    @mock.patch('pulp.bindings.server.httpslib.ProxyHTTPSConnection')
+    def test_request_proxy(self, ProxyHTTPSConnection):
+        """
+        Assert that connections through a proxy are not reused, but their SSL context is.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False, proxy_host='proxy')
+        wrapper = server.HTTPSServerWrapper(conn)
+        ProxyHTTPSConnection.return_value.getresponse.return_value = mock.MagicMock(
+            status=200, will_close=False)
+
+        wrapper.request('GET', '/awesome/api/', '')
+        wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(ProxyHTTPSConnection.call_count, 2)
+        self.assertEqual(ProxyHTTPSConnection.call_args_list[0],
+                         ProxyHTTPSConnection.call_args_list[1])
+        ProxyHTTPSConnection.return_value.request.assert_called_with(
+            'GET', 'https://host:443/awesome/api/', body='', headers=mock.ANY)
+        self.assertEqual(wrapper._idle, [])
+
+    @mock.patch('pulp.bindings.server.SSL.Context')
+    def test_ssl_context_cached(self, Context):
+        """
+        Assert that the SSL context is built once.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False)
+        wrapper = server.HTTPSServerWrapper(conn)
+
+        first = wrapper._get_ssl_context()
+        second = wrapper._get_ssl_context()
+
+        self.assertEqual(Context.call_count, 1)
+        self.assertTrue(first is second)
+
+    @mock.patch('pulp.bindings.server.os.path.getmtime')
+    @mock.patch('pulp.bindings.server.SSL.Context')
+    def test_ssl_context_certificate_changed(self, Context, getmtime):
+        """
+        Assert that the SSL context is built again, and idle connections closed, when the
+        client certificate changes.
+        """
+        conn = server.PulpConnection('host', verify_ssl=False, cert_filename='/cert.pem')
+        wrapper = server.HTTPSServerWrapper(conn)
+        getmtime.return_value = 1
+        wrapper.request('GET', '/awesome/api/', '')
+        idle = self.connections[0]
+        idle_socket = idle.sock
+
+        getmtime.return_value = 2
+        wrapper.request('GET', '/awesome/api/', '')
+
+        self.assertEqual(Context.call_count, 2)
+        Context.return_value.load_cert.assert_called_with('/cert.pem')
+        getmtime.assert_called_with('/cert.pem')
+        idle_socket.close.assert_called_once_with()
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(wrapper._idle, [self.connections[1]])
+
+
 class TestPulpConnection(unittest.TestCase):
     """
     This class contains tests for the PulpConnection object.
@@ -200,6 +440,7 @@ class TestPulpConnection(unittest.TestCase):
         self.assertEqual(connection.oauth_user, 'admin')
         self.assertEqual(connection.proxy_host, None)
         self.assertEqual(connection.proxy_port, 3128)
+        self.assertEqual(connection.max_connections, 4)
 
         # Make sure the headers are right
         expected_locale = locale.getdefaultlocale()[0]
@@ -87,6 +87,57 @@ class TestPurgeTasks(unittest.TestCase):
         self.server.DELETE.assert_called_once()
 
 
+class TestWatchTasks(unittest.TestCase):
+    def setUp(self):
+        self.server = mock.MagicMock()
+        self.api = tasks.TasksAPI(self.server)
+
+    def test_watch_tasks(self):
+        ret = self.api.watch_tasks({'t1': 'token', 't2': None}, timeout=5)
+
+        self.server.POST.assert_called_once_with(
+            '/v2/tasks/watch/', {'tasks': {'t1': 'token', 't2': None}, 'timeout': 5})
+        self.assertTrue(ret is self.server.POST.return_value)
+
+    def test_watch_tasks_default_timeout(self):
+        self.api.watch_tasks({'t1': None})
+
+        self.server.POST.assert_called_once_with('/v2/tasks/watch/', {'tasks': {'t1': None}})
+
+
+class TestTaskWatcher(unittest.TestCase):
+    def setUp(self):
+        self.api = mock.MagicMock()
+        self.watcher = tasks.TaskWatcher(self.api, timeout=10)
+
+    def test_wait(self):
+        report = copy.deepcopy(TASKS[0])
+        report['state'] = 'running'
+        self.api.watch_tasks.return_value.response_body = {
+            't1': {'changes': report, 'token': 'token-1'}}
+        first = self.watcher.wait(['t1'])
+        self.api.watch_tasks.return_value.response_body = {
+            't1': {'changes': {'state': 'finished', 'result': 3}, 'token': 'token-2'}}
+
+        second = self.watcher.wait(['t1'])
+
+        self.assertEqual(self.api.watch_tasks.call_args_list,
+                         [mock.call({'t1': None}, 10), mock.call({'t1': 'token-1'}, 10)])
+        self.assertEqual(first['t1'].state, 'running')
+        task = second['t1']
+        self.assertTrue(isinstance(task, responses.Task))
+        self.assertEqual(task.state, 'finished')
+        self.assertEqual(task.result, 3)
+        self.assertEqual(task.tags, TASKS[0]['tags'])
+        self.assertEqual(self.watcher.tokens, {'t1': 'token-2'})
+
+    def test_wait_unchanged(self):
+        self.api.watch_tasks.return_value.response_body = {}
+
+        self.assertEqual(self.watcher.wait(['t1']), {})
+        self.assertEqual(self.watcher.tokens, {})
+
+
 TASKS = [
     {
         'exception': None,
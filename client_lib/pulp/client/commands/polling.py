@@ -6,7 +6,9 @@ import time
 from gettext import gettext as _
 
 from pulp.client.extensions.extensions import PulpCliCommand, PulpCliFlag
+from pulp.bindings.exceptions import ApacheServerException, NotFoundException
 from pulp.bindings.responses import Task
+from pulp.bindings.tasks import TaskWatcher
 
 # Returned from the poll command if one or more of the tasks in the given list
 # was rejected
@@ -22,6 +24,10 @@ DESC_BACKGROUND = _('if specified, the client process will end immediately (the
                     'continue to run on the server)')
 FLAG_BACKGROUND = PulpCliFlag('--bg', DESC_BACKGROUND)
 
+# Number of seconds each request waits for the polled task to change, when the server
+# supports watching tasks
+WATCH_TIMEOUT_IN_SECONDS = 10
+
 
 class PollingCommand(PulpCliCommand):
     """
@@ -29,8 +35,11 @@ class PollingCommand(PulpCliCommand):
     Subclasses should override the rendering methods as appropriate to display
     custom messages based on the task state or progress.
 
-    If the poll_frequency_in_seconds is not specified, it will be loaded from
-    the configuration under output -> poll_frequency_in_seconds.
+    If the server supports watching tasks, each request for the state of a task
+    waits on the server until the task changes. Otherwise the task is fetched
+    every poll_frequency_in_seconds. If the poll_frequency_in_seconds is not
+    specified, it will be loaded from the configuration under
+    output -> poll_frequency_in_seconds.
 
     :ivar context: the client context
     :type context: pulp.client.extensions.core.ClientContext
@@ -64,6 +73,10 @@ class PollingCommand(PulpCliCommand):
         # list of tasks we already know about
         self.known_tasks = set()
 
+        # follows the tasks while the server supports watching them
+        self.watch_tasks = True
+        self.task_watcher = None
+
     def poll(self, task_list, user_input):
         """
         Entry point to begin polling on the tasks in the given list. Each task will be polled
@@ -210,10 +223,7 @@ class PollingCommand(PulpCliCommand):
                     first_run = False
                 self.progress(task, running_spinner)
 
-            time.sleep(self.poll_frequency_in_seconds)
-
-            response = self.context.server.tasks.get_task(task.task_id)
-            task = response.response_body
+            task = self._next_task_report(task)
 
         # One final call to update the progress with the end state. It's possible the run state
         # was never hit in the loop above, so we check for first_run again for the missing blank
@@ -225,6 +235,43 @@ class PollingCommand(PulpCliCommand):
 
         return task
 
+    def _next_task_report(self, task):
+        """
+        Retrieves the next report of a task: once it changed or the watch timeout passed if the
+        server supports watching tasks, after poll_frequency_in_seconds otherwise. Watching waits
+        for at least poll_frequency_in_seconds when the task did not change.
+
+        :param task: the last report of the task
+        :type  task: pulp.bindings.responses.Task
+
+        :return: the next report of the task
+        :rtype:  pulp.bindings.responses.Task
+        """
+        if self.watch_tasks:
+            if self.task_watcher is None:
+                self.task_watcher = TaskWatcher(self.context.server.tasks,
+                                                WATCH_TIMEOUT_IN_SECONDS)
+            started = time.time()
+            try:
+                changed = self.task_watcher.wait([task.task_id])
+            except (NotFoundException, ApacheServerException):
+                # Either the server does not support watching tasks, or the task does not
+                # exist, which fetching it reports below.
+                self.watch_tasks = False
+            else:
+                if task.task_id not in changed:
+                    # The server answers right away when too many requests are watching tasks
+                    # already, so wait as long as polling would before asking it again.
+                    remaining = self.poll_frequency_in_seconds - (time.time() - started)
+                    if remaining > 0:
+                        time.sleep(remaining)
+                return changed.get(task.task_id, task)
+
+        time.sleep(self.poll_frequency_in_seconds)
+
+        response = self.context.server.tasks.get_task(task.task_id)
+        return response.response_body
+
     def task_header(self, task):
         """
         Displays information to the user to indicate which task is about to be tracked.
@@ -1,6 +1,7 @@
 from gettext import gettext as _
 import os
 
+from okaara.parsers import parse_positive_int
 from okaara.prompt import COLOR_GREEN, COLOR_YELLOW
 
 from pulp.bindings.exceptions import ConflictException
@@ -37,6 +38,10 @@ OPTION_DIR = PulpCliOption('--dir', DESC_DIR, aliases=['-d'], allow_multiple=Tru
 DESC_VERBOSE = _('display extra information about the upload process')
 FLAG_VERBOSE = PulpCliFlag('-v', DESC_VERBOSE)
 
+DESC_PARALLEL = _('number of segments of each file to upload concurrently; defaults to 1')
+OPTION_PARALLEL = PulpCliOption('--parallel', DESC_PARALLEL, required=False,
+                                parse_func=parse_positive_int)
+
 
 class MetadataException(Exception):
     """
@@ -102,7 +107,8 @@ class PerformUploadCommand(polling.PollingCommand):
                         msg = _('%(i)s/%(t)s bytes')
                         bar.render(item, total, msg % {'i': item, 't': total})
 
-                    upload_manager.upload(upload_id, progress_callback)
+                    parallel = user_input.get(OPTION_PARALLEL.keyword) or 1
+                    upload_manager.upload(upload_id, progress_callback, parallel=parallel)
 
                     context.prompt.write(_('... completed'))
                     context.prompt.render_spacer()
@@ -178,6 +184,7 @@ class UploadCommand(PerformUploadCommand):
         if upload_files:
             self.add_option(OPTION_FILE)
             self.add_option(OPTION_DIR)
+            self.add_option(OPTION_PARALLEL)
 
         self.add_flag(FLAG_VERBOSE)
 
@@ -501,6 +508,8 @@ class ResumeCommand(PerformUploadCommand):
         self.prompt = context.prompt
         self.upload_manager = upload_manager
 
+        self.add_option(OPTION_PARALLEL)
+
     def run(self, **user_input):
         """
         This performs the work to resume the upload.
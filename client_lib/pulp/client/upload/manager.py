@@ -9,11 +9,16 @@ import copy
 import errno
 import os
 import pickle
+import Queue
+import sys
+import threading
+import time
 
 from pulp.common.lock import LockFile
 
 
 DEFAULT_CHUNKSIZE = 1048576  # 1 MB per upload call
+CHECKPOINT_INTERVAL = 2  # seconds between saves of the tracker file while uploading
 
 
 class ManagerUninitializedException(Exception):
@@ -179,17 +184,20 @@ class UploadManager(object):
 
         return upload_id
 
-    def upload(self, upload_id, callback_func=None, force=False):
+    def upload(self, upload_id, callback_func=None, force=False, parallel=1):
         """
         Begins or resumes the upload process for the given upload request.
         This call will not return until the upload is complete. The other
         expected exit point is a KeyboardError to kill the process. The
-        client-side on disk tracker files will store the current offset and
-        resume the upload from where it left off on the next call to this method.
+        client-side on disk tracker files will store the ranges of the file
+        that were uploaded and resume the upload from where it left off on the
+        next call to this method. The tracker file is saved at most every
+        CHECKPOINT_INTERVAL seconds while uploading, so up to that much work
+        may be repeated when resuming.
 
         The callback_func is used to get feedback on the upload process. After
         each successful upload segment call to the server, this function
-        will be invoked with the new offset in the file and the file size
+        will be invoked with the number of bytes uploaded so far and the file size
         (intended to be fed into a progress indicator). As this is called
         after each upload segment call, the granularity at which it is called
         depends on the chunk_size value for this instance.
@@ -212,6 +220,10 @@ class UploadManager(object):
                uploads
         @type  force: bool
 
+        @param parallel: number of segments to upload concurrently; segments
+               may then complete out of order
+        @type  parallel: int
+
         @raise MissingUploadRequestException: if a tracker file for upload_id
                cannot be found
         @raise ConcurrentUploadException: if an upload is already in progress
@@ -235,7 +247,26 @@ class UploadManager(object):
 
             source_file_size = os.path.getsize(tracker_file.source_filename)
 
-            f = open(tracker_file.source_filename, 'r')
+            if parallel > 1:
+                self._upload_parallel(tracker_file, source_file_size, callback_func, parallel)
+            else:
+                self._upload_sequential(tracker_file, source_file_size, callback_func)
+
+            tracker_file.is_finished_uploading = True
+        finally:
+            # Regardless of how this ends, it's no longer running, so make sure
+            # we update the tracker accordingly.
+            tracker_file.is_running = False
+            tracker_file.save()
+
+    def _upload_sequential(self, tracker_file, source_file_size, callback_func):
+        """
+        Uploads the remainder of the file after the tracker's offset one segment
+        at a time.
+        """
+        last_save = time.time()
+        f = open(tracker_file.source_filename, 'r')
+        try:
             while True:
                 # Load the chunk to upload
                 f.seek(tracker_file.offset)
@@ -244,20 +275,99 @@ class UploadManager(object):
                     break
 
                 # Server request
-                self.bindings.uploads.upload_segment(upload_id, tracker_file.offset, data)
+                self.bindings.uploads.upload_segment(tracker_file.upload_id, tracker_file.offset,
+                                                     data)
 
                 # Status update and callback notification
-                tracker_file.offset = min(tracker_file.offset + self.chunk_size, source_file_size)
-                tracker_file.save()
+                tracker_file.add_completed_range(tracker_file.offset,
+                                                 tracker_file.offset + len(data))
+                if time.time() - last_save >= CHECKPOINT_INTERVAL:
+                    tracker_file.save()
+                    last_save = time.time()
 
                 callback_func(tracker_file.offset, source_file_size)
+        finally:
+            f.close()
 
-            tracker_file.is_finished_uploading = True
+    def _upload_parallel(self, tracker_file, source_file_size, callback_func, parallel):
+        """
+        Uploads every range of the file the tracker does not record as completed,
+        using a pool of threads that each upload one segment at a time.
+        """
+        segments = Queue.Queue()
+        for start, end in tracker_file.pending_ranges(source_file_size):
+            for offset in xrange(start, end, self.chunk_size):
+                segments.put((offset, min(offset + self.chunk_size, end)))
+
+        results = Queue.Queue()
+        stop = threading.Event()
+        uploaders = []
+        for i in xrange(min(parallel, segments.qsize())):
+            uploader = threading.Thread(target=self._upload_segments,
+                                        args=(tracker_file, segments, results, stop))
+            uploader.daemon = True
+            uploader.start()
+            uploaders.append(uploader)
+
+        error = None
+        running = len(uploaders)
+        last_save = time.time()
+        try:
+            while running:
+                try:
+                    # A timeout keeps the wait interruptible by ctrl+c
+                    result = results.get(timeout=1)
+                except Queue.Empty:
+                    continue
+                if result is None:
+                    running -= 1
+                    continue
+
+                start, end, exc_info = result
+                if exc_info:
+                    # Let the other uploaders finish their current segment and stop
+                    stop.set()
+                    error = error or exc_info
+                    continue
+
+                tracker_file.add_completed_range(start, end)
+                if time.time() - last_save >= CHECKPOINT_INTERVAL:
+                    tracker_file.save()
+                    last_save = time.time()
+
+                if callback_func:
+                    callback_func(tracker_file.completed_size(), source_file_size)
         finally:
-            # Regardless of how this ends, it's no longer running, so make sure
-            # we update the tracker accordingly.
-            tracker_file.is_running = False
-            tracker_file.save()
+            stop.set()
+
+        if error:
+            raise error[0], error[1], error[2]
+
+    def _upload_segments(self, tracker_file, segments, results, stop):
+        """
+        Run by the upload threads of _upload_parallel. Uploads segments from the
+        queue until it is empty, an upload fails, or it is told to stop, and puts
+        a (start, end, exc_info) result for each segment in the results queue,
+        followed by None once the thread is done.
+        """
+        f = open(tracker_file.source_filename, 'r')
+        try:
+            while not stop.is_set():
+                try:
+                    start, end = segments.get_nowait()
+                except Queue.Empty:
+                    break
+                try:
+                    f.seek(start)
+                    data = f.read(end - start)
+                    self.bindings.uploads.upload_segment(tracker_file.upload_id, start, data)
+                except Exception:
+                    results.put((start, end, sys.exc_info()))
+                    break
+                results.put((start, end, None))
+        finally:
+            f.close()
+            results.put(None)
 
     def import_upload(self, upload_id):
         """
@@ -397,7 +507,8 @@ class UploadTracker(object):
         # Upload call information
         self.upload_id = None
         self.location = None  # URL to the upload request on the server
-        self.offset = None  # start of next chunk to upload
+        self.offset = None  # end of the uploaded data at the start of the file
+        self.completed_ranges = []  # sorted, disjoint [start, end) ranges that were uploaded
         self.source_filename = None  # path on disk to the file to upload
 
         # Import call information
@@ -410,6 +521,65 @@ class UploadTracker(object):
         self.is_running = False
         self.is_finished_uploading = False
 
+    def add_completed_range(self, start, end):
+        """
+        Records that the given range of the file was uploaded, and advances
+        the offset to the end of the uploaded data at the start of the file.
+
+        @param start: offset of the first uploaded byte
+        @type  start: int
+
+        @param end: offset after the last uploaded byte
+        @type  end: int
+        """
+        merged = []
+        for range_start, range_end in sorted(self._get_completed_ranges() + [[start, end]]):
+            if merged and range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        self.completed_ranges = merged
+        if merged[0][0] == 0:
+            self.offset = merged[0][1]
+
+    def pending_ranges(self, size):
+        """
+        @param size: size of the file being uploaded
+        @type  size: int
+
+        @return: the [start, end) ranges of the file that were not uploaded yet
+        @rtype:  list
+        """
+        pending = []
+        position = 0
+        for start, end in self._get_completed_ranges():
+            if start > position:
+                pending.append([position, start])
+            position = max(position, end)
+        if position < size:
+            pending.append([position, size])
+        return pending
+
+    def completed_size(self):
+        """
+        @return: number of bytes of the file that were uploaded
+        @rtype:  int
+        """
+        return sum(end - start for start, end in self._get_completed_ranges())
+
+    def _get_completed_ranges(self):
+        """
+        Tracker files saved before completed ranges were recorded only carry
+        the offset, up to which the file was uploaded.
+
+        @return: the completed [start, end) ranges, sorted
+        @rtype:  list
+        """
+        completed_ranges = getattr(self, 'completed_ranges', None)
+        if completed_ranges is None:
+            completed_ranges = [[0, self.offset]] if self.offset else []
+        return list(completed_ranges)
+
     def save(self):
         """
         Saves the current state of the tracker file. This will lock on the file
@@ -106,6 +106,21 @@ class TestPerformUploadCommand(base.PulpClientTests):
         # No errors should have been rendered
         self.assertEqual(render_failure_message.call_count, 0)
 
+    @mock.patch('pulp.client.commands.repo.upload.PerformUploadCommand.poll')
+    def test_upload_parallel(self, poll):
+        """
+        Make sure that perform_upload() uploads as many segments concurrently as requested.
+        """
+        upload_manager = mock.MagicMock()
+        upload_manager.get_upload.return_value.source_filename = '/tmp/a.rpm'
+        method = mock.MagicMock()
+        user_input = {upload.OPTION_PARALLEL.keyword: 4}
+        command = upload.PerformUploadCommand('name', 'description', method, self.context)
+
+        command.perform_upload(self.context, upload_manager, ['an_id'], user_input)
+
+        upload_manager.upload.assert_called_once_with('an_id', mock.ANY, parallel=4)
+
 
 class UploadCommandTests(base.PulpClientTests):
 
@@ -115,6 +130,9 @@ class UploadCommandTests(base.PulpClientTests):
         self.mock_upload_manager = mock.MagicMock()
         self.upload_command = upload.UploadCommand(self.context, self.mock_upload_manager)
 
+    def test_structure(self):
+        self.assertTrue(upload.OPTION_PARALLEL in self.upload_command.options)
+
     def test_verify_repo_exists(self):
         # Setup
         mock_repo_api = mock.MagicMock()
@@ -1,10 +1,13 @@
+import itertools
+
 import mock
 
+from pulp.bindings.exceptions import ApacheServerException
 from pulp.bindings.responses import (
     Task, STATE_WAITING, STATE_CANCELED, STATE_ERROR, STATE_FINISHED,
     STATE_RUNNING, STATE_SKIPPED, STATE_ACCEPTED)
 from pulp.client.commands.polling import (
-    PollingCommand, RESULT_ABORTED, FLAG_BACKGROUND, RESULT_BACKGROUND)
+    PollingCommand, RESULT_ABORTED, FLAG_BACKGROUND, RESULT_BACKGROUND, WATCH_TIMEOUT_IN_SECONDS)
 from pulp.devel.unit import base
 from pulp.devel.unit.task_simulator import TaskSimulator
 
@@ -374,3 +377,89 @@ class PollingCommandTests(base.PulpClientTests):
         self.assertEqual(result, RESULT_ABORTED)
 
         self.assertEqual(['abort'], self.prompt.get_write_tags())
+
+    @mock.patch('time.time')
+    @mock.patch('time.sleep')
+    def test_poll_watch_tasks(self, mock_sleep, mock_time):
+        """
+        Tasks are followed by watching them when the server supports it.
+        """
+        self.command.poll_frequency_in_seconds = 2
+        # the server waits for a change before it answers
+        mock_time.side_effect = itertools.count(0, 5).next
+        watch_tasks = mock.MagicMock()
+        self.bindings.tasks.watch_tasks = watch_tasks
+        watch_tasks.side_effect = [
+            mock.MagicMock(response_body={'1': {'changes': {'task_id': '1',
+                                                            'state': STATE_WAITING},
+                                                'token': 'a'}}),
+            mock.MagicMock(response_body={}),
+            mock.MagicMock(response_body={'1': {'changes': {'state': STATE_RUNNING},
+                                                'token': 'b'}}),
+            mock.MagicMock(response_body={'1': {'changes': {'state': STATE_FINISHED},
+                                                'token': 'c'}}),
+        ]
+
+        # Test
+        completed_tasks = self.command.poll([Task({'task_id': '1'})], {})
+
+        # Verify
+        # the watch returned no change after waiting, so the task is watched again right away
+        self.assertEqual(0, mock_sleep.call_count)
+        self.assertEqual(watch_tasks.call_args_list,
+                         [mock.call({'1': None}, WATCH_TIMEOUT_IN_SECONDS),
+                          mock.call({'1': 'a'}, WATCH_TIMEOUT_IN_SECONDS),
+                          mock.call({'1': 'a'}, WATCH_TIMEOUT_IN_SECONDS),
+                          mock.call({'1': 'b'}, WATCH_TIMEOUT_IN_SECONDS)])
+        self.assertEqual(1, len(completed_tasks))
+        self.assertEqual(STATE_FINISHED, completed_tasks[0].state)
+        self.assertEqual('1', completed_tasks[0].task_id)
+        self.assertTrue(self.command.watch_tasks)
+
+    @mock.patch('time.time', mock.MagicMock(return_value=100))
+    @mock.patch('time.sleep')
+    def test_poll_watch_tasks_busy(self, mock_sleep):
+        """
+        Watching waits like polling when the server returns no change right away, which it does
+        when too many requests are watching tasks already.
+        """
+        self.command.poll_frequency_in_seconds = 2
+        watch_tasks = mock.MagicMock()
+        self.bindings.tasks.watch_tasks = watch_tasks
+        watch_tasks.side_effect = [
+            mock.MagicMock(response_body={'1': {'changes': {'task_id': '1',
+                                                            'state': STATE_RUNNING},
+                                                'token': 'a'}}),
+            mock.MagicMock(response_body={}),
+            mock.MagicMock(response_body={'1': {'changes': {'state': STATE_FINISHED},
+                                                'token': 'b'}}),
+        ]
+
+        # Test
+        completed_tasks = self.command.poll([Task({'task_id': '1'})], {})
+
+        # Verify
+        mock_sleep.assert_called_once_with(2)
+        self.assertEqual(3, watch_tasks.call_count)
+        self.assertEqual(STATE_FINISHED, completed_tasks[0].state)
+
+    @mock.patch('time.sleep')
+    def test_poll_watch_tasks_not_supported(self, mock_sleep):
+        """
+        Tasks are fetched every poll_frequency_in_seconds when the server does not support
+        watching them, which is tried only once.
+        """
+        sim = TaskSimulator()
+        sim.install(self.bindings)
+        sim.add_task_states('1', [STATE_WAITING, STATE_RUNNING, STATE_FINISHED])
+        sim.watch_tasks = mock.MagicMock(side_effect=ApacheServerException(''))
+
+        # Test
+        task_list = sim.get_all_tasks().response_body
+        completed_tasks = self.command.poll(task_list, {})
+
+        # Verify
+        self.assertEqual(1, sim.watch_tasks.call_count)
+        self.assertEqual(2, mock_sleep.call_count)
+        self.assertFalse(self.command.watch_tasks)
+        self.assertEqual(STATE_FINISHED, completed_tasks[0].state)
@@ -302,6 +302,88 @@ class UploadManagerTests(unittest.TestCase):
         self.assertRaises(upload_util.ConcurrentUploadException, self.upload_manager.upload,
                           upload_id)
 
+    def test_upload_parallel(self):
+        # Setup
+        self.upload_manager.chunk_size = 100
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+        mock_callback = mock.Mock()
+
+        # Test
+        self.upload_manager.upload(upload_id, mock_callback.update_status, parallel=4)
+
+        # Verify
+        rpm_size = os.path.getsize(TEST_RPM_FILENAME)
+        num_upload_calls = int(math.ceil(float(rpm_size) / float(self.upload_manager.chunk_size)))
+        self.assertEqual(num_upload_calls, self.mock_upload_bindings.upload_segment.call_count)
+
+        # Every segment was sent once, with the data at its offset
+        f = open(TEST_RPM_FILENAME, 'r')
+        segments = {}
+        for single_call_args in self.mock_upload_bindings.upload_segment.call_args_list:
+            call_upload_id, offset, body = single_call_args[0]
+            self.assertEqual(upload_id, call_upload_id)
+            f.seek(offset)
+            self.assertEqual(f.read(self.upload_manager.chunk_size), body)
+            segments[offset] = body
+        f.close()
+        self.assertEqual(sorted(segments), range(0, rpm_size, self.upload_manager.chunk_size))
+
+        self.assertEqual(num_upload_calls, mock_callback.update_status.call_count)
+        self.assertEqual(mock.call(rpm_size, rpm_size), mock_callback.update_status.call_args)
+
+        tracker = upload_util.UploadTracker.load(self.upload_manager._tracker_filename(upload_id))
+        self.assertEqual(rpm_size, tracker.offset)
+        self.assertEqual([[0, rpm_size]], tracker.completed_ranges)
+        self.assertEqual(True, tracker.is_finished_uploading)
+        self.assertEqual(False, tracker.is_running)
+
+    def test_upload_parallel_resume(self):
+        # Setup
+        self.upload_manager.chunk_size = 200
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+        tracker = self.upload_manager._get_tracker_file_by_id(upload_id)
+        # Segments completed out of order before the upload was paused
+        tracker.add_completed_range(600, 1000)
+        tracker.add_completed_range(0, 300)
+        tracker.add_completed_range(1400, 1600)
+        self.assertEqual(300, tracker.offset)
+
+        # Test
+        self.upload_manager.upload(upload_id, parallel=2)
+
+        # Verify only the gaps were uploaded
+        rpm_size = os.path.getsize(TEST_RPM_FILENAME)
+        sent = sorted((c[0][1], c[0][1] + len(c[0][2]))
+                      for c in self.mock_upload_bindings.upload_segment.call_args_list)
+        expected = [(300, 500), (500, 600), (1000, 1200), (1200, 1400)] + [
+            (offset, min(offset + 200, rpm_size)) for offset in range(1600, rpm_size, 200)]
+        self.assertEqual(expected, sent)
+        self.assertEqual([[0, rpm_size]], tracker.completed_ranges)
+
+    def test_upload_parallel_failure(self):
+        # Setup
+        self.upload_manager.chunk_size = 1000
+        upload_id = self.upload_manager.initialize_upload(TEST_RPM_FILENAME, 'repo-1', 'type-1',
+                                                          {'k': 'v'}, 'm-1')
+
+        def upload_segment(upload_id, offset, data):
+            if offset == 2000:
+                raise NotFoundException({})
+        self.mock_upload_bindings.upload_segment.side_effect = upload_segment
+
+        # Test
+        self.assertRaises(NotFoundException, self.upload_manager.upload, upload_id, parallel=2)
+
+        # Verify the segments that were uploaded are recorded
+        tracker = upload_util.UploadTracker.load(self.upload_manager._tracker_filename(upload_id))
+        self.assertFalse(tracker.is_finished_uploading)
+        self.assertFalse(tracker.is_running)
+        # The segments before the failed one were taken from the queue first
+        self.assertEqual(2000, tracker.offset)
+        self.assertEqual(2000, tracker.pending_ranges(os.path.getsize(TEST_RPM_FILENAME))[0][0])
+
     def test_delete_upload(self):
         # Setup
         self.upload_manager.initialize()
@@ -444,3 +526,33 @@ class UploadManagerTests(unittest.TestCase):
         Configures the mock bindings to return a valid response on importing an upload.
         """
         self.mock_upload_bindings.import_upload.return_value = Response(200, {})
+
+
+class UploadTrackerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = upload_util.UploadTracker('/tmp/pulp-upload-tracker-test')
+        self.tracker.offset = 0
+
+    def test_add_completed_range(self):
+        self.tracker.add_completed_range(200, 300)
+        self.assertEqual(0, self.tracker.offset)
+        self.tracker.add_completed_range(0, 100)
+        self.assertEqual(100, self.tracker.offset)
+        self.tracker.add_completed_range(100, 200)
+        self.assertEqual([[0, 300]], self.tracker.completed_ranges)
+        self.assertEqual(300, self.tracker.offset)
+
+    def test_pending_ranges(self):
+        self.tracker.add_completed_range(100, 200)
+        self.tracker.add_completed_range(300, 400)
+        self.assertEqual([[0, 100], [200, 300], [400, 500]], self.tracker.pending_ranges(500))
+        self.assertEqual(200, self.tracker.completed_size())
+
+    def test_tracker_without_completed_ranges(self):
+        # Tracker files saved by older versions only have an offset
+        del self.tracker.completed_ranges
+        self.tracker.offset = 100
+        self.assertEqual([[100, 500]], self.tracker.pending_ranges(500))
+        self.tracker.add_completed_range(300, 400)
+        self.assertEqual([[0, 100], [300, 400]], self.tracker.completed_ranges)
@@ -128,6 +128,8 @@ PLP0049 = Error(
     _('Worker terminated abnormally while processing task %(task_id)s.  '
       'Check the logs for details'),
     ['task_id'])
+PLP0050 = Error("PLP0050", _("%(count)d orphaned files could not be removed: %(paths)s"),
+                ['count', 'paths'])
 
 # Create a section for general validation errors (PLP1000 - PLP2999)
 # Validation problems should be reported with a general PLP1000 error with a more specific
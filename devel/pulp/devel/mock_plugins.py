@@ -7,11 +7,14 @@ of any captured data as well as any configured behavior reverts back to
 the defaults.
 """
 
+import functools
+
 import mock
 
 from pulp.plugins.loader import api as plugin_api
 from pulp.plugins.loader import exceptions as plugin_exceptions
 from pulp.plugins.model import SyncReport, PublishReport
+from pulp.plugins.profiler import Profiler
 
 
 # Used when reverting the monkey patch
@@ -218,6 +221,10 @@ def install():
             mock.Mock(side_effect=lambda i, u, o, c, x: sorted(u))
         profiler.calculate_applicable_units = \
             mock.Mock(side_effect=lambda t, p, r, c, x: ['mocked-unit1', 'mocked-unit2'])
+        # Use the real batch implementation so it goes through calculate_applicable_units
+        profiler.calculate_applicable_units_batch = \
+            mock.Mock(side_effect=functools.partial(
+                Profiler.calculate_applicable_units_batch.im_func, profiler))
 
 
 def reset():
@@ -15,7 +15,7 @@ bindings object.
 
 import copy
 
-from pulp.bindings import responses
+from pulp.bindings import exceptions, responses
 
 
 TASK_TEMPLATE = {
@@ -123,6 +123,15 @@ class TaskSimulator(object):
 
         return response
 
+    def watch_tasks(self, tokens, timeout=None):
+        """
+        Simulates a server that does not support watching tasks, so that polling commands
+        fall back to calling get_task.
+
+        :raises NotFoundException: always
+        """
+        raise exceptions.NotFoundException({})
+
     def get_all_tasks(self, tags=()):
         """
         Returns the next state for all tasks that match the given tags, if any. The index
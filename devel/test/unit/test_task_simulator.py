@@ -2,6 +2,7 @@ import unittest
 
 import mock
 
+from pulp.bindings.exceptions import NotFoundException
 from pulp.bindings.responses import Response, Task
 from pulp.devel.unit import task_simulator
 from pulp.devel.unit.task_simulator import TaskSimulator
@@ -92,6 +93,10 @@ class TaskSimulatorTests(unittest.TestCase):
             task = all_tasks[i]
             self.assertEqual(task.task_id, 'task-%s' % i)
 
+    def test_watch_tasks(self):
+        # Test & Verify
+        self.assertRaises(NotFoundException, TaskSimulator().watch_tasks, {'task-1': None})
+
     def test_create_fake_task(self):
         # Test
         response = task_simulator.create_fake_task_response()
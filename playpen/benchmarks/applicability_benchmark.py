@@ -0,0 +1,169 @@
+#!/usr/bin/env python2
+"""
+Seed a local mongod with repositories and consumer unit profiles, then compare regenerating
+applicability one profile set at a time, the way the ApplicabilityRegenerationManager used to,
+with the batched regeneration it does now, and the storage each of them uses.
+
+A stub profiler stands in for the RPM profiler so no plugins need to be installed. It sleeps for
+--repo-cost milliseconds every time it has to load a repository and for --profile-cost
+milliseconds per profile set it evaluates, and reports the same --result-size applicable units
+for every consumer of a repository.
+"""
+
+from optparse import OptionParser
+import sys
+import time
+import uuid
+
+from mongoengine import errors as mongo_errors
+from pymongo.errors import DuplicateKeyError
+
+from pulp.plugins.profiler import Profiler
+from pulp.plugins.util import misc as plugin_misc
+from pulp.server.db import connection, model
+from pulp.server.db.model.consumer import (ApplicabilityResult, RepoProfileApplicability,
+                                           UnitProfile)
+from pulp.server.managers.consumer import applicability
+
+
+TYPE_ID = 'rpm'
+
+
+class StubProfiler(Profiler):
+
+    def __init__(self, repo_cost, profile_cost, result_size):
+        super(StubProfiler, self).__init__()
+        self.repo_cost = repo_cost / 1000.0
+        self.profile_cost = profile_cost / 1000.0
+        self.result_size = result_size
+
+    @classmethod
+    def metadata(cls):
+        return {'id': 'stub_profiler', 'display_name': 'Stub Profiler', 'types': [TYPE_ID]}
+
+    def _evaluate(self, unit_profile, bound_repo_id):
+        time.sleep(self.profile_cost)
+        # Consumers with the same number of profiles get the same applicability
+        return {TYPE_ID: ['%s-%s-%d' % (bound_repo_id, len(unit_profile), i)
+                          for i in xrange(self.result_size)]}
+
+    def calculate_applicable_units(self, unit_profile, bound_repo_id, config, conduit):
+        time.sleep(self.repo_cost)
+        return self._evaluate(unit_profile, bound_repo_id)
+
+    def calculate_applicable_units_batch(self, unit_profiles, bound_repo_id, config, conduit):
+        time.sleep(self.repo_cost)
+        return dict((h, self._evaluate(p, bound_repo_id)) for h, p in unit_profiles.iteritems())
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--db-name', default='pulp_applicability_benchmark',
+                      help='scratch database to seed; dropped at the end of the run')
+    parser.add_option('--repos', type='int', default=10,
+                      help='number of repositories every consumer is bound to')
+    parser.add_option('--profiles', type='int', default=1000,
+                      help='number of distinct consumer profiles')
+    parser.add_option('--batch-size', type='int', default=applicability.REGENERATION_BATCH_SIZE,
+                      help='number of profile sets regenerated together')
+    parser.add_option('--repo-cost', type='float', default=5,
+                      help='milliseconds the stub profiler spends loading a repository')
+    parser.add_option('--profile-cost', type='float', default=0.1,
+                      help='milliseconds the stub profiler spends on each profile set')
+    parser.add_option('--result-size', type='int', default=500,
+                      help='number of applicable units the stub profiler reports')
+    options, args = parser.parse_args()
+    return options
+
+
+def seed(num_repos, num_profiles):
+    repo_ids = ['applicability-benchmark-%d' % i for i in xrange(num_repos)]
+    for repo_id in repo_ids:
+        model.Repository(repo_id=repo_id, content_unit_counts={TYPE_ID: 1}).save()
+
+    profiles = []
+    for i in xrange(num_profiles):
+        profile_hash = uuid.uuid4().hex
+        profiles.append({'id': str(uuid.uuid4()), 'consumer_id': 'consumer-%d' % i,
+                         'content_type': TYPE_ID, 'profile_hash': profile_hash,
+                         'profile': [{'name': 'pkg-%d' % n, 'version': '1.0'}
+                                     for n in xrange(20)]})
+    for page in plugin_misc.paginate(profiles, 5000):
+        UnitProfile.get_collection().insert_many(page)
+
+    return [(repo_id, p['profile_hash'], [(p['profile_hash'], TYPE_ID, p['id'])])
+            for repo_id in repo_ids for p in profiles]
+
+
+def legacy_regenerate(profiles_to_process, profiler):
+    # The work regenerate_applicability used to do for every (repo, profile set) pair
+    collection = RepoProfileApplicability.get_collection()
+    for repo_id, all_profiles_hash, profiles in profiles_to_process:
+        try:
+            model.Repository.objects.get(repo_id=repo_id)
+        except mongo_errors.DoesNotExist:
+            continue
+        unit_profiles = UnitProfile.get_collection().find(
+            {'id': {'$in': [p_id for _, _, p_id in profiles]}},
+            projection=['profile', 'content_type', 'profile_hash'])
+        profiles = [(p['profile_hash'], p['content_type'], p['profile']) for p in unit_profiles]
+        result = profiler.calculate_applicable_units(profiles, repo_id, None, None)
+        for profile_hash, _, _ in profiles:
+            # Every record used to carry its own copy of the applicability data
+            document = {'profile_hash': profile_hash, 'repo_id': repo_id, 'profile': [],
+                        'applicability': result, 'all_profiles_hash': all_profiles_hash}
+            try:
+                collection.insert(document)
+            except DuplicateKeyError:
+                collection.update({'repo_id': repo_id, 'profile_hash': profile_hash,
+                                   'all_profiles_hash': all_profiles_hash},
+                                  {'$set': {'applicability': result}})
+    return storage_size()
+
+
+def batch_regenerate(profiles_to_process, batch_size):
+    manager = applicability.ApplicabilityRegenerationManager
+    for batch in plugin_misc.paginate(profiles_to_process, batch_size):
+        manager.batch_regenerate_applicability(batch)
+    return storage_size()
+
+
+def storage_size():
+    # Size in KiB of the applicability records and the results they reference
+    database = connection.get_database()
+    return sum(database.command('collstats', name).get('size', 0)
+               for name in (RepoProfileApplicability.collection_name,
+                            ApplicabilityResult.collection_name)) / 1024
+
+
+def timed(label, func, *args):
+    start = time.time()
+    result = func(*args)
+    elapsed = time.time() - start
+    print '%-24s %12s %10.2fs' % (label, result, elapsed)
+    return result
+
+
+def main():
+    options = parse_args()
+    connection.initialize(name=options.db_name)
+    database = connection.get_database()
+    profiler = StubProfiler(options.repo_cost, options.profile_cost, options.result_size)
+    applicability.ApplicabilityRegenerationManager._profiler = staticmethod(
+        lambda content_type: (profiler, {}))
+    try:
+        print 'seeding %d repositories and %d profiles...' % (options.repos, options.profiles)
+        profiles_to_process = seed(options.repos, options.profiles)
+
+        print '%-24s %12s %11s' % ('algorithm', 'size (KiB)', 'time')
+        timed('per profile set', legacy_regenerate, profiles_to_process, profiler)
+        RepoProfileApplicability.get_collection().remove()
+        ApplicabilityResult.get_collection().remove()
+        timed('batched', batch_regenerate, profiles_to_process, options.batch_size)
+    finally:
+        database.client.drop_database(options.db_name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python2
+"""
+Compare the requests per second the bindings make against a local HTTPS test server, with
+connections kept open and reused (max_connections > 0) and with a new connection made for
+each request (max_connections 0).
+
+The server is a threaded HTTP/1.1 server with a self-signed certificate generated with the
+openssl command, answering each GET with a small JSON document. It runs in a child process,
+so that it does not share the OpenSSL state of M2Crypto. The requests are made by --threads
+threads sharing one PulpConnection.
+"""
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from multiprocessing import Process, Queue
+from optparse import OptionParser
+import os
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from pulp.bindings.server import PulpConnection
+
+
+BODY = '{"it": "worked!"}'
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Buffer the response so it is sent in one segment
+    wbufsize = -1
+
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--requests', type='int', default=2000,
+                      help='number of requests made for each setting')
+    parser.add_option('--threads', type='int', default=1,
+                      help='number of threads making the requests')
+    parser.add_option('--max-connections', default='0,4',
+                      help='comma separated max_connections values to compare')
+    options, args = parser.parse_args()
+    return options
+
+
+def serve(cert, ports):
+    server = Server(('localhost', 0), Handler)
+    server.socket = ssl.wrap_socket(server.socket, certfile=cert, server_side=True)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(working_dir):
+    cert = os.path.join(working_dir, 'server.pem')
+    subprocess.check_call(
+        ['openssl', 'req', '-x509', '-nodes', '-newkey', 'rsa:2048', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', cert, '-out', cert],
+        stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+    ports = Queue()
+    process = Process(target=serve, args=(cert, ports))
+    process.daemon = True
+    process.start()
+    return process, ports.get()
+
+
+def run(options, port, max_connections):
+    connection = PulpConnection('localhost', port, verify_ssl=False,
+                                max_connections=int(max_connections))
+    wrapper = connection.server_wrapper
+    per_thread = options.requests // options.threads
+
+    def make_requests():
+        for i in xrange(per_thread):
+            status, body = wrapper.request('GET', '/pulp/api/v2/status/', None)
+            assert status == 200, status
+
+    threads = [threading.Thread(target=make_requests) for i in range(options.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return per_thread * options.threads, time.time() - start
+
+
+def main():
+    options = parse_args()
+    working_dir = tempfile.mkdtemp()
+    try:
+        server, port = start_server(working_dir)
+        print 'making %d requests with %d threads' % (options.requests, options.threads)
+        print '%-16s %10s %10s %12s' % ('max_connections', 'requests', 'time', 'requests/s')
+        for max_connections in options.max_connections.split(','):
+            count, elapsed = run(options, port, max_connections)
+            print '%-16s %10d %9.2fs %12.1f' % (max_connections, count, elapsed,
+                                                 count / elapsed)
+        server.terminate()
+    finally:
+        shutil.rmtree(working_dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
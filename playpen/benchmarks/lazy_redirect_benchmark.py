@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+"""
+Time how many lazy content redirects ContentView can sign per second, first loading the RSA key
+and signing every redirect as it used to, then with the key cached by Key.load_cached and
+finally with signed URLs reused for the redirect_url_cache_period.
+
+Every redirect is for one of --paths content paths, requested by one of --clients client
+addresses. The key is generated for the run in a temporary directory that is removed at the end.
+"""
+
+from optparse import OptionParser
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pulp.server.webservices.settings')
+
+from M2Crypto import RSA
+
+from pulp.server.config import config
+from pulp.server.content.web.views import ContentView
+from pulp.server.lazy import Key
+
+
+class FakeRequest(object):
+
+    def __init__(self, path, remote_ip):
+        self.path_info = path
+        self.environ = {
+            'wsgi.url_scheme': 'https',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '443',
+            'QUERY_STRING': '',
+            'REMOTE_ADDR': remote_ip,
+        }
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--requests', type='int', default=5000,
+                      help='number of redirected requests')
+    parser.add_option('--paths', type='int', default=100,
+                      help='number of distinct content paths requested')
+    parser.add_option('--clients', type='int', default=10,
+                      help='number of distinct client addresses')
+    parser.add_option('--key-bits', type='int', default=2048,
+                      help='size of the generated RSA key')
+    parser.add_option('--cache-period', type='int', default=60,
+                      help='redirect_url_cache_period used when signed URLs are cached')
+    options, args = parser.parse_args()
+    return options
+
+
+def generate_key(directory, bits):
+    path = os.path.join(directory, 'rsa.key')
+    key = RSA.gen_key(bits, 65537, callback=lambda *args: None)
+    key.save_key(path, cipher=None)
+    return path
+
+
+def run(load, cache_period, requests):
+    config.set('lazy', 'redirect_url_cache_period', str(cache_period))
+    start = time.time()
+    for request in requests:
+        ContentView.redirect(request, load())
+    return time.time() - start
+
+
+def main():
+    options = parse_args()
+    directory = tempfile.mkdtemp(prefix='lazy-redirect-benchmark-')
+    try:
+        key_path = generate_key(directory, options.key_bits)
+        requests = [FakeRequest('/var/lib/pulp/content/units/rpm/%d.rpm' %
+                                random.randrange(options.paths),
+                                '10.0.0.%d' % random.randrange(options.clients))
+                    for i in xrange(options.requests)]
+        print 'redirecting %d requests for %d paths from %d clients' % (
+            options.requests, options.paths, options.clients)
+        print '%-16s %10s %14s' % ('signing', 'time', 'redirects/s')
+        for label, load, cache_period in (
+                ('load+sign', lambda: Key.load(key_path), 0),
+                ('cached key', lambda: Key.load_cached(key_path), 0),
+                ('cached key+url', lambda: Key.load_cached(key_path), options.cache_period)):
+            elapsed = run(load, cache_period, requests)
+            print '%-16s %9.2fs %14.1f' % (label, elapsed, options.requests / elapsed)
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
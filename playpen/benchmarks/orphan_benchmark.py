@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+"""
+Seed a local mongod with synthetic content units and repository associations, then compare the
+per-unit orphan scan the OrphanManager used to do with the paged engine it uses now.
+"""
+
+from optparse import OptionParser
+import random
+import sys
+import time
+import uuid
+
+from pulp.plugins.loader import api as plugin_api
+from pulp.plugins.types import database as content_types_db
+from pulp.plugins.types.model import TypeDefinition
+from pulp.plugins.util import misc as plugin_misc
+from pulp.server.db import connection
+from pulp.server.db.model.repository import RepoContentUnit
+from pulp.server.managers.content.orphan import OrphanManager
+
+
+TYPE_ID = 'orphan_benchmark_unit'
+REPO_ID = 'orphan-benchmark'
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--db-name', default='pulp_orphan_benchmark',
+                      help='scratch database to seed; dropped at the end of the run')
+    parser.add_option('--units', type='int', default=100000,
+                      help='number of content units to create')
+    parser.add_option('--associated', type='float', default=0.5,
+                      help='fraction of the units that are associated with a repository')
+    parser.add_option('--skip-legacy', action='store_true', default=False,
+                      help='do not time the per-unit scan; useful for very large seeds')
+    options, args = parser.parse_args()
+    if not 0 <= options.associated <= 1:
+        parser.error('--associated must be between 0 and 1')
+    return options
+
+
+def seed(num_units, associated):
+    content_types_db.update_database([TypeDefinition(TYPE_ID, TYPE_ID, None, 'name', [], [])])
+    units_collection = content_types_db.type_units_collection(TYPE_ID)
+    associations_collection = RepoContentUnit.get_collection()
+
+    units = ({'_id': str(uuid.uuid4()), '_content_type_id': TYPE_ID, 'name': 'unit-%d' % i}
+             for i in xrange(num_units))
+    for page in plugin_misc.paginate(units, 5000):
+        units_collection.insert_many(page)
+        associations = [{'repo_id': REPO_ID, 'unit_id': unit['_id'], 'unit_type_id': TYPE_ID}
+                        for unit in page if random.random() < associated]
+        if associations:
+            associations_collection.insert_many(associations)
+
+
+def legacy_count():
+    # The algorithm the orphan manager used before it resolved associations a page at a time
+    units_collection = content_types_db.type_units_collection(TYPE_ID)
+    associations_collection = RepoContentUnit.get_collection()
+    count = 0
+    for unit in units_collection.find({}, projection=['_id']).batch_size(100):
+        if associations_collection.find({'unit_id': unit['_id']}).count() == 0:
+            count += 1
+    return count
+
+
+def timed(label, func, *args):
+    start = time.time()
+    result = func(*args)
+    elapsed = time.time() - start
+    print '%-24s %12s %10.2fs' % (label, result, elapsed)
+    return result
+
+
+def main():
+    options = parse_args()
+    connection.initialize(name=options.db_name)
+    plugin_api.initialize()
+    database = connection.get_database()
+    try:
+        print 'seeding %d units (%.0f%% associated)...' % (options.units, options.associated * 100)
+        seed(options.units, options.associated)
+
+        print '%-24s %12s %11s' % ('algorithm', 'orphans', 'time')
+        if not options.skip_legacy:
+            timed('per-unit scan', legacy_count)
+        timed('paged engine', OrphanManager().orphans_count_by_type, TYPE_ID)
+        timed('paged engine (delete)', OrphanManager.delete_orphans_by_type, TYPE_ID)
+    finally:
+        database.client.drop_database(options.db_name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
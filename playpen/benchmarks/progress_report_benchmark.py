@@ -0,0 +1,94 @@
+#!/usr/bin/env python2
+"""
+Count the progress report writes a publish step tree makes while processing --units units, for
+each of the given tasks progress_report_interval settings.
+
+The tree is a root step with a step that processes the units, among --steps sibling steps that
+do nothing. The writes go to a conduit that counts them and the size of the data they write,
+instead of to the database. An interval of 0 writes every report that changed the progress, as
+close as it gets to writing each processed unit.
+"""
+
+from optparse import OptionParser
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pulp.server.webservices.settings')
+
+from pulp.plugins.util.publish_step import Step
+from pulp.server.config import config
+
+
+class CountingConduit(object):
+
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def set_progress(self, status):
+        self.writes += 1
+        self.bytes += len(json.dumps(status))
+
+    def update_progress(self, status, changes):
+        self.writes += 1
+        self.bytes += sum(len(json.dumps(value)) for path, value in changes)
+
+
+class UnitStep(Step):
+
+    def __init__(self, units, work):
+        super(UnitStep, self).__init__('units')
+        self.units = units
+        self.work = work
+
+    def get_total(self):
+        return self.units
+
+    def get_iterator(self):
+        return xrange(self.units)
+
+    def process_main(self, item=None):
+        if self.work:
+            time.sleep(self.work)
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--units', type='int', default=100000,
+                      help='number of units processed')
+    parser.add_option('--steps', type='int', default=5,
+                      help='number of steps in the tree besides the unit step')
+    parser.add_option('--work', type='float', default=0.00002,
+                      help='seconds spent processing each unit')
+    parser.add_option('--intervals', default='0,0.5,1,5',
+                      help='comma separated progress_report_interval values to compare')
+    options, args = parser.parse_args()
+    return options
+
+
+def run(options, interval):
+    config.set('tasks', 'progress_report_interval', str(interval))
+    conduit = CountingConduit()
+    root = Step('root', status_conduit=conduit)
+    for i in range(options.steps):
+        root.add_child(Step('step-%d' % i))
+    root.insert_child(options.steps // 2, UnitStep(options.units, options.work))
+    start = time.time()
+    root.process_lifecycle()
+    return conduit, time.time() - start
+
+
+def main():
+    options = parse_args()
+    print 'processing %d units among %d steps' % (options.units, options.steps)
+    print '%-10s %10s %14s %10s' % ('interval', 'writes', 'bytes written', 'time')
+    for interval in options.intervals.split(','):
+        conduit, elapsed = run(options, float(interval))
+        print '%-10s %10d %14d %9.2fs' % (interval, conduit.writes, conduit.bytes, elapsed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
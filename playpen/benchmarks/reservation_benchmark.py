@@ -0,0 +1,132 @@
+#!/usr/bin/env python2
+"""
+Queue a backlog of fake resource-reserving tasks and time how long the resource manager takes to
+hand all of them to a pool of stub workers, first with the sleep-polling dispatch it used to do
+and then with the ReservationTable it uses now.
+
+Each stub worker is a thread that spends --task-cost milliseconds on every task it receives and
+then releases the task's reservation with the real _release_resource task. Every fake task
+reserves one of --resources resources, so tasks for the same resource queue up behind each other
+on the worker that holds it.
+"""
+
+from datetime import datetime
+from optparse import OptionParser
+import Queue
+import random
+import sys
+import threading
+import time
+import uuid
+
+from pulp.server.async import tasks
+from pulp.server.db import connection
+from pulp.server.db.model import ReservedResource, Worker
+from pulp.server.exceptions import NoWorkers
+
+
+class StubWorker(threading.Thread):
+
+    def __init__(self, name, task_cost):
+        super(StubWorker, self).__init__(name=name)
+        self.daemon = True
+        self.queue = Queue.Queue()
+        self.task_cost = task_cost / 1000.0
+        self.max_depth = 0
+        Worker(name=name, last_heartbeat=datetime.utcnow()).save()
+
+    def dispatch(self, task_id):
+        self.queue.put(task_id)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def run(self):
+        while True:
+            task_id = self.queue.get()
+            time.sleep(self.task_cost)
+            Worker.objects(name=self.name).update_one(set__last_heartbeat=datetime.utcnow())
+            tasks._release_resource(task_id)
+            self.queue.task_done()
+
+
+def parse_args():
+    parser = OptionParser()
+    parser.add_option('--db-name', default='pulp_reservation_benchmark',
+                      help='scratch database to seed; dropped at the end of the run')
+    parser.add_option('--tasks', type='int', default=2000,
+                      help='number of queued tasks')
+    parser.add_option('--resources', type='int', default=50,
+                      help='number of distinct resources the tasks reserve')
+    parser.add_option('--workers', type='int', default=8,
+                      help='number of stub workers')
+    parser.add_option('--task-cost', type='float', default=2,
+                      help='milliseconds a stub worker spends on each task')
+    options, args = parser.parse_args()
+    return options
+
+
+def legacy_reserve(task_id, resource_id):
+    # What _queue_reserved_task used to do before it could dispatch a task
+    while True:
+        try:
+            worker = tasks.get_worker_for_reservation(resource_id)
+        except NoWorkers:
+            pass
+        else:
+            break
+        try:
+            worker = tasks._get_unreserved_worker()
+        except NoWorkers:
+            pass
+        else:
+            break
+        time.sleep(0.25)
+    ReservedResource(task_id=task_id, worker_name=worker['name'], resource_id=resource_id).save()
+    return worker['name']
+
+
+def table_reserve():
+    table = tasks.ReservationTable()
+    table.start()
+    return lambda task_id, resource_id: table.reserve(task_id, [resource_id])
+
+
+def run(reserve, backlog, workers):
+    # Returns the time until the last task was dispatched and the deepest worker queue
+    start = time.time()
+    for resource_id in backlog:
+        task_id = str(uuid.uuid4())
+        workers[reserve(task_id, resource_id)].dispatch(task_id)
+    elapsed = time.time() - start
+    for worker in workers.itervalues():
+        worker.queue.join()
+    return elapsed, max(worker.max_depth for worker in workers.itervalues())
+
+
+def main():
+    options = parse_args()
+    connection.initialize(name=options.db_name)
+    database = connection.get_database()
+    try:
+        backlog = ['resource-%d' % random.randrange(options.resources)
+                   for i in xrange(options.tasks)]
+        print 'dispatching %d tasks for %d resources to %d workers' % (
+            options.tasks, options.resources, options.workers)
+        print '%-16s %10s %12s %10s' % ('dispatch', 'time', 'tasks/s', 'max depth')
+        for label, reserve in (('polling', lambda: legacy_reserve), ('table', table_reserve)):
+            ReservedResource.objects.delete()
+            Worker.objects.delete()
+            workers = {}
+            for i in xrange(options.workers):
+                worker = StubWorker('reservation-benchmark-%d@localhost' % i, options.task_cost)
+                worker.start()
+                workers[worker.name] = worker
+            elapsed, max_depth = run(reserve(), backlog, workers)
+            print '%-16s %9.2fs %12.1f %10d' % (label, elapsed, options.tasks / elapsed,
+                                                max_depth)
+    finally:
+        database.client.drop_database(options.db_name)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,14 +1,20 @@
+from collections import OrderedDict
 from gettext import gettext as _
 import logging
 import sys
+import threading
+import uuid
 
-from pymongo.errors import DuplicateKeyError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
+from pulp.common import dateutils
 from pulp.plugins.model import Unit, PublishReport
 from pulp.server.async.tasks import get_current_task_id
 from pulp.server.controllers import units as units_controller
 from pulp.server.db import model
 from pulp.server.db.model import TaskStatus
+from pulp.server.db.querysets import DUPLICATE_KEY_ERROR
 from pulp.server import exceptions as pulp_exceptions
 import pulp.plugins.conduits._common as common_utils
 import pulp.server.managers.factory as manager_factory
@@ -16,6 +22,9 @@ import pulp.server.managers.factory as manager_factory
 
 _logger = logging.getLogger(__name__)
 
+# Number of units buffered by an AddUnitMixin in batch mode before they are saved
+DEFAULT_UNIT_BATCH_SIZE = 1000
+
 
 class ImporterConduitException(Exception):
     """
@@ -413,6 +422,31 @@ class AddUnitMixin(object):
         self._added_count = 0
         self._updated_count = 0
 
+        # Units saved in batch mode that are not flushed yet
+        self._unit_batch = []
+        self._unit_batch_size = None
+        self._unit_batch_lock = threading.RLock()
+
+    def enable_batch_mode(self, batch_size=DEFAULT_UNIT_BATCH_SIZE):
+        """
+        Makes save_unit buffer the units instead of saving them right away. The
+        buffered units are saved together, with a few bulk queries for the
+        whole batch instead of several queries per unit, when batch_size units
+        are buffered and when flush_units is called. The unit count and last
+        unit added time of the repository are updated once per batch.
+
+        In batch mode, the id field of a unit is populated and the unit is
+        visible to the other calls of the conduit only once its batch is
+        flushed. Pulp flushes the units left when the importer returns from a
+        repository sync, an upload or an import of units, unless it raised an
+        exception.
+
+        @param batch_size: number of units to buffer before saving them
+        @type  batch_size: int
+        """
+        with self._unit_batch_lock:
+            self._unit_batch_size = batch_size
+
     def init_unit(self, type_id, unit_key, metadata, relative_path):
         """
         Initializes the Pulp representation of a content unit. The conduit will
@@ -477,7 +511,8 @@ class AddUnitMixin(object):
         the attributes on the passed-in unit.
 
         A reference to the provided unit is returned from this call. This call
-        will populate the unit's id field with the UUID for the unit.
+        will populate the unit's id field with the UUID for the unit, unless
+        batch mode is enabled; see enable_batch_mode.
 
         :param unit: unit object returned from the init_unit call
         :type  unit: Unit
@@ -485,6 +520,13 @@ class AddUnitMixin(object):
         :return: object reference to the provided unit, its state updated from the call
         :rtype:  Unit
         """
+        if self._unit_batch_size:
+            with self._unit_batch_lock:
+                self._unit_batch.append(unit)
+                if len(self._unit_batch) >= self._unit_batch_size:
+                    self.flush_units()
+            return unit
+
         try:
             association_manager = manager_factory.repo_unit_association_manager()
 
@@ -501,6 +543,95 @@ class AddUnitMixin(object):
             _logger.exception(_('Content unit association failed [%s]' % str(unit)))
             raise ImporterConduitException(e), None, sys.exc_info()[2]
 
+    def flush_units(self):
+        """
+        Saves and associates the units buffered in batch mode. This call has
+        no effect when no units are buffered.
+
+        For each type of unit, the units that already exist are looked up by
+        their unit keys with paged queries, then all the units are inserted or
+        updated with one unordered bulk write, and associated to the
+        repository with a bulk association. If several buffered units have the
+        same unit key, the last one saved wins, as if they were saved one at a
+        time.
+        """
+        with self._unit_batch_lock:
+            units, self._unit_batch = self._unit_batch, []
+            units_by_type = OrderedDict()
+            for unit in units:
+                units_by_type.setdefault(unit.type_id, []).append(unit)
+            try:
+                for type_id, type_units in units_by_type.iteritems():
+                    self._save_unit_batch(type_id, type_units)
+            except Exception, e:
+                _logger.exception(_('Content unit association failed for a batch of %(n)d units')
+                                  % {'n': len(units)})
+                raise ImporterConduitException(e), None, sys.exc_info()[2]
+
+    def _save_unit_batch(self, type_id, units):
+        """
+        Save or update units of a single type and associate them to the repository in bulk.
+
+        :param type_id: type of the units
+        :type  type_id: str
+        :param units:   units to save, in the order they were saved in
+        :type  units:   list of pulp.plugins.model.Unit
+        """
+        content_query_manager = manager_factory.content_query_manager()
+        association_manager = manager_factory.repo_unit_association_manager()
+
+        units_by_key = OrderedDict()
+        for unit in units:
+            units_by_key.setdefault(_hashable(unit.unit_key), []).append(unit)
+
+        key_fields = list(units[0].unit_key)
+        existing_ids = {}
+        for unit_dict in content_query_manager.get_multiple_units_by_keys_dicts(
+                type_id, [key_units[-1].unit_key for key_units in units_by_key.itervalues()],
+                model_fields=key_fields + ['_id']):
+            unit_key = dict((field, unit_dict.get(field)) for field in key_fields)
+            existing_ids[_hashable(unit_key)] = unit_dict['_id']
+
+        last_updated = dateutils.now_utc_timestamp()
+        requests = []
+        inserted = 0
+        for unit_key, key_units in units_by_key.iteritems():
+            unit_doc = common_utils.to_pulp_unit(key_units[-1])
+            unit_doc['_last_updated'] = last_updated
+            unit_id = existing_ids.get(unit_key)
+            if unit_id is None:
+                unit_id = str(uuid.uuid4())
+                unit_doc.update({'_id': unit_id, '_content_type_id': type_id})
+                requests.append(InsertOne(unit_doc))
+                inserted += 1
+            else:
+                requests.append(UpdateOne({'_id': unit_id}, {'$set': unit_doc}))
+            for unit in key_units:
+                unit.id = unit_id
+
+        collection = content_query_manager.get_content_unit_collection(type_id)
+        raced = []
+        try:
+            collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Units added by a concurrent sync since they were looked up are updated instead
+            for error in e.details['writeErrors']:
+                if error['code'] != DUPLICATE_KEY_ERROR:
+                    raise
+                raced.append(units_by_key.values()[error['index']])
+            for key_units in raced:
+                pulp_unit = common_utils.to_pulp_unit(key_units[-1])
+                unit_id = self._update_unit(key_units[-1], pulp_unit)
+                for unit in key_units:
+                    unit.id = unit_id
+            inserted -= len(raced)
+        self._added_count += inserted
+        self._updated_count += len(requests) - inserted - len(raced)
+
+        association_manager.associate_all_by_ids(self.repo_id, type_id,
+                                                 [key_units[0].id
+                                                  for key_units in units_by_key.itervalues()])
+
     def _update_unit(self, unit, pulp_unit):
         """
         Update a unit. If it is not found, add it.
@@ -625,6 +756,38 @@ class StatusMixin(object):
                 pass
             raise self.exception_class(e), None, sys.exc_info()[2]
 
+    def update_progress(self, status, changes):
+        """
+        Informs the server of the current state of the operation, like set_progress(),
+        but only writes the parts of the status that changed since it was last set.
+
+        @param status: the complete status, as it would be passed to set_progress()
+        @param changes: the parts of the status that changed, as (path, value) tuples;
+               a path is the sequence of keys and list indexes that lead to the value
+               within the status
+        @type  changes: list
+        """
+
+        if self.task_id is None:
+            # not running within a task
+            return
+
+        if self.report_id not in self.progress_report:
+            self.set_progress(status)
+            return
+
+        try:
+            self.progress_report[self.report_id] = status
+            fields = {}
+            for path, value in changes:
+                keys = ['set', 'progress_report', self.report_id] + [str(key) for key in path]
+                fields['__'.join(keys)] = value
+            TaskStatus.objects(task_id=self.task_id).update_one(**fields)
+        except Exception, e:
+            _logger.exception(
+                'Exception from server updating progress for report [%s]' % self.report_id)
+            raise self.exception_class(e), None, sys.exc_info()[2]
+
 
 class PublishReportMixin(object):
 
@@ -707,3 +870,19 @@ def do_get_repo_units(repo_id, criteria, exception_class, as_generator=False):
         _logger.exception(
             'Exception from server requesting all content units for repository [%s]' % repo_id)
         raise exception_class(e), None, sys.exc_info()[2]
+
+
+def _hashable(value):
+    """
+    Convert a unit key, or any of its values, into a value that can be used as a dictionary key.
+
+    :param value: unit key or value of a unit key field
+    :type  value: object
+    :return:      hashable value that is equal for equal unit keys
+    :rtype:       object
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((field, _hashable(v)) for field, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
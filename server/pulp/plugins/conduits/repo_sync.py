@@ -127,7 +127,8 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         server at the end of a successful sync_repo call.
 
         The added, updated, and removed unit count fields will be populated with
-        the tracking counters maintained by the conduit based on calls into it.
+        the tracking counters maintained by the conduit based on calls into it,
+        after the units buffered in batch mode are flushed.
         If these are inaccurate for a given plugin's implementation, the counts
         can be changed in the returned report before returning it to Pulp.
 
@@ -137,6 +138,7 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         @param details: potentially longer log of the sync; may be None
         @type  details: any serializable
         """
+        self.flush_units()
         r = SyncReport(True, self._added_count, self._updated_count,
                        self._removed_count, summary, details)
         return r
@@ -149,7 +151,8 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         unexpected exception bubbling up).
 
         The added, updated, and removed unit count fields will be populated with
-        the tracking counters maintained by the conduit based on calls into it.
+        the tracking counters maintained by the conduit based on calls into it,
+        after the units buffered in batch mode are flushed.
         If these are inaccurate for a given plugin's implementation, the counts
         can be changed in the returned report before returning it to Pulp. This
         data will capture how far it got before building the report and should
@@ -162,6 +165,7 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         @param details: potentially longer log of the sync; may be None
         @type  details: any serializable
         """
+        self.flush_units()
         r = SyncReport(False, self._added_count, self._updated_count,
                        self._removed_count, summary, details)
         return r
@@ -173,7 +177,8 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         will indicate the sync has been cancelled.
 
         The added, updated, and removed unit count fields will be populated with
-        the tracking counters maintained by the conduit based on calls into it.
+        the tracking counters maintained by the conduit based on calls into it,
+        after the units buffered in batch mode are flushed.
         If these are inaccurate for a given plugin's implementation, the counts
         can be changed in the returned report before returning it to Pulp. This
         data will capture how far it got before building the report and should
@@ -186,6 +191,7 @@ class RepoSyncConduit(RepoScratchPadMixin, ImporterScratchPadMixin, AddUnitMixin
         @param details: potentially longer log of the sync; may be None
         @type  details: any serializable
         """
+        self.flush_units()
         r = SyncReport(False, self._added_count, self._updated_count,
                        self._removed_count, summary, details)
         r.canceled_flag = True
@@ -5,7 +5,19 @@ from pulp.plugins.conduits.mixins import (
 
 class UploadConduit(AddUnitMixin, SingleRepoUnitsMixin, SearchUnitsMixin):
 
-    def __init__(self, repo_id, importer_id):
+    def __init__(self, repo_id, importer_id, upload_checksum=None):
         AddUnitMixin.__init__(self, repo_id, importer_id)
         SingleRepoUnitsMixin.__init__(self, repo_id, ImporterConduitException)
         SearchUnitsMixin.__init__(self, ImporterConduitException)
+        self.upload_checksum = upload_checksum
+
+    def get_upload_checksum(self):
+        """
+        Returns the checksum the server computed while the file was uploaded, which the importer
+        can use instead of reading the uploaded file to compute it.
+
+        :return: tuple of the checksum type and the hex digest of the uploaded file, or None if
+                 the server did not compute the checksum of the whole file
+        :rtype:  tuple
+        """
+        return self.upload_checksum
@@ -241,3 +241,27 @@ class Profiler(object):
         :rtype:               list of str
         """
         raise NotImplementedError()
+
+    def calculate_applicable_units_batch(self, unit_profiles, bound_repo_id, config, conduit):
+        """
+        Calculate applicability for several consumer profile sets against the same bound
+        repository. Profilers that can share work between consumers, for example by loading the
+        content of the repository only once, should override this method. The default
+        implementation calls calculate_applicable_units once per profile set.
+
+        :param unit_profiles: map of all_profiles_hash to the set of consumer unit profiles that
+                              it identifies
+        :type  unit_profiles: dict
+        :param bound_repo_id: repo id of a repository to be used to calculate applicability
+                              against the given consumer profiles
+        :type  bound_repo_id: str
+        :param config:        plugin configuration
+        :type  config:        pulp.server.plugins.config.PluginCallConfiguration
+        :param conduit:       provides access to relevant Pulp functionality
+        :type  conduit:       pulp.plugins.conduits.profile.ProfilerConduit
+        :return:              map of all_profiles_hash to the applicability calculated for it
+        :rtype:               dict
+        """
+        return dict((all_profiles_hash, self.calculate_applicable_units(
+            unit_profile, bound_repo_id, config, conduit))
+            for all_profiles_hash, unit_profile in unit_profiles.iteritems())
@@ -1,5 +1,6 @@
 from gettext import gettext as _
 from itertools import chain, imap
+from Queue import Queue
 import copy
 import hashlib
 import itertools
@@ -8,6 +9,7 @@ import os
 import shutil
 import sys
 import tarfile
+import threading
 import time
 import traceback
 import uuid
@@ -49,6 +51,66 @@ def _post_order(step):
     yield step
 
 
+def _copy_progress_report(reports):
+    """
+    Detach step reports, as built by Step.get_progress_report(), from the steps.
+
+    The reports are built anew for each call, but share the error details list and the
+    progress details of the steps, which are copied.
+
+    :param reports: The step reports
+    :type reports: list of dict
+    :returns: The same reports
+    :rtype: list of dict
+    """
+    for report in reports:
+        report[reporting_constants.PROGRESS_ERROR_DETAILS_KEY] = \
+            list(report[reporting_constants.PROGRESS_ERROR_DETAILS_KEY])
+        details = report[reporting_constants.PROGRESS_DETAILS_KEY]
+        if isinstance(details, (dict, list)):
+            report[reporting_constants.PROGRESS_DETAILS_KEY] = copy.deepcopy(details)
+        _copy_progress_report(report.get(reporting_constants.PROGRESS_SUB_STEPS_KEY, []))
+    return reports
+
+
+def _progress_changes(old, new, path=()):
+    """
+    Find the parts of a step progress report that changed.
+
+    Step reports that only differ in their sub-steps are descended into, so only the
+    reports of the steps that changed are returned.
+
+    :param old: The step reports that were last reported
+    :type old: list of dict
+    :param new: The current step reports
+    :type new: list of dict
+    :param path: The keys and indexes that lead to the reports in the progress report
+    :type path: tuple
+    :returns: The changed step reports, as (path, report) tuples, or None if the reports
+              are for different steps
+    :rtype: list
+    """
+    if len(old) != len(new):
+        return None
+    sub_steps_key = reporting_constants.PROGRESS_SUB_STEPS_KEY
+    changes = []
+    for index, (old_report, new_report) in enumerate(zip(old, new)):
+        if old_report == new_report:
+            continue
+        old_fields = dict(old_report, **{sub_steps_key: None})
+        new_fields = dict(new_report, **{sub_steps_key: None})
+        sub_changes = None
+        if old_fields == new_fields and sub_steps_key in new_report:
+            sub_changes = _progress_changes(old_report.get(sub_steps_key, []),
+                                            new_report[sub_steps_key],
+                                            path + (index, sub_steps_key))
+        if sub_changes is None:
+            changes.append((path + (index,), new_report))
+        else:
+            changes.extend(sub_changes)
+    return changes
+
+
 class Step(object):
     """
     Base class for step processing. The only tie to the platform is an assumption of
@@ -106,10 +168,15 @@ class Step(object):
         self.children = []
         self.last_report_time = 0
         self.last_reported_state = self.state
+        self.last_report = None
         self.timestamp = str(time.time())
         self.non_halting_exceptions = non_halting_exceptions or []
         self.exceptions = []
         self.disable_reporting = disable_reporting
+        self._report_interval = None
+        self._report_lock = threading.Lock()
+        self._report_timer = None
+        self._pending_report = None
 
     def add_child(self, step):
         """
@@ -233,23 +300,7 @@ class Step(object):
                 item_iterator = self.get_iterator()
                 if item_iterator is not None:
                     # We are using a generator and will call _process_block for each item
-                    for item in item_iterator:
-                        if self.canceled:
-                            break
-                        try:
-                            self._process_block(item=item)
-                        except Exception as e:
-                            raise_exception = True
-                            for exception in self.non_halting_exceptions:
-                                if isinstance(e, exception):
-                                    raise_exception = False
-                                    self._record_failure(e=e)
-                                    self.exceptions.append(e)
-                                    break
-                            if raise_exception:
-                                raise
-                        # Clean out the progress_details for the individual item
-                        self.progress_details = ""
+                    self._process_items(item_iterator)
                     if self.exceptions:
                         raise PulpCodedTaskFailedException(error_code=error_codes.PLP0032,
                                                            task_id=self.status_conduit.task_id)
@@ -291,6 +342,54 @@ class Step(object):
         """
         pass
 
+    def process_result(self, item, result):
+        """
+        Override this method to use the value returned by process_main() for an item, such as
+        adding it to a metadata file. It is always called from the thread processing the step,
+        one item at a time, even when process_main() is called concurrently.
+
+        :param item: The item that was processed
+        :type item: object
+        :param result: The value returned by process_main() for the item
+        :type result: object
+        """
+        pass
+
+    def _process_items(self, item_iterator):
+        """
+        This is part of the workflow internals that should not be overridden unless you are sure of
+        what you are doing. Process the items returned by get_iterator() one at a time.
+
+        :param item_iterator: The items to process
+        :type item_iterator: iterator
+        """
+        for item in item_iterator:
+            if self.canceled:
+                break
+            try:
+                self._process_block(item=item)
+            except Exception as e:
+                if not self._record_item_exception(e):
+                    raise
+            # Clean out the progress_details for the individual item
+            self.progress_details = ""
+
+    def _record_item_exception(self, e):
+        """
+        Record an exception raised processing an item, if it is a non halting exception.
+
+        :param e: The exception
+        :type e: Exception
+        :returns: Whether the exception was recorded; if not, processing should be halted
+        :rtype: bool
+        """
+        for exception in self.non_halting_exceptions:
+            if isinstance(e, exception):
+                self._record_failure(e=e)
+                self.exceptions.append(e)
+                return True
+        return False
+
     def _process_block(self, item=None):
         """
         This is part of the workflow internals that should not be overridden unless you are sure of
@@ -300,9 +399,10 @@ class Step(object):
         failures = self.progress_failures
         # Need to keep backwards compatibility
         if item:
-            self.process_main(item=item)
+            result = self.process_main(item=item)
         else:
-            self.process_main()
+            result = self.process_main()
+        self.process_result(item, result)
         if failures == self.progress_failures and \
                 self.progress_successes + failures < self.get_total():
             self.progress_successes += 1
@@ -327,6 +427,12 @@ class Step(object):
         """
         Bubble up that something has changed where progress should be reported.
         It is up to the parent to determine what actions should be taken.
+
+        The root step writes the progress report at most once per the tasks
+        progress_report_interval setting. Reports made sooner are coalesced into one
+        write when the interval has passed. Forced reports and state changes of any
+        step are written immediately.
+
         :param force: Whether or not a write to the database should be forced
         :type force: bool
         """
@@ -339,15 +445,54 @@ class Step(object):
             self.last_reported_state = self.state
         if self.parent:
             self.parent.report_progress(force)
-        else:
-            if force:
-                self.get_status_conduit().set_progress(self.get_progress_report())
-            else:
-                current_time = time.time()
-                if current_time != self.last_report_time:
-                    # Update at most once a second
-                    self.get_status_conduit().set_progress(self.get_progress_report())
-                    self.last_report_time = current_time
+            return
+        if self._report_interval is None:
+            self._report_interval = float(pulp_config.get('tasks', 'progress_report_interval'))
+        # The report is built here, on the thread processing the steps, as it is the only
+        # thread that changes them.
+        report = _copy_progress_report(self.get_progress_report())
+        with self._report_lock:
+            self._pending_report = report
+            if force or self.last_report_time + self._report_interval <= time.time():
+                self._write_progress()
+                return
+            if self._report_timer is None:
+                delay = self.last_report_time + self._report_interval - time.time()
+                self._report_timer = threading.Timer(delay, self._flush_progress)
+                self._report_timer.daemon = True
+                self._report_timer.start()
+
+    def _flush_progress(self):
+        """
+        Write the pending progress report of the step tree, if any.
+        This is called by the timer of a coalesced write.
+        """
+        with self._report_lock:
+            self._write_progress()
+
+    def _write_progress(self):
+        """
+        Write the pending progress report of the step tree, cancelling any pending write.
+        Only the reports of the steps that changed since the last write are written.
+        The caller must hold the report lock.
+        """
+        if self._report_timer is not None:
+            self._report_timer.cancel()
+            self._report_timer = None
+        report = self._pending_report
+        if report is None:
+            return
+        self._pending_report = None
+        changes = None
+        if self.last_report is not None:
+            changes = _progress_changes(self.last_report, report)
+        conduit = self.get_status_conduit()
+        if changes is None:
+            conduit.set_progress(report)
+        elif changes:
+            conduit.update_progress(report, changes)
+        self.last_report = report
+        self.last_report_time = time.time()
 
     def get_progress_report(self):
         """
@@ -433,8 +578,23 @@ class Step(object):
 class PluginStep(Step):
     """
     Base plugin step. It's likely you want to inherit from this and not use it directly.
+
+    Steps whose process_main() is thread safe, such as steps whose work on each item is
+    bound by I/O, can process items concurrently by setting process_concurrency above 1.
+    process_main() is then called on that many threads, while progress reporting and
+    process_result() stay on the thread processing the step. Failures, non halting
+    exceptions and cancellation are handled as when items are processed one at a time.
+
+    :ivar process_concurrency: The number of items processed at a time
+    :type process_concurrency: int
+    :ivar ordered_results: Whether process_result() is called in the order of the items
+                           rather than in the order their processing finishes
+    :type ordered_results: bool
     """
 
+    process_concurrency = 1
+    ordered_results = True
+
     def __init__(self, step_type, repo=None, conduit=None, config=None, working_dir=None,
                  plugin_type=None, **kwargs):
         """
@@ -460,6 +620,122 @@ class PluginStep(Step):
         self.conduit = conduit
         self.config = config
 
+    def _process_items(self, item_iterator):
+        """
+        This is part of the workflow internals that should not be overridden unless you are sure of
+        what you are doing. Process the items returned by get_iterator(), process_concurrency
+        items at a time.
+
+        :param item_iterator: The items to process
+        :type item_iterator: iterator
+        """
+        if self.process_concurrency <= 1:
+            return super(PluginStep, self)._process_items(item_iterator)
+
+        requests = Queue()
+        results = Queue()
+        threads = []
+        for i in range(self.process_concurrency):
+            thread = threading.Thread(target=self._process_items_thread, args=(requests, results),
+                                      name='%s-%d' % (self.step_id, i))
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        # Results that are not their turn yet, by item index, when results are ordered
+        finished = {}
+        state = {'queued': 0, 'completed': 0, 'next': 0, 'halt': None}
+
+        def collect():
+            index, item, result, exc_info = results.get()
+            if not self.ordered_results:
+                self._complete_item(item, result, exc_info, state)
+                return
+            finished[index] = (item, result, exc_info)
+            while state['next'] in finished:
+                self._complete_item(*finished.pop(state['next']) + (state,))
+                state['next'] += 1
+
+        try:
+            for item in item_iterator:
+                # Up to two items per thread are processed or waiting for their turn to complete,
+                # so the iterator is consumed as the items are processed
+                while state['queued'] - state['completed'] >= 2 * self.process_concurrency \
+                        and not (self.canceled or state['halt']):
+                    collect()
+                if self.canceled or state['halt']:
+                    break
+                requests.put((state['queued'], item))
+                state['queued'] += 1
+            while state['completed'] < state['queued']:
+                collect()
+        finally:
+            for thread in threads:
+                requests.put(None)
+            for thread in threads:
+                thread.join()
+
+        if state['halt']:
+            exc_info = state['halt']
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _process_items_thread(self, requests, results):
+        """
+        The main of the threads processing items. Calls process_main() for the queued items
+        until the end-of-queue marker (None) is read.
+
+        :param requests: The (index, item) tuples to process
+        :type requests: Queue.Queue
+        :param results: Receives an (index, item, result, exc_info) tuple for each item,
+                        exc_info being None if process_main() succeeded
+        :type results: Queue.Queue
+        """
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            index, item = request
+            try:
+                # Need to keep backwards compatibility
+                if item:
+                    result = self.process_main(item=item)
+                else:
+                    result = self.process_main()
+            except Exception:
+                results.put((index, item, None, sys.exc_info()))
+            else:
+                results.put((index, item, result, None))
+
+    def _complete_item(self, item, result, exc_info, state):
+        """
+        Account for an item processed concurrently, on the thread processing the step.
+
+        :param item: The item that was processed
+        :type item: object
+        :param result: The value returned by process_main() for the item
+        :type result: object
+        :param exc_info: The exception process_main() raised, as returned by sys.exc_info(),
+                         or None
+        :type exc_info: tuple
+        :param state: The state of _process_items()
+        :type state: dict
+        """
+        state['completed'] += 1
+        if state['halt']:
+            return
+        if exc_info is not None:
+            if not self._record_item_exception(exc_info[1]):
+                state['halt'] = exc_info
+                return
+        else:
+            self.process_result(item, result)
+        # Items that recorded failures while being processed count as failed instead
+        processed = self.progress_successes + self.progress_failures
+        if processed < state['completed'] and processed < self.get_total():
+            self.progress_successes += 1
+        self.progress_details = ""
+        self.report_progress()
+
     def get_working_dir(self):
         """
         Return the working directory. The working dir is checked first, then
@@ -1,4 +1,10 @@
+import atexit
 import logging
+import os
+import threading
+import time
+from Queue import Full, Queue
+
 from kombu import Connection, Exchange, Producer
 
 from pulp.server.config import config
@@ -6,13 +12,266 @@ from pulp.server.config import config
 DEFAULT_EXCHANGE_NAME = 'pulp.api.v2'
 _logger = logging.getLogger(__name__)
 
+# How long, in seconds, a publisher waits to connect again after the broker failed.
+RECONNECT_INTERVAL = 5
+
+# The maximum number of seconds spent publishing the queued messages when the process exits.
+EXIT_TIMEOUT = 5
+
+# The minimum number of seconds between two warnings about dropped messages.
+DROPPED_WARNING_INTERVAL = 60
+
+
+class Publisher(object):
+    """
+    Publishes messages to a broker from a background thread, so that the callers never
+    wait for the broker, even when it is unreachable.
+
+    Messages are queued in memory, up to max_queued of them, and published in order by a
+    daemon thread over a connection it keeps open. When publishing a message fails, it is
+    published again on a new connection. If that fails too, the message is dropped and the
+    thread waits RECONNECT_INTERVAL seconds before publishing the next one. Messages that
+    do not fit in the queue are dropped.
+
+    A publisher belongs to the process that created it; get a new one after a fork.
+    Subclasses implement _publish() and _close().
+
+    :ivar name: The name of the publishing thread.
+    :type name: str
+    :ivar pid:  The ID of the process the publisher belongs to.
+    :type pid:  int
+    """
+
+    def __init__(self, name, max_queued):
+        """
+        :param name:       The name of the publishing thread.
+        :type  name:       str
+        :param max_queued: The maximum number of messages waiting to be published.
+        :type  max_queued: int
+        """
+        self.name = name
+        self.pid = os.getpid()
+        self._queue = Queue(max_queued)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._published = 0
+        self._dropped = 0
+        self._last_warning = 0
+
+    def put(self, message):
+        """
+        Queue a message to be published. This never blocks.
+
+        :param message: The message, as expected by _publish().
+        :type  message: object
+        :return: True if the message was queued, False if it was dropped.
+        :rtype:  bool
+        """
+        self._start()
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except Full:
+            self._drop()
+            return False
+
+    def stats(self):
+        """
+        :return: The number of messages waiting to be published ('queued'), published
+                 ('published') and dropped ('dropped') by this publisher.
+        :rtype:  dict
+        """
+        with self._lock:
+            return {'queued': self._queue.qsize(),
+                    'published': self._published,
+                    'dropped': self._dropped}
+
+    def flush(self, timeout):
+        """
+        Wait until the queued messages have been published or dropped, or the timeout passes.
+        Messages queued by another process are not waited for, since its publishing thread
+        did not survive the fork.
+
+        :param timeout: The maximum number of seconds to wait.
+        :type  timeout: float
+        """
+        if self.pid != os.getpid():
+            return
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def stop(self, timeout):
+        """
+        Publish the queued messages for at most timeout seconds, and stop publishing.
+        This is called when the process exits.
+
+        :param timeout: The maximum number of seconds to publish for.
+        :type  timeout: float
+        """
+        self.flush(timeout)
+        self._stopping.set()
+
+    def _start(self):
+        """
+        Start the publishing thread, unless it is already running.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+        atexit.register(self.stop, EXIT_TIMEOUT)
+
+    def _run(self):
+        """
+        The publishing thread: publish the queued messages until the publisher is stopped.
+        """
+        while True:
+            message = self._queue.get()
+            try:
+                if self._stopping.is_set():
+                    return
+                self._send(message)
+            finally:
+                self._queue.task_done()
+
+    def _send(self, message):
+        """
+        Publish a message, once more on a new connection if it fails. The message is
+        dropped if that fails too.
+
+        :param message: The message.
+        :type  message: object
+        """
+        try:
+            self._publish(message)
+        except Exception:
+            # The connection may have been closed by the broker since the previous message.
+            self._close()
+            try:
+                self._publish(message)
+            except Exception:
+                _logger.debug('%s: publishing a message failed' % self.name, exc_info=True)
+                self._close()
+                self._drop()
+                self._stopping.wait(RECONNECT_INTERVAL)
+                return
+        with self._lock:
+            self._published += 1
+
+    def _drop(self):
+        """
+        Count a dropped message and warn about it, at most every DROPPED_WARNING_INTERVAL
+        seconds.
+        """
+        with self._lock:
+            self._dropped += 1
+            now = time.time()
+            if now - self._last_warning < DROPPED_WARNING_INTERVAL:
+                return
+            self._last_warning = now
+            dropped = self._dropped
+        _logger.warn('%s: %d messages dropped so far because the broker is unreachable or '
+                     'too slow' % (self.name, dropped))
+
+    def _publish(self, message):
+        """
+        Publish a message, connecting to the broker as needed.
+
+        :param message: The message.
+        :type  message: object
+        :raises Exception: if publishing failed.
+        """
+        raise NotImplementedError()
+
+    def _close(self):
+        """
+        Close the connection to the broker, if any. This must not raise.
+        """
+        raise NotImplementedError()
+
+
+class NotificationPublisher(Publisher):
+    """
+    Publishes task status messages to the DEFAULT_EXCHANGE_NAME topic exchange with kombu.
+    The exchange is declared once per connection, when the first message is published.
+    """
+
+    def __init__(self, broker_url, max_queued):
+        """
+        :param broker_url: The URL of the AMQP broker.
+        :type  broker_url: str
+        :param max_queued: The maximum number of messages waiting to be published.
+        :type  max_queued: int
+        """
+        super(NotificationPublisher, self).__init__('notification-publisher', max_queued)
+        self.broker_url = broker_url
+        self.exchange = Exchange(name=DEFAULT_EXCHANGE_NAME, type='topic')
+        self._connection = None
+        self._producer = None
+
+    def _publish(self, message):
+        """
+        Publish a message.
+
+        :param message: The payload and the routing key of the message.
+        :type  message: tuple
+        """
+        payload, routing_key = message
+        if self._producer is None:
+            self._connection = Connection(self.broker_url)
+            self._producer = Producer(self._connection)
+            self._producer.maybe_declare(self.exchange)
+        self._producer.publish(payload, exchange=self.exchange, routing_key=routing_key)
+
+    def _close(self):
+        """
+        Close the connection to the broker, if any.
+        """
+        connection = self._connection
+        self._connection = None
+        self._producer = None
+        if connection is not None:
+            try:
+                connection.release()
+            except Exception:
+                pass
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """
+    Get the task status message publisher of this process.
+
+    :return: The publisher.
+    :rtype:  NotificationPublisher
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None or _publisher.pid != os.getpid():
+            _publisher = NotificationPublisher(
+                config.get('messaging', 'event_notification_url'),
+                config.getint('messaging', 'message_buffer_size'))
+        return _publisher
+
 
 def send(document, routing_key=None):
     """
-    Attempt to send a message to the AMQP broker.
+    Queue a message to be sent to the AMQP broker.
 
-    If we cannot obtain a new connection then the message will be dropped. Note
-    that we do not block when waiting for a connection.
+    The message is sent by a background thread. If the broker cannot be reached or too many
+    messages are waiting to be sent, the message will be dropped. Note that we do not block
+    when waiting for the broker.
 
     :param document: the taskstatus Document we want to send
     :type  document: mongoengine.Document
@@ -31,11 +290,4 @@ def send(document, routing_key=None):
         _logger.warn("unable to convert document to JSON; event message not sent")
         return
 
-    broker_url = config.get('messaging', 'event_notification_url')
-
-    notification_topic = Exchange(name=DEFAULT_EXCHANGE_NAME, type='topic')
-
-    with Connection(broker_url) as connection:
-        producer = Producer(connection)
-        producer.maybe_declare(notification_topic)
-        producer.publish(payload, exchange=notification_topic, routing_key=routing_key)
+    get_publisher().put((payload, routing_key))
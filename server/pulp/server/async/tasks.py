@@ -5,6 +5,7 @@ from gettext import gettext as _
 import logging
 import os
 import signal
+import threading
 import time
 import traceback
 import uuid
@@ -17,17 +18,19 @@ from celery.app import control, defaults
 from celery.result import AsyncResult
 from mongoengine.queryset import DoesNotExist
 from mongoengine.errors import NotUniqueError
+from pymongo.cursor import CursorType
 
 from pulp.common.constants import RESOURCE_MANAGER_WORKER_NAME, SCHEDULER_WORKER_NAME
 from pulp.common import constants, dateutils, tags
 from pulp.plugins.util import misc
 
+from pulp.server.async import worker_selection
 from pulp.server.async.celery_instance import celery, RESOURCE_MANAGER_QUEUE, \
     DEDICATED_QUEUE_EXCHANGE
 from pulp.server.exceptions import PulpException, MissingResource, \
     NoWorkers, PulpCodedException, error_codes
 from pulp.server.config import config
-from pulp.server.db.model import Worker, ReservedResource, TaskStatus, \
+from pulp.server.db.model import Worker, ReservedResource, ReservationRelease, TaskStatus, \
     ResourceManagerLock, CeleryBeatLock
 from pulp.server.managers.repo import _common as common_utils
 from pulp.server.managers import factory as managers
@@ -37,6 +40,13 @@ from pulp.server.managers.schedule import utils
 controller = control.Control(app=celery)
 _logger = logging.getLogger(__name__)
 
+# Seconds a task waiting for a worker sleeps before checking again for workers that came online
+RESERVATION_WAIT_TIMEOUT = 1.0
+# Seconds the online workers are cached for by the reservation table
+ONLINE_WORKERS_TTL = 1.0
+# Seconds to wait before tailing the reservation releases again after the cursor is lost
+RELEASE_TAIL_RETRY_DELAY = 1.0
+
 
 class PulpTask(CeleryTask):
     """
@@ -131,22 +141,19 @@ def _queue_reserved_task_list(name, task_id, resource_id_list, inner_args, inner
     """
     _logger.debug('_queue_reserved_task_list for task %s and ids [%s]' %
                   (task_id, resource_id_list))
-    # Find a/the available Worker for processing our list of resources
-    worker = get_worker_for_reservation_list(resource_id_list)
-    # Reserve each resource, associating them with that Worker
-    for rid in resource_id_list:
-        _logger.debug('...saving RR for RID %s' % rid)
-        ReservedResource(task_id=task_id, worker_name=worker['name'], resource_id=rid).save()
+    # Wait for a/the available Worker for processing our list of resources, and reserve each
+    # resource, associating them with that Worker
+    worker_name = _get_reservation_table().reserve(task_id, resource_id_list)
 
     # Dispatch the Worker
-    inner_kwargs['routing_key'] = worker.name
+    inner_kwargs['routing_key'] = worker_name
     inner_kwargs['exchange'] = DEDICATED_QUEUE_EXCHANGE
     inner_kwargs['task_id'] = task_id
     try:
         celery.tasks[name].apply_async(*inner_args, **inner_kwargs)
     finally:
         # Arrange to release all held reserved-resources
-        _release_resource.apply_async((task_id, ), routing_key=worker.name,
+        _release_resource.apply_async((task_id, ), routing_key=worker_name,
                                       exchange=DEDICATED_QUEUE_EXCHANGE)
 
 
@@ -161,7 +168,7 @@ def _queue_reserved_task(name, task_id, resource_id, inner_args, inner_kwargs):
 
     The inner task is dispatched into a dedicated queue for a worker that is decided at dispatch
     time. The logic deciding which queue receives a task is controlled through the
-    find_worker function.
+    ReservationTable class.
 
     :param name:          The name of the task to be called
     :type name:           basestring
@@ -176,34 +183,16 @@ def _queue_reserved_task(name, task_id, resource_id, inner_args, inner_kwargs):
 
     :return: None
     """
-    while True:
-        try:
-            worker = get_worker_for_reservation(resource_id)
-        except NoWorkers:
-            pass
-        else:
-            break
-
-        try:
-            worker = _get_unreserved_worker()
-        except NoWorkers:
-            pass
-        else:
-            break
-
-        # No worker is ready for this work, so we need to wait
-        time.sleep(0.25)
+    worker_name = _get_reservation_table().reserve(task_id, [resource_id])
 
-    ReservedResource(task_id=task_id, worker_name=worker['name'], resource_id=resource_id).save()
-
-    inner_kwargs['routing_key'] = worker.name
+    inner_kwargs['routing_key'] = worker_name
     inner_kwargs['exchange'] = DEDICATED_QUEUE_EXCHANGE
     inner_kwargs['task_id'] = task_id
 
     try:
         celery.tasks[name].apply_async(*inner_args, **inner_kwargs)
     finally:
-        _release_resource.apply_async((task_id, ), routing_key=worker.name,
+        _release_resource.apply_async((task_id, ), routing_key=worker_name,
                                       exchange=DEDICATED_QUEUE_EXCHANGE)
 
 
@@ -245,11 +234,9 @@ def get_worker_for_reservation_list(resources):
     """
     Return the Worker instance that is associated with the reservations described by the 'resources'
     list. This will be either an existing Worker that is dealing with at least one of the specified
-    resources, or an available idle Worker. We sleep and retry the request until it can be
-    fulfilled.
+    resources, or an available idle Worker. We wait until the request can be fulfilled.
 
     :param resources:   A list of the names of the resources you wish to reserve for your task.
-
     :type resources:    list
     :returns:           The Worker instance that has a reserved_resource entry associated with it
                         for each resource in 'resources'
@@ -257,27 +244,8 @@ def get_worker_for_reservation_list(resources):
     """
 
     _logger.debug('get_worker_for_reservation_list [%s]' % resources)
-    # We leave this loop once we find a Worker to return - otherwise, sleep and try again
-    while True:
-        reservation_workers = set(
-            [reservation['worker_name'] for reservation in
-                ReservedResource.objects(resource_id__in=resources)])
-        _logger.debug('...num-RR is %d' % len(reservation_workers))
-        if len(reservation_workers) == 1:  # Exactly one worker holds any of the desired resources
-            _logger.debug('...one-holds')
-            return Worker.objects(name=list(reservation_workers)[0]).first()
-        elif len(reservation_workers) == 0:  # No worker holds any of the desired resources
-            _logger.debug('...zero-holds')
-            try:
-                worker = _get_unreserved_worker()
-                return worker
-            except NoWorkers:
-                _logger.debug('...unresolved NoWorkers - WAIT')
-                pass
-        else:
-            _logger.debug('...multiple-holds - WAIT')
-
-        time.sleep(0.25)
+    worker_name = _get_reservation_table().wait_for_worker(resources)
+    return Worker.objects(name=worker_name).first()
 
 
 def _get_unreserved_worker():
@@ -310,6 +278,230 @@ def _get_unreserved_worker():
         raise NoWorkers()
 
 
+class ReservationTable(object):
+    """
+    The reservations of the resource manager, kept in memory.
+
+    The table is loaded from the ReservedResource collection when it is started, records every
+    reservation the resource manager makes, and follows the ReservationRelease collection to
+    learn about the reservations released by the workers. Tasks that have to wait for a worker
+    wait on a condition variable that is notified whenever reservations are released, instead of
+    polling the database.
+
+    All reservations are made by the single active resource manager, so the table only has to be
+    reloaded when releases may have been missed.
+    """
+
+    def __init__(self):
+        self.pid = None
+        self._condition = threading.Condition()
+        # task_id: (worker_name, resource_ids)
+        self._tasks = {}
+        # resource_id: [worker_name, number of tasks holding the resource]
+        self._resources = {}
+        # worker_name: number of tasks reserved on the worker
+        self._workers = {}
+        self._online_workers = []
+        self._online_workers_expiry = 0
+        self._policy = worker_selection.get_policy()
+
+    def start(self):
+        """
+        Load the reservations and start following the released ones.
+        """
+        self.pid = os.getpid()
+        self.load()
+        thread = threading.Thread(target=self._follow_releases, name='reservation-releases')
+        thread.daemon = True
+        thread.start()
+
+    def load(self):
+        """
+        Replace the contents of the table with the reservations in the database.
+        """
+        with self._condition:
+            self._tasks = {}
+            self._resources = {}
+            self._workers = {}
+            tasks = {}
+            for reservation in ReservedResource.objects.all():
+                tasks.setdefault(
+                    (reservation['task_id'], reservation['worker_name']), []).append(
+                        reservation['resource_id'])
+            for (task_id, worker_name), resource_ids in tasks.iteritems():
+                self._add(task_id, worker_name, resource_ids)
+            self._condition.notify_all()
+
+    def reserve(self, task_id, resource_ids):
+        """
+        Wait for a worker that can take all of the given resources, and reserve them for the task
+        on that worker.
+
+        :param task_id:      The UUID of the task to reserve the resources for
+        :type  task_id:      basestring
+        :param resource_ids: The names of the resources to reserve
+        :type  resource_ids: list
+        :return:             The name of the worker the resources were reserved on
+        :rtype:              basestring
+        """
+        runtimes = self._get_runtimes()
+        with self._condition:
+            worker_name = self.wait_for_worker(resource_ids, runtimes)
+            for resource_id in resource_ids:
+                ReservedResource(task_id=task_id, worker_name=worker_name,
+                                 resource_id=resource_id).save()
+            self._add(task_id, worker_name, resource_ids)
+            return worker_name
+
+    def wait_for_worker(self, resource_ids, runtimes=None):
+        """
+        Wait until exactly one worker holds any of the given resources, or none of them is held
+        and the worker selection policy chooses one of the online workers.
+
+        :param resource_ids: The names of the resources to find a worker for
+        :type  resource_ids: list
+        :param runtimes:     The mean runtimes of the workers given to the worker selection
+                             policy; looked up if not specified, see _get_runtimes()
+        :type  runtimes:     dict
+        :return:             The name of the worker
+        :rtype:              basestring
+        """
+        if runtimes is None:
+            runtimes = self._get_runtimes()
+        with self._condition:
+            while True:
+                holders = set(self._resources[resource_id][0] for resource_id in resource_ids
+                              if resource_id in self._resources)
+                if len(holders) == 1:
+                    return holders.pop()
+                elif not holders:
+                    loads = dict(
+                        (name, worker_selection.WorkerLoad(self._workers.get(name, 0),
+                                                           runtimes.get(name)))
+                        for name in self._get_online_workers())
+                    worker_name = self._policy.select(loads)
+                    if worker_name:
+                        return worker_name
+                self._condition.wait(RESERVATION_WAIT_TIMEOUT)
+
+    def release(self, task_ids):
+        """
+        Remove the reservations of the given tasks and wake up the tasks waiting for a worker.
+
+        :param task_ids: The UUIDs of the tasks whose reservations were released
+        :type  task_ids: list
+        """
+        with self._condition:
+            for task_id in task_ids:
+                try:
+                    worker_name, resource_ids = self._tasks.pop(task_id)
+                except KeyError:
+                    continue
+                for resource_id in resource_ids:
+                    holder = self._resources[resource_id]
+                    holder[1] -= 1
+                    if not holder[1]:
+                        del self._resources[resource_id]
+                self._workers[worker_name] -= 1
+                if not self._workers[worker_name]:
+                    del self._workers[worker_name]
+            self._condition.notify_all()
+
+    def _get_runtimes(self):
+        """
+        Get the mean runtimes of the workers if the worker selection policy uses them.
+
+        They are queried from the database whenever their cache expired, so this is called
+        before the condition is acquired, not to block the other reservations and releases.
+
+        :return: Worker names mapped to the mean runtime of their recently finished tasks
+        :rtype:  dict
+        """
+        if self._policy.needs_runtimes:
+            return worker_selection.get_mean_runtimes()
+        return {}
+
+    def _add(self, task_id, worker_name, resource_ids):
+        """
+        Record the reservation of resources for a task on a worker.
+
+        :param task_id:      The UUID of the task
+        :type  task_id:      basestring
+        :param worker_name:  The name of the worker
+        :type  worker_name:  basestring
+        :param resource_ids: The names of the reserved resources
+        :type  resource_ids: list
+        """
+        self._tasks[task_id] = (worker_name, resource_ids)
+        for resource_id in resource_ids:
+            self._resources.setdefault(resource_id, [worker_name, 0])[1] += 1
+        self._workers[worker_name] = self._workers.get(worker_name, 0) + 1
+
+    def _get_online_workers(self):
+        """
+        :return: The names of the online workers that can be assigned work, cached for
+                 ONLINE_WORKERS_TTL seconds
+        :rtype:  list
+        """
+        now = time.time()
+        if now >= self._online_workers_expiry:
+            self._online_workers = filter(
+                _is_worker, [worker['name'] for worker in Worker.objects.get_online()])
+            self._online_workers_expiry = now + ONLINE_WORKERS_TTL
+        return self._online_workers
+
+    def _follow_releases(self):
+        """
+        Tail the ReservationRelease collection for as long as the process lives. Each time the
+        cursor is lost, the table is reloaded, because releases may have been missed meanwhile.
+        """
+        while True:
+            try:
+                self._tail_releases()
+            except Exception:
+                _logger.exception(_('Failed to follow reservation releases.'))
+            time.sleep(RELEASE_TAIL_RETRY_DELAY)
+            try:
+                self.load()
+            except Exception:
+                _logger.exception(_('Failed to reload the reservation table.'))
+
+    def _tail_releases(self):
+        """
+        Apply every release in the ReservationRelease collection, and wait for more of them until
+        the cursor is lost.
+        """
+        collection = ReservationRelease._get_collection()
+        while True:
+            cursor = collection.find(cursor_type=CursorType.TAILABLE_AWAIT)
+            released = False
+            while cursor.alive:
+                for release in cursor:
+                    released = True
+                    self.release(release['task_ids'])
+            if released:
+                return
+            # The cursor of an empty capped collection dies right away
+            time.sleep(RELEASE_TAIL_RETRY_DELAY)
+
+
+_reservation_table = None
+
+
+def _get_reservation_table():
+    """
+    :return: The reservation table of this process, started on first use
+    :rtype:  ReservationTable
+    """
+    global _reservation_table
+    # A table inherited from a parent process has no thread following the releases
+    if _reservation_table is None or _reservation_table.pid != os.getpid():
+        table = ReservationTable()
+        table.start()
+        _reservation_table = table
+    return _reservation_table
+
+
 def _delete_worker(name, normal_shutdown=False):
     """
     Delete the Worker with _id name from the database, cancel any associated tasks and reservations
@@ -339,7 +531,10 @@ def _delete_worker(name, normal_shutdown=False):
     Worker.objects(name=name).delete()
 
     # Delete all reserved_resource documents for the worker
+    task_ids = [r['task_id'] for r in ReservedResource.objects(worker_name=name).only('task_id')]
     ReservedResource.objects(worker_name=name).delete()
+    if task_ids:
+        ReservationRelease(task_ids=task_ids).save()
 
     # If the worker is a resource manager, we also need to delete the associated lock
     if name.startswith(RESOURCE_MANAGER_WORKER_NAME):
@@ -362,7 +557,7 @@ def _release_resource(task_id):
     the _queue_reserved_task task.
 
     When a resource-reserving task is complete, this method releases the resource by removing the
-    ReservedResource object by UUID.
+    ReservedResource object by UUID, and records a ReservationRelease for the resource manager.
 
     :param task_id: The UUID of the task that requested the reservation
     :type  task_id: basestring
@@ -377,6 +572,8 @@ def _release_resource(task_id):
 
         new_task.on_failure(exception, task_id, (), {}, MyEinfo)
     ReservedResource.objects(task_id=task_id).delete()
+    # Recorded after the deletion, so that a reservation table reloaded in between misses nothing
+    ReservationRelease(task_ids=[task_id]).save()
 
 
 class TaskResult(object):
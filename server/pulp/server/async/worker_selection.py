@@ -0,0 +1,228 @@
+"""
+Policies that choose the worker a reserved task is dispatched to.
+
+A task that reserves a resource already held by a worker always goes to that worker, so that
+tasks reserving the same resource never run concurrently. When none of its resources are held,
+the resource manager asks the policy configured by the 'worker_selection' setting in the [tasks]
+section of server.conf to choose among the online workers, given the load of each of them:
+
+* unreserved: any worker that holds no reservations, or wait until one does not. This is the
+  default, and how Pulp has always chosen workers.
+* least_loaded: the worker with the least work queued, estimated from its reserved tasks and the
+  mean runtime of the tasks it finished recently.
+* weighted_round_robin: take turns over all the workers, giving each a share of the tasks in
+  proportion to how fast it finished tasks recently.
+
+Every task dispatched to a worker holds its reservations until the worker has run it, so the
+number of reserved tasks of a worker is the depth of its dedicated queue, plus the task running.
+"""
+
+from collections import namedtuple
+from datetime import datetime, timedelta
+from gettext import gettext as _
+import logging
+import time
+
+from pulp.common import constants, dateutils
+from pulp.server.config import config
+from pulp.server.db.model import ReservedResource, TaskStatus
+
+
+_logger = logging.getLogger(__name__)
+
+# Tasks finished within this many seconds are used to compute the mean runtimes of the workers
+RUNTIME_WINDOW = 3600
+# At most this many recently finished tasks are used to compute the mean runtimes
+RUNTIME_SAMPLE_SIZE = 1000
+# Seconds the mean runtimes are cached for
+RUNTIME_CACHE_TTL = 60
+
+DEFAULT_POLICY = 'unreserved'
+
+# reserved_tasks: number of tasks holding reservations on the worker
+# mean_runtime: mean runtime in seconds of the tasks the worker finished recently, or None
+WorkerLoad = namedtuple('WorkerLoad', ['reserved_tasks', 'mean_runtime'])
+
+_runtimes_cache = {'expiry': 0, 'runtimes': {}}
+
+
+class WorkerSelectionPolicy(object):
+    """
+    Base class of the worker selection policies.
+
+    :ivar needs_runtimes: whether the policy uses the mean_runtime of the worker loads; it is
+                          None in the loads given to the policies that do not
+    :type needs_runtimes: bool
+    """
+
+    needs_runtimes = False
+
+    def select(self, loads):
+        """
+        Choose a worker.
+
+        :param loads: The online workers that can be assigned work, mapped to their WorkerLoad
+        :type  loads: dict
+        :return:      The name of the chosen worker, or None to wait for the loads to change
+        :rtype:       basestring
+        """
+        raise NotImplementedError()
+
+
+class UnreservedPolicy(WorkerSelectionPolicy):
+    """
+    Choose a worker that holds no reservations.
+    """
+
+    def select(self, loads):
+        idle = [name for name, load in loads.iteritems() if not load.reserved_tasks]
+        if idle:
+            return min(idle)
+
+
+class LeastLoadedPolicy(WorkerSelectionPolicy):
+    """
+    Choose the worker with the least work queued.
+
+    The work queued on a worker is estimated as its reserved tasks times the mean runtime of the
+    tasks it finished recently. Workers without recently finished tasks are assumed to be as fast
+    as the others on average.
+    """
+
+    needs_runtimes = True
+
+    def select(self, loads):
+        if not loads:
+            return None
+        default_runtime = _mean([load.mean_runtime for load in loads.itervalues()]) or 1.0
+
+        def queued_work(name):
+            load = loads[name]
+            return (load.reserved_tasks * (load.mean_runtime or default_runtime),
+                    load.reserved_tasks, name)
+
+        return min(loads, key=queued_work)
+
+
+class WeightedRoundRobinPolicy(WorkerSelectionPolicy):
+    """
+    Take turns over the workers, using the smooth weighted round robin algorithm.
+
+    The weight of a worker is the rate at which it finished tasks recently, so that it gets a
+    share of the tasks in proportion to its speed. Workers without recently finished tasks get
+    the mean weight of the others.
+    """
+
+    needs_runtimes = True
+
+    def __init__(self):
+        self._current = {}
+
+    def select(self, loads):
+        if not loads:
+            return None
+        weights = dict((name, 1.0 / load.mean_runtime) for name, load in loads.iteritems()
+                       if load.mean_runtime)
+        default_weight = _mean(weights.values()) or 1.0
+        total = 0
+        for name in loads:
+            weight = weights.get(name, default_weight)
+            self._current[name] = self._current.get(name, 0) + weight
+            total += weight
+        # Forget the workers that went offline
+        for name in set(self._current) - set(loads):
+            del self._current[name]
+        selected = max(sorted(loads), key=self._current.get)
+        self._current[selected] -= total
+        return selected
+
+
+POLICIES = {
+    'unreserved': UnreservedPolicy,
+    'least_loaded': LeastLoadedPolicy,
+    'weighted_round_robin': WeightedRoundRobinPolicy,
+}
+
+
+def get_policy_name():
+    """
+    :return: The name of the configured worker selection policy, or the default policy if the
+             configured one does not exist
+    :rtype:  basestring
+    """
+    name = config.get('tasks', 'worker_selection')
+    if name not in POLICIES:
+        msg = _('Unknown worker selection policy "%(name)s", using "%(default)s" instead.')
+        _logger.error(msg % {'name': name, 'default': DEFAULT_POLICY})
+        return DEFAULT_POLICY
+    return name
+
+
+def get_policy():
+    """
+    :return: A new instance of the configured worker selection policy
+    :rtype:  WorkerSelectionPolicy
+    """
+    return POLICIES[get_policy_name()]()
+
+
+def get_mean_runtimes():
+    """
+    Compute the mean runtime of the tasks each worker finished recently from their TaskStatus.
+    The result is cached for RUNTIME_CACHE_TTL seconds.
+
+    :return: Worker names mapped to the mean runtime in seconds of their recently finished tasks
+    :rtype:  dict
+    """
+    now = time.time()
+    if now < _runtimes_cache['expiry']:
+        return _runtimes_cache['runtimes']
+
+    since = datetime.now(dateutils.utc_tz()) - timedelta(seconds=RUNTIME_WINDOW)
+    statuses = TaskStatus.objects(
+        state=constants.CALL_FINISHED_STATE,
+        finish_time__gte=dateutils.format_iso8601_datetime(since)).only(
+            'worker_name', 'start_time', 'finish_time').order_by(
+                '-finish_time').limit(RUNTIME_SAMPLE_SIZE)
+    samples = {}
+    for status in statuses:
+        if not (status['worker_name'] and status['start_time']):
+            continue
+        runtime = (dateutils.parse_iso8601_datetime(status['finish_time']) -
+                   dateutils.parse_iso8601_datetime(status['start_time']))
+        samples.setdefault(status['worker_name'], []).append(runtime.total_seconds())
+
+    runtimes = dict((name, _mean(values)) for name, values in samples.iteritems())
+    _runtimes_cache['runtimes'] = runtimes
+    _runtimes_cache['expiry'] = now + RUNTIME_CACHE_TTL
+    return runtimes
+
+
+def get_worker_loads(worker_names):
+    """
+    Compute the load of workers from the database.
+
+    :param worker_names: The names of the workers
+    :type  worker_names: list
+    :return:             The worker names mapped to their WorkerLoad
+    :rtype:              dict
+    """
+    reserved_tasks = dict(
+        (group['_id'], group['count']) for group in ReservedResource._get_collection().aggregate(
+            [{'$match': {'worker_name': {'$in': list(worker_names)}}},
+             {'$group': {'_id': '$worker_name', 'count': {'$sum': 1}}}]))
+    runtimes = get_mean_runtimes()
+    return dict((name, WorkerLoad(reserved_tasks.get(name, 0), runtimes.get(name)))
+                for name in worker_names)
+
+
+def _mean(values):
+    """
+    :param values: numbers, of which None values are ignored
+    :type  values: list
+    :return:       The mean of the numbers, or None if there are none
+    :rtype:        float
+    """
+    values = [value for value in values if value is not None]
+    if values:
+        return sum(values) / float(len(values))
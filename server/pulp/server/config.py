@@ -104,6 +104,7 @@ _default_values = {
         'topic_exchange': 'amq.topic',
         'event_notifications_enabled': 'false',
         'event_notification_url': 'qpid://localhost:5672/',
+        'message_buffer_size': '10000',
     },
     'security': {
         'cacert': '/etc/pki/pulp/ca.crt',
@@ -122,7 +123,9 @@ _default_values = {
         'log_type': 'syslog',
         'key_url': '/pulp/gpg',
         'ks_url': '/pulp/ks',
-        'working_directory': '/var/cache/pulp'
+        'working_directory': '/var/cache/pulp',
+        'orphan_delete_concurrency': '8',
+        'upload_checksum_type': '',
     },
     'tasks': {
         'broker_url': 'qpid://localhost/',
@@ -132,6 +135,10 @@ _default_values = {
         'certfile': '/etc/pki/pulp/qpid/client.crt',
         'login_method': '',
         'worker_timeout': '30',
+        'worker_selection': 'unreserved',
+        'progress_report_interval': '1',
+        'watch_timeout': '30',
+        'max_watchers': '5',
     },
     'lazy': {
         'redirect_host': '',
@@ -139,7 +146,9 @@ _default_values = {
         'redirect_path': '/streamer/',
         'https_retrieval': 'true',
         'download_interval': '30',
-        'download_concurrency': '5'
+        'download_concurrency': '5',
+        'redirect_url_cache_period': '0',
+        'download_shards': '1'
     },
     'profiling': {
         'enabled': 'false',
@@ -2,6 +2,8 @@ from gettext import gettext as _
 import logging
 import mimetypes
 import os
+import threading
+import time
 
 from django.http import \
     HttpResponse, HttpResponseRedirect, HttpResponseForbidden, Http404
@@ -17,6 +19,14 @@ logger = logging.getLogger(__name__)
 
 SAFE_STORAGE_SUBDIRS = ('published', 'content', 'static')
 
+# Seconds a signed redirect URL stays valid once it is no longer handed out,
+# the same as the default expiration of URL.sign()
+SIGNATURE_LIFETIME = 90
+# Signed redirect URLs cached for the current period, see ContentView.sign()
+SIGNED_URL_CACHE_SIZE = 10000
+_signed_urls = {'period': None, 'urls': {}}
+_signed_urls_lock = threading.Lock()
+
 # xsendfile doesn't use Content-Encoding, so create a mimetypes instance that has no encodings
 # to ensure it only ever returns Content-Type guesses without the Content-Encoding component
 mimetypes_noencoding = mimetypes.MimeTypes()
@@ -124,13 +134,54 @@ class ContentView(View):
             path,
             query)
 
-        url = URL(redirect)
-        signed = url.sign(key, remote_ip=remote_ip)
-        return HttpResponseRedirect(str(signed))
+        signed = ContentView.sign(redirect, key, remote_ip)
+        return HttpResponseRedirect(signed)
+
+    @staticmethod
+    def sign(redirect, key, remote_ip):
+        """
+        Sign a redirect URL.
+
+        When the redirect_url_cache_period lazy setting is set, the URLs signed
+        during each period of that many seconds are cached and handed out again
+        to the same client for the rest of the period. They all expire
+        SIGNATURE_LIFETIME seconds after the end of the period.
+
+        :param redirect: The unsigned redirect URL.
+        :type redirect: str
+        :param key: A private RSA key.
+        :type key: RSA.RSA
+        :param remote_ip: The IP address of the client the URL is signed for.
+        :type remote_ip: str
+        :return: The signed URL.
+        :rtype: str
+        """
+        cache_period = int(pulp_conf.get('lazy', 'redirect_url_cache_period'))
+        if cache_period <= 0:
+            return str(URL(redirect).sign(key, remote_ip=remote_ip))
+
+        now = time.time()
+        period = int(now // cache_period)
+        cache_key = (redirect, remote_ip, key)
+        with _signed_urls_lock:
+            if _signed_urls['period'] != period or \
+                    len(_signed_urls['urls']) >= SIGNED_URL_CACHE_SIZE:
+                _signed_urls['period'] = period
+                _signed_urls['urls'] = {}
+            signed = _signed_urls['urls'].get(cache_key)
+        if signed is not None:
+            return signed
+
+        expiration = (period + 1) * cache_period + SIGNATURE_LIFETIME - now
+        signed = str(URL(redirect).sign(key, expiration, remote_ip=remote_ip))
+        with _signed_urls_lock:
+            if _signed_urls['period'] == period:
+                _signed_urls['urls'][cache_key] = signed
+        return signed
 
     def __init__(self, **kwargs):
         super(ContentView, self).__init__(**kwargs)
-        self.key = Key.load(pulp_conf.get('authentication', 'rsa_key'))
+        self.key = Key.load_cached(pulp_conf.get('authentication', 'rsa_key'))
         # Make sure all requested paths fall under these sub-directories, otherwise
         # we might find ourselves serving private keys to all and sundry.
         local_storage = pulp_conf.get('server', 'storage_dir')
@@ -1,5 +1,6 @@
 from gettext import gettext as _
-from itertools import chain, izip_longest
+from collections import defaultdict
+from itertools import izip_longest
 import copy
 import logging
 import os
@@ -12,6 +13,8 @@ import uuid
 from bson.objectid import ObjectId, InvalidId
 import celery
 from mongoengine import NotUniqueError, OperationError, ValidationError, DoesNotExist
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from nectar.config import DownloaderConfig
 from nectar.request import DownloadRequest
 from nectar.downloaders.threaded import HTTPThreadedDownloader
@@ -41,6 +44,7 @@ from pulp.server.controllers import importer as importer_controller
 from pulp.server.db import connection, model
 from pulp.server.db.model.repository import (
     RepoContentUnit, RepoSyncResult, RepoPublishResult)
+from pulp.server.db.querysets import DUPLICATE_KEY_ERROR
 from pulp.server.exceptions import PulpCodedTaskException
 from pulp.server.lazy import URL, Key
 from pulp.server.managers import factory as manager_factory
@@ -57,6 +61,11 @@ TYPE_ID = 'type_id'
 UNIT_FILES = 'unit_files'
 REQUEST = 'request'
 
+# The number of units whose download requests are built at a time.
+DOWNLOAD_PAGE_SIZE = 1000
+# The most shards a lazy download is split into; shards are ranges of 2-digit ID prefixes.
+MAX_DOWNLOAD_SHARDS = 256
+
 
 def get_associated_unit_ids(repo_id, unit_type, repo_content_unit_q=None):
     """
@@ -260,19 +269,21 @@ def find_repo_content_units(
                 yield_count += 1
 
 
-def find_units_not_downloaded(repo_id):
+def find_units_not_downloaded(repo_id, id_range=None):
     """
     Find content units that have not been fully downloaded.
 
-    :param repo_id: ID of the repo whose units should be retrieved.
-    :type  repo_id: str
+    :param repo_id:  ID of the repo whose units should be retrieved.
+    :type  repo_id:  str
+    :param id_range: The (first, last) range of unit IDs to retrieve, or None for all.
+    :type  id_range: tuple
 
-    :return: The requested units.
+    :return: The requested units, read a page at a time; see _iterate_by_id().
     :rtype:  generator
     """
     query_sets = get_mongoengine_unit_querysets(repo_id, file_units=True)
-    query_sets = [q(downloaded=False) for q in query_sets]
-    return chain(*query_sets)
+    query_sets = [q(downloaded=False, **_id_range_filter(id_range)) for q in query_sets]
+    return _iterate_by_id(query_sets)
 
 
 def missing_unit_count(repo_id):
@@ -338,16 +349,76 @@ def associate_single_unit(repository, unit):
     :param unit: The unit to associate to the repository.
     :type unit: pulp.server.db.model.ContentUnit
     """
-    current_timestamp = dateutils.now_utc_timestamp()
-    formatted_datetime = dateutils.format_iso8601_utc_timestamp(current_timestamp)
-    qs = model.RepositoryContentUnit.objects(
-        repo_id=repository.repo_id,
-        unit_id=unit.id,
-        unit_type_id=unit._content_type_id)
-    qs.update_one(
-        set_on_insert__created=formatted_datetime,
-        set__updated=formatted_datetime,
-        upsert=True)
+    associate_units_by_id(repository.repo_id, unit._content_type_id, [unit.id],
+                          update_repo_metadata=False)
+
+
+def associate_units_by_id(repo_id, unit_type_id, unit_ids, update_repo_metadata=True):
+    """
+    Associate units of a single type to a repository in bulk.
+
+    The unit IDs are handled in pages. Each page is written with a single unordered bulk
+    write of upserts, which create the missing associations and refresh the updated
+    timestamp of the existing ones, so a single unit costs a single round trip.
+
+    :param repo_id: identifies the repository to update
+    :type  repo_id: str
+    :param unit_type_id: identifies the type of the units
+    :type  unit_type_id: str
+    :param unit_ids: IDs of the units to associate; duplicates are associated once
+    :type  unit_ids: iterable of str
+    :param update_repo_metadata: if True, the content unit counts and the last unit added
+                                 timestamp of the repository are updated once all the units are
+                                 associated
+    :type  update_repo_metadata: bool
+    :return: number of units that were not associated to the repository before
+    :rtype:  int
+    """
+    formatted_datetime = dateutils.format_iso8601_utc_timestamp(dateutils.now_utc_timestamp())
+    collection = model.RepositoryContentUnit._get_collection()
+    added = 0
+    for page in paginate(unit_ids):
+        operations = [_association_upsert(repo_id, unit_type_id, unit_id, formatted_datetime)
+                      for unit_id in sorted(set(page))]
+        try:
+            added += collection.bulk_write(operations, ordered=False).upserted_count
+        except BulkWriteError as e:
+            # Two tasks may upsert the same association at the same time, in which case one of
+            # the upserts fails on the unique index. Those upserts are retried once, when they
+            # update the association the other task created. Anything else is a real failure.
+            errors = e.details['writeErrors']
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            added += e.details['nUpserted']
+            collection.bulk_write([operations[error['index']] for error in errors],
+                                  ordered=False)
+
+    if update_repo_metadata and added:
+        update_unit_count(repo_id, unit_type_id, added)
+        update_last_unit_added(repo_id)
+    return added
+
+
+def _association_upsert(repo_id, unit_type_id, unit_id, formatted_datetime):
+    """
+    Build a bulk write operation that associates a unit to a repository.
+
+    :param repo_id: identifies the repository
+    :type  repo_id: str
+    :param unit_type_id: identifies the type of the unit
+    :type  unit_type_id: str
+    :param unit_id: identifies the unit
+    :type  unit_id: str
+    :param formatted_datetime: ISO8601 timestamp of the association
+    :type  formatted_datetime: str
+    :return: upsert operation for the repo_content_units collection
+    :rtype:  pymongo.operations.UpdateOne
+    """
+    query = {'repo_id': repo_id, 'unit_type_id': unit_type_id, 'unit_id': unit_id}
+    update = {'$set': {'updated': formatted_datetime},
+              '$setOnInsert': {'created': formatted_datetime,
+                               '_ns': model.RepositoryContentUnit._ns.default}}
+    return UpdateOne(query, update, upsert=True)
 
 
 def disassociate_units(repository, unit_iterable):
@@ -368,11 +439,26 @@ def disassociate_units(repository, unit_iterable):
             repo_id=repository.repo_id, unit_id__in=unit_id_list)
         # queryset delete returns the number of records deleted
         units_removed += qs.delete()
+        _add_orphan_candidates((unit.type_id, unit.id) for unit in unit_group)
 
     if units_removed:
         update_last_unit_removed(repository.repo_id)
 
 
+def _add_orphan_candidates(unit_ids):
+    """
+    Record units that lost a repository association as orphan candidates.
+
+    :param unit_ids: (unit type id, unit id) tuples of the disassociated units
+    :type  unit_ids: iterable of tuple
+    """
+    unit_ids_by_type = {}
+    for unit_type_id, unit_id in unit_ids:
+        unit_ids_by_type.setdefault(unit_type_id, []).append(unit_id)
+    for unit_type_id, unit_id_list in unit_ids_by_type.items():
+        model.OrphanCandidate.objects.add(unit_type_id, unit_id_list)
+
+
 def create_repo(repo_id, display_name=None, description=None, notes=None, importer_type_id=None,
                 importer_repo_plugin_config=None, distributor_list=None):
     """
@@ -557,6 +643,10 @@ def delete(repo_id):
         model.Importer.objects(repo_id=repo_id).delete()
         RepoSyncResult.get_collection().remove({'repo_id': repo_id})
         RepoPublishResult.get_collection().remove({'repo_id': repo_id})
+        associations = RepoContentUnit.get_collection().find(
+            {'repo_id': repo_id}, projection=['unit_type_id', 'unit_id'])
+        for page in paginate(associations):
+            _add_orphan_candidates((a['unit_type_id'], a['unit_id']) for a in page)
         RepoContentUnit.get_collection().remove({'repo_id': repo_id})
     except Exception, e:
         msg = _('Error updating one or more database collections while removing repo [%(r)s]')
@@ -806,6 +896,8 @@ def sync(repo_id, sync_config_override=None, scheduled_call_id=None):
         # which will set up cancel_sync_repo() as the target for the signal handler
         sync_repo = register_sigterm_handler(importer.sync_repo, importer.cancel_sync_repo)
         sync_report = sync_repo(transfer_repo, conduit, call_config)
+        # Save the units the importer left buffered in batch mode
+        conduit.flush_units()
 
     except Exception, e:
         sync_end_timestamp = _now_timestamp()
@@ -1437,12 +1529,28 @@ def queue_download_repo(repo_id, verify_all_units=False):
 
 
 @celery.task(base=Task)
-def download_deferred():
+def download_deferred(id_range=None):
     """
     Downloads all the units with entries in the DeferredDownload collection.
+
+    When more than one download shard is configured, the units are split into that
+    many ranges of IDs and a task is queued to download each range instead.
+
+    :param id_range: The (first, last) range of unit IDs to download. None downloads
+                     all units, possibly by queuing shard tasks.
+    :type  id_range: tuple
+
+    :return: A TaskResult listing the shard tasks, if any were queued.
+    :rtype:  pulp.server.async.tasks.TaskResult
     """
+    if id_range is None:
+        task_tags = [tags.action_tag(tags.ACTION_DEFERRED_DOWNLOADS_TYPE)]
+        spawned_tasks = _queue_download_shards(download_deferred, [], {}, task_tags)
+        if spawned_tasks:
+            return TaskResult(spawned_tasks=spawned_tasks)
+
     task_description = _('Download Cached On-Demand Content')
-    deferred_content_units = _get_deferred_content_units()
+    deferred_content_units = _get_deferred_content_units(id_range)
     download_requests = _create_download_requests(deferred_content_units)
     download_step = LazyUnitDownloadStep(
         _('on_demand_download'),
@@ -1453,12 +1561,15 @@ def download_deferred():
 
 
 @celery.task(base=Task)
-def download_repo(repo_id, verify_all_units=False):
+def download_repo(repo_id, verify_all_units=False, id_range=None):
     """
     Download all content units in the repository that have catalog entries associated
     with them. If a unit is encountered that does not have any catalog entries, it is
     skipped.
 
+    When more than one download shard is configured, the units are split into that
+    many ranges of IDs and a task is queued to download each range instead.
+
     :param repo_id:          The ID of the repository to download all lazy units for.
     :type  repo_id:          str
     :param verify_all_units: When verify_all_units is `True`, all units in the
@@ -1466,13 +1577,30 @@ def download_repo(repo_id, verify_all_units=False):
                              already present in its expected storage location and its
                              checksum is valid, it will not be downloaded again.
     :type  verify_all_units: bool
+    :param id_range:         The (first, last) range of unit IDs to download. None
+                             downloads all units, possibly by queuing shard tasks.
+    :type  id_range:         tuple
+
+    :return: A TaskResult listing the shard tasks, if any were queued.
+    :rtype:  pulp.server.async.tasks.TaskResult
     """
+    if id_range is None:
+        task_tags = [
+            tags.resource_tag(tags.RESOURCE_REPOSITORY_TYPE, repo_id),
+            tags.action_tag(tags.ACTION_DOWNLOAD_TYPE)
+        ]
+        spawned_tasks = _queue_download_shards(
+            download_repo, [repo_id], {'verify_all_units': verify_all_units}, task_tags)
+        if spawned_tasks:
+            return TaskResult(spawned_tasks=spawned_tasks)
+
     task_description = _('Download Repository Content')
     if verify_all_units:
-        repo_unit_querysets = get_mongoengine_unit_querysets(repo_id)
-        missing_content_units = chain(*repo_unit_querysets)
+        id_filter = _id_range_filter(id_range)
+        repo_unit_querysets = [q(**id_filter) for q in get_mongoengine_unit_querysets(repo_id)]
+        missing_content_units = _iterate_by_id(repo_unit_querysets)
     else:
-        missing_content_units = find_units_not_downloaded(repo_id)
+        missing_content_units = find_units_not_downloaded(repo_id, id_range)
 
     download_requests = _create_download_requests(missing_content_units)
     download_step = LazyUnitDownloadStep(
@@ -1483,84 +1611,246 @@ def download_repo(repo_id, verify_all_units=False):
     download_step.start()
 
 
-def _get_deferred_content_units():
+def _queue_download_shards(task, args, kwargs, task_tags):
+    """
+    Queue a download task for each range of unit IDs, when more than one download
+    shard is configured.
+
+    :param task:      The download task to queue.
+    :type  task:      celery.app.task.Task
+    :param args:      The positional arguments of the task.
+    :type  args:      list
+    :param kwargs:    The keyword arguments of the task, without the ID range.
+    :type  kwargs:    dict
+    :param task_tags: The tags of the queued tasks.
+    :type  task_tags: list
+
+    :return: The IDs of the queued tasks; empty when the download is not sharded.
+    :rtype:  list of str
     """
-    Retrieve a list of units that have been added to the DeferredDownload collection.
+    shards = min(int(pulp_conf.get('lazy', 'download_shards')), MAX_DOWNLOAD_SHARDS)
+    if shards <= 1:
+        return []
+    spawned_tasks = []
+    for id_range in _id_ranges(shards):
+        shard_kwargs = dict(kwargs, id_range=id_range)
+        spawned_tasks.append(task.apply_async(args, shard_kwargs, tags=task_tags).task_id)
+    return spawned_tasks
+
+
+def _id_ranges(count):
+    """
+    Split the unit ID space into ranges holding about the same number of units.
+    Unit IDs are random UUIDs, so ranges of ID prefixes of the same width do.
+
+    :param count: The number of ranges, up to MAX_DOWNLOAD_SHARDS.
+    :type  count: int
+
+    :return: The (first, last) ranges, covering every ID. A range includes the IDs
+             from first, inclusive, to last, exclusive; None is no bound.
+    :rtype:  list of tuple
+    """
+    bounds = ['%02x' % (MAX_DOWNLOAD_SHARDS * i // count) for i in range(1, count)]
+    bounds = [None] + bounds + [None]
+    return zip(bounds[:-1], bounds[1:])
+
+
+def _id_range_filter(id_range, field='id'):
+    """
+    Build the query filter that matches the IDs in a range.
+
+    :param id_range: The (first, last) range of IDs, as returned by _id_ranges(), or None.
+    :type  id_range: tuple
+    :param field:    The name of the ID field.
+    :type  field:    str
+
+    :return: Keyword arguments for a mongoengine query.
+    :rtype:  dict
+    """
+    query = {}
+    if id_range is not None:
+        first, last = id_range
+        if first is not None:
+            query[field + '__gte'] = first
+        if last is not None:
+            query[field + '__lt'] = last
+    return query
+
+
+def _paginate_by_id(query_set):
+    """
+    Read the documents of a query set DOWNLOAD_PAGE_SIZE at a time, in the order of
+    their IDs.
+
+    Each page is read by a new query, resuming after the last ID of the previous
+    page, and no cursor is left open while the caller processes a page. The
+    downloads of a page can take longer than the database keeps an idle cursor
+    open, and a single cursor would be closed by the time the next page is read.
+
+    :param query_set: The documents to read.
+    :type  query_set: mongoengine.queryset.QuerySet
+
+    :return: A generator of pages of up to DOWNLOAD_PAGE_SIZE documents.
+    :rtype:  generator of list
+    """
+    page_query_set = query_set
+    while True:
+        page = list(page_query_set.order_by('id').limit(DOWNLOAD_PAGE_SIZE))
+        if page:
+            yield page
+        if len(page) < DOWNLOAD_PAGE_SIZE:
+            return
+        page_query_set = query_set.filter(id__gt=page[-1].id)
+
+
+def _iterate_by_id(query_sets):
+    """
+    Read the documents of query sets a page at a time; see _paginate_by_id().
+
+    :param query_sets: The query sets to read, one after the other.
+    :type  query_sets: iterable of mongoengine.queryset.QuerySet
+
+    :return: A generator of documents.
+    :rtype:  generator
+    """
+    for query_set in query_sets:
+        for page in _paginate_by_id(query_set):
+            for document in page:
+                yield document
+
+
+def _get_deferred_content_units(id_range=None):
+    """
+    Retrieve the units that have been added to the DeferredDownload collection.
+
+    The entries are read a page at a time, see _paginate_by_id(), and the units of
+    each page are loaded with one query per unit type.
+
+    :param id_range: The (first, last) range of unit IDs to retrieve, or None for all.
+    :type  id_range: tuple
 
     :return: A generator of content units that correspond to DeferredDownload entries.
     :rtype:  generator of pulp.server.db.model.FileContentUnit
     """
-    for deferred_download in model.DeferredDownload.objects.filter():
-        try:
-            unit_model = plugin_api.get_unit_model_by_id(deferred_download.unit_type_id)
+    query_set = model.DeferredDownload.objects.filter(**_id_range_filter(id_range, 'unit_id'))
+    for page in _paginate_by_id(query_set):
+        unit_ids = defaultdict(set)
+        for deferred_download in page:
+            unit_ids[deferred_download.unit_type_id].add(deferred_download.unit_id)
+        for unit_type_id, type_unit_ids in unit_ids.iteritems():
+            unit_model = plugin_api.get_unit_model_by_id(unit_type_id)
             if unit_model is None:
                 _logger.error(_('Unable to find the model object for the {type} type.').format(
-                    type=deferred_download.unit_type_id))
-            else:
-                unit = unit_model.objects.filter(id=deferred_download.unit_id).get()
+                    type=unit_type_id))
+                continue
+            # Read all the units before yielding any, so no cursor is left open.
+            for unit in list(unit_model.objects.filter(id__in=list(type_unit_ids))):
+                type_unit_ids.discard(unit.id)
                 yield unit
-        except DoesNotExist:
-            # This is normal if the content unit in question has been purged during an
-            # orphan cleanup.
-            _logger.debug(_('Unable to find the {type}:{id} content unit.').format(
-                type=deferred_download.unit_type_id, id=deferred_download.unit_id))
+            for unit_id in type_unit_ids:
+                # This is normal if the content unit in question has been purged during an
+                # orphan cleanup.
+                _logger.debug(_('Unable to find the {type}:{id} content unit.').format(
+                    type=unit_type_id, id=unit_id))
 
 
 def _create_download_requests(content_units):
     """
-    Make a list of Nectar DownloadRequests for the given content units using
+    Generate Nectar DownloadRequests for the given content units using
     the lazy catalog.
 
-    :param content_units: The content units to build a list of DownloadRequests for.
-    :type  content_units: list of pulp.server.db.model.FileContentUnit
+    The units are processed DOWNLOAD_PAGE_SIZE at a time and the catalog entries
+    of each page are loaded with one query, so only a page of units is held in
+    memory as the downloader consumes the requests.
+
+    :param content_units: The content units to build DownloadRequests for.
+    :type  content_units: iterable of pulp.server.db.model.FileContentUnit
 
-    :return: A list of DownloadRequests; each request includes a ``data``
+    :return: A generator of DownloadRequests; each request includes a ``data``
              instance variable which is a dict containing the FileContentUnit,
              the list of files in the unit, and the downloaded file's storage
              path.
-    :rtype:  list of nectar.request.DownloadRequest
+    :rtype:  generator of nectar.request.DownloadRequest
     """
-    requests = []
+    # Resolved now, in the task, rather than by the thread consuming the requests.
     working_dir = common_utils.get_working_directory()
     signing_key = Key.load(pulp_conf.get('authentication', 'rsa_key'))
+    return _generate_download_requests(content_units, working_dir, signing_key)
+
+
+def _generate_download_requests(content_units, working_dir, signing_key):
+    """
+    Generate the DownloadRequests of _create_download_requests().
+
+    :param content_units: The content units to build DownloadRequests for.
+    :type  content_units: iterable of pulp.server.db.model.FileContentUnit
+    :param working_dir:   The directory the files are downloaded to.
+    :type  working_dir:   str
+    :param signing_key:   The server private RSA key to sign the streamer URLs with.
+    :type  signing_key:   M2Crypto.RSA.RSA
+
+    :return: A generator of DownloadRequests.
+    :rtype:  generator of nectar.request.DownloadRequest
+    """
+    for page in paginate(content_units, DOWNLOAD_PAGE_SIZE):
+        catalog = _get_catalog_entries(page)
+        for content_unit in page:
+            # All files in the unit; every request for a unit has a reference to this dict.
+            # It is complete before any of the requests is handed to the downloader.
+            unit_files = {}
+            unit_requests = []
+            unit_working_dir = os.path.join(working_dir, content_unit.id)
+            for file_path in content_unit.list_files():
+                catalog_entry = catalog.get((content_unit.type_id, content_unit.id, file_path))
+                if catalog_entry is None:
+                    continue
+                signed_url = _get_streamer_url(catalog_entry, signing_key)
 
-    for content_unit in content_units:
-        # All files in the unit; every request for a unit has a reference to this dict.
-        unit_files = {}
-        unit_working_dir = os.path.join(working_dir, content_unit.id)
-        for file_path in content_unit.list_files():
-            qs = model.LazyCatalogEntry.objects.filter(
-                unit_id=content_unit.id,
-                unit_type_id=content_unit.type_id,
-                path=file_path
-            )
-            catalog_entry = qs.order_by('revision').first()
-            if catalog_entry is None:
-                continue
-            signed_url = _get_streamer_url(catalog_entry, signing_key)
-
-            temporary_destination = os.path.join(
-                unit_working_dir,
-                os.path.basename(catalog_entry.path)
-            )
-            mkdir(unit_working_dir)
-            unit_files[temporary_destination] = {
-                CATALOG_ENTRY: catalog_entry,
-                PATH_DOWNLOADED: None,
-            }
-
-            request = DownloadRequest(signed_url, temporary_destination)
-            # For memory reasons, only hold onto the id and type_id so we can reload the unit
-            # once it's successfully downloaded.
-            request.data = {
-                TYPE_ID: content_unit.type_id,
-                UNIT_ID: content_unit.id,
-                UNIT_FILES: unit_files,
-                REQUEST: request
-            }
-            requests.append(request)
-
-    return requests
+                temporary_destination = os.path.join(
+                    unit_working_dir,
+                    os.path.basename(catalog_entry.path)
+                )
+                mkdir(unit_working_dir)
+                unit_files[temporary_destination] = {
+                    CATALOG_ENTRY: catalog_entry,
+                    PATH_DOWNLOADED: None,
+                }
+
+                request = DownloadRequest(signed_url, temporary_destination)
+                # For memory reasons, only hold onto the id and type_id so we can reload the
+                # unit once it's successfully downloaded.
+                request.data = {
+                    TYPE_ID: content_unit.type_id,
+                    UNIT_ID: content_unit.id,
+                    UNIT_FILES: unit_files,
+                    REQUEST: request
+                }
+                unit_requests.append(request)
+            for request in unit_requests:
+                yield request
+
+
+def _get_catalog_entries(content_units):
+    """
+    Load the catalog entries of the files in the given content units with one query.
+
+    :param content_units: The content units.
+    :type  content_units: iterable of pulp.server.db.model.FileContentUnit
+
+    :return: The catalog entry with the lowest revision for each file, keyed by
+             (unit_type_id, unit_id, path).
+    :rtype:  dict
+    """
+    catalog = {}
+    qs = model.LazyCatalogEntry.objects.filter(
+        unit_id__in=[content_unit.id for content_unit in content_units],
+        unit_type_id__in=list(set(content_unit.type_id for content_unit in content_units))
+    )
+    # Lower revisions come last and replace the higher ones.
+    for catalog_entry in qs.order_by('-revision'):
+        key = (catalog_entry.unit_type_id, catalog_entry.unit_id, catalog_entry.path)
+        catalog[key] = catalog_entry
+    return catalog
 
 
 def _get_streamer_url(catalog_entry, signing_key):
@@ -1598,7 +1888,7 @@ class LazyUnitDownloadStep(DownloadEventListener):
     to download from the Pulp Streamer components.
 
     :ivar download_requests: The download requests the step will process.
-    :type download_requests: list of nectar.request.DownloadRequest
+    :type download_requests: iterable of nectar.request.DownloadRequest
     :ivar download_config:   The keyword args used to initialize the Nectar
                              downloader configuration.
     :type download_config:   dict
@@ -1610,11 +1900,19 @@ class LazyUnitDownloadStep(DownloadEventListener):
         """
         Initializes a Step that downloads all the download requests provided.
 
-        :param download_requests:   List of download requests to process.
-        :type  download_requests:   list of nectar.request.DownloadRequest
+        :param download_requests:   The download requests to process. When they are not
+                                    a list, they are counted as the downloader consumes them.
+        :type  download_requests:   iterable of nectar.request.DownloadRequest
         """
         self.description = step_description
-        self.download_requests = download_requests
+        if isinstance(download_requests, list):
+            self.download_requests = download_requests
+            self.total_units = len(download_requests)
+            self.all_queued = True
+        else:
+            self.download_requests = self._count_requests(download_requests)
+            self.total_units = 0
+            self.all_queued = False
         self.download_config = {
             MAX_CONCURRENT: int(pulp_conf.get('lazy', 'download_concurrency')),
             HEADERS: {PULP_STREAM_REQUEST_HEADER: 'true'},
@@ -1633,7 +1931,6 @@ class LazyUnitDownloadStep(DownloadEventListener):
         self.progress_successes = 0
         self.progress_failures = 0
         self.error_details = []
-        self.total_units = len(download_requests)
         self.last_report_time = 0
         self.last_reported_state = self.state
         self.timestamp = str(time.time())
@@ -1646,6 +1943,22 @@ class LazyUnitDownloadStep(DownloadEventListener):
         self.state = reporting_constants.STATE_RUNNING
         self.report()
         self.downloader.download(self.download_requests)
+        self.report()
+
+    def _count_requests(self, download_requests):
+        """
+        Count the download requests as they are handed to the downloader.
+
+        :param download_requests: The download requests.
+        :type  download_requests: iterable of nectar.request.DownloadRequest
+
+        :return: A generator of the download requests.
+        :rtype:  generator of nectar.request.DownloadRequest
+        """
+        for request in download_requests:
+            self.total_units += 1
+            yield request
+        self.all_queued = True
 
     def report(self):
         """
@@ -1654,7 +1967,7 @@ class LazyUnitDownloadStep(DownloadEventListener):
         progress reporting system when that has been implemented.
         """
         total_processed = self.progress_successes + self.progress_failures
-        if self.total_units == total_processed:
+        if self.all_queued and self.total_units == total_processed:
             self.state = reporting_constants.STATE_COMPLETE
 
         if self.progress_failures > 0:
@@ -13,6 +13,7 @@ import traceback
 from pulp.common import constants
 from pulp.plugins.loader.api import load_content_types
 from pulp.plugins.loader.manager import PluginManager
+from pulp.plugins.types import database as types_db
 from pulp.server import logs
 from pulp.server.db import connection
 from pulp.server.db.migrate import models
@@ -21,6 +22,7 @@ from pulp.server.db.migrations.lib import managers
 from pulp.server.db.fields import UTCDateTimeField
 from pulp.server.managers import factory, status
 from pulp.server.managers.auth.role.cud import RoleManager, SUPER_USER_ROLE
+from pulp.server.managers.content.orphan import OrphanManager
 
 from pymongo.errors import ServerSelectionTimeoutError
 
@@ -55,6 +57,11 @@ def parse_args():
     parser.add_option('--dry-run', action='store_true', dest='dry_run', default=False,
                       help=_('Perform a dry run with no changes made. Returns 1 if there are '
                              'migrations to apply.'))
+    parser.add_option('--verify-orphan-index', action='store_true', dest='verify_orphan_index',
+                      default=False,
+                      help=_('Check the orphan candidates against the repository associations '
+                             'instead of migrating, and record any missing orphans. Returns %d '
+                             'if any were missing.') % os.EX_DATAERR)
     options, args = parser.parse_args()
     if args:
         parser.error(_('Unknown arguments: %s') % ', '.join(args))
@@ -205,12 +212,15 @@ def ensure_database_indexes():
     model.RepositoryContentUnit.ensure_indexes()
     model.Repository.ensure_indexes()
     model.ReservedResource.ensure_indexes()
+    model.ReservationRelease.ensure_indexes()
     model.TaskStatus.ensure_indexes()
     model.Worker.ensure_indexes()
     model.CeleryBeatLock.ensure_indexes()
     model.ResourceManagerLock.ensure_indexes()
     model.LazyCatalogEntry.ensure_indexes()
     model.DeferredDownload.ensure_indexes()
+    model.OrphanCandidate.ensure_indexes()
+    model.OrphanScanWatermark.ensure_indexes()
     model.Distributor.ensure_indexes()
     model.User.ensure_indexes()
 
@@ -246,6 +256,8 @@ def main():
         options = parse_args()
         _start_logging()
         connection.initialize(max_timeout=1)
+        if options.verify_orphan_index:
+            return _verify_orphan_index()
         active_workers = None
 
         if not options.dry_run:
@@ -354,6 +366,32 @@ def _auto_manage_db(options):
     return os.EX_OK
 
 
+def _verify_orphan_index():
+    """
+    Check the orphan candidates of every content type against the repository associations. Any
+    orphan the orphan manager would miss is logged and recorded as a candidate.
+
+    :return: os.EX_OK if no orphans were missing, os.EX_DATAERR otherwise
+    :rtype:  int
+    """
+    type_ids = set(types_db.all_type_ids())
+    type_ids.update(PluginManager().unit_models.keys())
+
+    total_missing = 0
+    for type_id in sorted(type_ids):
+        missing = OrphanManager.verify_orphan_index(type_id)
+        if missing:
+            message = _('%(n)d orphaned units of type %(t)s were missing from the orphan index '
+                        'and have been added to it.')
+            _logger.warning(message % {'n': len(missing), 't': type_id})
+        total_missing += len(missing)
+
+    if total_missing:
+        return os.EX_DATAERR
+    _logger.info(_('The orphan index is consistent with the repository associations.'))
+    return os.EX_OK
+
+
 def _start_logging():
     """
     Call into Pulp to get the logging started, and set up the _logger to be used in this module.
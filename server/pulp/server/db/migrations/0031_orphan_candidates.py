@@ -0,0 +1,51 @@
+import time
+
+from pymongo import UpdateOne
+
+from pulp.plugins.util.misc import paginate
+from pulp.server.db import connection
+from pulp.server.db.migrations.lib import utils
+
+
+# Must match ORPHAN_INDEX_CLOCK_SKEW in pulp.server.managers.content.orphan
+CLOCK_SKEW = 300
+
+
+def migrate(*args, **kwargs):
+    """
+    Backfill the orphan candidates with every unit that is not associated with a repository, and
+    record the time of the backfill as the orphan scan watermark of each content type.
+
+    :param args:   unused
+    :type  args:   list
+    :param kwargs: unused
+    :type  kwargs: dict
+    """
+    db = connection.get_database()
+    associations = db['repo_content_units']
+    candidates = db['orphan_candidates']
+    watermarks = db['orphan_scan_watermarks']
+
+    # list_collections(filter=) isn't introduced until 3.6, alas
+    for collname in db.collection_names():
+        if not collname.startswith('units_'):
+            continue
+        type_id = collname[len('units_'):]
+        cutoff = int(time.time()) - CLOCK_SKEW
+        units = db[collname].find({}, projection=['_id']).batch_size(1000)
+
+        with utils.MigrationProgressLog(type_id, db[collname].count()) as migration_log:
+            for page in paginate(units):
+                id_list = [unit['_id'] for unit in page]
+                associated = set(associations.distinct('unit_id', {'unit_id': {'$in': id_list}}))
+                requests = [UpdateOne({'unit_type_id': type_id, 'unit_id': unit_id},
+                                      {'$set': {'updated': cutoff}},
+                                      upsert=True)
+                            for unit_id in id_list if unit_id not in associated]
+                if requests:
+                    candidates.bulk_write(requests, ordered=False)
+                migration_log.progress(migrated_units=len(page))
+
+        watermarks.update_one({'content_type_id': type_id},
+                              {'$set': {'watermark': cutoff}},
+                              upsert=True)
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import time
+
+from pymongo import UpdateOne
+
+from pulp.plugins.util.misc import paginate
+from pulp.server.db import connection
+from pulp.server.db.migrations.lib import utils
+
+
+def migrate(*args, **kwargs):
+    """
+    Move the applicability data out of repo_profile_applicability documents into the content
+    addressed applicability_results collection, and reference it from each document by digest.
+
+    :param args:   unused
+    :type  args:   list
+    :param kwargs: unused
+    :type  kwargs: dict
+    """
+    db = connection.get_database()
+    rpa_collection = db['repo_profile_applicability']
+    results_collection = db['applicability_results']
+
+    query = {'applicability': {'$exists': True}}
+    # applicability data can be large, so keep the batches small
+    applicabilities = rpa_collection.find(query, projection=['applicability']).batch_size(100)
+
+    with utils.MigrationProgressLog('Applicability', rpa_collection.find(query).count()) as \
+            migration_log:
+        for page in paginate(applicabilities, 100):
+            now = int(time.time())
+            results = {}
+            requests = []
+            for applicability in page:
+                digest = _calculate_digest(applicability['applicability'])
+                results[digest] = applicability['applicability']
+                requests.append(UpdateOne({'_id': applicability['_id']},
+                                          {'$set': {'applicability_digest': digest},
+                                           '$unset': {'applicability': ''}}))
+            # Results are written first, so that no document references a missing result
+            results_collection.bulk_write(
+                [UpdateOne({'_id': result_digest},
+                           {'$set': {'updated': now}, '$setOnInsert': {'applicability': result}},
+                           upsert=True)
+                 for result_digest, result in results.iteritems()], ordered=False)
+            rpa_collection.bulk_write(requests, ordered=False)
+            migration_log.progress(migrated_units=len(page))
+
+
+def _calculate_digest(applicability):
+    """
+    Must match ApplicabilityResult.calculate_digest in pulp.server.db.model.consumer
+
+    :param applicability: A dictionary mapping content_type_ids to lists of applicable Unit IDs.
+    :type  applicability: dict
+    :return:              Hash of the applicability data
+    :rtype:               basestring
+    """
+    serialized_applicability = json.dumps(applicability, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(serialized_applicability).hexdigest()
@@ -28,8 +28,8 @@ from pulp.server.compat import digestmod
 from pulp.server.db.fields import ISO8601StringField, UTCDateTimeField
 from pulp.server.db.model.reaper_base import ReaperMixin
 from pulp.server.db.model import base
-from pulp.server.db.querysets import (CriteriaQuerySet, RepoQuerySet, RepositoryContentUnitQuerySet,
-                                      WorkerQuerySet)
+from pulp.server.db.querysets import (CriteriaQuerySet, OrphanCandidateQuerySet, RepoQuerySet,
+                                      RepositoryContentUnitQuerySet, WorkerQuerySet)
 from pulp.server.managers import factory
 from pulp.server.util import Singleton
 from pulp.server.webservices.views import serializers
@@ -397,6 +397,27 @@ class ReservedResource(AutoRetryDocument):
             'allow_inheritance': False}
 
 
+class ReservationRelease(AutoRetryDocument):
+    """
+    Instances of this class record that the reservations of some tasks have been released.
+
+    Reservations are released by the workers that ran the tasks, not by the resource manager
+    that made them, so the resource manager tails this capped collection to learn about releases
+    as they happen. Events only name tasks, whose IDs are never reused, so replaying any of them
+    is harmless.
+
+    :ivar task_ids: The uuids of the tasks whose reservations were released
+    :type task_ids: mongoengine.ListField
+    """
+
+    task_ids = ListField(StringField())
+
+    meta = {'collection': 'reservation_releases',
+            'max_documents': 10000,
+            'max_size': 1024 * 1024,
+            'allow_inheritance': False}
+
+
 class Worker(AutoRetryDocument):
     """
     Represents a worker.
@@ -517,7 +538,8 @@ class TaskStatus(AutoRetryDocument, ReaperMixin):
     _ns = StringField(default='task_status')
 
     meta = {'collection': 'task_status',
-            'indexes': ['-tags', '-state', {'fields': ['-task_id'], 'unique': True}, '-group_id'],
+            'indexes': ['-tags', '-state', {'fields': ['-task_id'], 'unique': True}, '-group_id',
+                        '-finish_time'],
             'allow_inheritance': False,
             'queryset_class': CriteriaQuerySet}
 
@@ -1144,6 +1166,54 @@ class LazyCatalogEntry(AutoRetryDocument):
         qs = LazyCatalogEntry.objects.filter(revision__in=revisions, **query)
         qs.delete()
 
+    @classmethod
+    def save_revisions(cls, entries, batch_size=1000):
+        """
+        Add many entries, each with the next revision number of its path.
+        Previous revisions are deleted.
+
+        This has the effect of calling save_revision on each entry, but the entries are
+        written in batches. For each importer in a batch, one aggregate query finds the
+        latest revision of the paths in the batch, and all the entries are inserted with the
+        next revision at once, after which the previous revisions of all the paths are
+        removed with a single ranged delete. When several entries of an importer have the
+        same path, only the last one is kept.
+
+        :param entries:    The entries to add, which may be a generator so that catalogs do not
+                           have to fit in memory.
+        :type  entries:    iterable of LazyCatalogEntry
+        :param batch_size: The number of entries written at once.
+        :type  batch_size: int
+        :return:           The number of entries added.
+        :rtype:            int
+        """
+        added = 0
+        collection = cls._get_collection()
+        for batch in misc.paginate(entries, batch_size):
+            entries_by_importer = {}
+            for entry in batch:
+                entry.validate()
+                entries_by_importer.setdefault(entry.importer_id, {})[entry.path] = entry
+            for importer_id, entries_by_path in entries_by_importer.iteritems():
+                paths = entries_by_path.keys()
+                latest = list(collection.aggregate([
+                    {'$match': {'importer_id': importer_id, 'path': {'$in': paths}}},
+                    {'$group': {'_id': None, 'revision': {'$max': '$revision'}}}]))
+                # One revision newer than all the paths of the batch keeps every path's
+                # revisions increasing, and lets a single query delete the previous ones.
+                revision = (latest[0]['revision'] if latest else 0) + 1
+                documents = []
+                for entry in entries_by_path.itervalues():
+                    entry.revision = revision
+                    documents.append(entry.to_mongo())
+                collection.insert_many(documents, ordered=False)
+                for entry, document in zip(entries_by_path.itervalues(), documents):
+                    entry.id = document['_id']
+                collection.delete_many({'importer_id': importer_id, 'path': {'$in': paths},
+                                        'revision': {'$lt': revision}})
+                added += len(documents)
+        return added
+
 
 class DeferredDownload(AutoRetryDocument):
     """
@@ -1172,6 +1242,70 @@ class DeferredDownload(AutoRetryDocument):
     _ns = StringField(default='deferred_download')
 
 
+class OrphanCandidate(AutoRetryDocument):
+    """
+    A content unit that may have become an orphan.
+
+    An entry is recorded whenever a unit loses a repository association. Together with the units
+    updated since the last orphan scan of a content type, these entries are the only units the
+    orphan manager needs to examine. Entries for units that turn out to still be associated, or
+    that no longer exist, are pruned by the orphan manager.
+
+    :ivar unit_id: The associated content unit ID.
+    :type unit_id: str
+    :ivar unit_type_id: The associated content unit type.
+    :type unit_type_id: str
+    :ivar updated: last time the unit was recorded as a candidate (seconds since the epoch)
+    :type updated: int
+    :ivar _ns: (Deprecated), Contains the name of the collection this model represents
+    :type _ns: mongoengine.StringField
+    """
+    meta = {
+        'collection': 'orphan_candidates',
+        'allow_inheritance': False,
+        'indexes': [
+            {
+                'fields': ['unit_type_id', 'unit_id'],
+                'unique': True
+            }
+        ],
+        'queryset_class': OrphanCandidateQuerySet
+    }
+
+    unit_id = StringField(required=True)
+    unit_type_id = StringField(required=True)
+    updated = IntField(required=True)
+
+    # For backward compatibility
+    _ns = StringField(default='orphan_candidates')
+
+
+class OrphanScanWatermark(AutoRetryDocument):
+    """
+    Records how far the orphan candidates of a content type are up to date.
+
+    Every unit of the content type whose `_last_updated` timestamp is older than the watermark,
+    and which is an orphan, is recorded as an OrphanCandidate.
+
+    :ivar content_type_id: The content unit type.
+    :type content_type_id: str
+    :ivar watermark: start time of the last complete orphan scan (seconds since the epoch)
+    :type watermark: int
+    :ivar _ns: (Deprecated), Contains the name of the collection this model represents
+    :type _ns: mongoengine.StringField
+    """
+    meta = {
+        'collection': 'orphan_scan_watermarks',
+        'allow_inheritance': False,
+    }
+
+    content_type_id = StringField(required=True, unique=True)
+    watermark = IntField(required=True, default=0)
+
+    # For backward compatibility
+    _ns = StringField(default='orphan_scan_watermarks')
+
+
 class User(AutoRetryDocument):
     """
     :ivar login: user's login name, must be unique for each user
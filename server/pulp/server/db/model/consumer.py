@@ -14,6 +14,9 @@
 import datetime
 import hashlib
 import json
+import time
+
+from pymongo import UpdateOne
 
 from pulp.server.db.model.base import Model
 from pulp.server.db.model.reaper_base import ReaperMixin
@@ -165,6 +168,73 @@ class Bind(Model):
         self.deleted = False
 
 
+class ApplicabilityResult(Model):
+    """
+    This class models a Mongo collection of applicability data addressed by its content. Many
+    consumer profile sets share the same applicability against a repository, so
+    RepoProfileApplicability documents only store the digest of their applicability data, and the
+    data itself is stored once in this collection, using the digest as the _id.
+
+    The updated field is the time, in seconds since the epoch, when a RepoProfileApplicability
+    document last referenced the result. It protects results that are being written from being
+    removed as orphans.
+    """
+    collection_name = 'applicability_results'
+
+    unique_indices = ()
+    search_indices = (
+        ('updated',),
+    )
+
+    @staticmethod
+    def calculate_digest(applicability):
+        """
+        Return the digest that addresses the given applicability data.
+
+        :param applicability: A dictionary mapping content_type_ids to lists of applicable Unit IDs.
+        :type  applicability: dict
+        :return:              Hash of the applicability data
+        :rtype:               basestring
+        """
+        # Don't use any whitespace in the json separators, and sort dictionary keys to be repeatable
+        serialized_applicability = json.dumps(applicability, separators=(',', ':'), sort_keys=True)
+        hasher = hashlib.sha256(serialized_applicability)
+        return hasher.hexdigest()
+
+    @classmethod
+    def upsert(cls, applicability, digest=None):
+        """
+        Build a bulk write operation that stores the given applicability data, unless a result
+        with the same digest is already stored, and marks the result as used now.
+
+        :param applicability: A dictionary mapping content_type_ids to lists of applicable Unit IDs.
+        :type  applicability: dict
+        :param digest:        The digest of applicability, calculated when not given
+        :type  digest:        basestring
+        :return:              upsert operation for the applicability_results collection
+        :rtype:               pymongo.operations.UpdateOne
+        """
+        if digest is None:
+            digest = cls.calculate_digest(applicability)
+        return UpdateOne({'_id': digest},
+                         {'$set': {'updated': int(time.time())},
+                          '$setOnInsert': {'applicability': applicability}},
+                         upsert=True)
+
+    @classmethod
+    def get_results(cls, digests):
+        """
+        Load the applicability data for the given digests with a single query.
+
+        :param digests: digests of the applicability data to load
+        :type  digests: iterable
+        :return:        map of digest to applicability data. Missing digests are left out.
+        :rtype:         dict
+        """
+        results = cls.get_collection().find({'_id': {'$in': list(set(digests))}})
+        return dict((result['_id'], result['applicability']) for result in results)
+
+
 class RepoProfileApplicability(Model):
     """
     This class models a Mongo collection that is used to store pre-calculated applicability results
@@ -172,7 +242,8 @@ class RepoProfileApplicability(Model):
     all_profiles_hash, each individual profile is identified by profile_hash and can be found in
     the consumer_unit_profiles collection.
     The applicability data is a dictionary structure that represents the applicable units for
-    the given set of profiles and repository.
+    the given set of profiles and repository. It is stored once in the ApplicabilityResult
+    collection, and the documents in this collection reference it by applicability_digest.
 
     The RepoProfileApplicabilityManager can be accessed through the classlevel "objects" attribute.
     """
@@ -183,10 +254,11 @@ class RepoProfileApplicability(Model):
     )
     search_indices = (
         ('repo_id',),
+        ('applicability_digest',),
     )
 
-    def __init__(self, profile_hash, repo_id, profile, applicability, _id=None,
-                 all_profiles_hash=None, **kwargs):
+    def __init__(self, profile_hash, repo_id, profile, applicability=None, _id=None,
+                 all_profiles_hash=None, applicability_digest=None, **kwargs):
         """
         Construct a RepoProfileApplicability object.
 
@@ -204,6 +276,9 @@ class RepoProfileApplicability(Model):
         :param all_profiles_hash: The hash of the set of the profiles that this applicability
                                   data is for
         :type  all_profiles_hash: basestring
+        :param applicability_digest: The digest of the applicability data, as stored in the
+                                     database
+        :type  applicability_digest: basestring
         :param kwargs:        unused, but collected to allow instantiation from Mongo query results
         :type  kwargs:        dict
         """
@@ -215,6 +290,7 @@ class RepoProfileApplicability(Model):
         self.applicability = applicability
         self._id = _id
         self.all_profiles_hash = all_profiles_hash
+        self.applicability_digest = applicability_digest
 
         # The superclass puts an unnecessary (and confusingly named) id attribute on this model.
         # Let's remove it.
@@ -229,12 +305,18 @@ class RepoProfileApplicability(Model):
     def save(self):
         """
         Save any changes made to this RepoProfileApplicability model to the database. If it doesn't
-        exist in the database already, insert a new record to represent it.
+        exist in the database already, insert a new record to represent it. The applicability data
+        is stored in the ApplicabilityResult collection, unless it is already there.
         """
+        self.applicability_digest = ApplicabilityResult.calculate_digest(self.applicability)
+        ApplicabilityResult.get_collection().bulk_write(
+            [ApplicabilityResult.upsert(self.applicability, self.applicability_digest)])
+
         # If this object's _id attribute is not None, then it represents an existing DB object.
         # Else, we need to create an object with this object's attributes
         new_document = {'profile_hash': self.profile_hash, 'repo_id': self.repo_id,
-                        'profile': self.profile, 'applicability': self.applicability,
+                        'profile': self.profile,
+                        'applicability_digest': self.applicability_digest,
                         'all_profiles_hash': self.all_profiles_hash}
         if self._id is not None:
             self.get_collection().update({'_id': self._id}, new_document)
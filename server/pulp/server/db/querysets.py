@@ -1,16 +1,23 @@
 from datetime import datetime, timedelta
 from gettext import gettext as _
 import operator
+import time
 
 from mongoengine import Q
 from mongoengine.queryset import DoesNotExist, QuerySetNoCache
-from pymongo import ASCENDING
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from pulp.common.dateutils import ensure_tz
+from pulp.plugins.util.misc import paginate
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.constants import PULP_PROCESS_TIMEOUT_INTERVAL
 
 
+# error code reported by mongo when a write violates a unique index
+DUPLICATE_KEY_ERROR = 11000
+
+
 class QuerySetPreventCache(QuerySetNoCache):
     """
     All custom QuerySet classes should inherit from this class rather than QuerySet
@@ -228,3 +235,52 @@ class RepositoryContentUnitQuerySet(CriteriaQuerySet):
         :rtype:  int
         """
         return self._num_between("updated", start, end, repo_id)
+
+
+class OrphanCandidateQuerySet(QuerySetPreventCache):
+    """
+    Custom queryset for orphan candidates.
+    """
+
+    def add(self, unit_type_id, unit_ids):
+        """
+        Record the given content units as orphan candidates.
+
+        Units that are already recorded have their `updated` timestamp refreshed, so that a scan
+        that started before this call does not prune them.
+
+        :param unit_type_id: content type of the units
+        :type  unit_type_id: basestring
+        :param unit_ids: ids of the content units that may have become orphans
+        :type  unit_ids: iterable of basestring
+        """
+        now = int(time.time())
+        collection = self._document._get_collection()
+        for page in paginate(unit_ids):
+            requests = [UpdateOne({'unit_type_id': unit_type_id, 'unit_id': unit_id},
+                                  {'$set': {'updated': now}}, upsert=True)
+                        for unit_id in page]
+            try:
+                collection.bulk_write(requests, ordered=False)
+            except BulkWriteError, e:
+                # concurrent upserts of the same unit may collide on the unique index, in which
+                # case the unit has been recorded anyway
+                errors = e.details.get('writeErrors', [])
+                if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                    raise
+
+    def prune(self, unit_type_id, unit_ids, before):
+        """
+        Remove the given content units from the orphan candidates.
+
+        Only entries recorded before the given time are removed, so a unit that loses an
+        association while a scan is running stays a candidate.
+
+        :param unit_type_id: content type of the units
+        :type  unit_type_id: basestring
+        :param unit_ids: ids of the content units that are known not to be orphans
+        :type  unit_ids: list of basestring
+        :param before: seconds since the epoch; only entries updated before this are removed
+        :type  before: int
+        """
+        self(unit_type_id=unit_type_id, unit_id__in=unit_ids, updated__lt=before).delete()
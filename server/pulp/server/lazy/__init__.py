@@ -1,2 +1,2 @@
 from pulp.server.lazy.alias import AliasTable  # noqa
-from pulp.server.lazy.url import Key, SignedURL, URL  # noqa
+from pulp.server.lazy.url import Key, PolicyCache, SignedURL, URL  # noqa
@@ -18,8 +18,11 @@ zDFYRlosVNTom5YiKprVkJEAo3cbTOMoZss_NS-vpzauuk-qXwqj05gI7fJVsVD915gGcY0xPUbpCbVT
 """
 
 from base64 import urlsafe_b64encode, urlsafe_b64decode
+from collections import OrderedDict
 from gettext import gettext as _
 from hashlib import sha256
+import os
+from threading import Lock
 from time import time
 from urllib import quote, unquote
 from urlparse import ParseResult, urlparse, urlunparse
@@ -269,7 +272,7 @@ class Policy(object):
         return policy
 
     @staticmethod
-    def validate(key, encoded, signature):
+    def validate(key, encoded, signature, cache=None):
         """
         Decode and validate a policy.
 
@@ -279,11 +282,18 @@ class Policy(object):
         :type encoded: str
         :param signature: A base64 encoded RSA signature.
         :type signature: str
+        :param cache: An optional cache of verified policies that is looked
+            up before, and updated after, the signature is verified.
+        :type cache: PolicyCache
         :return: The validated and decoded policy.
         :rtype: Policy
         :raise NotValid: if the signature and policy digest cannot be
             validated using the public key. Or, that the policy has expired.
         """
+        if cache is not None:
+            policy = cache.get(key, encoded, signature)
+            if policy is not None:
+                return policy
         try:
             digest = Policy.digest(encoded)
             if not key.verify(digest, Base64.decode(signature)):
@@ -291,9 +301,11 @@ class Policy(object):
             policy = Policy.decode(encoded)
             if policy.expiration <= time():
                 raise PolicyExpired()
-            return policy
         except RSA.RSAError:
             raise PolicyNotAuthenticated()
+        if cache is not None:
+            cache.add(key, encoded, signature, policy)
+        return policy
 
     def __init__(self, resource, expiration):
         """
@@ -341,6 +353,89 @@ class Policy(object):
         return str(self.__dict__)
 
 
+class PolicyCache(object):
+    """
+    A bounded LRU cache of verified policies.
+    Policies are cached by (key, encoded-policy, signature) once the signature
+    has been verified and are dropped when they expire, so a cached policy can
+    be trusted without verifying its signature again.
+
+    :ivar size: The maximum number of cached policies.
+    :type size: int
+    :ivar hits: The number of lookups that found a valid policy.
+    :type hits: int
+    :ivar misses: The number of lookups that did not.
+    :type misses: int
+    """
+
+    def __init__(self, size=10000):
+        """
+        :param size: The maximum number of cached policies.
+        :type size: int
+        """
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._policies = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def hit_ratio(self):
+        """
+        :return: The fraction of the lookups that found a valid policy.
+        :rtype: float
+        """
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def get(self, key, encoded, signature):
+        """
+        Get a verified policy.
+
+        :param key: The public RSA key the signature was verified with.
+        :type key: RSA.RSA
+        :param encoded: A base64 encoded json policy.
+        :type encoded: str
+        :param signature: A base64 encoded RSA signature.
+        :type signature: str
+        :return: The decoded policy, or None when not cached or expired.
+        :rtype: Policy
+        """
+        cache_key = (key, encoded, signature)
+        with self._lock:
+            policy = self._policies.pop(cache_key, None)
+            if policy is None or policy.expiration <= time():
+                self.misses += 1
+                return None
+            self._policies[cache_key] = policy
+            self.hits += 1
+            return policy
+
+    def add(self, key, encoded, signature, policy):
+        """
+        Add a verified policy, evicting the least recently used one when full.
+
+        :param key: The public RSA key the signature was verified with.
+        :type key: RSA.RSA
+        :param encoded: A base64 encoded json policy.
+        :type encoded: str
+        :param signature: A base64 encoded RSA signature.
+        :type signature: str
+        :param policy: The decoded policy.
+        :type policy: Policy
+        """
+        with self._lock:
+            self._policies.pop((key, encoded, signature), None)
+            self._policies[(key, encoded, signature)] = policy
+            while len(self._policies) > self.size:
+                self._policies.popitem(last=False)
+
+    def __len__(self):
+        return len(self._policies)
+
+
 class Query(object):
     """
     URL query.
@@ -388,6 +483,10 @@ class Key(object):
     Provides RSA key management.
     """
 
+    # Keys loaded by load_cached(), by path, as tuples of: (mtime, key)
+    _cache = {}
+    _cache_lock = Lock()
+
     @staticmethod
     def load(path=None, pem=None):
         """
@@ -410,6 +509,28 @@ class Key(object):
             key = RSA.load_pub_key_bio(bfr)
         return key
 
+    @staticmethod
+    def load_cached(path):
+        """
+        Get an RSA key at the specified path.
+        The parsed key is kept for the life of the process and only loaded
+        again once the modification time of the file changes.
+
+        :param path: An absolute path to a PEM encoded key.
+        :type path: str
+        :return: The loaded key.
+        :rtype: RSA.RSA
+        """
+        mtime = os.stat(path).st_mtime
+        with Key._cache_lock:
+            cached = Key._cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        key = Key.load(path=path)
+        with Key._cache_lock:
+            Key._cache[path] = (mtime, key)
+        return key
+
 
 class URL(object):
     """
@@ -569,7 +690,7 @@ class SignedURL(URL):
         except KeyError:
             raise NotSigned()
 
-    def validate(self, key, **extensions):
+    def validate(self, key, cache=None, **extensions):
         """
         Validate the URL *content* using the RSA signature and the
         public key specified by *key*.  The policy is validated.
@@ -579,6 +700,8 @@ class SignedURL(URL):
 
         :param key: A public RSA key.
         :type key: RSA.RSA
+        :param cache: An optional cache of verified policies.
+        :type cache: PolicyCache
         :param extensions: Optional policy extensions.
         :type extensions: dict
         :return: The resource specified in the policy.
@@ -587,7 +710,7 @@ class SignedURL(URL):
             validated using the public key. Or, that the policy has expired.
         """
         policy, signature = self.bundle
-        policy = Policy.validate(key, policy, signature)
+        policy = Policy.validate(key, policy, signature, cache)
         if self.resource != policy.resource:
             raise ResourceNotMatched()
         for k, v in policy.extensions.items():
@@ -4,6 +4,7 @@ Contains content applicability management classes
 import hashlib
 import itertools
 import json
+import time
 
 from gettext import gettext as _
 from logging import getLogger
@@ -11,22 +12,36 @@ from uuid import uuid4
 
 from celery import task
 from mongoengine import errors as mongo_errors
-from pymongo.errors import DuplicateKeyError
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from pulp.plugins.conduits.profiler import ProfilerConduit
 from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.loader import api as plugin_api, exceptions as plugin_exceptions
 from pulp.plugins.profiler import Profiler
+from pulp.plugins.util import misc as plugin_misc
 from pulp.server.async.tasks import Task
 from pulp.server.db import model, connection
-from pulp.server.db.model.consumer import Bind, RepoProfileApplicability, UnitProfile
+from pulp.server.db.model.consumer import (ApplicabilityResult, Bind, RepoProfileApplicability,
+                                           UnitProfile)
 from pulp.server.db.model.criteria import Criteria
+from pulp.server.db.querysets import DUPLICATE_KEY_ERROR
 from pulp.server.managers import factory as managers
 from pulp.server.managers.consumer.query import ConsumerQueryManager
 
 
 _logger = getLogger(__name__)
 
+# Number of (repo_id, all_profiles_hash) pairs regenerated together. Every batch loads its
+# repositories and unit profiles once and makes one profiler call per repository.
+REGENERATION_BATCH_SIZE = 100
+
+# Seconds an applicability result is kept after it was last used, even if nothing references it
+APPLICABILITY_RESULT_GRACE = 3600
+
+# Default number of consumers reported on by one page of the paginated applicability query
+APPLICABILITY_PAGE_SIZE = 1000
+
 
 class ApplicabilityRegenerationManager(object):
     @staticmethod
@@ -63,6 +78,8 @@ class ApplicabilityRegenerationManager(object):
 
         # Iterate through each unique all_profiles_hash and regenerate applicability,
         # if it doesn't exist.
+        # list of tuples (repo_id, all_profiles_hash, profiles)
+        profiles_to_process = []
         for repo_id in repo_consumer_map:
             seen_hashes = set()
             for consumer_id in repo_consumer_map[repo_id]:
@@ -77,8 +94,10 @@ class ApplicabilityRegenerationManager(object):
                         continue
                     # If applicability does not exist, generate applicability data for given
                     # profiles and repo id.
-                    ApplicabilityRegenerationManager.regenerate_applicability(all_profiles_hash,
-                                                                              profiles, repo_id)
+                    profiles_to_process.append((repo_id, all_profiles_hash, profiles))
+
+        for batch in plugin_misc.paginate(profiles_to_process, REGENERATION_BATCH_SIZE):
+            ApplicabilityRegenerationManager.batch_regenerate_applicability(batch)
 
     @staticmethod
     def regenerate_applicability_for_repos(repo_criteria):
@@ -100,6 +119,8 @@ class ApplicabilityRegenerationManager(object):
         consumer_profile_map = ApplicabilityRegenerationManager._get_consumer_profile_map(
             consumer_ids)
 
+        # list of tuples (repo_id, all_profiles_hash, profiles)
+        profiles_to_process = []
         for repo_id in repo_consumer_map:
             seen_hashes = set()
             for consumer_id in repo_consumer_map[repo_id]:
@@ -109,10 +130,11 @@ class ApplicabilityRegenerationManager(object):
                         continue
                     seen_hashes.add(all_profiles_hash)
                     profiles = consumer_profile_map[consumer_id]['profiles']
+                    profiles_to_process.append((repo_id, all_profiles_hash, profiles))
 
-                    # Regenerate applicability data for a given all_profiles_hash and repo id
-                    ApplicabilityRegenerationManager.regenerate_applicability(
-                        all_profiles_hash, profiles, repo_id)
+        # Regenerate applicability data for each all_profiles_hash and repo id
+        for batch in plugin_misc.paginate(profiles_to_process, REGENERATION_BATCH_SIZE):
+            ApplicabilityRegenerationManager.batch_regenerate_applicability(batch)
 
     @staticmethod
     def queue_regenerate_applicability_for_repos(repo_criteria):
@@ -136,7 +158,6 @@ class ApplicabilityRegenerationManager(object):
             consumer_ids)
 
         task_group_id = uuid4()
-        batch_size = 10
 
         # list of tuples (repo_id, all_profiles_hash, profiles)
         profiles_to_process = []
@@ -150,7 +171,7 @@ class ApplicabilityRegenerationManager(object):
                     seen_hashes.add(all_profiles_hash)
                     profiles = consumer_profile_map[consumer_id]['profiles']
                     profiles_to_process.append((repo_id, all_profiles_hash, profiles))
-                    if len(profiles_to_process) >= batch_size:
+                    if len(profiles_to_process) >= REGENERATION_BATCH_SIZE:
                         batch_regenerate_applicability_task.apply_async(
                             (profiles_to_process,), **{'group_id': task_group_id})
                         profiles_to_process = []
@@ -166,15 +187,91 @@ class ApplicabilityRegenerationManager(object):
         """
         Regenerate and save applicability data for a batch of applicabilities
 
+        Work is grouped by repository. Repository metadata and unit profiles are loaded once for
+        the whole batch, every set of profiles bound to a repository is handed to the profiler in
+        a single call and the results are written with one unordered bulk upsert.
+
         :param profiles_to_process: profile data necessary for applicability calculation,
                                     [(repo_id, all_profiles_hash, profiles), ...]
         :type  profiles_to_process: list of tuples
         """
+        # {repo_id: {content_type: {all_profiles_hash: profiles}}}
+        repo_profiles_map = {}
+        profile_ids = set()
         for repo_id, all_profiles_hash, profiles in profiles_to_process:
+            # The same profiler is assumed to handle all the profiles of a consumer, so the
+            # profiler is picked by the content type of the first profile.
+            content_type = profiles[0][1]
+            repo_profiles_map.setdefault(repo_id, {}).setdefault(
+                content_type, {})[all_profiles_hash] = profiles
+            profile_ids.update(p_id for _, _, p_id in profiles)
+
+        if not repo_profiles_map:
+            return
 
-            # Regenerate applicability data for given profiles and repo id
-            ApplicabilityRegenerationManager.regenerate_applicability(all_profiles_hash,
-                                                                      profiles, repo_id)
+        repo_content_types = ApplicabilityRegenerationManager._get_existing_repos_content_types(
+            repo_profiles_map.keys())
+        unit_profiles = ApplicabilityRegenerationManager._get_unit_profiles(profile_ids)
+
+        profiler_conduit = ProfilerConduit()
+        profilers = {}
+        # Applicability data is stored once per distinct result and referenced by its digest
+        results = {}
+        operations = []
+        for repo_id, content_type_map in repo_profiles_map.iteritems():
+            for content_type, profile_sets in content_type_map.iteritems():
+                if content_type not in profilers:
+                    profilers[content_type] = ApplicabilityRegenerationManager._profiler(
+                        content_type)
+                profiler, profiler_cfg = profilers[content_type]
+
+                # Check if the profiler supports applicability, else skip these profiles
+                if profiler.calculate_applicable_units == Profiler.calculate_applicable_units:
+                    continue
+
+                # Only regenerate applicability if the repo contains any of the types the
+                # profiler handles.
+                if not (set(repo_content_types.get(repo_id, [])) &
+                        set(profiler.metadata()['types'])):
+                    continue
+
+                unit_profile_sets = {}
+                for all_profiles_hash, profiles in profile_sets.iteritems():
+                    try:
+                        unit_profile_sets[all_profiles_hash] = [unit_profiles[p_id]
+                                                                for _, _, p_id in profiles]
+                    except KeyError:
+                        # Consumer can be removed during applicability regeneration,
+                        # so it is possible that its profile no longer exists. It is harmless.
+                        continue
+                if not unit_profile_sets:
+                    continue
+
+                call_config = PluginCallConfiguration(plugin_config=profiler_cfg,
+                                                      repo_plugin_config=None)
+                try:
+                    applicability_map = profiler.calculate_applicable_units_batch(
+                        unit_profile_sets, repo_id, call_config, profiler_conduit)
+                except NotImplementedError:
+                    msg = "Profiler for content type [%s] does not support applicability" % \
+                          content_type
+                    _logger.debug(msg)
+                    continue
+
+                for all_profiles_hash, applicability in applicability_map.iteritems():
+                    digest = ApplicabilityResult.calculate_digest(applicability)
+                    results[digest] = applicability
+                    # Reference the applicability results from each of the profiles, so that
+                    # applicability data is available in any applicability profile record.
+                    for profile_hash, _, _ in unit_profile_sets[all_profiles_hash]:
+                        operations.append(_applicability_upsert(
+                            repo_id, all_profiles_hash, profile_hash, digest))
+
+        # Results are written first, so that a profile record never references a missing result
+        _bulk_write(ApplicabilityResult.get_collection(),
+                    [ApplicabilityResult.upsert(result, result_digest)
+                     for result_digest, result in results.iteritems()])
+        _bulk_write(RepoProfileApplicability.get_collection(), operations)
 
     @staticmethod
     def regenerate_applicability(all_profiles_hash, profiles, bound_repo_id):
@@ -191,79 +288,8 @@ class ApplicabilityRegenerationManager(object):
                               against the given unit profile
         :type  bound_repo_id: str
         """
-        profiler_conduit = ProfilerConduit()
-
-        # Get the profiler for content_type of given profiles.
-        # The assumption is that the same profiler is used for all the content types, so different
-        # profilers are not supported at the moment.
-        # Take the content type from the first profile.
-        content_type = profiles[0][1]
-        profiler, profiler_cfg = ApplicabilityRegenerationManager._profiler(content_type)
-
-        # Check if the profiler supports applicability, else return
-        if profiler.calculate_applicable_units == Profiler.calculate_applicable_units:
-            # If base class calculate_applicable_units method is called,
-            # skip applicability regeneration
-            return
-
-        # Find out which content types have unit counts greater than zero in the bound repo
-        repo_content_types = ApplicabilityRegenerationManager._get_existing_repo_content_types(
-            bound_repo_id)
-
-        # Get the intersection of existing types in the repo and the types that the profiler
-        # handles. If the intersection is not empty, regenerate applicability
-        if (set(repo_content_types) & set(profiler.metadata()['types'])):
-            profile_ids = [p_id for _, _, p_id in profiles]
-            unit_profiles = UnitProfile.get_collection().find({'id': {'$in': profile_ids}},
-                                                              projection=['profile',
-                                                                          'content_type',
-                                                                          'profile_hash'])
-            try:
-                profiles = [(p['profile_hash'], p['content_type'], p['profile']) for p in
-                            unit_profiles]
-            except TypeError:
-                # It means that p = None.
-                # Consumer can be removed during applicability regeneration,
-                # so it is possible that its profile no longer exists. It is harmless.
-                return
-
-            call_config = PluginCallConfiguration(plugin_config=profiler_cfg,
-                                                  repo_plugin_config=None)
-            try:
-                applicability = profiler.calculate_applicable_units(profiles,
-                                                                    bound_repo_id,
-                                                                    call_config,
-                                                                    profiler_conduit)
-            except NotImplementedError:
-                msg = "Profiler for content type [%s] does not support applicability" % content_type
-                _logger.debug(msg)
-                return
-
-            # Save applicability results on each of the profiles. The results are duplicated.
-            # It's a compromise to have applicability data available in any applicability profile
-            # record in the DB.
-            for profile in profiles:
-                profile_hash = profile[0]
-                try:
-                    # Create a new RepoProfileApplicability object and save it in the db
-                    RepoProfileApplicability.objects.create(profile_hash=profile_hash,
-                                                            repo_id=bound_repo_id,
-                                                            # profiles can be large, the one in
-                                                            # repo_profile_applicability collection
-                                                            # is no longer used,
-                                                            # it's a duplicated data
-                                                            # from the consumer_unit_profiles
-                                                            # collection.
-                                                            profile=[],
-                                                            applicability=applicability,
-                                                            all_profiles_hash=all_profiles_hash)
-                except DuplicateKeyError:
-                    applicability_dict = RepoProfileApplicability.get_collection().find_one(
-                        {'repo_id': bound_repo_id, 'all_profiles_hash': all_profiles_hash,
-                         'profile_hash': profile_hash})
-                    existing_applicability = RepoProfileApplicability(**applicability_dict)
-                    existing_applicability.applicability = applicability
-                    existing_applicability.save()
+        ApplicabilityRegenerationManager.batch_regenerate_applicability(
+            [(bound_repo_id, all_profiles_hash, profiles)])
 
     @staticmethod
     def _get_existing_repo_content_types(repo_id):
@@ -288,6 +314,40 @@ class ApplicabilityRegenerationManager(object):
                 repo_content_types_with_non_zero_unit_count.append(content_type)
         return repo_content_types_with_non_zero_unit_count
 
+    @staticmethod
+    def _get_existing_repos_content_types(repo_ids):
+        """
+        For each of the given repositories, find the content_type_ids that have content unit
+        counts greater than 0. Repositories that do not exist are left out of the result.
+
+        :param repo_ids: ids of the repositories of interest
+        :type  repo_ids: list
+        :return:         map of repo_id to a list of content type ids with unit counts greater
+                         than 0
+        :rtype:          dict
+        """
+        repos = model.Repository.objects(repo_id__in=list(repo_ids)).only(
+            'repo_id', 'content_unit_counts')
+        return dict((repo.repo_id, [content_type for content_type, count
+                                    in repo.content_unit_counts.items() if count > 0])
+                    for repo in repos)
+
+    @staticmethod
+    def _get_unit_profiles(profile_ids):
+        """
+        Load unit profiles in a single query.
+
+        :param profile_ids: ids of the unit profiles to load
+        :type  profile_ids: iterable
+        :return:            map of profile id to a (profile_hash, content_type, profile) tuple
+        :rtype:             dict
+        """
+        unit_profiles = UnitProfile.get_collection().find(
+            {'id': {'$in': list(profile_ids)}},
+            projection=['id', 'profile', 'content_type', 'profile_hash'])
+        return dict((p['id'], (p['profile_hash'], p['content_type'], p['profile']))
+                    for p in unit_profiles)
+
     @staticmethod
     def _is_existing_applicability(repo_id, all_profiles_hash):
         """
@@ -471,9 +531,14 @@ class RepoProfileApplicabilityManager(object):
         :rtype:              list
         """
         collection = RepoProfileApplicability.get_collection()
-        mongo_applicabilities = collection.find(query_params)
-        applicabilities = [RepoProfileApplicability(**dict(applicability))
-                           for applicability in mongo_applicabilities]
+        mongo_applicabilities = list(collection.find(query_params))
+        results = ApplicabilityResult.get_results(
+            a.get('applicability_digest') for a in mongo_applicabilities)
+        applicabilities = []
+        for applicability in mongo_applicabilities:
+            applicability = RepoProfileApplicability(**dict(applicability))
+            applicability.applicability = results.get(applicability.applicability_digest)
+            applicabilities.append(applicability)
         return applicabilities
 
     def get(self, query_params):
@@ -596,6 +661,33 @@ class RepoProfileApplicabilityManager(object):
                 profiles_removed = profiles_batch_size + skip_idx
             _logger.info("Orphaned consumer profiles processed: %s" % profiles_removed)
 
+        RepoProfileApplicabilityManager.remove_orphaned_results()
+
+    @staticmethod
+    def remove_orphaned_results():
+        """
+        Remove the ApplicabilityResult objects that no RepoProfileApplicability object references
+        anymore. Results that were used within the last APPLICABILITY_RESULT_GRACE seconds are
+        kept, since they may belong to applicability that is being regenerated right now.
+        """
+        rpa_collection = RepoProfileApplicability.get_collection()
+        results_collection = ApplicabilityResult.get_collection()
+        cutoff = int(time.time()) - APPLICABILITY_RESULT_GRACE
+        stale_results = results_collection.find({'updated': {'$lt': cutoff}},
+                                                projection=['_id']).batch_size(1000)
+
+        removed = 0
+        for page in plugin_misc.paginate(stale_results):
+            digests = [result['_id'] for result in page]
+            referenced = set(rpa_collection.distinct('applicability_digest',
+                                                     {'applicability_digest': {'$in': digests}}))
+            orphaned = [digest for digest in digests if digest not in referenced]
+            if orphaned:
+                # Results that were used again since they were read are not removed
+                removed += results_collection.delete_many(
+                    {'_id': {'$in': orphaned}, 'updated': {'$lt': cutoff}}).deleted_count
+        _logger.info("Orphaned applicability results removed: %s" % removed)
+
 
 # Instantiate one of the managers on the object it manages for convenience
 RepoProfileApplicability.objects = RepoProfileApplicabilityManager()
@@ -629,6 +721,60 @@ def retrieve_consumer_applicability(consumer_criteria, content_types=None):
     # We only need the consumer ids
     consumer_criteria['fields'] = ['id']
     consumer_ids = [c['id'] for c in ConsumerQueryManager.find_by_criteria(consumer_criteria)]
+    return _get_consumers_applicability(consumer_ids, content_types)
+
+
+def retrieve_consumer_applicability_page(consumer_criteria, content_types=None,
+                                         page_size=APPLICABILITY_PAGE_SIZE, page_token=None):
+    """
+    Query content applicability for one page of the consumers matched by a given
+    consumer_criteria, optionally limiting by content type.
+
+    Consumers are paged through in order of their ids, so that only page_size consumers are held
+    in memory at a time. The sort, limit and skip options of the criteria are not used. The
+    applicability reports have the format retrieve_consumer_applicability() returns, but only
+    collate the consumers of one page, so consumers with the same applicability may be reported
+    on several pages.
+
+    :param consumer_criteria: The consumer selection criteria
+    :type  consumer_criteria: pulp.server.db.model.criteria.Criteria
+    :param content_types:     An optional list of content types that the caller wishes to limit
+                              the results to. Defaults to None, which will return data for all
+                              types
+    :type  content_types:     list
+    :param page_size:         The maximum number of consumers to report on
+    :type  page_size:         int
+    :param page_token:        The next_page value of the previous page, None for the first page
+    :type  page_token:        basestring
+    :return: a dictionary with the keys 'applicability', the applicability reports for this
+             page, and 'next_page', the page_token of the next page or None if this is the last
+             page
+    :rtype:  dict
+    """
+    filters = consumer_criteria.filters or {}
+    if page_token is not None:
+        window = {'id': {'$gt': page_token}}
+        filters = {'$and': [filters, window]} if filters else window
+    page_criteria = Criteria(filters=filters, sort=[('id', ASCENDING)], limit=page_size,
+                             fields=['id'])
+    consumer_ids = [c['id'] for c in ConsumerQueryManager.find_by_criteria(page_criteria)]
+    next_page = consumer_ids[-1] if len(consumer_ids) == page_size else None
+    return {'applicability': _get_consumers_applicability(consumer_ids, content_types),
+            'next_page': next_page}
+
+
+def _get_consumers_applicability(consumer_ids, content_types):
+    """
+    Build the applicability reports for the given consumers.
+
+    :param consumer_ids:  ids of the consumers to report on
+    :type  consumer_ids:  list
+    :param content_types: An optional list of content types that the caller wishes to limit the
+                          results to, None for all types
+    :type  content_types: list
+    :return: applicability reports, in the format retrieve_consumer_applicability() returns
+    :rtype:  list
+    """
     consumer_map = dict([(c, {'profiles': [], 'repo_ids': []}) for c in consumer_ids])
 
     # Fill out the mapping of consumer_ids to profiles, and store the list of all_profiles_hashes
@@ -785,23 +931,31 @@ def _get_applicability_map(all_profiles_hashes, content_types):
     :rtype:                dict
     """
 
-    applicabilities = RepoProfileApplicability.get_collection().find(
+    applicabilities = list(RepoProfileApplicability.get_collection().find(
         {'all_profiles_hash': {'$in': all_profiles_hashes}},
-        projection=['all_profiles_hash', 'repo_id', 'applicability'])
+        projection=['all_profiles_hash', 'repo_id', 'applicability_digest']))
+    # Dereference the applicability data of all the records with a single query
+    results = ApplicabilityResult.get_results(a['applicability_digest'] for a in applicabilities)
     return_value = {}
     for a in applicabilities:
+        try:
+            # Records share results, so each one gets its own copy of the data to modify
+            applicability = dict(results[a['applicability_digest']])
+        except KeyError:
+            # The result was removed as an orphan since the record was read
+            continue
         if content_types is not None:
             # The caller has requested us to filter by content_type, so we need to look through
             # the applicability data and filter out the unwanted content types. Some
             # applicabilities may end up being empty if they don't have any data for the
             # requested types, so we'll build a list of those to remove
-            for key in a['applicability'].keys():
+            for key in applicability.keys():
                 if key not in content_types:
-                    del a['applicability'][key]
+                    del applicability[key]
             # If a doesn't have anything worth reporting, move on to the next applicability
-            if not a['applicability']:
+            if not applicability:
                 continue
-        return_value[(a['all_profiles_hash'], a['repo_id'])] = {'applicability': a['applicability'],
+        return_value[(a['all_profiles_hash'], a['repo_id'])] = {'applicability': applicability,
                                                                 'consumers': []}
     return return_value
 
@@ -862,3 +1016,54 @@ def _calculate_all_profiles_hash(profile_hashes):
     serialized_profile_hashes = json.dumps(sorted(profile_hashes))
     hasher = hashlib.sha256(serialized_profile_hashes)
     return hasher.hexdigest()
+
+
+def _applicability_upsert(repo_id, all_profiles_hash, profile_hash, digest):
+    """
+    Build a bulk write operation that points one profile of a profile set at its applicability
+    data.
+
+    :param repo_id:           The repo ID that this applicability data is for
+    :type  repo_id:           basestring
+    :param all_profiles_hash: The hash of the set of the profiles that this applicability data is
+                              for
+    :type  all_profiles_hash: basestring
+    :param profile_hash:      The hash of the profile that is a part of the profile set
+    :type  profile_hash:      basestring
+    :param digest:            The digest of the applicability data in the ApplicabilityResult
+                              collection
+    :type  digest:            basestring
+
+    :return: upsert operation for the repo_profile_applicability collection
+    :rtype:  pymongo.operations.UpdateOne
+    """
+    query = {'repo_id': repo_id, 'all_profiles_hash': all_profiles_hash,
+             'profile_hash': profile_hash}
+    # profiles can be large, the one in repo_profile_applicability collection is no longer used,
+    # it's a duplicated data from the consumer_unit_profiles collection.
+    update = {'$set': {'applicability_digest': digest},
+              '$setOnInsert': {'profile': []}}
+    return UpdateOne(query, update, upsert=True)
+
+
+def _bulk_write(collection, operations):
+    """
+    Write upserts with unordered bulk writes.
+
+    Two workers may try to insert the same document at the same time, in which case one of the
+    upserts fails on a unique index. Those upserts are retried once, when they will update the
+    document the other worker created.
+
+    :param collection: collection to write to
+    :type  collection: pymongo.collection.Collection
+    :param operations: upserts to write
+    :type  operations: list of pymongo.operations.UpdateOne
+    """
+    for page in plugin_misc.paginate(operations):
+        try:
+            collection.bulk_write(page, ordered=False)
+        except BulkWriteError, e:
+            errors = e.details['writeErrors']
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            collection.bulk_write([page[error['index']] for error in errors], ordered=False)
@@ -1,25 +1,36 @@
 from gettext import gettext as _
+from Queue import Queue
+from threading import Lock, Thread
+import errno
 import itertools
 import logging
 import os
 import re
 import shutil
+import time
 
 from celery import task
 
+from pulp.common import error_codes
 from pulp.plugins.types import database as content_types_db
 from pulp.plugins.loader import api as plugin_api
 from pulp.plugins.util import misc as plugin_misc
 from pulp.server import config as pulp_config, exceptions as pulp_exceptions
 from pulp.server.async.tasks import Task
 from pulp.server.controllers import units as units_controller
-from pulp.server.db.model.repository import RepoContentUnit
 from pulp.server.db import model
 from pulp.server.exceptions import MissingResource
 
 
 _logger = logging.getLogger(__name__)
 
+# Number of content units whose repository associations are resolved with a single query
+ORPHAN_PAGE_SIZE = plugin_misc.DEFAULT_PAGE_SIZE
+
+# Seconds subtracted from the start of an orphan scan before it is used as a watermark, to allow
+# for clock differences between the hosts that update units and record orphan candidates
+ORPHAN_INDEX_CLOCK_SKEW = 300
+
 
 class OrphanManager(object):
 
@@ -48,8 +59,8 @@ class OrphanManager(object):
         :rtype: int
         """
         count = 0
-        for unit in OrphanManager.generate_orphans_by_type(content_type_id):
-            count += 1
+        for page in OrphanManager.generate_orphan_pages_by_type(content_type_id):
+            count += len(page)
         return count
 
     def generate_all_orphans(self, fields=None):
@@ -98,20 +109,197 @@ class OrphanManager(object):
         :return: generator of orphaned content units for the given content type
         :rtype: generator
         """
+        for page in OrphanManager.generate_orphan_pages_by_type(content_type_id, fields):
+            for content_unit in page:
+                yield content_unit
+
+    @staticmethod
+    def generate_orphan_pages_by_type(content_type_id, fields=None, content_unit_ids=None,
+                                      page_size=ORPHAN_PAGE_SIZE):
+        """
+        Return a generator of pages of orphaned content units of the given content type.
+
+        This is the single code path used to count, list and delete orphans. The repository
+        associations for an entire page of units are resolved with a single query, so the number
+        of database round trips is proportional to the number of pages rather than the number of
+        units.
 
-        fields = fields if fields is not None else ['_id']
+        When content_unit_ids is None, only the recorded orphan candidates of the type and the
+        units updated since its last complete scan are examined, so the cost is proportional to
+        the recent churn rather than the total number of units. See OrphanCandidate.
+
+        If fields is not specified, only the `_id` field will be present. The `_id` field is
+        always included.
+
+        :param content_type_id: id of the content type
+        :type content_type_id: basestring
+        :param fields: list of fields to include in each content unit
+        :type fields: list or None
+        :param content_unit_ids: list of content unit ids to consider; None means all units
+        :type content_unit_ids: iterable or None
+        :param page_size: maximum number of units to examine per page
+        :type page_size: int
+        :return: generator of non-empty lists of orphaned content units
+        :rtype: generator
+        """
+        if content_unit_ids is not None:
+            return OrphanManager._scan_orphan_pages(content_type_id, fields, content_unit_ids,
+                                                    page_size)
+        return OrphanManager._indexed_orphan_pages(content_type_id, fields, page_size)
+
+    @staticmethod
+    def _scan_orphan_pages(content_type_id, fields=None, content_unit_ids=None,
+                           page_size=ORPHAN_PAGE_SIZE):
+        """
+        Return a generator of pages of orphaned content units, without consulting the orphan
+        candidates.
+
+        :param content_type_id: id of the content type
+        :type content_type_id: basestring
+        :param fields: list of fields to include in each content unit
+        :type fields: list or None
+        :param content_unit_ids: list of content unit ids to consider; None means all units
+        :type content_unit_ids: iterable or None
+        :param page_size: maximum number of units to examine per page
+        :type page_size: int
+        :return: generator of non-empty lists of orphaned content units
+        :rtype: generator
+        """
+        fields = list(fields) if fields is not None else ['_id']
+        if '_id' not in fields:
+            fields.append('_id')
         content_units_collection = content_types_db.type_units_collection(content_type_id)
-        repo_content_units_collection = RepoContentUnit.get_collection()
 
-        for content_unit in content_units_collection.find({}, projection=fields).batch_size(100):
+        if content_unit_ids is None:
+            content_units = content_units_collection.find(
+                {}, projection=fields).batch_size(page_size)
+        else:
+            content_units = itertools.chain.from_iterable(
+                content_units_collection.find({'_id': {'$in': list(page)}}, projection=fields)
+                for page in plugin_misc.paginate(content_unit_ids, page_size))
+
+        for page in OrphanManager._filter_orphan_pages(content_units, lambda u: u['_id'],
+                                                       page_size):
+            yield page
+
+    @staticmethod
+    def _indexed_orphan_pages(content_type_id, fields=None, page_size=ORPHAN_PAGE_SIZE):
+        """
+        Return a generator of pages of orphaned content units, examining only the orphan
+        candidates of the type and the units updated since its last complete scan.
+
+        Orphans found among the recently updated units are recorded as candidates, and
+        candidates that are associated again or no longer exist are pruned. The watermark of
+        the type is advanced once the generator is exhausted.
+
+        :param content_type_id: id of the content type
+        :type content_type_id: basestring
+        :param fields: list of fields to include in each content unit
+        :type fields: list or None
+        :param page_size: maximum number of units to examine per page
+        :type page_size: int
+        :return: generator of non-empty lists of orphaned content units
+        :rtype: generator
+        """
+        cutoff = int(time.time()) - ORPHAN_INDEX_CLOCK_SKEW
+        watermark = OrphanManager._get_watermark(content_type_id)
+
+        # bring the candidates up to date with the units updated since the last complete scan
+        if watermark:
+            spec = {'_last_updated': {'$gte': watermark}}
+        else:
+            spec = {}
+        content_units_collection = content_types_db.type_units_collection(content_type_id)
+        recent_units = content_units_collection.find(spec, projection=['_id']).batch_size(
+            page_size)
+        for page in OrphanManager._filter_orphan_pages(recent_units, lambda u: u['_id'],
+                                                       page_size):
+            model.OrphanCandidate.objects.add(content_type_id, [unit['_id'] for unit in page])
+
+        candidate_ids = model.OrphanCandidate.objects(
+            unit_type_id=content_type_id).scalar('unit_id')
+        for id_page in plugin_misc.paginate(candidate_ids, page_size):
+            orphans = []
+            for page in OrphanManager._scan_orphan_pages(content_type_id, fields, id_page,
+                                                         page_size):
+                orphans.extend(page)
+            orphan_ids = set(unit['_id'] for unit in orphans)
+            stale_ids = [unit_id for unit_id in id_page if unit_id not in orphan_ids]
+            if stale_ids:
+                model.OrphanCandidate.objects.prune(content_type_id, stale_ids, cutoff)
+            if orphans:
+                yield orphans
+
+        model.OrphanScanWatermark.objects(content_type_id=content_type_id).update_one(
+            set__watermark=cutoff, upsert=True)
+
+    @staticmethod
+    def _get_watermark(content_type_id):
+        """
+        :param content_type_id: id of the content type
+        :type content_type_id: basestring
+        :return: start time of the last complete orphan scan of the type; 0 if it was never
+                 scanned
+        :rtype: int
+        """
+        watermark = model.OrphanScanWatermark.objects(content_type_id=content_type_id).first()
+        if watermark is None:
+            return 0
+        return watermark.watermark
+
+    @staticmethod
+    def verify_orphan_index(content_type_id, page_size=ORPHAN_PAGE_SIZE):
+        """
+        Check the orphan candidates of the given content type against the real associations.
 
-            repo_content_units_cursor = repo_content_units_collection.find(
-                {'unit_id': content_unit['_id']})
+        Every orphan is examined. Orphans that are neither recorded as candidates nor updated
+        since the last complete scan of the type would be missed by the orphan manager; they are
+        recorded as candidates and returned.
 
-            if repo_content_units_cursor.count() > 0:
+        :param content_type_id: id of the content type
+        :type content_type_id: basestring
+        :param page_size: maximum number of units to examine per page
+        :type page_size: int
+        :return: ids of the orphans that were missing from the candidates
+        :rtype: list
+        """
+        watermark = OrphanManager._get_watermark(content_type_id)
+        missing = []
+        for page in OrphanManager._scan_orphan_pages(content_type_id, ['_last_updated'],
+                                                     page_size=page_size):
+            id_list = [unit['_id'] for unit in page
+                       if (unit.get('_last_updated') or 0) < watermark]
+            if not id_list:
                 continue
+            recorded = set(model.OrphanCandidate.objects(
+                unit_type_id=content_type_id, unit_id__in=id_list).distinct('unit_id'))
+            missing.extend(unit_id for unit_id in id_list if unit_id not in recorded)
 
-            yield content_unit
+        if missing:
+            model.OrphanCandidate.objects.add(content_type_id, missing)
+        return missing
+
+    @staticmethod
+    def _filter_orphan_pages(content_units, get_unit_id, page_size=ORPHAN_PAGE_SIZE):
+        """
+        Split the given content units into pages and remove the associated units from each.
+
+        :param content_units: content units to examine
+        :type content_units: iterable
+        :param get_unit_id: callable that returns the id of a content unit
+        :type get_unit_id: callable
+        :param page_size: maximum number of units to examine per page
+        :type page_size: int
+        :return: generator of non-empty lists of orphaned content units
+        :rtype: generator
+        """
+        for units_group in plugin_misc.paginate(content_units, page_size):
+            id_list = [get_unit_id(unit) for unit in units_group]
+            non_orphans = set(model.RepositoryContentUnit.objects(unit_id__in=id_list)
+                              .distinct('unit_id'))
+            orphans = [unit for unit in units_group if get_unit_id(unit) not in non_orphans]
+            if orphans:
+                yield orphans
 
     @staticmethod
     def generate_orphans_by_type_with_unit_keys(content_type_id):
@@ -150,12 +338,9 @@ class OrphanManager(object):
                                  given content type and unit id
         """
 
-        for content_unit in OrphanManager.generate_orphans_by_type(content_type_id):
-
-            if content_unit['_id'] != content_unit_id:
-                continue
-
-            return content_unit
+        for page in OrphanManager.generate_orphan_pages_by_type(
+                content_type_id, content_unit_ids=[content_unit_id]):
+            return page[0]
 
         raise pulp_exceptions.MissingResource(content_type=content_type_id,
                                               content_unit=content_unit_id)
@@ -233,24 +418,28 @@ class OrphanManager(object):
 
         fields = ('_id', '_storage_path') + unit_key_fields
         count = 0
-        for content_unit in OrphanManager.generate_orphans_by_type(content_type_id, fields=fields):
-
-            if content_unit_ids is not None and content_unit['_id'] not in content_unit_ids:
-                continue
-
-            model.LazyCatalogEntry.objects(
-                unit_id=content_unit['_id'],
-                unit_type_id=content_type_id
-            ).delete()
-            content_units_collection.remove(content_unit['_id'])
+        with OrphanFileRemover() as file_remover:
+            for page in OrphanManager.generate_orphan_pages_by_type(
+                    content_type_id, fields=fields, content_unit_ids=content_unit_ids):
+                id_list = [content_unit['_id'] for content_unit in page]
+                model.LazyCatalogEntry.objects(
+                    unit_id__in=id_list,
+                    unit_type_id=content_type_id
+                ).delete()
+                content_units_collection.delete_many({'_id': {'$in': id_list}})
+                model.OrphanCandidate.objects(
+                    unit_type_id=content_type_id,
+                    unit_id__in=id_list
+                ).delete()
 
-            if hasattr(content_model, 'do_post_delete_actions'):
-                content_model.do_post_delete_actions(content_unit)
+                for content_unit in page:
+                    if hasattr(content_model, 'do_post_delete_actions'):
+                        content_model.do_post_delete_actions(content_unit)
 
-            storage_path = content_unit.get('_storage_path', None)
-            if storage_path is not None:
-                OrphanManager.delete_orphaned_file(storage_path)
-            count += 1
+                    storage_path = content_unit.get('_storage_path', None)
+                    if storage_path is not None:
+                        file_remover.remove(storage_path)
+                count += len(page)
         return count
 
     @staticmethod
@@ -276,46 +465,40 @@ class OrphanManager(object):
             raise MissingResource(content_type_id=type_id)
 
         fields = ('id', '_storage_path') + unit_key_fields
-        if content_unit_ids:
-            query_sets = []
-            for page in plugin_misc.paginate(content_unit_ids):
-                qs = content_model.objects(id__in=page).only(*fields)
-                query_sets.append(qs)
-            content_units = itertools.chain(*query_sets)
-        else:
-            content_units = content_model.objects.only(*fields)
+        if not content_unit_ids:
+            # the orphan candidates narrow the units down to the ones that are likely orphans
+            content_unit_ids = (unit['_id'] for page in
+                                OrphanManager.generate_orphan_pages_by_type(type_id)
+                                for unit in page)
+        content_units = itertools.chain.from_iterable(
+            content_model.objects(id__in=page).only(*fields)
+            for page in plugin_misc.paginate(content_unit_ids))
 
         count = 0
 
-        # Paginate the content units
-        for units_group in plugin_misc.paginate(content_units):
-            # Build the list of ids to search for an easier way to access units in the group by id
-            unit_dict = dict()
-            for unit in units_group:
-                unit_dict[unit.id] = unit
-
-            id_list = list(unit_dict.iterkeys())
-
-            # Clear the units that are currently associated from unit_dict
-            non_orphan = model.RepositoryContentUnit.objects(unit_id__in=id_list)\
-                .distinct('unit_id')
-            for non_orphan_id in non_orphan:
-                unit_dict.pop(non_orphan_id)
-
-            # Remove the unit, lazy catalog entries, and any content in storage.
-            for unit_to_delete in unit_dict.itervalues():
+        with OrphanFileRemover() as file_remover:
+            # Paginate the content units, keeping only the orphans of each page
+            for orphans in OrphanManager._filter_orphan_pages(content_units, lambda u: u.id):
+                # Remove the units and their lazy catalog entries in bulk
+                id_list = [unit.id for unit in orphans]
                 model.LazyCatalogEntry.objects(
-                    unit_id=str(unit_to_delete.id),
+                    unit_id__in=id_list,
                     unit_type_id=str(type_id)
                 ).delete()
-                unit_to_delete.delete()
+                content_model.objects(id__in=id_list).delete()
+                model.OrphanCandidate.objects(
+                    unit_type_id=type_id,
+                    unit_id__in=id_list
+                ).delete()
 
-                if hasattr(content_model, 'do_post_delete_actions'):
-                    content_model.do_post_delete_actions(unit_to_delete)
+                # Remove any content in storage
+                for unit_to_delete in orphans:
+                    if hasattr(content_model, 'do_post_delete_actions'):
+                        content_model.do_post_delete_actions(unit_to_delete)
 
-                if unit_to_delete._storage_path:
-                    OrphanManager.delete_orphaned_file(unit_to_delete._storage_path)
-                count += 1
+                    if unit_to_delete._storage_path:
+                        file_remover.remove(unit_to_delete._storage_path)
+                count += len(orphans)
 
         return count
 
@@ -326,6 +509,24 @@ class OrphanManager(object):
         @param path: absolute path to the file to delete
         @type  path: str
         """
+        directory = OrphanManager.remove_orphaned_file(path)
+        if directory is not None:
+            OrphanManager.prune_empty_directories([directory])
+
+    @staticmethod
+    def remove_orphaned_file(path, storage_dir=None):
+        """
+        Delete an orphaned file, leaving its parent directories in place.
+
+        :param path: absolute path to the file to delete
+        :type  path: str
+        :param storage_dir: the pulp content storage directory; read from the server
+                            configuration if not specified
+        :type  storage_dir: str
+        :return: the directory that held the file, which may have fallen empty; None if no
+                 directory needs to be pruned
+        :rtype:  str or None
+        """
         if not os.path.lexists(path):
             _logger.debug(_('Path: {p} does not exist').format(p=path))
             return
@@ -335,7 +536,8 @@ class OrphanManager(object):
         if not os.path.isabs(path):
             raise ValueError(_('Path: %(p)s must be absolute path') % {'p': path})
 
-        storage_dir = pulp_config.config.get('server', 'storage_dir')
+        if storage_dir is None:
+            storage_dir = pulp_config.config.get('server', 'storage_dir')
 
         # shared content
         if OrphanManager.is_shared(storage_dir, path):
@@ -343,19 +545,47 @@ class OrphanManager(object):
             return
 
         OrphanManager.delete(path)
+        return os.path.dirname(path)
 
-        # delete parent directories on the path as long as they fall empty
+    @staticmethod
+    def prune_empty_directories(directories, storage_dir=None):
+        """
+        Delete the given directories, and their parents, as long as they are empty.
+
+        Directories are examined deepest first, so every directory is listed at most once even
+        when it is the parent of many of the given directories. The content type directories
+        directly under <storage-dir>/content are never deleted.
+
+        :param directories: absolute paths of directories that may have fallen empty
+        :type  directories: iterable of str
+        :param storage_dir: the pulp content storage directory; read from the server
+                            configuration if not specified
+        :type  storage_dir: str
+        """
+        if storage_dir is None:
+            storage_dir = pulp_config.config.get('server', 'storage_dir')
         root_content_regex = re.compile(os.path.join(storage_dir, 'content', '[^/]+/?$'))
-        while True:
-            path = os.path.dirname(path)
-            if root_content_regex.match(path):
-                break
-            contents = os.listdir(path)
-            if contents:
-                break
-            if not os.access(path, os.W_OK):
-                break
-            os.rmdir(path)
+
+        pending = set(directories)
+        while pending:
+            depth = max(path.count(os.sep) for path in pending)
+            level = [path for path in pending if path.count(os.sep) == depth]
+            pending.difference_update(level)
+            for path in level:
+                if root_content_regex.match(path):
+                    continue
+                try:
+                    contents = os.listdir(path)
+                except OSError, e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                    continue
+                if contents:
+                    continue
+                if not os.access(path, os.W_OK):
+                    continue
+                os.rmdir(path)
+                pending.add(os.path.dirname(path))
 
     @staticmethod
     def is_shared(storage_dir, path):
@@ -420,6 +650,102 @@ class OrphanManager(object):
             _logger.error(_('Delete path: %(p)s failed: %(m)s'), {'p': path, 'm': str(e)})
 
 
+class OrphanFileRemover(object):
+    """
+    Removes the files of deleted orphans on a pool of threads.
+
+    Files are removed concurrently as they are queued, which hides the latency of network backed
+    storage. The parent directories that fall empty are pruned once, when the remover is closed,
+    so each directory is listed at most once no matter how many of the files it held. Use it as
+    a context manager. Files that could not be removed are reported by a PulpCodedException
+    raised from close().
+
+    :ivar concurrency: the number of threads removing files
+    :type concurrency: int
+    :ivar storage_dir: the pulp content storage directory
+    :type storage_dir: str
+    """
+
+    def __init__(self, concurrency=None):
+        """
+        :param concurrency: the number of threads removing files; read from the server
+                            configuration if not specified
+        :type  concurrency: int
+        """
+        if concurrency is None:
+            concurrency = pulp_config.config.getint('server', 'orphan_delete_concurrency')
+        self.concurrency = max(1, concurrency)
+        self.storage_dir = pulp_config.config.get('server', 'storage_dir')
+        self._queue = Queue(self.concurrency * 100)
+        self._directories = set()
+        self._failed = []
+        self._lock = Lock()
+        self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *unused):
+        try:
+            self.close()
+        except pulp_exceptions.PulpCodedException:
+            # do not mask the exception that ended the block
+            if exc_type is None:
+                raise
+
+    def remove(self, path):
+        """
+        Queue an orphaned file for removal. The threads are started by the first call.
+
+        :param path: absolute path to the file to delete
+        :type  path: str
+        """
+        if not self._threads:
+            for i in range(self.concurrency):
+                thread = Thread(target=self._run, name='orphan-remover-%d' % i)
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put(path)
+
+    def close(self):
+        """
+        Wait for the queued files to be removed, then prune the directories that fell empty.
+
+        :raises PulpCodedException: if any of the files could not be removed
+        """
+        for thread in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        OrphanManager.prune_empty_directories(self._directories, self.storage_dir)
+        self._directories = set()
+        failed, self._failed = sorted(self._failed), []
+        if failed:
+            raise pulp_exceptions.PulpCodedException(
+                error_codes.PLP0050, count=len(failed), paths=', '.join(failed))
+
+    def _run(self):
+        """
+        The thread main. Removes queued files until the end-of-queue marker (None) is read.
+        """
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                directory = OrphanManager.remove_orphaned_file(path, self.storage_dir)
+            except Exception:
+                _logger.exception(_('Deleting orphaned file: %(p)s failed') % {'p': path})
+                with self._lock:
+                    self._failed.append(path)
+                continue
+            if directory is not None:
+                with self._lock:
+                    self._directories.add(directory)
+
+
 delete_all_orphans = task(OrphanManager.delete_all_orphans, base=Task)
 delete_orphans_by_id = task(OrphanManager.delete_orphans_by_id, base=Task, ignore_result=True)
 delete_orphans_by_type = task(OrphanManager.delete_orphans_by_type, base=Task, ignore_result=True)
@@ -1,5 +1,8 @@
+from cStringIO import StringIO
 from errno import ENOENT
 from gettext import gettext as _
+import hashlib
+import json
 import logging
 import os
 import sys
@@ -13,7 +16,7 @@ from pulp.plugins.config import PluginCallConfiguration
 from pulp.plugins.loader import api as plugin_api, exceptions as plugin_exceptions
 from pulp.plugins.util import misc
 
-from pulp.server import config as pulp_config
+from pulp.server import config as pulp_config, util as server_util
 from pulp.server.async.tasks import Task
 from pulp.server.db import model
 from pulp.server.exceptions import (PulpDataException, MissingResource, PulpExecutionException,
@@ -23,6 +26,13 @@ from pulp.server.controllers import repository as repo_controller
 
 logger = logging.getLogger(__name__)
 
+# Upload segments are copied from the request to the upload file in buffers of this many bytes
+SEGMENT_BUFFER_SIZE = 64 * 1024
+
+# Uploads mapped to the type of the running checksum this process computed for them, the checksum
+# object and the number of bytes of the upload it covers
+_running_checksums = {}
+
 
 class ContentUploadManager(object):
     def initialize_upload(self):
@@ -69,17 +79,89 @@ class ContentUploadManager(object):
         @param data: content to write to the file
         @type  data: str
         """
+        self.save_stream(upload_id, offset, StringIO(data))
+
+    def save_stream(self, upload_id, offset, stream):
+        """
+        Saves the bits read from a file-like object into the given upload
+        request starting at an offset value. The bits are copied to the file
+        in buffers of SEGMENT_BUFFER_SIZE bytes, so a segment never has to fit
+        in memory.
+
+        If the upload_checksum_type setting of the server section is set, a
+        running checksum of the upload is computed while the segments that
+        extend the beginning of the upload are written. See
+        get_upload_checksum.
+
+        @param upload_id: upload request ID
+        @type  upload_id: str
+
+        @param offset: area in the uploaded file to start writing at
+        @type  offset: int
+
+        @param stream: file-like object to read the content to write from,
+                       until it is exhausted
+        @type  stream: file
+        """
 
         file_path = ContentUploadManager._upload_file_path(upload_id)
 
         # Make sure the upload was initialized first and hasn't been deleted
-        if not os.path.exists(file_path):
+        try:
+            fd = os.open(file_path, os.O_WRONLY)
+        except OSError as e:
+            if e.errno != ENOENT:
+                raise
             raise MissingResource(upload_request=upload_id)
 
-        f = open(file_path, 'r+')
-        f.seek(offset)
-        f.write(data)
-        f.close()
+        try:
+            checksum = ContentUploadManager._resume_running_checksum(upload_id, offset)
+            # Python 2 has no os.pwrite; each request has its own descriptor, so seeking it does
+            # not affect segments written concurrently
+            os.lseek(fd, offset, os.SEEK_SET)
+            size = 0
+            while True:
+                data = stream.read(SEGMENT_BUFFER_SIZE)
+                if not data:
+                    break
+                if checksum is not None:
+                    checksum.update(data)
+                size += len(data)
+                while data:
+                    data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+
+        if checksum is not None:
+            ContentUploadManager._save_running_checksum(upload_id, checksum, offset + size)
+
+    def get_upload_checksum(self, upload_id):
+        """
+        Returns the running checksum the server computed while the upload was
+        written, if it covers the whole upload.
+
+        The running checksum is only extended by the segments written right
+        after the part of the upload it already covers, so it is incomplete
+        when the segments were uploaded out of order or the checksum type
+        setting was changed during the upload.
+
+        @param upload_id: upload request ID
+        @type  upload_id: str
+
+        @return: tuple of the checksum type and the hex digest of the upload,
+                 or None if the running checksum does not cover the upload
+        @rtype:  tuple
+        """
+        state = ContentUploadManager._read_checksum_state(upload_id)
+        if state is None:
+            return None
+        try:
+            upload_size = os.path.getsize(ContentUploadManager._upload_file_path(upload_id))
+        except OSError:
+            return None
+        if state['size'] != upload_size:
+            return None
+        return state['checksum_type'], state['value']
 
     def delete_upload(self, upload_id):
         """
@@ -93,12 +175,14 @@ class ContentUploadManager(object):
         @raise MissingResource: if the upload request ID does not exist
         """
 
-        file_path = ContentUploadManager._upload_file_path(upload_id)
-        try:
-            os.remove(file_path)
-        except OSError as e:
-            if e.errno != ENOENT:
-                raise
+        _running_checksums.pop(upload_id, None)
+        for file_path in (ContentUploadManager._upload_file_path(upload_id),
+                          ContentUploadManager._checksum_file_path(upload_id)):
+            try:
+                os.remove(file_path)
+            except OSError as e:
+                if e.errno != ENOENT:
+                    raise
 
     def read_upload(self, upload_id):
         """
@@ -206,7 +290,10 @@ class ContentUploadManager(object):
             raise MissingResource(repo_id), None, sys.exc_info()[2]
 
         # Assemble the data needed for the import
-        conduit = UploadConduit(repo_id, repo_importer['id'])
+        upload_checksum = None
+        if upload_id is not None:
+            upload_checksum = ContentUploadManager().get_upload_checksum(upload_id)
+        conduit = UploadConduit(repo_id, repo_importer['id'], upload_checksum=upload_checksum)
 
         call_config = PluginCallConfiguration(plugin_config, repo_importer['config'],
                                               override_config)
@@ -218,6 +305,8 @@ class ContentUploadManager(object):
         try:
             result = importer_instance.upload_unit(transfer_repo, unit_type_id, unit_key,
                                                    unit_metadata, file_path, conduit, call_config)
+            # Save the units the importer left buffered in batch mode
+            conduit.flush_units()
             if not result['success_flag']:
                 raise PulpCodedException(
                     error_code=error_codes.PLP0047, repo_id=transfer_repo.id,
@@ -258,6 +347,115 @@ class ContentUploadManager(object):
         path = os.path.join(upload_storage_dir, upload_id)
         return path
 
+    @staticmethod
+    def _checksum_file_path(upload_id):
+        """
+        Returns the full path to the file holding the running checksum of the given upload.
+
+        :param upload_id: identifies the upload in question
+        :type  upload_id: str
+        :return:          full path on the server's filesystem
+        :rtype:           str
+        """
+        storage_dir = pulp_config.config.get('server', 'storage_dir')
+        checksum_dir = os.path.join(storage_dir, 'upload_checksums')
+        misc.mkdir(checksum_dir)
+        return os.path.join(checksum_dir, upload_id)
+
+    @staticmethod
+    def _read_checksum_state(upload_id):
+        """
+        Reads the running checksum of the given upload, as saved by the last process that
+        extended it.
+
+        :param upload_id: identifies the upload in question
+        :type  upload_id: str
+        :return:          dict with the checksum_type, the hex digest value and the size of the
+                          beginning of the upload it covers, or None if there is none
+        :rtype:           dict
+        """
+        try:
+            with open(ContentUploadManager._checksum_file_path(upload_id)) as checksum_file:
+                return json.load(checksum_file)
+        except (IOError, ValueError):
+            return None
+
+    @staticmethod
+    def _resume_running_checksum(upload_id, offset):
+        """
+        Returns the running checksum of the given upload, brought up to the offset a segment is
+        about to be written at, or None if the segment does not extend it.
+
+        Checksum objects cannot be handed between the web server processes, so every process keeps
+        its own running checksum of the uploads it receives segments for. When other processes
+        extended the running checksum since, this process catches up by reading the segments they
+        wrote back from the upload file, which is likely still in the page cache.
+
+        :param upload_id: identifies the upload in question
+        :type  upload_id: str
+        :param offset:    offset the segment is written at
+        :type  offset:    int
+        :return:          checksum object covering the upload up to the offset, or None
+        :rtype:           hashlib.HASH
+        """
+        checksum_type = pulp_config.config.get('server', 'upload_checksum_type')
+        if not checksum_type:
+            return None
+        try:
+            new_checksum = hashlib.new(checksum_type)
+        except ValueError:
+            logger.error(_('Unknown upload checksum type "%(t)s".') % {'t': checksum_type})
+            return None
+
+        state = ContentUploadManager._read_checksum_state(upload_id)
+        if state is None:
+            covered = 0
+        elif state['checksum_type'] == checksum_type:
+            covered = state['size']
+        else:
+            return None
+        if offset != covered:
+            return None
+
+        cached_type, checksum, size = _running_checksums.get(upload_id, (None, None, 0))
+        if cached_type == checksum_type and size <= offset:
+            # The segment may fail to be written, so leave the cached checksum as it is
+            checksum = checksum.copy()
+        else:
+            checksum, size = new_checksum, 0
+        if size < offset:
+            with open(ContentUploadManager._upload_file_path(upload_id)) as upload_file:
+                upload_file.seek(size)
+                while size < offset:
+                    data = upload_file.read(min(server_util.CHECKSUM_CHUNK_SIZE, offset - size))
+                    if not data:
+                        return None
+                    checksum.update(data)
+                    size += len(data)
+        return checksum
+
+    @staticmethod
+    def _save_running_checksum(upload_id, checksum, size):
+        """
+        Saves the running checksum of the given upload, so the other processes can extend it and
+        the importer can use it.
+
+        :param upload_id: identifies the upload in question
+        :type  upload_id: str
+        :param checksum:  checksum object covering the beginning of the upload
+        :type  checksum:  hashlib.HASH
+        :param size:      number of bytes of the upload the checksum covers
+        :type  size:      int
+        """
+        checksum_type = pulp_config.config.get('server', 'upload_checksum_type')
+        _running_checksums[upload_id] = (checksum_type, checksum, size)
+        state = {'checksum_type': checksum_type, 'value': checksum.hexdigest(), 'size': size}
+        file_path = ContentUploadManager._checksum_file_path(upload_id)
+        temp_path = '%s.%d' % (file_path, os.getpid())
+        with open(temp_path, 'w') as checksum_file:
+            json.dump(state, checksum_file)
+        os.rename(temp_path, file_path)
+
     @staticmethod
     def _upload_storage_dir():
         """
@@ -1,18 +1,25 @@
 import logging
+import os
+import threading
 
 from qpid.messaging import Connection
-from qpid.messaging.exceptions import ConnectionError, MessagingError
+from qpid.messaging.exceptions import ConnectionError
 
 from pulp.common.compat import json
+from pulp.server.async.emit import Publisher
 from pulp.server.compat import json_util
 from pulp.server.config import config
 
 
+_publisher_lock = threading.Lock()
+
+
 class TopicPublishManager(object):
     BASE_SUBJECT = 'pulp.server'
     EXCHANGE = config.get('messaging', 'topic_exchange')
 
     _connection = None
+    _publisher = None
     _logged_disabled = False
     _logger = logging.getLogger(__name__)
 
@@ -49,6 +56,19 @@ class TopicPublishManager(object):
 
         return cls._connection
 
+    @classmethod
+    def publisher(cls):
+        """
+        :return:    The topic message publisher of this process.
+        :rtype:     TopicPublisher
+        """
+        with _publisher_lock:
+            if cls._publisher is None or cls._publisher.pid != os.getpid():
+                # The connection of the parent process, if any, cannot be shared.
+                cls._connection = None
+                cls._publisher = TopicPublisher(config.getint('messaging', 'message_buffer_size'))
+            return cls._publisher
+
     @classmethod
     def publish(cls, event, exchange=None):
         """
@@ -56,8 +76,8 @@ class TopicPublishManager(object):
         version of the output from the event's "data" method as the content
         of the message.
 
-        Failures to publish a message will be logged but will not prevent
-        execution from continuing.
+        The message is sent by a background thread; failures to publish it
+        are logged but will not prevent execution from continuing.
 
         :param event: the event that should be published to a remote exchange
         :type  event: pulp.server.event.data.Event
@@ -66,16 +86,65 @@ class TopicPublishManager(object):
                          whatever is setup in the server config.
         :type  exchange: str
         """
-        connection = cls.connection()
-        if connection:
-            subject = '%s.%s' % (cls.BASE_SUBJECT, event.event_type)
-            destination = (
-                '%s/%s; {create:always, node:{type:topic}, link:{x-declare:{auto-delete:True}}}' % (
-                    exchange or cls.EXCHANGE, subject))
-
-            data = json.dumps(event.data(), default=json_util.default)
-            try:
-                cls.connection().session().sender(destination).send(data)
-            except MessagingError, e:
-                # log the error, but allow life to go on.
-                cls._logger.exception('could not publish message: %s' % str(e))
+        if not config.get('messaging', 'url'):
+            cls._disabled_message()
+            return
+        subject = '%s.%s' % (cls.BASE_SUBJECT, event.event_type)
+        destination = (
+            '%s/%s; {create:always, node:{type:topic}, link:{x-declare:{auto-delete:True}}}' % (
+                exchange or cls.EXCHANGE, subject))
+
+        data = json.dumps(event.data(), default=json_util.default)
+        cls.publisher().put((destination, data))
+
+
+class TopicPublisher(Publisher):
+    """
+    Publishes topic messages on the connection of the TopicPublishManager, with one
+    session. The sender of each destination, which declares its exchange, is created
+    once per session, when the first message is sent to it.
+    """
+
+    def __init__(self, max_queued):
+        """
+        :param max_queued: The maximum number of messages waiting to be published.
+        :type  max_queued: int
+        """
+        super(TopicPublisher, self).__init__('topic-publisher', max_queued)
+        self._session = None
+        self._senders = {}
+
+    def _publish(self, message):
+        """
+        Publish a message.
+
+        :param message: The destination and the content of the message.
+        :type  message: tuple
+        """
+        destination, data = message
+        if self._session is None:
+            connection = TopicPublishManager.connection()
+            if connection is None:
+                raise ConnectionError('not connected to the messaging server')
+            self._session = connection.session()
+            self._senders = {}
+        sender = self._senders.get(destination)
+        if sender is None:
+            sender = self._senders[destination] = self._session.sender(destination)
+        sender.send(data)
+
+    def _close(self):
+        """
+        Close the session and the connection of the TopicPublishManager, if any.
+        """
+        session = self._session
+        self._session = None
+        self._senders = {}
+        connection = TopicPublishManager._connection
+        TopicPublishManager._connection = None
+        for closeable in (session, connection):
+            if closeable is not None:
+                try:
+                    closeable.close()
+                except Exception:
+                    pass
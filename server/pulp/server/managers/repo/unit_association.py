@@ -105,7 +105,9 @@ class RepoUnitAssociationManager(object):
         """
         Creates multiple associations between the given repo and content units.
 
-        See associate_unit_by_id for semantics.
+        See associate_unit_by_id for semantics. The associations are made in
+        bulk, and the unit count and last unit added time of the repo are
+        updated once for all of them.
 
         @param repo_id: identifies the repo
         @type  repo_id: str
@@ -122,21 +124,7 @@ class RepoUnitAssociationManager(object):
         @raise InvalidType: if the given owner type is not of the valid enumeration
         """
 
-        # There may be a way to batch this in mongo which would be ideal for a
-        # bulk operation like this. But for deadline purposes, this call will
-        # simply loop and call the single method.
-
-        unique_count = 0
-        for unit_id in unit_id_list:
-            if not RepoUnitAssociationManager.association_exists(repo_id, unit_id, unit_type_id):
-                unique_count += 1
-            self.associate_unit_by_id(repo_id, unit_type_id, unit_id, False)
-
-        # update the count of associated units on the repo object
-        if unique_count:
-            repo_controller.update_unit_count(repo_id, unit_type_id, unique_count)
-            repo_controller.update_last_unit_added(repo_id)
-        return unique_count
+        return repo_controller.associate_units_by_id(repo_id, unit_type_id, unit_id_list)
 
     @staticmethod
     def _units_from_criteria(source_repo, criteria):
@@ -271,6 +259,8 @@ class RepoUnitAssociationManager(object):
             copied_units = importer_instance.import_units(
                 transfer_source_repo, transfer_dest_repo, conduit, call_config,
                 units=transfer_units)
+            # Save the units the importer left buffered in batch mode
+            conduit.flush_units()
             if isinstance(copied_units, tuple):
                 suc_units_ids = [u.to_id_dict() for u in copied_units[0] if u is not None]
                 unsuc_units_ids = [u.to_id_dict() for u in copied_units[1]]
@@ -390,6 +380,7 @@ class RepoUnitAssociationManager(object):
                 'unit_id': {'$in': unit_ids}
             }
             collection.remove(spec)
+            model.OrphanCandidate.objects.add(unit_type_id, unit_ids)
 
         repo_controller.update_last_unit_removed(repo_id)
         repo_controller.rebuild_content_unit_counts(repo)
@@ -4,6 +4,7 @@ Manager to return status information about a running Pulp instance
 from logging import getLogger
 from pkg_resources import get_distribution
 
+from pulp.server.async import worker_selection
 from pulp.server.async.celery_instance import celery
 from pulp.server.db import connection
 from pulp.server.db.model import Worker
@@ -28,6 +29,26 @@ def get_workers():
     return Worker.objects.get_online()
 
 
+def get_worker_selection_policy():
+    """
+    :returns:          name of the policy choosing the workers of reserved tasks
+    :rtype:            str
+    """
+    return worker_selection.get_policy_name()
+
+
+def get_worker_loads(worker_names):
+    """
+    :param worker_names: names of the workers
+    :type  worker_names: list
+    :returns:          worker names mapped to their number of reserved tasks and the mean
+                       runtime in seconds of the tasks they finished recently
+    :rtype:            dict
+    """
+    loads = worker_selection.get_worker_loads(worker_names)
+    return dict((name, load._asdict()) for name, load in loads.iteritems())
+
+
 def get_mongo_conn_status():
     """
     Perform a simple mongo operation and return success or failure.
@@ -14,8 +14,10 @@ from pulp.server.managers import factory
 from pulp.server.managers.consumer import bind
 from pulp.server.managers.consumer import profile
 from pulp.server.managers.consumer import query as query_manager
-from pulp.server.managers.consumer.applicability import (regenerate_applicability_for_consumers,
-                                                         retrieve_consumer_applicability)
+from pulp.server.managers.consumer.applicability import (APPLICABILITY_PAGE_SIZE,
+                                                         regenerate_applicability_for_consumers,
+                                                         retrieve_consumer_applicability,
+                                                         retrieve_consumer_applicability_page)
 from pulp.server.managers.schedule.consumer import (UNIT_INSTALL_ACTION, UNIT_UNINSTALL_ACTION,
                                                     UNIT_UPDATE_ACTION)
 from pulp.server.webservices.views import search
@@ -812,7 +814,9 @@ class ConsumerContentApplicabilityView(View):
         Query content applicability for a given consumer criteria query.
 
         body {criteria: <object>,
-              content_types: <array>[optional]}
+              content_types: <array>[optional],
+              page_size: <int>[optional],
+              page_token: <str>[optional]}
 
         This method returns a JSON document containing an array of objects that each have two
         keys: 'consumers', and 'applicability'. 'consumers' will index an array of consumer_ids,
@@ -825,6 +829,10 @@ class ConsumerContentApplicabilityView(View):
          {'consumers': ['consumer_2', 'consumer_3'],
           'applicability': {'content_type_1': ['unit_1', 'unit_2']}}]
 
+        If page_size or page_token is given, the consumers are reported on page_size at a time.
+        The response is then an object with the array of one page under 'applicability', and the
+        page_token to request the next page with under 'next_page', which is null on the last page.
+
         :param request: WSGI request object
         :type request: django.core.handlers.wsgi.WSGIRequest
 
@@ -838,10 +846,16 @@ class ConsumerContentApplicabilityView(View):
         try:
             consumer_criteria = self._get_consumer_criteria(request)
             content_types = self._get_content_types(request)
+            page = self._get_page(request, consumer_criteria)
         except InvalidValue, e:
             return HttpResponseBadRequest(str(e))
 
-        response = retrieve_consumer_applicability(consumer_criteria, content_types)
+        if page is not None:
+            page_size, page_token = page
+            response = retrieve_consumer_applicability_page(consumer_criteria, content_types,
+                                                            page_size, page_token)
+        else:
+            response = retrieve_consumer_applicability(consumer_criteria, content_types)
         return generate_json_response_with_pulp_encoder(response)
 
     def _get_consumer_criteria(self, request):
@@ -890,6 +904,41 @@ class ConsumerContentApplicabilityView(View):
 
         return content_types
 
+    def _get_page(self, request, consumer_criteria):
+        """
+        Get the page of consumers that the caller wishes to limit the response to. If the caller
+        did not ask for a paginated response, this will return None.
+
+        :param request: WSGI request object
+        :type request: django.core.handlers.wsgi.WSGIRequest
+        :param consumer_criteria: The consumer criteria from the request
+        :type consumer_criteria: pulp.server.db.model.criteria.Criteria
+
+        :raises InvalidValue: if some parameters were invalid
+
+        :return: (page_size, page_token), or None if no page was requested
+        :rtype:  tuple or None
+        """
+
+        body = request.body_as_json
+
+        if 'page_size' not in body and 'page_token' not in body:
+            return None
+
+        page_size = body.get('page_size', APPLICABILITY_PAGE_SIZE)
+        if isinstance(page_size, bool) or not isinstance(page_size, int) or page_size < 1:
+            raise InvalidValue('page_size must be a positive integer.')
+
+        page_token = body.get('page_token')
+        if page_token is not None and not isinstance(page_token, basestring):
+            raise InvalidValue('page_token must be a string.')
+
+        if consumer_criteria.limit is not None or consumer_criteria.skip is not None:
+            raise InvalidValue('limit and skip cannot be used in the criteria of a paginated '
+                               'query.')
+
+        return page_size, page_token
+
 
 class ConsumerContentApplicRegenerationView(View):
     """
@@ -478,8 +478,9 @@ class UploadSegmentResourceView(View):
         upload_manager = factory.content_upload_manager()
 
         # If the upload ID doesn't exists, either because it was not initialized
-        # or was deleted, the call to the manager will raise missing resource
-        upload_manager.save_data(upload_id, offset, request.body)
+        # or was deleted, the call to the manager will raise missing resource. The request is
+        # read as a stream, so the segment is written to the file without being held in memory.
+        upload_manager.save_stream(upload_id, offset, request)
         return generate_json_response(None)
 
 
@@ -29,16 +29,22 @@ class StatusView(View):
 
         # do not ask for the worker list unless we have a DB connection
         if pulp_db_connection['connected']:
+            workers = list(status_manager.get_workers())
             # convert Worker documents to dicts
-            pulp_workers = [w.to_mongo().to_dict() for w in status_manager.get_workers()]
+            pulp_workers = [w.to_mongo().to_dict() for w in workers]
+            worker_loads = status_manager.get_worker_loads([w.name for w in workers])
         else:
             pulp_workers = []
+            worker_loads = {}
 
         # 'api_version' is deprecated and can go away in 3.0, bz #1171763
         status_data = {'api_version': '2',
                        'versions': pulp_version,
                        'database_connection': pulp_db_connection,
                        'messaging_connection': pulp_messaging_connection,
-                       'known_workers': pulp_workers}
+                       'known_workers': pulp_workers,
+                       'worker_selection': {
+                           'policy': status_manager.get_worker_selection_policy(),
+                           'worker_loads': worker_loads}}
 
         return generate_json_response_with_pulp_encoder(status_data)
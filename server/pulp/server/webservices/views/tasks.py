@@ -2,6 +2,10 @@
 This module contains views related to Pulp's task system models.
 """
 from datetime import datetime
+import hashlib
+import json
+import threading
+import time
 
 from django.views.generic import View
 from django.http import HttpResponse
@@ -12,18 +16,27 @@ from pulp.common.constants import CALL_CANCELED_STATE, CALL_COMPLETE_STATES
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.async import tasks
 from pulp.server.auth import authorization
+from pulp.server.config import config
 from pulp.server.db.model import Worker, TaskStatus
 from pulp.server.exceptions import MissingResource
 from pulp.server.webservices.views import search
 from pulp.server.webservices.views.decorators import auth_required
 from pulp.server.webservices.views.serializers import dispatch as serial_dispatch
 from pulp.server.webservices.views.util import (generate_json_response,
-                                                generate_json_response_with_pulp_encoder)
+                                                generate_json_response_with_pulp_encoder,
+                                                parse_json_body, pulp_json_encoder)
 
 
 # This constant set is used for deleting the completed tasks from the collection.
 VALID_STATES = set(filter(lambda state: state != CALL_CANCELED_STATE, CALL_COMPLETE_STATES))
 
+# How often, in seconds, a watch request checks the watched tasks for changes.
+WATCH_INTERVAL = 0.5
+
+# Bounds the number of watch requests of this process that wait for changes at once, so they
+# cannot take all the threads of the web server process.
+_watchers = threading.Semaphore(max(0, config.getint('tasks', 'max_watchers')))
+
 
 def task_serializer(task):
     """
@@ -41,6 +54,83 @@ def task_serializer(task):
     return task
 
 
+def task_report(task):
+    """
+    Serialize a task for the API, including the queue of the worker it was assigned to.
+
+    :param task: The task from the database
+    :type  task: pulp.server.db.model.TaskStatus
+
+    :return: the serialized task
+    :rtype: dict
+    """
+    task_dict = task_serializer(task)
+    if 'worker_name' in task_dict:
+        queue_name = Worker(name=task_dict['worker_name'],
+                            last_heartbeat=datetime.now()).queue_name
+        task_dict.update({'queue': queue_name})
+    return task_dict
+
+
+def watch_token(task_dict):
+    """
+    Build the watch token of a serialized task: a digest of the value of each of its fields,
+    used to tell which fields changed since the token was handed out.
+
+    :param task_dict: A serialized task
+    :type  task_dict: dict
+
+    :return: the watch token
+    :rtype: str
+    """
+    digests = []
+    for field, value in sorted(task_dict.items()):
+        encoded = json.dumps(value, sort_keys=True, default=pulp_json_encoder)
+        digests.append('%s:%s' % (field, hashlib.sha1(encoded).hexdigest()[:12]))
+    return ','.join(digests)
+
+
+def task_changes(task_dict, token):
+    """
+    Find the fields of a serialized task that changed since a watch token was handed out.
+
+    :param task_dict: A serialized task
+    :type  task_dict: dict
+    :param token: A watch token of the task, or None
+    :type  token: str or None
+
+    :return: the new watch token and the changed fields, with their values. Fields that were
+             removed have a value of None.
+    :rtype: tuple
+    """
+    new_token = watch_token(task_dict)
+    if token == new_token:
+        return new_token, {}
+    old_digests = dict(item.split(':', 1) for item in token.split(',')) if token else {}
+    new_digests = dict(item.split(':', 1) for item in new_token.split(','))
+    changes = dict((field, task_dict[field]) for field, digest in new_digests.items()
+                   if old_digests.get(field) != digest)
+    changes.update((field, None) for field in old_digests if field not in new_digests)
+    return new_token, changes
+
+
+def valid_watch_token(token):
+    """
+    Tell whether a watch token sent by a client is well formed.
+
+    :param token: A watch token of a task, or None
+    :type  token: object
+
+    :return: True if the token is None or a string of field:digest pairs separated by commas
+    :rtype: bool
+    """
+    if token is None:
+        return True
+    if not isinstance(token, basestring):
+        return False
+    return all(len(item.split(':', 1)) == 2 for item in token.split(','))
+
+
 class TaskSearchView(search.SearchView):
     """
     This view provides GET and POST searching on TaskStatus objects.
@@ -124,12 +214,7 @@ class TaskResourceView(View):
         except DoesNotExist:
             raise MissingResource(task_id)
 
-        task_dict = task_serializer(task)
-        if 'worker_name' in task_dict:
-            queue_name = Worker(name=task_dict['worker_name'],
-                                last_heartbeat=datetime.now()).queue_name
-            task_dict.update({'queue': queue_name})
-        return generate_json_response_with_pulp_encoder(task_dict)
+        return generate_json_response_with_pulp_encoder(task_report(task))
 
     @auth_required(authorization.DELETE)
     def delete(self, request, task_id):
@@ -146,3 +231,85 @@ class TaskResourceView(View):
         """
         tasks.cancel(task_id)
         return generate_json_response(None)
+
+
+class TaskWatchView(View):
+    """
+    View for waiting on changes to tasks.
+    """
+
+    @auth_required(authorization.READ)
+    @parse_json_body(json_type=dict)
+    def post(self, request):
+        """
+        Wait until any of the given tasks changes or the timeout passes, and return the fields
+        of each task that changed since its watch token was handed out. Tasks are checked for
+        changes every WATCH_INTERVAL seconds. When as many requests as the tasks max_watchers
+        setting wait in this process already, the changed tasks are returned right away.
+
+        The body contains 'tasks', a dict of the watch token of each task by task ID, and
+        optionally 'timeout', the number of seconds to wait for a change. The token of a task
+        is None on the first request. The timeout is capped by the tasks watch_timeout setting,
+        which is also the default.
+
+        :param request: WSGI request object
+        :type  request: django.core.handlers.wsgi.WSGIRequest
+
+        :return: Response containing a dict of the changed tasks by task ID. Each is a dict with
+                 'changes', the changed fields of the task report and their values, and 'token',
+                 the new watch token of the task. It is empty if the timeout passed.
+        :rtype:  django.http.HttpResponse
+        :raises MissingValue: if no tasks are given
+        :raises InvalidValue: if some parameters are invalid
+        :raises MissingResource: if some of the tasks are not found
+        """
+        params = request.body_as_json
+        tokens = params.pop('tasks', None)
+        max_timeout = config.getfloat('tasks', 'watch_timeout')
+        timeout = params.pop('timeout', max_timeout)
+        if not tokens:
+            raise pulp_exceptions.MissingValue(['tasks'])
+        if not isinstance(tokens, dict):
+            raise pulp_exceptions.InvalidValue(['tasks'])
+        if not all(valid_watch_token(token) for token in tokens.values()):
+            raise pulp_exceptions.InvalidValue(['tasks'])
+        if not isinstance(timeout, (int, long, float)) or timeout < 0:
+            raise pulp_exceptions.InvalidValue(['timeout'])
+        if params:
+            raise pulp_exceptions.InvalidValue(params.keys())
+
+        if not _watchers.acquire(False):
+            return generate_json_response_with_pulp_encoder(self._changed_tasks(tokens))
+        try:
+            deadline = time.time() + min(timeout, max_timeout)
+            while True:
+                changed = self._changed_tasks(tokens)
+                if changed or time.time() >= deadline:
+                    return generate_json_response_with_pulp_encoder(changed)
+                time.sleep(WATCH_INTERVAL)
+        finally:
+            _watchers.release()
+
+    @staticmethod
+    def _changed_tasks(tokens):
+        """
+        Find the tasks that changed since their watch tokens were handed out.
+
+        :param tokens: The watch token of each task by task ID
+        :type  tokens: dict
+
+        :return: The changed tasks by task ID. Each is a dict with 'changes' and 'token'.
+        :rtype:  dict
+        :raises MissingResource: if some of the tasks are not found
+        """
+        tasks_by_id = dict((task.task_id, task)
+                           for task in TaskStatus.objects(task_id__in=tokens.keys()))
+        missing = [task_id for task_id in tokens if task_id not in tasks_by_id]
+        if missing:
+            raise MissingResource(task_ids=missing)
+        changed = {}
+        for task_id, task in tasks_by_id.items():
+            token, changes = task_changes(task_report(task), tokens[task_id])
+            if changes:
+                changed[task_id] = {'changes': changes, 'token': token}
+        return changed
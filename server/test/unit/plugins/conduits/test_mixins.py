@@ -1,6 +1,6 @@
 import unittest
 
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import mock
 import mongoengine
 
@@ -12,6 +12,7 @@ from pulp.server import constants
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.controllers import distributor as dist_controller
 from pulp.server.db import model
+from pulp.server.db.querysets import DUPLICATE_KEY_ERROR
 from pulp.server.exceptions import MissingResource
 from pulp.server.managers import factory as manager_factory
 import pulp.plugins.types.database as types_database
@@ -620,6 +621,104 @@ class AddUnitMixinTests(unittest.TestCase):
         # Test
         self.assertRaises(mixins.ImporterConduitException, self.mixin.save_unit, None)
 
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_collection')
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_multiple_units_by_keys_dicts')
+    @mock.patch('pulp.server.managers.repo.unit_association.RepoUnitAssociationManager.'
+                'associate_all_by_ids')
+    def test_save_unit_batch_mode(self, mock_associate, mock_get, mock_collection):
+        self.mixin.enable_batch_mode(batch_size=3)
+        mock_get.return_value = [{'_id': 'existing', 'k': 'v1'}]
+        units = [Unit('t', {'k': 'v1'}, {'m': 'm1'}, None),
+                 Unit('t', {'k': 'v2'}, {'m': 'm1'}, None),
+                 Unit('t', {'k': 'v2'}, {'m': 'm2'}, None)]
+
+        # Nothing is saved until the batch is full
+        self.mixin.save_unit(units[0])
+        self.mixin.save_unit(units[1])
+        self.assertFalse(mock_get.called)
+        self.assertEqual(units[0].id, None)
+        self.mixin.save_unit(units[2])
+
+        mock_get.assert_called_once_with('t', [{'k': 'v1'}, {'k': 'v2'}],
+                                         model_fields=['k', '_id'])
+        requests = mock_collection.return_value.bulk_write.call_args[0][0]
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[0]._filter, {'_id': 'existing'})
+        self.assertEqual(requests[0]._doc['$set']['m'], 'm1')
+        # the last unit saved with a unit key wins
+        self.assertEqual(requests[1]._doc['m'], 'm2')
+        self.assertFalse(mock_collection.return_value.bulk_write.call_args[1]['ordered'])
+
+        self.assertEqual(units[0].id, 'existing')
+        self.assertEqual(units[1].id, requests[1]._doc['_id'])
+        self.assertEqual(units[2].id, units[1].id)
+        mock_associate.assert_called_once_with(self.repo_id, 't', ['existing', units[1].id])
+        self.assertEqual(self.mixin._added_count, 1)
+        self.assertEqual(self.mixin._updated_count, 1)
+
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_collection')
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_multiple_units_by_keys_dicts', return_value=[])
+    @mock.patch('pulp.server.managers.repo.unit_association.RepoUnitAssociationManager.'
+                'associate_all_by_ids')
+    def test_flush_units_by_type(self, mock_associate, mock_get, mock_collection):
+        self.mixin.enable_batch_mode()
+        self.mixin.save_unit(Unit('t1', {'k': 'v'}, {}, None))
+        self.mixin.save_unit(Unit('t2', {'k': 'v'}, {}, None))
+        self.mixin.save_unit(Unit('t1', {'k': 'v2'}, {}, None))
+
+        self.mixin.flush_units()
+        self.mixin.flush_units()
+
+        self.assertEqual([c[0][0] for c in mock_get.call_args_list], ['t1', 't2'])
+        self.assertEqual(mock_collection.return_value.bulk_write.call_count, 2)
+        self.assertEqual([c[0][1] for c in mock_associate.call_args_list], ['t1', 't2'])
+        self.assertEqual(self.mixin._added_count, 3)
+
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_by_keys_dict', return_value={'_id': 'existing'})
+    @mock.patch('pulp.server.managers.content.cud.ContentManager.update_content_unit')
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_collection')
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_multiple_units_by_keys_dicts', return_value=[])
+    @mock.patch('pulp.server.managers.repo.unit_association.RepoUnitAssociationManager.'
+                'associate_all_by_ids')
+    def test_flush_units_race_condition(self, mock_associate, mock_get, mock_collection,
+                                        mock_update, mock_get_one):
+        """
+        A unit added by another workflow since it was looked up is updated instead.
+        """
+        self.mixin.enable_batch_mode()
+        units = [Unit('t', {'k': 'v1'}, {}, None), Unit('t', {'k': 'v2'}, {}, None)]
+        for unit in units:
+            self.mixin.save_unit(unit)
+        mock_collection.return_value.bulk_write.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 1, 'code': DUPLICATE_KEY_ERROR}]})
+
+        self.mixin.flush_units()
+
+        self.assertEqual(mock_update.call_count, 1)
+        self.assertEqual(units[1].id, 'existing')
+        self.assertEqual(self.mixin._added_count, 1)
+        self.assertEqual(self.mixin._updated_count, 1)
+        mock_associate.assert_called_once_with(self.repo_id, 't', [units[0].id, 'existing'])
+
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_content_unit_collection')
+    @mock.patch('pulp.server.managers.content.query.ContentQueryManager.'
+                'get_multiple_units_by_keys_dicts', return_value=[])
+    def test_flush_units_with_error(self, mock_get, mock_collection):
+        self.mixin.enable_batch_mode()
+        self.mixin.save_unit(Unit('t', {'k': 'v1'}, {}, None))
+        mock_collection.return_value.bulk_write.side_effect = BulkWriteError(
+            {'writeErrors': [{'index': 0, 'code': 2}]})
+
+        self.assertRaises(mixins.ImporterConduitException, self.mixin.flush_units)
+
     @mock.patch('pulp.server.managers.content.cud.ContentManager.link_referenced_content_units')
     def test_link_unit(self, mock_link):
         # Setup
@@ -724,6 +823,52 @@ class StatusMixinTests(unittest.TestCase):
         # Test
         self.assertRaises(mixins.ImporterConduitException, self.mixin.set_progress, 'foo')
 
+    @mock.patch('pulp.server.db.model.TaskStatus.objects')
+    @mock.patch('pulp.plugins.conduits.mixins.get_current_task_id')
+    def test_update_progress(self, mock_get_task_id, mock_task_status_objects):
+        # Setup
+        mock_get_task_id.return_value = 'test-id'
+        test_task_documents = mock_task_status_objects.return_value
+        self.mixin = mixins.StatusMixin('test-report', mixins.ImporterConduitException)
+        self.mixin.set_progress([{'a': 1}])
+
+        # Test
+        status = [{'a': 2, 'sub_steps': [{'b': 3}]}]
+        self.mixin.update_progress(status, [((0, 'a'), 2), ((0, 'sub_steps', 0), {'b': 3})])
+
+        # Verify
+        self.assertEqual(2, test_task_documents.update_one.call_count)
+        test_task_documents.update_one.assert_called_with(**{
+            'set__progress_report__test-report__0__a': 2,
+            'set__progress_report__test-report__0__sub_steps__0': {'b': 3}})
+        self.assertEqual({'test-report': status}, self.mixin.progress_report)
+
+    @mock.patch('pulp.server.db.model.TaskStatus.objects')
+    @mock.patch('pulp.plugins.conduits.mixins.get_current_task_id')
+    def test_update_progress_not_set(self, mock_get_task_id, mock_task_status_objects):
+        # Setup
+        mock_get_task_id.return_value = 'test-id'
+        self.mixin = mixins.StatusMixin('test-report', mixins.ImporterConduitException)
+
+        # Test
+        self.mixin.update_progress('status', [((0,), 'status')])
+
+        # Verify
+        mock_task_status_objects.return_value.update_one.assert_called_once_with(
+            set__progress_report={'test-report': 'status'})
+
+    @mock.patch('pulp.server.db.model.TaskStatus.objects')
+    def test_update_progress_with_exception(self, mock_call):
+        # Setup
+        self.mixin = mixins.StatusMixin('test-report', mixins.ImporterConduitException)
+        self.mixin.task_id = 'test_id'
+        self.mixin.progress_report['test-report'] = 'foo'
+        mock_call.side_effect = Exception()
+
+        # Test
+        self.assertRaises(mixins.ImporterConduitException, self.mixin.update_progress,
+                          'foo', [])
+
 
 class PublishReportMixinTests(unittest.TestCase):
 
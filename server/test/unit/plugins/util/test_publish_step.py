@@ -199,6 +199,156 @@ class StepTests(PublisherBase):
         step.report_progress()
         self.assertFalse(step.status_conduit.report_progress.called)
 
+    def test_report_progress_first(self):
+        """
+        Test that the first report is written in full
+        """
+        step = publish_step.Step('foo_step', status_conduit=Mock())
+        step.report_progress()
+        step.status_conduit.set_progress.assert_called_once_with(step.get_progress_report())
+        self.assertEquals(step.last_report, step.get_progress_report())
+
+    @patch('pulp.plugins.util.publish_step.threading.Timer')
+    def test_report_progress_coalesced(self, mock_timer):
+        """
+        Test that reports within the interval are coalesced into one pending write
+        """
+        step = publish_step.Step('foo_step', status_conduit=Mock())
+        step.report_progress()
+        step.progress_successes = 1
+        step.report_progress()
+        step.progress_successes = 2
+        step.report_progress()
+
+        self.assertEquals(1, step.status_conduit.set_progress.call_count)
+        self.assertFalse(step.status_conduit.update_progress.called)
+        self.assertEquals(1, mock_timer.call_count)
+        self.assertEquals(step._flush_progress, mock_timer.call_args[0][1])
+        mock_timer.return_value.start.assert_called_once_with()
+
+        # the pending write sends the latest progress and is done
+        step._flush_progress()
+        mock_timer.return_value.cancel.assert_called_once_with()
+        self.assertEquals(None, step._report_timer)
+        changes = step.status_conduit.update_progress.call_args[0][1]
+        self.assertEquals([((0,), step.get_progress_report()[0])], changes)
+
+    @patch('pulp.plugins.util.publish_step.threading.Timer')
+    def test_report_progress_coalesced_snapshot(self, mock_timer):
+        """
+        Test that the pending write sends the report built by the last report_progress() call,
+        without reading the steps from the timer thread
+        """
+        step = publish_step.Step('foo_step', status_conduit=Mock())
+        step.report_progress()
+        step.progress_successes = 1
+        step.report_progress()
+        expected = step.get_progress_report()
+        step.progress_successes = 2
+        step.progress_failures = 1
+
+        with patch.object(step, 'get_progress_report') as mock_get_report:
+            step._flush_progress()
+            self.assertFalse(mock_get_report.called)
+
+        self.assertEquals(expected, step.status_conduit.update_progress.call_args[0][0])
+        self.assertEquals(reporting_constants.STATE_NOT_STARTED, step.state)
+
+        # nothing is pending anymore
+        step._flush_progress()
+        self.assertEquals(1, step.status_conduit.update_progress.call_count)
+
+    @patch('pulp.plugins.util.publish_step.threading.Timer')
+    def test_report_progress_state_change(self, mock_timer):
+        """
+        Test that a state change is written without waiting for the interval
+        """
+        step = publish_step.Step('foo_step', status_conduit=Mock())
+        step.report_progress()
+        step.state = reporting_constants.STATE_RUNNING
+        step.report_progress()
+
+        self.assertFalse(mock_timer.called)
+        self.assertEquals(1, step.status_conduit.update_progress.call_count)
+
+    @patch('pulp.plugins.util.publish_step.pulp_config')
+    def test_report_progress_interval_passed(self, mock_config):
+        """
+        Test that a report after the interval is written immediately
+        """
+        mock_config.get.return_value = '0'
+        step = publish_step.Step('foo_step', status_conduit=Mock())
+        step.report_progress()
+        step.progress_successes = 1
+        step.report_progress()
+        step.report_progress()
+
+        mock_config.get.assert_called_once_with('tasks', 'progress_report_interval')
+        self.assertEquals(1, step.status_conduit.set_progress.call_count)
+        # unchanged progress is not written again
+        self.assertEquals(1, step.status_conduit.update_progress.call_count)
+
+    def test_report_progress_dirty_child(self):
+        """
+        Test that only the reports of the child steps that changed are written
+        """
+        step = publish_step.Step('foo_step', status_conduit=Mock())
+        child = publish_step.Step('child')
+        grandchildren = [publish_step.Step('grandchild'), publish_step.Step('grandchild')]
+        step.add_child(child)
+        for grandchild in grandchildren:
+            child.add_child(grandchild)
+        step.report_progress(force=True)
+
+        grandchildren[1].progress_successes = 1
+        step.report_progress(force=True)
+
+        report = grandchildren[1].get_progress_report()[0]
+        step.status_conduit.update_progress.assert_called_once_with(
+            step.get_progress_report(),
+            [((0, reporting_constants.PROGRESS_SUB_STEPS_KEY, 1), report)])
+
+
+class CopyProgressReportTests(unittest.TestCase):
+
+    def test_copy(self):
+        step = publish_step.Step('foo_step')
+        child = publish_step.Step('child')
+        step.add_child(child)
+        child.progress_details = {'a': [1]}
+
+        report = publish_step._copy_progress_report(step.get_progress_report())
+        child.error_details.append({'error': 'e'})
+        child.progress_details['a'].append(2)
+
+        self.assertEquals([], report[0][reporting_constants.PROGRESS_ERROR_DETAILS_KEY])
+        self.assertEquals({'a': [1]}, report[0][reporting_constants.PROGRESS_DETAILS_KEY])
+
+
+class ProgressChangesTests(unittest.TestCase):
+
+    def test_unchanged(self):
+        self.assertEquals([], publish_step._progress_changes([{'a': 1}], [{'a': 1}]))
+
+    def test_different_steps(self):
+        self.assertEquals(None, publish_step._progress_changes([{'a': 1}], []))
+
+    def test_changed_step(self):
+        old = [{'a': 1, 'sub_steps': [{'b': 1}]}, {'c': 1}]
+        new = [{'a': 2, 'sub_steps': [{'b': 2}]}, {'c': 1}]
+        self.assertEquals([((0,), new[0])], publish_step._progress_changes(old, new))
+
+    def test_changed_sub_steps(self):
+        old = [{'a': 1, 'sub_steps': [{'b': 1}, {'b': 1}]}]
+        new = [{'a': 1, 'sub_steps': [{'b': 1}, {'b': 2}]}]
+        self.assertEquals([((0, 'sub_steps', 1), {'b': 2})],
+                          publish_step._progress_changes(old, new))
+
+    def test_added_sub_step(self):
+        old = [{'a': 1, 'sub_steps': [{'b': 1}]}]
+        new = [{'a': 1, 'sub_steps': [{'b': 1}, {'b': 2}]}]
+        self.assertEquals([((0,), new[0])], publish_step._progress_changes(old, new))
+
 
 class TestStepProcessBlock(unittest.TestCase):
     def test_increments_progress(self):
@@ -219,6 +369,135 @@ class TestStepProcessBlock(unittest.TestCase):
         # make sure progress does not get incremented beyond the total
         self.assertEqual(step.progress_successes, 1)
 
+    def test_process_result(self):
+        step = publish_step.Step('foo_step', disable_reporting=True)
+        step.process_main = Mock()
+        step.process_result = Mock()
+
+        step._process_block(item='foo')
+
+        step.process_main.assert_called_once_with(item='foo')
+        step.process_result.assert_called_once_with('foo', step.process_main.return_value)
+
+
+class ConcurrentStep(publish_step.PluginStep):
+    """
+    A step that processes numbers on 4 threads, taking longer for the lower ones.
+    """
+
+    process_concurrency = 4
+
+    def __init__(self, items, **kwargs):
+        super(ConcurrentStep, self).__init__('concurrent_step', disable_reporting=True, **kwargs)
+        self.items = items
+        self.results = []
+
+    def get_total(self):
+        return len(self.items)
+
+    def get_iterator(self):
+        return iter(self.items)
+
+    def process_main(self, item=None):
+        time.sleep(0.005 * (len(self.items) - item))
+        if item == 5:
+            raise ValueError(item)
+        return item * 2
+
+    def process_result(self, item, result):
+        self.results.append((item, result))
+
+
+class TestPluginStepProcessItems(unittest.TestCase):
+
+    def test_ordered(self):
+        step = ConcurrentStep(range(1, 5))
+
+        step.process()
+
+        self.assertEqual(step.results, [(1, 2), (2, 4), (3, 6), (4, 8)])
+        self.assertEqual(step.progress_successes, 4)
+        self.assertEqual(step.state, reporting_constants.STATE_COMPLETE)
+
+    def test_unordered(self):
+        step = ConcurrentStep(range(1, 5))
+        step.ordered_results = False
+
+        step.process()
+
+        self.assertEqual(sorted(step.results), [(1, 2), (2, 4), (3, 6), (4, 8)])
+        self.assertNotEqual(step.results[0], (1, 2))
+        self.assertEqual(step.progress_successes, 4)
+
+    def test_bounded(self):
+        step = ConcurrentStep(range(1, 5))
+        step.process_concurrency = 2
+        consumed = []
+
+        def get_iterator():
+            for item in step.items:
+                consumed.append(item)
+                yield item
+
+        def process_result(item, result):
+            step.results.append((item, len(consumed)))
+
+        step.get_iterator = get_iterator
+        step.process_result = process_result
+
+        step.process()
+
+        # four items are processed or waiting when the first one completes
+        self.assertEqual(step.results[0], (1, 4))
+
+    def test_non_halting_exception(self):
+        step = ConcurrentStep(range(1, 9), non_halting_exceptions=[ValueError])
+        step.status_conduit = Mock()
+
+        self.assertRaises(publish_step.PulpCodedTaskFailedException, step.process)
+
+        self.assertEqual([item for item, result in step.results], [1, 2, 3, 4, 6, 7, 8])
+        self.assertEqual(step.progress_successes, 7)
+        self.assertEqual(step.progress_failures, 1)
+        self.assertEqual(len(step.exceptions), 1)
+
+    def test_halting_exception(self):
+        step = ConcurrentStep(range(1, 9))
+
+        self.assertRaises(ValueError, step.process)
+
+        self.assertEqual([item for item, result in step.results], [1, 2, 3, 4])
+        self.assertEqual(step.state, reporting_constants.STATE_FAILED)
+
+    def test_cancel(self):
+        step = ConcurrentStep(range(1, 30))
+        step.process_concurrency = 2
+
+        def process_result(item, result):
+            step.results.append(item)
+            step.cancel()
+
+        step.process_result = process_result
+
+        step.process()
+
+        # the items in flight when the step was canceled are completed
+        self.assertEqual(step.results, [1, 2, 3, 4])
+
+    def test_recorded_failure(self):
+        step = ConcurrentStep(range(1, 5))
+
+        def process_main(item=None):
+            if item == 2:
+                step._record_failure()
+
+        step.process_main = process_main
+
+        step.process()
+
+        self.assertEqual(step.progress_successes, 3)
+        self.assertEqual(step.progress_failures, 1)
+
 
 class PluginStepTests(PluginBase):
     """
@@ -4,7 +4,9 @@ This module contains tests for the pulp.server.async.emit module.
 import unittest
 
 import mock
-from pulp.server.async.emit import send
+from pulp.server.async import emit
+from pulp.server.async.emit import (DEFAULT_EXCHANGE_NAME, NotificationPublisher, Publisher,
+                                    get_publisher, send)
 
 
 class TestEmit(unittest.TestCase):
@@ -38,42 +40,210 @@ class TestEmit(unittest.TestCase):
         mock_logger.warn.assert_called_once_with('unable to convert document to JSON; '
                                                  'event message not sent')
 
+    @mock.patch('pulp.server.async.emit.get_publisher')
     @mock.patch('pulp.server.async.emit.config')
-    @mock.patch('pulp.server.async.emit.Connection')
-    @mock.patch('pulp.server.async.emit.Producer')
-    def test_send_other_exception(self, mock_producer, mock_conn, mock_config):
+    def test_send(self, mock_config, mock_get_publisher):
         """
-        Raise an exception if we get an Exception when sending a message
+        Test that the message is queued to be published
         """
         doc = mock.Mock()
         doc.to_json.return_value = '{"a": "B"}'
         mock_config.getboolean.return_value = True
-        mock_config.get.return_value = "amqp://some.amqp.url/"
-        mock_producer.side_effect = Exception("boom!")
 
-        self.assertRaises(Exception, send, doc)
+        send(doc, routing_key='tasks.1')
 
+        mock_get_publisher.return_value.put.assert_called_once_with(('{"a": "B"}', 'tasks.1'))
+
+    @mock.patch('pulp.server.async.emit._publisher', None)
+    @mock.patch('pulp.server.async.emit.os.getpid')
     @mock.patch('pulp.server.async.emit.config')
+    def test_get_publisher(self, mock_config, mock_getpid):
+        """
+        Test that each process has a publisher of its own
+        """
+        mock_config.get.return_value = 'amqp://some.amqp.url/'
+        mock_config.getint.return_value = 10
+        mock_getpid.return_value = 1
+
+        first = get_publisher()
+        second = get_publisher()
+        mock_getpid.return_value = 2
+        third = get_publisher()
+
+        self.assertTrue(isinstance(first, NotificationPublisher))
+        self.assertTrue(first is second)
+        self.assertFalse(first is third)
+        self.assertEqual(third.pid, 2)
+        self.assertEqual(third.broker_url, 'amqp://some.amqp.url/')
+        mock_config.getint.assert_called_with('messaging', 'message_buffer_size')
+
+
+class FakePublisher(Publisher):
+    """
+    Records the published messages instead of sending them to a broker.
+    """
+
+    def __init__(self, max_queued=10):
+        super(FakePublisher, self).__init__('fake-publisher', max_queued)
+        self.published = []
+        self.failures = 0
+        self.closed = 0
+
+    def _publish(self, message):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('broker unreachable')
+        self.published.append(message)
+
+    def _close(self):
+        self.closed += 1
+
+
+@mock.patch('pulp.server.async.emit.atexit', mock.Mock())
+@mock.patch('pulp.server.async.emit.RECONNECT_INTERVAL', 0)
+class TestPublisher(unittest.TestCase):
+
+    def test_put(self):
+        """
+        Test that the queued messages are published in order
+        """
+        publisher = FakePublisher()
+
+        for i in range(5):
+            self.assertTrue(publisher.put(i))
+        publisher.flush(5)
+
+        self.assertEqual(publisher.published, range(5))
+        self.assertEqual(publisher.stats(), {'queued': 0, 'published': 5, 'dropped': 0})
+        self.assertTrue(publisher._thread.daemon)
+        emit.atexit.register.assert_called_with(publisher.stop, emit.EXIT_TIMEOUT)
+
+    @mock.patch('pulp.server.async.emit._logger', mock.Mock())
+    def test_put_full(self):
+        """
+        Test that messages that do not fit in the queue are dropped without blocking
+        """
+        publisher = FakePublisher(max_queued=2)
+        publisher._start = mock.Mock()
+
+        results = [publisher.put(i) for i in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(publisher.stats(), {'queued': 2, 'published': 0, 'dropped': 1})
+
+    def test_retry(self):
+        """
+        Test that a message is published again on a new connection when publishing fails
+        """
+        publisher = FakePublisher()
+        publisher.failures = 1
+
+        publisher.put('a')
+        publisher.flush(5)
+
+        self.assertEqual(publisher.published, ['a'])
+        self.assertEqual(publisher.closed, 1)
+        self.assertEqual(publisher.stats()['dropped'], 0)
+
+    @mock.patch('pulp.server.async.emit._logger')
+    def test_drop(self, mock_logger):
+        """
+        Test that a message is dropped when publishing it fails twice, and that dropped
+        messages are logged at most every DROPPED_WARNING_INTERVAL seconds
+        """
+        publisher = FakePublisher()
+        publisher.failures = 4
+
+        for message in ('a', 'b', 'c'):
+            publisher.put(message)
+        publisher.flush(5)
+
+        self.assertEqual(publisher.published, ['c'])
+        self.assertEqual(publisher.stats(), {'queued': 0, 'published': 1, 'dropped': 2})
+        self.assertEqual(mock_logger.warn.call_count, 1)
+
+    @mock.patch('pulp.server.async.emit.time.time')
+    def test_flush_timeout(self, mock_time):
+        """
+        Test that flush() returns once the timeout passed
+        """
+        publisher = FakePublisher()
+        publisher._start = mock.Mock()
+        publisher.put('a')
+        mock_time.side_effect = [100, 106]
+
+        publisher.flush(5)
+
+        self.assertEqual(publisher.stats()['queued'], 1)
+
+    def test_stop(self):
+        """
+        Test that stop() publishes the queued messages, and that the thread stops
+        """
+        publisher = FakePublisher()
+        publisher.put('a')
+
+        publisher.stop(5)
+        publisher.put('b')
+        publisher._thread.join(5)
+
+        self.assertEqual(publisher.published, ['a'])
+        self.assertFalse(publisher._thread.is_alive())
+
+    @mock.patch('pulp.server.async.emit.os.getpid')
+    def test_flush_forked(self, mock_getpid):
+        """
+        Test that flush() does not wait for the messages of the parent process
+        """
+        mock_getpid.return_value = 1
+        publisher = FakePublisher()
+        publisher._start = mock.Mock()
+        publisher.put('a')
+        mock_getpid.return_value = 2
+
+        publisher.flush(5)
+
+        self.assertEqual(publisher.stats()['queued'], 1)
+
+
+class TestNotificationPublisher(unittest.TestCase):
+
     @mock.patch('pulp.server.async.emit.Producer')
     @mock.patch('pulp.server.async.emit.Connection')
     @mock.patch('pulp.server.async.emit.Exchange')
-    def test_send(self, mock_exchange, mock_conn, mock_producer, mock_config):
+    def test_publish(self, mock_exchange, mock_conn, mock_producer):
         """
-        Test a successful send
+        Test that messages are published on one connection, declaring the exchange once
         """
-        doc = mock.Mock()
-        doc.to_json.return_value = '{"a": "B"}'
-        mock_config.getboolean.return_value = True
-        mock_config.get.return_value = "amqp://some.amqp.url/"
-
-        mock_exchange_instance = mock.Mock()
-        mock_exchange.return_value = mock_exchange_instance
+        publisher = NotificationPublisher('amqp://some.amqp.url/', 10)
+
+        publisher._publish(('{"a": "B"}', None))
+        publisher._publish(('{"a": "C"}', 'tasks.1'))
+
+        mock_exchange.assert_called_once_with(name=DEFAULT_EXCHANGE_NAME, type='topic')
+        mock_conn.assert_called_once_with('amqp://some.amqp.url/')
+        mock_producer.assert_called_once_with(mock_conn.return_value)
+        producer = mock_producer.return_value
+        producer.maybe_declare.assert_called_once_with(mock_exchange.return_value)
+        self.assertEqual(producer.publish.call_args_list,
+                         [mock.call('{"a": "B"}', routing_key=None,
+                                    exchange=mock_exchange.return_value),
+                          mock.call('{"a": "C"}', routing_key='tasks.1',
+                                    exchange=mock_exchange.return_value)])
 
-        mock_producer_instance = mock.Mock()
-        mock_producer.return_value = mock_producer_instance
+    @mock.patch('pulp.server.async.emit.Producer')
+    @mock.patch('pulp.server.async.emit.Connection')
+    def test_close(self, mock_conn, mock_producer):
+        """
+        Test that the connection is released and a new one made for the next message
+        """
+        publisher = NotificationPublisher('amqp://some.amqp.url/', 10)
+        publisher._publish(('{"a": "B"}', None))
+        mock_conn.return_value.release.side_effect = IOError()
 
-        send(doc)
+        publisher._close()
+        publisher._publish(('{"a": "C"}', None))
 
-        mock_producer_instance.maybe_declare.assert_called_once_with(mock_exchange_instance)
-        mock_producer_instance.publish.assert_called_once_with('{"a": "B"}', routing_key=None,
-                                                               exchange=mock_exchange_instance)
+        mock_conn.return_value.release.assert_called_once_with()
+        self.assertEqual(mock_conn.call_count, 2)
+        self.assertEqual(mock_producer.return_value.maybe_declare.call_count, 2)
@@ -1,8 +1,8 @@
 """
 This module contains tests for the pulp.server.async.tasks module.
 """
-from datetime import datetime
 import signal
+import threading
 import unittest
 import uuid
 
@@ -19,8 +19,8 @@ from pulp.common.constants import (CALL_CANCELED_STATE, CALL_FINISHED_STATE,
                                    SCHEDULER_WORKER_NAME, RESOURCE_MANAGER_WORKER_NAME)
 from pulp.common.tags import action_tag, resource_tag, RESOURCE_CONSUMER_TYPE
 from pulp.devel.unit.util import compare_dict
-from pulp.server.async import app, tasks
-from pulp.server.db.model import Worker, TaskStatus
+from pulp.server.async import app, tasks, worker_selection
+from pulp.server.db.model import TaskStatus
 from pulp.server.db.reaper import queue_reap_expired_documents
 from pulp.server.exceptions import NoWorkers, PulpException, PulpCodedException
 from pulp.server.maintenance.monthly import queue_monthly_maintenance
@@ -38,17 +38,9 @@ WORKER_3 = 'worker-3'
 class TestQueueReservedTask(ResourceReservationTests):
 
     def setUp(self):
-        self.patch_a = mock.patch('pulp.server.async.tasks.get_worker_for_reservation')
-        self.mock_get_worker_for_reservation = self.patch_a.start()
-
-        self.patch_b = mock.patch('pulp.server.async.tasks._get_unreserved_worker')
-        self.mock_get_unreserved_worker = self.patch_b.start()
-
-        self.patch_c = mock.patch('pulp.server.async.tasks.time', autospec=True)
-        self.mock_time = self.patch_c.start()
-
-        self.patch_d = mock.patch('pulp.server.async.tasks.ReservedResource', autospec=True)
-        self.mock_reserved_resource = self.patch_d.start()
+        self.patch_a = mock.patch('pulp.server.async.tasks._get_reservation_table')
+        self.mock_table = self.patch_a.start().return_value
+        self.mock_table.reserve.return_value = 'worker1'
 
         self.patch_e = mock.patch('pulp.server.async.tasks.celery', autospec=True)
         self.mock_celery = self.patch_e.start()
@@ -61,25 +53,20 @@ class TestQueueReservedTask(ResourceReservationTests):
 
     def tearDown(self):
         self.patch_a.stop()
-        self.patch_b.stop()
-        self.patch_c.stop()
-        self.patch_d.stop()
         self.patch_e.stop()
         self.patch_f.stop()
         super(TestQueueReservedTask, self).tearDown()
 
-    def test_creates_and_saves_reserved_resource(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
+    def test_reserves_resource(self):
         tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
-        self.mock_reserved_resource.assert_called_once_with(task_id='my_task_id',
-                                                            worker_name='worker1',
-                                                            resource_id='my_resource_id')
-        self.mock_reserved_resource.return_value.save.assert_called_once_with()
+        self.mock_table.reserve.assert_called_once_with('my_task_id', ['my_resource_id'])
+
+    def test_reserves_resource_list(self):
+        tasks._queue_reserved_task_list('task_name', 'my_task_id', ['r1', 'r2'], [1, 2],
+                                        {'a': 2})
+        self.mock_table.reserve.assert_called_once_with('my_task_id', ['r1', 'r2'])
 
     def test_dispatches_inner_task(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
         tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
         apply_async = self.mock_celery.tasks['task_name'].apply_async
         if is_celery_4:
@@ -92,8 +79,6 @@ class TestQueueReservedTask(ResourceReservationTests):
                                                 exchange='C.dq')
 
     def test_dispatches__release_resource(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
         tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
         if is_celery_4:
             self.mock__release_resource.apply_async.assert_called_once_with(('my_task_id',),
@@ -104,44 +89,110 @@ class TestQueueReservedTask(ResourceReservationTests):
                                                                             routing_key='worker1',
                                                                             exchange='C.dq')
 
-    def test_get_worker_for_reservation_breaks_out_of_loop(self):
-        self.mock_get_worker_for_reservation.return_value = Worker(
-            name='worker1', last_heartbeat=datetime.utcnow())
-        tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
-        self.assertTrue(not self.mock_get_unreserved_worker.called)
-        self.assertTrue(not self.mock_time.sleep.called)
 
-    def test_get_unreserved_worker_breaks_out_of_loop(self):
-        self.mock_get_worker_for_reservation.side_effect = NoWorkers()
-        self.mock_get_unreserved_worker.return_value = Worker(name='worker1',
-                                                              last_heartbeat=datetime.utcnow())
-        tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2], {'a': 2})
-        self.assertTrue(not self.mock_time.sleep.called)
+class TestReservationTable(unittest.TestCase):
 
-    def test_loops_and_sleeps_waiting_for_available_worker(self):
-        self.mock_get_worker_for_reservation.side_effect = NoWorkers()
-        self.mock_get_unreserved_worker.side_effect = NoWorkers()
+    def setUp(self):
+        self.patch_a = mock.patch('pulp.server.async.tasks.ReservedResource', autospec=True)
+        self.mock_reserved_resource = self.patch_a.start()
+        self.mock_reserved_resource.objects.all.return_value = [
+            {'task_id': 'task-1', 'worker_name': WORKER_1, 'resource_id': 'r1'},
+            {'task_id': 'task-1', 'worker_name': WORKER_1, 'resource_id': 'r2'},
+        ]
 
-        class BreakOutException(Exception):
-            pass
+        self.patch_b = mock.patch('pulp.server.async.tasks.Worker', autospec=True)
+        self.mock_worker = self.patch_b.start()
+        self.mock_worker.objects.get_online.return_value = [
+            {'name': RESOURCE_MANAGER_WORKER_NAME + '@host'}, {'name': WORKER_1},
+            {'name': WORKER_2}]
 
-        def side_effect(*args):
-            def second_call(*args):
-                raise BreakOutException()
-            self.mock_time.sleep.side_effect = second_call
-            return None
+        self.patch_c = mock.patch('pulp.server.async.tasks.worker_selection.get_mean_runtimes',
+                                  return_value={WORKER_1: 10.0})
+        self.patch_c.start()
 
-        self.mock_time.sleep.side_effect = side_effect
+        self.table = tasks.ReservationTable()
+        self.table.load()
 
-        try:
-            tasks._queue_reserved_task('task_name', 'my_task_id', 'my_resource_id', [1, 2],
-                                       {'a': 2})
-        except BreakOutException:
-            pass
-        else:
-            self.fail('_queue_reserved_task should have raised a BreakOutException')
+    def tearDown(self):
+        self.patch_a.stop()
+        self.patch_b.stop()
+        self.patch_c.stop()
 
-        self.mock_time.sleep.assert_has_calls([mock.call(0.25), mock.call(0.25)])
+    def test_held_resource_goes_to_its_worker(self):
+        self.assertEqual(self.table.wait_for_worker(['r2', 'r3']), WORKER_1)
+        self.assertFalse(self.mock_worker.objects.get_online.called)
+
+    def test_free_resource_goes_to_unreserved_worker(self):
+        self.assertEqual(self.table.wait_for_worker(['r3']), WORKER_2)
+
+    def test_free_resource_goes_to_selected_worker(self):
+        self.table._policy = mock.Mock()
+        self.table._policy.select.return_value = WORKER_1
+
+        self.assertEqual(self.table.wait_for_worker(['r3']), WORKER_1)
+        self.table._policy.select.assert_called_once_with({
+            WORKER_1: worker_selection.WorkerLoad(1, 10.0),
+            WORKER_2: worker_selection.WorkerLoad(0, None)})
+
+    def test_runtimes_not_fetched_for_policies_without_runtimes(self):
+        self.table._policy = worker_selection.UnreservedPolicy()
+
+        self.assertEqual(self.table.reserve('task-2', ['r3']), WORKER_2)
+        self.assertFalse(worker_selection.get_mean_runtimes.called)
+
+    def test_runtimes_fetched_without_condition(self):
+        self.table._policy = worker_selection.LeastLoadedPolicy()
+        owned = []
+        worker_selection.get_mean_runtimes.side_effect = lambda: (
+            owned.append(self.table._condition._is_owned()) or {WORKER_1: 10.0})
+
+        self.table.reserve('task-2', ['r3'])
+        self.table.wait_for_worker(['r4'])
+
+        self.assertEqual(owned, [False, False])
+
+    def test_online_workers_cached(self):
+        self.table.wait_for_worker(['r3'])
+        self.table.wait_for_worker(['r4'])
+        self.assertEqual(self.mock_worker.objects.get_online.call_count, 1)
+
+    def test_reserve_saves_and_records_reservations(self):
+        worker_name = self.table.reserve('task-2', ['r3', 'r4'])
+
+        self.assertEqual(worker_name, WORKER_2)
+        self.mock_reserved_resource.assert_has_calls([
+            mock.call(task_id='task-2', worker_name=WORKER_2, resource_id='r3'),
+            mock.call().save(),
+            mock.call(task_id='task-2', worker_name=WORKER_2, resource_id='r4'),
+            mock.call().save()])
+        self.assertEqual(self.table.wait_for_worker(['r4']), WORKER_2)
+
+    def test_release(self):
+        self.table.reserve('task-2', ['r1'])
+        self.table.release(['task-1', 'unknown-task'])
+        self.assertEqual(self.table.wait_for_worker(['r1']), WORKER_1)
+        self.table.release(['task-2'])
+        self.assertEqual(self.table._resources, {})
+        self.assertEqual(self.table._workers, {})
+
+    @mock.patch('pulp.server.async.tasks.RESERVATION_WAIT_TIMEOUT', 0.01)
+    def test_waits_for_release(self):
+        self.table.reserve('task-2', ['r3'])
+        releaser = threading.Timer(0.05, self.table.release, [['task-1']])
+        releaser.start()
+        # r1 and r3 are held by different workers until task-1 is released
+        self.assertEqual(self.table.wait_for_worker(['r1', 'r3']), WORKER_2)
+        releaser.join()
+
+    @mock.patch('pulp.server.async.tasks.ReservationTable.load')
+    @mock.patch('pulp.server.async.tasks.threading.Thread')
+    def test_get_reservation_table_started_once_per_process(self, mock_thread, mock_load):
+        with mock.patch('pulp.server.async.tasks._reservation_table', None):
+            table = tasks._get_reservation_table()
+            self.assertTrue(tasks._get_reservation_table() is table)
+            with mock.patch('pulp.server.async.tasks.os.getpid', return_value=-1):
+                self.assertFalse(tasks._get_reservation_table() is table)
+        self.assertEqual(mock_thread.return_value.start.call_count, 2)
 
 
 class TestDeleteWorker(ResourceReservationTests):
@@ -168,6 +219,9 @@ class TestDeleteWorker(ResourceReservationTests):
         self.patch_i = mock.patch('pulp.server.async.tasks.constants', autospec=True)
         self.mock_constants = self.patch_i.start()
 
+        self.patch_j = mock.patch('pulp.server.async.tasks.ReservationRelease')
+        self.mock_reservation_release = self.patch_j.start()
+
         super(TestDeleteWorker, self).setUp()
 
     def tearDown(self):
@@ -178,6 +232,7 @@ class TestDeleteWorker(ResourceReservationTests):
         self.patch_f.stop()
         self.patch_g.stop()
         self.patch_i.stop()
+        self.patch_j.stop()
         super(TestDeleteWorker, self).tearDown()
 
     def test_normal_shutdown_true_logs_correctly(self):
@@ -198,6 +253,17 @@ class TestDeleteWorker(ResourceReservationTests):
         remove = self.mock_reserved_resource.objects.return_value.delete
         remove.assert_called_once_with()
 
+    def test_records_release_of_reservations(self):
+        only = self.mock_reserved_resource.objects.return_value.only
+        only.return_value = [{'task_id': 'task-1'}, {'task_id': 'task-2'}]
+        tasks._delete_worker('worker1')
+        self.mock_reservation_release.assert_called_once_with(task_ids=['task-1', 'task-2'])
+        self.mock_reservation_release.return_value.save.assert_called_once_with()
+
+    def test_no_release_without_reservations(self):
+        tasks._delete_worker('worker1')
+        self.assertFalse(self.mock_reservation_release.called)
+
     @mock.patch('pulp.server.async.tasks.Worker.objects')
     def test_removes_the_worker(self, mock_worker_objects):
         mock_document = mock.Mock()
@@ -244,6 +310,9 @@ class TestReleaseResource(unittest.TestCase):
         self.patch_d = mock.patch('pulp.server.async.tasks.constants', autospec=True)
         self.mock_constants = self.patch_d.start()
 
+        self.patch_e = mock.patch('pulp.server.async.tasks.ReservationRelease')
+        self.mock_reservation_release = self.patch_e.start()
+
         super(TestReleaseResource, self).setUp()
 
     def tearDown(self):
@@ -251,6 +320,7 @@ class TestReleaseResource(unittest.TestCase):
         self.patch_b.stop()
         self.patch_c.stop()
         self.patch_d.stop()
+        self.patch_e.stop()
         super(TestReleaseResource, self).tearDown()
 
     def test_deletes_reserved_resource(self):
@@ -259,6 +329,11 @@ class TestReleaseResource(unittest.TestCase):
         self.mock_reserved_resource.objects.assert_called_once_with(task_id=mock_task_id)
         self.mock_reserved_resource.objects.return_value.delete.assert_called_once_with()
 
+    def test_records_release(self):
+        tasks._release_resource('task-1')
+        self.mock_reservation_release.assert_called_once_with(task_ids=['task-1'])
+        self.mock_reservation_release.return_value.save.assert_called_once_with()
+
     def test_finds_running_task_by_uuid(self):
         mock_task_id = mock.Mock()
         tasks._release_resource(mock_task_id)
@@ -0,0 +1,139 @@
+"""
+This module contains tests for the pulp.server.async.worker_selection module.
+"""
+from datetime import datetime, timedelta
+import unittest
+
+import mock
+
+from pulp.common import constants, dateutils
+from pulp.server.async import worker_selection
+from pulp.server.async.worker_selection import WorkerLoad
+
+
+MODULE = 'pulp.server.async.worker_selection.'
+
+
+class TestUnreservedPolicy(unittest.TestCase):
+
+    def test_select_unreserved(self):
+        policy = worker_selection.UnreservedPolicy()
+        loads = {'w1': WorkerLoad(1, 1.0), 'w2': WorkerLoad(0, 50.0), 'w3': WorkerLoad(0, None)}
+        self.assertEqual(policy.select(loads), 'w2')
+
+    def test_wait_when_all_reserved(self):
+        policy = worker_selection.UnreservedPolicy()
+        self.assertEqual(policy.select({'w1': WorkerLoad(1, 1.0)}), None)
+        self.assertEqual(policy.select({}), None)
+
+
+class TestLeastLoadedPolicy(unittest.TestCase):
+
+    def test_select_least_queued_work(self):
+        policy = worker_selection.LeastLoadedPolicy()
+        # w1 has 3 * 1s of work queued, w2 has 1 * 10s
+        loads = {'w1': WorkerLoad(3, 1.0), 'w2': WorkerLoad(1, 10.0)}
+        self.assertEqual(policy.select(loads), 'w1')
+
+    def test_select_idle(self):
+        policy = worker_selection.LeastLoadedPolicy()
+        loads = {'w1': WorkerLoad(1, 0.1), 'w2': WorkerLoad(0, 10.0)}
+        self.assertEqual(policy.select(loads), 'w2')
+
+    def test_unknown_runtime_is_mean(self):
+        policy = worker_selection.LeastLoadedPolicy()
+        # w3 is assumed to take (2 + 4) / 2 = 3 seconds per task
+        loads = {'w1': WorkerLoad(2, 2.0), 'w2': WorkerLoad(1, 4.0), 'w3': WorkerLoad(1, None)}
+        self.assertEqual(policy.select(loads), 'w3')
+
+    def test_no_workers(self):
+        self.assertEqual(worker_selection.LeastLoadedPolicy().select({}), None)
+
+
+class TestWeightedRoundRobinPolicy(unittest.TestCase):
+
+    def test_shares_follow_speed(self):
+        policy = worker_selection.WeightedRoundRobinPolicy()
+        # w1 finishes tasks three times as fast as w2
+        loads = {'w1': WorkerLoad(5, 1.0), 'w2': WorkerLoad(0, 3.0)}
+        selected = [policy.select(loads) for i in range(8)]
+        self.assertEqual(selected.count('w1'), 6)
+        self.assertEqual(selected.count('w2'), 2)
+        # smooth: w2 is not starved until the end of the cycle
+        self.assertTrue('w2' in selected[:4])
+
+    def test_equal_weights_alternate(self):
+        policy = worker_selection.WeightedRoundRobinPolicy()
+        loads = {'w1': WorkerLoad(0, None), 'w2': WorkerLoad(0, None)}
+        self.assertEqual([policy.select(loads) for i in range(4)], ['w1', 'w2', 'w1', 'w2'])
+
+    def test_forgets_offline_workers(self):
+        policy = worker_selection.WeightedRoundRobinPolicy()
+        policy.select({'w1': WorkerLoad(0, None), 'w2': WorkerLoad(0, None)})
+        self.assertEqual(policy.select({'w2': WorkerLoad(0, None)}), 'w2')
+        self.assertEqual(policy._current.keys(), ['w2'])
+
+
+class TestGetPolicy(unittest.TestCase):
+
+    @mock.patch(MODULE + 'config')
+    def test_configured(self, mock_config):
+        mock_config.get.return_value = 'least_loaded'
+        self.assertTrue(isinstance(worker_selection.get_policy(),
+                                   worker_selection.LeastLoadedPolicy))
+        mock_config.get.assert_called_once_with('tasks', 'worker_selection')
+
+    @mock.patch(MODULE + '_logger')
+    @mock.patch(MODULE + 'config')
+    def test_unknown(self, mock_config, mock_logger):
+        mock_config.get.return_value = 'fastest'
+        self.assertEqual(worker_selection.get_policy_name(), 'unreserved')
+        self.assertTrue(mock_logger.error.called)
+
+
+class TestGetMeanRuntimes(unittest.TestCase):
+
+    def setUp(self):
+        worker_selection._runtimes_cache['expiry'] = 0
+
+    def tearDown(self):
+        worker_selection._runtimes_cache['expiry'] = 0
+
+    @mock.patch(MODULE + 'TaskStatus')
+    def test_mean_runtimes(self, mock_task_status):
+        start = datetime.now(dateutils.utc_tz())
+
+        def status(worker_name, seconds):
+            return {'worker_name': worker_name,
+                    'start_time': dateutils.format_iso8601_datetime(start),
+                    'finish_time': dateutils.format_iso8601_datetime(
+                        start + timedelta(seconds=seconds))}
+
+        query = mock_task_status.objects.return_value.only.return_value.order_by.return_value
+        query.limit.return_value = [status('w1', 2), status('w1', 4), status('w2', 10),
+                                    {'worker_name': 'w3', 'start_time': None,
+                                     'finish_time': None}]
+
+        self.assertEqual(worker_selection.get_mean_runtimes(), {'w1': 3.0, 'w2': 10.0})
+        # cached
+        self.assertEqual(worker_selection.get_mean_runtimes(), {'w1': 3.0, 'w2': 10.0})
+
+        self.assertEqual(mock_task_status.objects.call_count, 1)
+        self.assertEqual(mock_task_status.objects.call_args[1]['state'],
+                         constants.CALL_FINISHED_STATE)
+        query.limit.assert_called_once_with(worker_selection.RUNTIME_SAMPLE_SIZE)
+
+
+class TestGetWorkerLoads(unittest.TestCase):
+
+    @mock.patch(MODULE + 'get_mean_runtimes', return_value={'w1': 3.0})
+    @mock.patch(MODULE + 'ReservedResource')
+    def test_loads(self, mock_reserved_resource, mock_get_mean_runtimes):
+        aggregate = mock_reserved_resource._get_collection.return_value.aggregate
+        aggregate.return_value = [{'_id': 'w1', 'count': 2}]
+
+        loads = worker_selection.get_worker_loads(['w1', 'w2'])
+
+        self.assertEqual(loads, {'w1': WorkerLoad(2, 3.0), 'w2': WorkerLoad(0, None)})
+        pipeline = aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0], {'$match': {'worker_name': {'$in': ['w1', 'w2']}}})
@@ -45,7 +45,7 @@ class TestContentView(TestCase):
         }
 
     @patch(MODULE + '.pulp_conf')
-    @patch(MODULE + '.Key.load')
+    @patch(MODULE + '.Key.load_cached')
     def test_init(self, key_load, pulp_conf):
         key_path = '/tmp/rsa.key'
         conf = {
@@ -61,7 +61,7 @@ class TestContentView(TestCase):
         # validation
         key_load.assert_called_once_with(key_path)
 
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     def test_urljoin(self):
         scheme = 'http'
         host = 'redhat.com'
@@ -133,6 +133,7 @@ class TestContentView(TestCase):
                 'redirect_host': '',
                 'redirect_port': '',
                 'redirect_path': redirect_path,
+                'redirect_url_cache_period': '0',
             }
         }
         pulp_conf.get.side_effect = lambda s, p: conf.get(s).get(p)
@@ -171,6 +172,7 @@ class TestContentView(TestCase):
                 'redirect_host': host,
                 'redirect_port': port,
                 'redirect_path': redirect_path,
+                'redirect_url_cache_period': '0',
             }
         }
         pulp_conf.get.side_effect = lambda s, p: conf.get(s).get(p)
@@ -189,12 +191,43 @@ class TestContentView(TestCase):
         redirect.assert_called_once_with(str(url.return_value.sign.return_value))
         self.assertEqual(reply, redirect.return_value)
 
+    @patch(MODULE + '.time.time')
+    @patch(MODULE + '.URL')
+    @patch(MODULE + '.pulp_conf')
+    def test_sign_cached(self, pulp_conf, url, now):
+        pulp_conf.get.return_value = '60'
+        url.return_value.sign.side_effect = ['signed-1', 'signed-2', 'signed-3']
+        key = Mock()
+        redirect = 'https://dev.example.com/streamer/zoo/lion'
+        content_views._signed_urls['period'] = None
+
+        # test
+        now.return_value = 1230.0
+        signed = [ContentView.sign(redirect, key, '10.0.0.1'),
+                  ContentView.sign(redirect, key, '10.0.0.2')]
+        now.return_value = 1259.0
+        signed.append(ContentView.sign(redirect, key, '10.0.0.1'))
+        now.return_value = 1260.0
+        signed.append(ContentView.sign(redirect, key, '10.0.0.1'))
+
+        # validation
+        pulp_conf.get.assert_called_with('lazy', 'redirect_url_cache_period')
+        self.assertEqual(signed, ['signed-1', 'signed-2', 'signed-1', 'signed-3'])
+        # signatures expire SIGNATURE_LIFETIME seconds after the end of their period
+        self.assertEqual(
+            url.return_value.sign.call_args_list[0][0],
+            (key, 1260 + content_views.SIGNATURE_LIFETIME - 1230.0))
+        self.assertEqual(
+            url.return_value.sign.call_args_list[2][0],
+            (key, 1320 + content_views.SIGNATURE_LIFETIME - 1260.0))
+        self.assertEqual(url.return_value.sign.call_args_list[1][1], {'remote_ip': '10.0.0.2'})
+
     @patch('os.path.lexists', Mock(return_value=True))
     @patch('os.path.realpath')
     @patch('os.path.exists')
     @patch(MODULE + '.allow_access')
     @patch(MODULE + '.ContentView.x_send')
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     def test_get_x_send(self, x_send, allow_access, exists, realpath):
         allow_access.return_value = True
         exists.return_value = True
@@ -217,7 +250,7 @@ class TestContentView(TestCase):
         self.assertEqual(reply, x_send.return_value)
 
     @patch('os.path.lexists', Mock(return_value=False))
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     @patch(MODULE + '.allow_access')
     @patch('os.path.realpath')
     def test_get_http(self, realpath, allow_access):
@@ -241,7 +274,7 @@ class TestContentView(TestCase):
     @patch(MODULE + '.pulp_conf.get', return_value='True')
     @patch(MODULE + '.allow_access')
     @patch(MODULE + '.ContentView.redirect')
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     def test_get_redirected(self, redirect, allow_access, mock_conf_get, exists, realpath):
         allow_access.return_value = True
         exists.return_value = False
@@ -268,7 +301,7 @@ class TestContentView(TestCase):
     @patch('os.path.lexists', Mock(return_value=False))
     @patch('os.path.realpath', Mock())
     @patch(MODULE + '.allow_access', Mock(return_value=True))
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     @patch(MODULE + '.pulp_conf')
     def test_get_not_found(self, pulp_conf):
         host = 'localhost'
@@ -287,7 +320,7 @@ class TestContentView(TestCase):
 
     @patch(MODULE + '.allow_access')
     @patch(MODULE + '.HttpResponseForbidden')
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     def test_get_not_authorized(self, forbidden, allow_access):
         allow_access.return_value = False
 
@@ -307,7 +340,7 @@ class TestContentView(TestCase):
 
     @patch(MODULE + '.allow_access')
     @patch(MODULE + '.HttpResponseForbidden')
-    @patch(MODULE + '.Key.load', Mock())
+    @patch(MODULE + '.Key.load_cached', Mock())
     def test_get_outside_pub(self, forbidden, allow_access):
         allow_access.return_value = True
 
@@ -5,14 +5,17 @@ from bson.objectid import InvalidId
 from mock import call, Mock, MagicMock, patch
 import mock
 import mongoengine
+from pymongo.errors import BulkWriteError
 
 from pulp.common import dateutils, error_codes
+from pulp.common.plugins import reporting_constants
 from pulp.common.compat import unittest
 from pulp.plugins.loader import exceptions as plugin_exceptions
 from pulp.plugins.model import PublishReport
 from pulp.server.controllers import repository as repo_controller
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.db import model
+from pulp.server.db.querysets import DUPLICATE_KEY_ERROR
 
 
 MODULE = 'pulp.server.controllers.repository.'
@@ -23,6 +26,33 @@ class MockException(Exception):
     pass
 
 
+class FakeQuerySet(object):
+    """
+    A query set of documents with an id, that records the filters of the queries it runs.
+    """
+
+    def __init__(self, documents, queries=None, **filters):
+        self.documents = documents
+        self.queries = queries if queries is not None else []
+        self.filters = filters
+
+    def __call__(self, **filters):
+        return self.filter(**filters)
+
+    def filter(self, **filters):
+        return FakeQuerySet(self.documents, self.queries, **dict(self.filters, **filters))
+
+    def order_by(self, field):
+        assert field == 'id'
+        return self
+
+    def limit(self, count):
+        self.queries.append(self.filters)
+        last_id = self.filters.get('id__gt')
+        documents = [d for d in self.documents if last_id is None or d.id > last_id]
+        return sorted(documents, key=lambda d: d.id)[:count]
+
+
 class DemoModel(model.ContentUnit):
     key_field = mongoengine.StringField()
     unit_key_fields = ['key_field']
@@ -259,12 +289,11 @@ class FindUnitsNotDownloadedTests(unittest.TestCase):
 
     @patch(MODULE + 'get_mongoengine_unit_querysets')
     def test_call(self, mock_repo_querysets):
-        mock_qs = Mock()
-        mock_qs.return_value = [0, 1, 2]
+        mock_qs = FakeQuerySet([Mock(id=i) for i in range(3)])
         mock_repo_querysets.return_value = [mock_qs]
         units = repo_controller.find_units_not_downloaded('mock_repo')
-        for x, unit in zip(range(3), units):
-            self.assertEqual(x, unit)
+        self.assertEqual([unit.id for unit in units], [0, 1, 2])
+        self.assertEqual(mock_qs.queries, [{'downloaded': False}])
 
 
 class MissingUnitCountTests(unittest.TestCase):
@@ -373,28 +402,113 @@ class UpdateRepoUnitCountsTests(unittest.TestCase):
 
 class AssociateSingleUnitTests(unittest.TestCase):
 
-    @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
-    @patch('pulp.server.controllers.repository.dateutils.format_iso8601_utc_timestamp')
-    def test_unit_association(self, mock_get_timestamp, mock_rcu_objects):
-        mock_get_timestamp.return_value = 'foo_tstamp'
+    @patch('pulp.server.controllers.repository.associate_units_by_id')
+    def test_unit_association(self, mock_associate):
         test_unit = DemoModel(id='bar', key_field='baz')
         repo = MagicMock(repo_id='foo')
         repo_controller.associate_single_unit(repo, test_unit)
-        mock_rcu_objects.assert_called_once_with(
-            repo_id='foo',
-            unit_id='bar',
-            unit_type_id=DemoModel._content_type_id.default
-        )
-        mock_rcu_objects.return_value.update_one.assert_called_once_with(
-            set_on_insert__created='foo_tstamp',
-            set__updated='foo_tstamp',
-            upsert=True)
+        mock_associate.assert_called_once_with('foo', DemoModel._content_type_id.default,
+                                               ['bar'], update_repo_metadata=False)
+
+
+@patch('pulp.server.controllers.repository.update_last_unit_added')
+@patch('pulp.server.controllers.repository.update_unit_count')
+@patch('pulp.server.controllers.repository.dateutils.format_iso8601_utc_timestamp',
+       return_value='foo_tstamp')
+@patch('pulp.server.controllers.repository.model.RepositoryContentUnit')
+class AssociateUnitsByIdTests(unittest.TestCase):
+
+    def test_associate_new_and_existing(self, mock_rcu, mock_get_timestamp, mock_update_count,
+                                        mock_update_last):
+        collection = mock_rcu._get_collection.return_value
+        collection.bulk_write.return_value.upserted_count = 2
+
+        added = repo_controller.associate_units_by_id('foo', 'type-1',
+                                                      ['unit-1', 'unit-2', 'unit-3', 'unit-2'])
+
+        self.assertEqual(added, 2)
+        self.assertEqual(collection.bulk_write.call_count, 1)
+        operations = collection.bulk_write.call_args[0][0]
+        self.assertEqual([o._filter for o in operations], [
+            {'repo_id': 'foo', 'unit_type_id': 'type-1', 'unit_id': 'unit-1'},
+            {'repo_id': 'foo', 'unit_type_id': 'type-1', 'unit_id': 'unit-2'},
+            {'repo_id': 'foo', 'unit_type_id': 'type-1', 'unit_id': 'unit-3'}])
+        self.assertEqual(operations[0]._doc['$set'], {'updated': 'foo_tstamp'})
+        self.assertEqual(operations[0]._doc['$setOnInsert']['created'], 'foo_tstamp')
+        self.assertTrue(operations[0]._upsert)
+        self.assertFalse(collection.bulk_write.call_args[1]['ordered'])
+        self.assertFalse(mock_rcu.objects.called)
+        mock_update_count.assert_called_once_with('foo', 'type-1', 2)
+        mock_update_last.assert_called_once_with('foo')
+
+    @patch('pulp.server.controllers.repository.paginate')
+    def test_pages(self, mock_paginate, mock_rcu, mock_get_timestamp, mock_update_count,
+                   mock_update_last):
+        mock_paginate.return_value = [('unit-1', 'unit-2'), ('unit-3',)]
+        collection = mock_rcu._get_collection.return_value
+        collection.bulk_write.side_effect = [Mock(upserted_count=2), Mock(upserted_count=1)]
+
+        added = repo_controller.associate_units_by_id('foo', 'type-1', iter(['unit-1']))
+
+        self.assertEqual(added, 3)
+        self.assertEqual(collection.bulk_write.call_count, 2)
+        mock_update_count.assert_called_once_with('foo', 'type-1', 3)
+
+    def test_all_existing(self, mock_rcu, mock_get_timestamp, mock_update_count,
+                          mock_update_last):
+        collection = mock_rcu._get_collection.return_value
+        collection.bulk_write.return_value.upserted_count = 0
+
+        added = repo_controller.associate_units_by_id('foo', 'type-1', ['unit-1'])
+
+        self.assertEqual(added, 0)
+        self.assertEqual(collection.bulk_write.call_count, 1)
+        self.assertFalse(mock_update_count.called)
+        self.assertFalse(mock_update_last.called)
+
+    def test_no_repo_metadata(self, mock_rcu, mock_get_timestamp, mock_update_count,
+                              mock_update_last):
+        collection = mock_rcu._get_collection.return_value
+        collection.bulk_write.return_value.upserted_count = 1
+
+        added = repo_controller.associate_units_by_id('foo', 'type-1', ['unit-1'],
+                                                      update_repo_metadata=False)
+
+        self.assertEqual(added, 1)
+        self.assertFalse(mock_update_count.called)
+        self.assertFalse(mock_update_last.called)
+
+    def test_concurrent_duplicates(self, mock_rcu, mock_get_timestamp, mock_update_count,
+                                   mock_update_last):
+        collection = mock_rcu._get_collection.return_value
+        collection.bulk_write.side_effect = [
+            BulkWriteError({'nUpserted': 1,
+                            'writeErrors': [{'index': 1, 'code': DUPLICATE_KEY_ERROR}]}),
+            Mock(upserted_count=0)]
+
+        added = repo_controller.associate_units_by_id('foo', 'type-1', ['unit-1', 'unit-2'])
+
+        self.assertEqual(added, 1)
+        retried = collection.bulk_write.call_args_list[1][0][0]
+        self.assertEqual([o._filter['unit_id'] for o in retried], ['unit-2'])
+        mock_update_count.assert_called_once_with('foo', 'type-1', 1)
+
+    def test_write_error(self, mock_rcu, mock_get_timestamp, mock_update_count,
+                         mock_update_last):
+        collection = mock_rcu._get_collection.return_value
+        collection.bulk_write.side_effect = BulkWriteError(
+            {'nUpserted': 0, 'writeErrors': [{'index': 0, 'code': 2}]})
+
+        self.assertRaises(BulkWriteError, repo_controller.associate_units_by_id, 'foo',
+                          'type-1', ['unit-1'])
 
 
 class TestDisassociateUnits(unittest.TestCase):
+    @patch('pulp.server.controllers.repository.model.OrphanCandidate.objects')
     @patch('pulp.server.controllers.repository.update_last_unit_removed')
     @patch('pulp.server.controllers.repository.model.RepositoryContentUnit.objects')
-    def test_disassociate_units(self, m_rcu_objects, m_update_last_unit_removed):
+    def test_disassociate_units(self, m_rcu_objects, m_update_last_unit_removed,
+                                m_candidate_objects):
         """"
         Test that multiple objects are all deleted and timestamp for units removal updated
         """
@@ -405,6 +519,7 @@ class TestDisassociateUnits(unittest.TestCase):
         m_rcu_objects.assert_called_once_with(repo_id='foo', unit_id__in=['bar', 'baz'])
         m_rcu_objects.return_value.delete.assert_called_once()
         m_update_last_unit_removed.assert_called_once_with('foo')
+        m_candidate_objects.add.assert_called_once_with(test_unit1.type_id, ['bar', 'baz'])
 
     @patch('pulp.server.controllers.repository.update_last_unit_removed')
     def test_disassociate_units_empty_iterable(self, m_update_last_unit_removed):
@@ -1756,39 +1871,132 @@ class TestQueueDownloadRepo(unittest.TestCase):
 
 class TestDownloadDeferred(unittest.TestCase):
 
+    @patch(MODULE + '_queue_download_shards', Mock(return_value=[]))
     @patch(MODULE + 'LazyUnitDownloadStep')
     @patch(MODULE + '_create_download_requests')
     @patch(MODULE + '_get_deferred_content_units')
     def test_download_deferred(self, mock_get_deferred, mock_create_requests, mock_step):
         """Assert the download step is initialized and called."""
         repo_controller.download_deferred()
+        mock_get_deferred.assert_called_once_with(None)
         mock_create_requests.assert_called_once_with(mock_get_deferred.return_value)
         mock_step.return_value.start.assert_called_once_with()
 
+    @patch(MODULE + 'tags')
+    @patch(MODULE + '_queue_download_shards')
+    @patch(MODULE + 'LazyUnitDownloadStep')
+    def test_download_deferred_sharded(self, mock_step, mock_queue_shards, mock_tags):
+        """Assert shard tasks are queued instead of downloading."""
+        mock_queue_shards.return_value = ['1', '2']
+        result = repo_controller.download_deferred()
+        mock_queue_shards.assert_called_once_with(
+            repo_controller.download_deferred, [], {}, [mock_tags.action_tag.return_value])
+        self.assertEqual(result.spawned_tasks, [{'task_id': '1'}, {'task_id': '2'}])
+        self.assertFalse(mock_step.called)
+
+    @patch(MODULE + '_queue_download_shards')
+    @patch(MODULE + 'LazyUnitDownloadStep')
+    @patch(MODULE + '_create_download_requests', Mock())
+    @patch(MODULE + '_get_deferred_content_units')
+    def test_download_deferred_shard(self, mock_get_deferred, mock_step, mock_queue_shards):
+        """Assert a shard task downloads its range."""
+        repo_controller.download_deferred(id_range=['40', '80'])
+        self.assertFalse(mock_queue_shards.called)
+        mock_get_deferred.assert_called_once_with(['40', '80'])
+        mock_step.return_value.start.assert_called_once_with()
+
 
 class TestDownloadRepo(unittest.TestCase):
 
+    @patch(MODULE + '_queue_download_shards', Mock(return_value=[]))
     @patch(MODULE + 'LazyUnitDownloadStep')
     @patch(MODULE + '_create_download_requests')
     @patch(MODULE + 'find_units_not_downloaded')
     def test_download_repo_no_verify(self, mock_missing_units, mock_create_requests, mock_step):
         """Assert the download step is initialized and called with missing units."""
         repo_controller.download_repo('fake-id')
-        mock_missing_units.assert_called_once_with('fake-id')
+        mock_missing_units.assert_called_once_with('fake-id', None)
         mock_create_requests.assert_called_once_with(mock_missing_units.return_value)
         mock_step.return_value.start.assert_called_once_with()
 
+    @patch(MODULE + '_queue_download_shards', Mock(return_value=[]))
     @patch(MODULE + 'LazyUnitDownloadStep')
     @patch(MODULE + '_create_download_requests')
     @patch(MODULE + 'get_mongoengine_unit_querysets')
     def test_download_repo_verify(self, mock_units_qs, mock_create_requests, mock_step):
         """Assert the download step is initialized and called with all units."""
-        mock_units_qs.return_value = [['some'], ['lists']]
+        mock_units_qs.return_value = [FakeQuerySet([Mock(id='some')]),
+                                      FakeQuerySet([Mock(id='units')])]
         repo_controller.download_repo('fake-id', verify_all_units=True)
         mock_units_qs.assert_called_once_with('fake-id')
-        self.assertEqual(list(mock_create_requests.call_args[0][0]), ['some', 'lists'])
+        units = mock_create_requests.call_args[0][0]
+        self.assertEqual([unit.id for unit in units], ['some', 'units'])
         mock_step.return_value.start.assert_called_once_with()
 
+    @patch(MODULE + 'LazyUnitDownloadStep', Mock())
+    @patch(MODULE + '_create_download_requests')
+    @patch(MODULE + 'get_mongoengine_unit_querysets')
+    def test_download_repo_verify_shard(self, mock_units_qs, mock_create_requests):
+        """Assert a shard task inspects the units in its range."""
+        queryset = FakeQuerySet([Mock(id='some')])
+        mock_units_qs.return_value = [queryset]
+        repo_controller.download_repo('fake-id', verify_all_units=True, id_range=[None, '80'])
+        units = mock_create_requests.call_args[0][0]
+        self.assertEqual([unit.id for unit in units], ['some'])
+        self.assertEqual(queryset.queries, [{'id__lt': '80'}])
+
+    @patch(MODULE + 'tags')
+    @patch(MODULE + '_queue_download_shards')
+    @patch(MODULE + 'LazyUnitDownloadStep')
+    def test_download_repo_sharded(self, mock_step, mock_queue_shards, mock_tags):
+        """Assert shard tasks are queued instead of downloading."""
+        mock_queue_shards.return_value = ['1']
+        result = repo_controller.download_repo('fake-id', verify_all_units=True)
+        mock_queue_shards.assert_called_once_with(
+            repo_controller.download_repo, ['fake-id'], {'verify_all_units': True},
+            [mock_tags.resource_tag.return_value, mock_tags.action_tag.return_value])
+        self.assertEqual(result.spawned_tasks, [{'task_id': '1'}])
+        self.assertFalse(mock_step.called)
+
+
+class TestQueueDownloadShards(unittest.TestCase):
+
+    @patch(MODULE + 'pulp_conf')
+    def test_not_sharded(self, mock_conf):
+        mock_conf.get.return_value = '1'
+        task = Mock()
+        self.assertEqual(repo_controller._queue_download_shards(task, [], {}, []), [])
+        mock_conf.get.assert_called_once_with('lazy', 'download_shards')
+        self.assertFalse(task.apply_async.called)
+
+    @patch(MODULE + 'pulp_conf')
+    def test_sharded(self, mock_conf):
+        mock_conf.get.return_value = '2'
+        task = Mock()
+        spawned = repo_controller._queue_download_shards(task, ['a'], {'b': 1}, ['tag'])
+        self.assertEqual(spawned, [task.apply_async.return_value.task_id] * 2)
+        self.assertEqual(task.apply_async.call_args_list, [
+            call(['a'], {'b': 1, 'id_range': (None, '80')}, tags=['tag']),
+            call(['a'], {'b': 1, 'id_range': ('80', None)}, tags=['tag']),
+        ])
+
+
+class TestIdRanges(unittest.TestCase):
+
+    def test_id_ranges(self):
+        self.assertEqual(repo_controller._id_ranges(1), [(None, None)])
+        self.assertEqual(repo_controller._id_ranges(3),
+                         [(None, '55'), ('55', 'aa'), ('aa', None)])
+        ranges = repo_controller._id_ranges(repo_controller.MAX_DOWNLOAD_SHARDS)
+        self.assertEqual(ranges[1], ('01', '02'))
+        self.assertEqual(ranges[-1], ('ff', None))
+
+    def test_id_range_filter(self):
+        self.assertEqual(repo_controller._id_range_filter(None), {})
+        self.assertEqual(repo_controller._id_range_filter((None, None)), {})
+        self.assertEqual(repo_controller._id_range_filter(('10', '20'), 'unit_id'),
+                         {'unit_id__gte': '10', 'unit_id__lt': '20'})
+
 
 class TestGetDeferredContentUnits(unittest.TestCase):
 
@@ -1796,24 +2004,46 @@ class TestGetDeferredContentUnits(unittest.TestCase):
     @patch(MODULE + 'model.DeferredDownload')
     def test_get_deferred_content_units(self, mock_qs, mock_get_model):
         # Setup
-        mock_unit = Mock(unit_type_id='abc', unit_id='123')
-        mock_qs.objects.filter.return_value = [mock_unit]
+        mock_unit = Mock(id=1, unit_type_id='abc', unit_id='123')
+        mock_qs.objects.filter.return_value = FakeQuerySet([mock_unit])
+        unit = Mock(id='123')
+        mock_get_model.return_value.objects.filter.return_value = [unit]
 
         # Test
         result = list(repo_controller._get_deferred_content_units())
-        self.assertEqual(1, len(result))
+        self.assertEqual([unit], result)
+        mock_qs.objects.filter.assert_called_once_with()
         mock_get_model.assert_called_once_with('abc')
         unit_filter = mock_get_model.return_value.objects.filter
-        unit_filter.assert_called_once_with(id='123')
-        unit_filter.return_value.get.assert_called_once_with()
+        unit_filter.assert_called_once_with(id__in=['123'])
+
+    @patch(MODULE + 'DOWNLOAD_PAGE_SIZE', 2)
+    @patch(MODULE + 'plugin_api.get_unit_model_by_id')
+    @patch(MODULE + 'model.DeferredDownload')
+    def test_get_deferred_content_units_paged(self, mock_qs, mock_get_model):
+        # Setup
+        mock_qs.objects.filter.return_value = FakeQuerySet([
+            Mock(id=1, unit_type_id='abc', unit_id='1'),
+            Mock(id=2, unit_type_id='abc', unit_id='2'),
+            Mock(id=3, unit_type_id='abc', unit_id='3'),
+        ])
+        mock_get_model.return_value.objects.filter.side_effect = \
+            lambda id__in: [Mock(id=unit_id) for unit_id in sorted(id__in)]
+
+        # Test
+        result = list(repo_controller._get_deferred_content_units(('1', None)))
+        self.assertEqual(['1', '2', '3'], [unit.id for unit in result])
+        mock_qs.objects.filter.assert_called_once_with(unit_id__gte='1')
+        unit_filter = mock_get_model.return_value.objects.filter
+        self.assertEqual(2, unit_filter.call_count)
 
     @patch(MODULE + '_logger.error')
     @patch(MODULE + 'plugin_api.get_unit_model_by_id')
     @patch(MODULE + 'model.DeferredDownload')
     def test_get_deferred_content_units_no_model(self, mock_qs, mock_get_model, mock_log):
         # Setup
-        mock_unit = Mock(unit_type_id='abc', unit_id='123')
-        mock_qs.objects.filter.return_value = [mock_unit]
+        mock_unit = Mock(id=1, unit_type_id='abc', unit_id='123')
+        mock_qs.objects.filter.return_value = FakeQuerySet([mock_unit])
         mock_get_model.return_value = None
 
         # Test
@@ -1827,10 +2057,9 @@ class TestGetDeferredContentUnits(unittest.TestCase):
     @patch(MODULE + 'model.DeferredDownload')
     def test_get_deferred_content_units_no_unit(self, mock_qs, mock_get_model, mock_log):
         # Setup
-        mock_unit = Mock(unit_type_id='abc', unit_id='123')
-        mock_qs.objects.filter.return_value = [mock_unit]
-        unit_qs = mock_get_model.return_value.objects.filter.return_value
-        unit_qs.get.side_effect = mongoengine.DoesNotExist()
+        mock_unit = Mock(id=1, unit_type_id='abc', unit_id='123')
+        mock_qs.objects.filter.return_value = FakeQuerySet([mock_unit])
+        mock_get_model.return_value.objects.filter.return_value = []
 
         # Test
         result = list(repo_controller._get_deferred_content_units())
@@ -1839,6 +2068,44 @@ class TestGetDeferredContentUnits(unittest.TestCase):
         mock_get_model.assert_called_once_with('abc')
 
 
+class TestPaginateById(unittest.TestCase):
+
+    @patch(MODULE + 'DOWNLOAD_PAGE_SIZE', 2)
+    def test_paginate_by_id(self):
+        """
+        Assert each page is read by a new query resuming after the previous page, so
+        documents removed while a page is processed do not make the next one skip any.
+        """
+        documents = [Mock(id=i) for i in range(1, 6)]
+        query_set = FakeQuerySet(documents, unit_id__gte='1')
+        pages = []
+
+        for page in repo_controller._paginate_by_id(query_set):
+            pages.append([document.id for document in page])
+            # The downloaded units are removed from the collection.
+            for document in page:
+                documents.remove(document)
+
+        self.assertEqual(pages, [[1, 2], [3, 4], [5]])
+        self.assertEqual(query_set.queries, [
+            {'unit_id__gte': '1'},
+            {'unit_id__gte': '1', 'id__gt': 2},
+            {'unit_id__gte': '1', 'id__gt': 4},
+        ])
+
+    @patch(MODULE + 'DOWNLOAD_PAGE_SIZE', 2)
+    def test_paginate_by_id_full_pages(self):
+        """
+        Assert the query after a last full page ends the iteration.
+        """
+        query_set = FakeQuerySet([Mock(id=i) for i in range(1, 5)])
+
+        pages = list(repo_controller._paginate_by_id(query_set))
+
+        self.assertEqual([[d.id for d in page] for page in pages], [[1, 2], [3, 4]])
+        self.assertEqual(len(query_set.queries), 3)
+
+
 class TestCreateDownloadRequests(unittest.TestCase):
 
     @patch(MODULE + 'Key.load', Mock())
@@ -1850,8 +2117,8 @@ class TestCreateDownloadRequests(unittest.TestCase):
         # Setup
         content_units = [Mock(id='123', type_id='abc', list_files=lambda: ['/file/path'])]
         filtered_qs = mock_catalog.objects.filter.return_value
-        catalog_entry = filtered_qs.order_by.return_value.first.return_value
-        catalog_entry.path = '/storage/123/path'
+        catalog_entry = Mock(unit_id='123', unit_type_id='abc', path='/file/path')
+        filtered_qs.order_by.return_value = [catalog_entry]
         expected_data_dict = {
             repo_controller.TYPE_ID: 'abc',
             repo_controller.UNIT_ID: '123',
@@ -1864,21 +2131,56 @@ class TestCreateDownloadRequests(unittest.TestCase):
         }
 
         # Test
-        requests = repo_controller._create_download_requests(content_units)
+        requests = list(repo_controller._create_download_requests(content_units))
         expected_data_dict[repo_controller.REQUEST] = requests[0]
         mock_catalog.objects.filter.assert_called_once_with(
-            unit_id='123',
-            unit_type_id='abc',
-            path='/file/path'
+            unit_id__in=['123'],
+            unit_type_id__in=['abc']
         )
-        filtered_qs.order_by.assert_called_once_with('revision')
-        filtered_qs.order_by.return_value.first.assert_called_once_with()
+        filtered_qs.order_by.assert_called_once_with('-revision')
         mock_mkdir.assert_called_once_with('/working/123')
         self.assertEqual(1, len(requests))
         self.assertEqual(mock_get_url.return_value, requests[0].url)
         self.assertEqual('/working/123/path', requests[0].destination)
         self.assertEqual(expected_data_dict, requests[0].data)
 
+    @patch(MODULE + 'DOWNLOAD_PAGE_SIZE', 1)
+    @patch(MODULE + 'Key.load', Mock())
+    @patch(MODULE + 'common_utils.get_working_directory', Mock(return_value='/working/'))
+    @patch(MODULE + 'mkdir', Mock())
+    @patch(MODULE + '_get_streamer_url')
+    @patch(MODULE + 'model.LazyCatalogEntry')
+    def test_create_download_requests_paged(self, mock_catalog, mock_get_url):
+        # Setup
+        content_units = [
+            Mock(id='1', type_id='abc', list_files=lambda: ['/a', '/b']),
+            Mock(id='2', type_id='abc', list_files=lambda: ['/c', '/d']),
+        ]
+        entries = {
+            '1': [Mock(unit_id='1', unit_type_id='abc', path='/a', revision=1),
+                  Mock(unit_id='1', unit_type_id='abc', path='/a', revision=0),
+                  Mock(unit_id='1', unit_type_id='abc', path='/b', revision=0)],
+            '2': [Mock(unit_id='2', unit_type_id='abc', path='/c', revision=0)],
+        }
+        mock_catalog.objects.filter.side_effect = \
+            lambda unit_id__in, unit_type_id__in: Mock(
+                order_by=Mock(return_value=entries[unit_id__in[0]]))
+
+        # Test
+        requests = repo_controller._create_download_requests(content_units)
+        first = next(requests)
+        self.assertEqual(1, mock_catalog.objects.filter.call_count)
+        requests = [first] + list(requests)
+
+        # Validation
+        self.assertEqual(2, mock_catalog.objects.filter.call_count)
+        self.assertEqual(['/working/1/a', '/working/1/b', '/working/2/c'],
+                         [request.destination for request in requests])
+        unit_files = first.data[repo_controller.UNIT_FILES]
+        self.assertEqual(2, len(unit_files))
+        self.assertEqual(entries['1'][1],
+                         unit_files['/working/1/a'][repo_controller.CATALOG_ENTRY])
+
 
 class TestGetStreamerUrl(unittest.TestCase):
 
@@ -1972,6 +2274,29 @@ class TestLazyUnitDownloadStep(unittest.TestCase):
         self.step.start()
         self.step.downloader.download.assert_called_once_with(self.step.download_requests)
 
+    @patch(MODULE + 'model.TaskStatus', Mock())
+    def test_start_generator(self):
+        """Assert requests from a generator are counted as they are downloaded."""
+        step = repo_controller.LazyUnitDownloadStep('test_step', 'Test Step', iter([Mock()] * 2))
+        step.downloader = Mock()
+        step.downloader.download.side_effect = list
+        self.assertEqual(0, step.total_units)
+        self.assertFalse(step.all_queued)
+
+        step.progress_successes = 2
+        step.start()
+
+        self.assertEqual(2, step.total_units)
+        self.assertTrue(step.all_queued)
+        self.assertEqual(reporting_constants.STATE_COMPLETE, step.state)
+
+    def test_report_not_all_queued(self):
+        """Assert the step is not complete until all requests are queued."""
+        self.step.all_queued = False
+        self.step.progress_successes = 1
+        self.step.report()
+        self.assertEqual(reporting_constants.STATE_NOT_STARTED, self.step.state)
+
     @patch(MODULE + 'plugin_api.get_unit_model_by_id')
     @patch(MODULE + 'model.DeferredDownload')
     def test_download_started(self, mock_deferred_download, mock_get_model):
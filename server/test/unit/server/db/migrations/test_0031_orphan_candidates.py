@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from pulp.server.db.migrate.models import MigrationModule
+
+MIGRATION = 'pulp.server.db.migrations.0031_orphan_candidates'
+
+
+class TestMigration(TestCase):
+    """
+    Test the migration.
+    """
+
+    @patch('.'.join((MIGRATION, 'time.time')))
+    @patch('.'.join((MIGRATION, 'connection.get_database')))
+    def test_migrate(self, m_get_database, m_time):
+        """
+        Test that unassociated units are recorded as candidates and the watermark is set.
+        """
+        m_time.return_value = 1000
+        collections = dict((name, MagicMock()) for name in (
+            'repo_content_units', 'orphan_candidates', 'orphan_scan_watermarks', 'units_rpm',
+            'repos'))
+        db = m_get_database.return_value
+        db.__getitem__.side_effect = collections.__getitem__
+        db.collection_names.return_value = ['repos', 'units_rpm']
+        units = collections['units_rpm']
+        units.find.return_value.batch_size.return_value = [{'_id': 'a'}, {'_id': 'b'}]
+        units.count.return_value = 2
+        collections['repo_content_units'].distinct.return_value = ['b']
+
+        # test
+        module = MigrationModule(MIGRATION)._module
+        module.migrate()
+
+        # validation
+        collections['repo_content_units'].distinct.assert_called_once_with(
+            'unit_id', {'unit_id': {'$in': ['a', 'b']}})
+        requests = collections['orphan_candidates'].bulk_write.call_args[0][0]
+        self.assertEqual(len(requests), 1)
+        self.assertEqual(requests[0]._filter, {'unit_type_id': 'rpm', 'unit_id': 'a'})
+        collections['orphan_scan_watermarks'].update_one.assert_called_once_with(
+            {'content_type_id': 'rpm'},
+            {'$set': {'watermark': 700}},
+            upsert=True)
+        self.assertFalse(collections['repos'].find.called)
@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from pulp.server.db.migrate.models import MigrationModule
+from pulp.server.db.model.consumer import ApplicabilityResult
+
+MIGRATION = 'pulp.server.db.migrations.0032_applicability_results'
+
+
+class TestMigration(TestCase):
+    """
+    Test the migration.
+    """
+
+    @patch('.'.join((MIGRATION, 'time.time')))
+    @patch('.'.join((MIGRATION, 'connection.get_database')))
+    def test_migrate(self, m_get_database, m_time):
+        """
+        Test that identical applicability data is stored once and referenced by digest.
+        """
+        m_time.return_value = 1000
+        collections = dict((name, MagicMock()) for name in (
+            'repo_profile_applicability', 'applicability_results'))
+        db = m_get_database.return_value
+        db.__getitem__.side_effect = collections.__getitem__
+        rpa_collection = collections['repo_profile_applicability']
+        rpa_collection.find.return_value.batch_size.return_value = [
+            {'_id': 1, 'applicability': {'rpm': ['a', 'b']}},
+            {'_id': 2, 'applicability': {'rpm': ['a', 'b']}},
+            {'_id': 3, 'applicability': {'erratum': ['c']}},
+        ]
+
+        # test
+        module = MigrationModule(MIGRATION)._module
+        module.migrate()
+
+        # validation
+        digest_1 = ApplicabilityResult.calculate_digest({'rpm': ['a', 'b']})
+        digest_2 = ApplicabilityResult.calculate_digest({'erratum': ['c']})
+        results = collections['applicability_results'].bulk_write.call_args[0][0]
+        self.assertEqual(sorted((r._filter, r._doc) for r in results), sorted([
+            ({'_id': digest_1}, {'$set': {'updated': 1000},
+                                 '$setOnInsert': {'applicability': {'rpm': ['a', 'b']}}}),
+            ({'_id': digest_2}, {'$set': {'updated': 1000},
+                                 '$setOnInsert': {'applicability': {'erratum': ['c']}}}),
+        ]))
+        requests = rpa_collection.bulk_write.call_args[0][0]
+        self.assertEqual([(r._filter, r._doc) for r in requests], [
+            ({'_id': 1}, {'$set': {'applicability_digest': digest_1},
+                          '$unset': {'applicability': ''}}),
+            ({'_id': 2}, {'$set': {'applicability_digest': digest_1},
+                          '$unset': {'applicability': ''}}),
+            ({'_id': 3}, {'$set': {'applicability_digest': digest_2},
+                          '$unset': {'applicability': ''}}),
+        ])
+
+    @patch('.'.join((MIGRATION, 'connection.get_database')))
+    def test_migrate_nothing(self, m_get_database):
+        """
+        Test that nothing is written when there is nothing to migrate.
+        """
+        collections = dict((name, MagicMock()) for name in (
+            'repo_profile_applicability', 'applicability_results'))
+        db = m_get_database.return_value
+        db.__getitem__.side_effect = collections.__getitem__
+        collections['repo_profile_applicability'].find.return_value.batch_size.return_value = []
+
+        module = MigrationModule(MIGRATION)._module
+        module.migrate()
+
+        self.assertFalse(collections['applicability_results'].bulk_write.called)
+        self.assertFalse(collections['repo_profile_applicability'].bulk_write.called)
@@ -20,6 +20,7 @@ class TestRepoProfileApplicability(PulpServerTests):
 
     def tearDown(self):
         self.collection.drop()
+        consumer.ApplicabilityResult.get_collection().drop()
 
     def test___init___no__id(self):
         """
@@ -113,7 +114,11 @@ class TestRepoProfileApplicability(PulpServerTests):
         self.assertEqual(document['profile_hash'], profile_hash)
         self.assertEqual(document['repo_id'], repo_id)
         self.assertEqual(document['profile'], profile)
-        self.assertEqual(document['applicability'], applicability_data)
+        digest = consumer.ApplicabilityResult.calculate_digest(applicability_data)
+        self.assertEqual(document['applicability_digest'], digest)
+        self.assertFalse('applicability' in document)
+        result = consumer.ApplicabilityResult.get_collection().find_one({'_id': digest})
+        self.assertEqual(result['applicability'], applicability_data)
 
         # Our applicability object should still have the correct _id attribute
         self.assertEqual(applicability._id, document['_id'])
@@ -142,12 +147,57 @@ class TestRepoProfileApplicability(PulpServerTests):
         self.assertEqual(document['profile_hash'], profile_hash)
         self.assertEqual(document['repo_id'], repo_id)
         self.assertEqual(document['profile'], profile)
-        self.assertEqual(document['applicability'], applicability_data)
+        digest = consumer.ApplicabilityResult.calculate_digest(applicability_data)
+        self.assertEqual(document['applicability_digest'], digest)
+        self.assertFalse('applicability' in document)
+        result = consumer.ApplicabilityResult.get_collection().find_one({'_id': digest})
+        self.assertEqual(result['applicability'], applicability_data)
 
         # Our applicability object should now have the correct _id attribute
         self.assertEqual(applicability._id, document['_id'])
 
 
+class TestApplicabilityResult(unittest.TestCase):
+    """
+    Test the ApplicabilityResult class.
+    """
+    def test_calculate_digest(self):
+        """
+        Assert that the digest does not depend on the order of the dictionary keys.
+        """
+        digest = consumer.ApplicabilityResult.calculate_digest({'rpm': ['a'], 'erratum': ['b']})
+
+        self.assertEqual(len(digest), 64)
+        self.assertEqual(
+            consumer.ApplicabilityResult.calculate_digest({'erratum': ['b'], 'rpm': ['a']}),
+            digest)
+        self.assertNotEqual(consumer.ApplicabilityResult.calculate_digest({'rpm': ['a']}),
+                            digest)
+
+    @mock.patch('pulp.server.db.model.consumer.time.time', return_value=1000)
+    def test_upsert(self, m_time):
+        """
+        Assert that the data is only set when the result is inserted.
+        """
+        operation = consumer.ApplicabilityResult.upsert({'rpm': ['a']}, 'digest')
+
+        self.assertEqual(operation._filter, {'_id': 'digest'})
+        self.assertEqual(operation._doc, {'$set': {'updated': 1000},
+                                          '$setOnInsert': {'applicability': {'rpm': ['a']}}})
+        self.assertTrue(operation._upsert)
+
+    @mock.patch('pulp.server.db.model.consumer.ApplicabilityResult.get_collection')
+    def test_get_results(self, m_get_collection):
+        m_get_collection.return_value.find.return_value = [
+            {'_id': 'digest', 'applicability': {'rpm': ['a']}}]
+
+        results = consumer.ApplicabilityResult.get_results(['digest', 'digest'])
+
+        m_get_collection.return_value.find.assert_called_once_with(
+            {'_id': {'$in': ['digest']}})
+        self.assertEqual(results, {'digest': {'rpm': ['a']}})
+
+
 class TestUnitProfile(unittest.TestCase):
     """
     Test the UnitProfile class.
@@ -501,7 +501,7 @@ class TestManageDB(MigrationTest):
                                 mocked_apply_migration, mock_entry, getLogger, mock_ensure_indexes):
         logger = MagicMock()
         getLogger.return_value = logger
-        mock_args = Namespace(dry_run=True, test=False)
+        mock_args = Namespace(dry_run=True, test=False, verify_orphan_index=False)
         mock_parse_args.return_value = mock_args
 
         # Test that when dry run is on, it returns 1 if migrations remain
@@ -536,10 +536,53 @@ class TestManageDB(MigrationTest):
                                mock_getLogger):
         e = models.MigrationRemovedError('0002', '1.2.0', '1.1.0', 'foo')
         mock_auto_manage_db.side_effect = e
+        mock_parse_args.return_value = Namespace(dry_run=False, test=False,
+                                                 verify_orphan_index=False)
 
         ret = manage.main()
         self.assertEqual(ret, os.EX_SOFTWARE)
 
+    @patch('pulp.server.db.manage.logging.getLogger')
+    @patch('pulp.server.db.manage.connection.initialize')
+    @patch('pulp.server.db.manage.parse_args', autospec=True)
+    @patch.object(manage, '_auto_manage_db')
+    @patch.object(manage, 'OrphanManager')
+    @patch.object(manage, 'PluginManager')
+    @patch.object(manage, 'types_db')
+    def test_verify_orphan_index(self, mock_types_db, mock_plugin_manager, mock_orphan_manager,
+                                 mock_auto_manage_db, mock_parse_args, mock_init, mock_getLogger):
+        mock_parse_args.return_value = Namespace(dry_run=False, test=False,
+                                                 verify_orphan_index=True)
+        mock_types_db.all_type_ids.return_value = ['type-1']
+        mock_plugin_manager.return_value.unit_models = {'type-2': MagicMock()}
+        mock_orphan_manager.verify_orphan_index.return_value = []
+
+        ret = manage.main()
+
+        self.assertEqual(ret, os.EX_OK)
+        self.assertFalse(mock_auto_manage_db.called)
+        self.assertEqual(mock_orphan_manager.verify_orphan_index.call_args_list,
+                         [call('type-1'), call('type-2')])
+
+    @patch('pulp.server.db.manage.logging.getLogger')
+    @patch('pulp.server.db.manage.connection.initialize')
+    @patch('pulp.server.db.manage.parse_args', autospec=True)
+    @patch.object(manage, 'OrphanManager')
+    @patch.object(manage, 'PluginManager')
+    @patch.object(manage, 'types_db')
+    def test_verify_orphan_index_missing(self, mock_types_db, mock_plugin_manager,
+                                         mock_orphan_manager, mock_parse_args, mock_init,
+                                         mock_getLogger):
+        mock_parse_args.return_value = Namespace(dry_run=False, test=False,
+                                                 verify_orphan_index=True)
+        mock_types_db.all_type_ids.return_value = ['type-1']
+        mock_plugin_manager.return_value.unit_models = {}
+        mock_orphan_manager.verify_orphan_index.return_value = ['unit-1']
+
+        ret = manage.main()
+
+        self.assertEqual(ret, os.EX_DATAERR)
+
 
 class TestMigrationModule(MigrationTest):
     def test___cmp__(self):
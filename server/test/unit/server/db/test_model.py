@@ -1359,6 +1359,66 @@ class TestLazyCatalogEntry(unittest.TestCase):
         save.assert_called_once_with()
         qs.delete.assert_called_once_with()
 
+    @staticmethod
+    def _insert_many(documents, ordered):
+        for i, document in enumerate(documents):
+            document['_id'] = 'id-%d' % i
+
+    @staticmethod
+    def _entry(path, importer_id='44', url='http://x'):
+        return model.LazyCatalogEntry(path=path, importer_id=importer_id, unit_id='123',
+                                      unit_type_id='test', url=url)
+
+    @patch('pulp.server.db.model.LazyCatalogEntry._get_collection')
+    def test_save_revisions(self, get_collection):
+        collection = get_collection.return_value
+        collection.aggregate.return_value = iter([{'_id': None, 'revision': 3}])
+        collection.insert_many.side_effect = self._insert_many
+        entries = [self._entry('/a'), self._entry('/b'), self._entry('/a', url='http://y')]
+
+        # test
+        added = model.LazyCatalogEntry.save_revisions(iter(entries))
+
+        # validation
+        self.assertEqual(added, 2)
+        pipeline = collection.aggregate.call_args[0][0]
+        self.assertEqual(pipeline[0]['$match']['importer_id'], '44')
+        self.assertEqual(sorted(pipeline[0]['$match']['path']['$in']), ['/a', '/b'])
+        documents = collection.insert_many.call_args[0][0]
+        # the last entry of a path wins
+        self.assertEqual(sorted((d['path'], d['url'], d['revision']) for d in documents),
+                         [('/a', 'http://y', 4), ('/b', 'http://x', 4)])
+        self.assertEqual(entries[2].revision, 4)
+        self.assertTrue(entries[2].id is not None)
+        delete_spec = collection.delete_many.call_args[0][0]
+        self.assertEqual(delete_spec['revision'], {'$lt': 4})
+        self.assertEqual(sorted(delete_spec['path']['$in']), ['/a', '/b'])
+
+    @patch('pulp.server.db.model.LazyCatalogEntry._get_collection')
+    def test_save_revisions_batches(self, get_collection):
+        collection = get_collection.return_value
+        collection.aggregate.side_effect = lambda pipeline: iter([])
+        collection.insert_many.side_effect = self._insert_many
+        entries = [self._entry('/a'), self._entry('/b'), self._entry('/c', importer_id='45')]
+
+        # test
+        added = model.LazyCatalogEntry.save_revisions(entries, batch_size=2)
+
+        # validation
+        self.assertEqual(added, 3)
+        self.assertEqual(collection.aggregate.call_count, 2)
+        self.assertEqual(collection.insert_many.call_count, 2)
+        self.assertEqual(collection.delete_many.call_count, 2)
+        self.assertEqual([e.revision for e in entries], [1, 1, 1])
+
+    @patch('pulp.server.db.model.LazyCatalogEntry._get_collection')
+    def test_save_revisions_invalid(self, get_collection):
+        entry = self._entry('/a')
+        entry.url = None
+
+        self.assertRaises(ValidationError, model.LazyCatalogEntry.save_revisions, [entry])
+        self.assertFalse(get_collection.return_value.insert_many.called)
+
 
 class TestDeferredDownload(unittest.TestCase):
     """
@@ -6,7 +6,8 @@ from M2Crypto import RSA
 
 from pulp.server.lazy.url import (
     NotValid, DecodingError, NotSigned, ResourceNotMatched, ExtensionNotMatched, PolicyMalformed,
-    PolicyNotAuthenticated, PolicyExpired, Base64, JSON, Policy, Query, Key, URL, SignedURL)
+    PolicyNotAuthenticated, PolicyExpired, Base64, JSON, Policy, PolicyCache, Query, Key, URL,
+    SignedURL)
 
 
 MODULE = 'pulp.server.lazy.url'
@@ -194,6 +195,36 @@ class TestPolicy(TestCase):
         decode.assert_called_once_with(encoded)
         self.assertEqual(policy, decode.return_value)
 
+    @patch(MODULE + '.time')
+    @patch(MODULE + '.Base64', Mock())
+    @patch(MODULE + '.Policy.decode')
+    @patch(MODULE + '.Policy.digest')
+    def test_validate_cached(self, digest, decode, time):
+        time.return_value = 10
+        decode.return_value = Policy('', 20)
+        key = Mock()
+        cache = PolicyCache()
+
+        # test
+        first = Policy.validate(key, '12345==', '0x44', cache)
+        second = Policy.validate(key, '12345==', '0x44', cache)
+
+        # validation
+        digest.assert_called_once_with('12345==')
+        self.assertEqual(key.verify.call_count, 1)
+        self.assertEqual(first, decode.return_value)
+        self.assertEqual(second, decode.return_value)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    @patch(MODULE + '.Base64', Mock())
+    @patch(MODULE + '.Policy.digest', Mock())
+    def test_validate_not_cached_when_invalid(self):
+        key = Mock()
+        key.verify.return_value = False
+        cache = PolicyCache()
+        self.assertRaises(PolicyNotAuthenticated, Policy.validate, key, '', '', cache)
+        self.assertEqual(len(cache), 0)
+
     @patch(MODULE + '.Base64', Mock())
     @patch(MODULE + '.Policy.digest', Mock())
     def test_validate_invalid_signature(self):
@@ -259,6 +290,59 @@ class TestPolicy(TestCase):
         self.assertEqual(str(policy), str(policy.__dict__))
 
 
+class TestPolicyCache(TestCase):
+
+    @patch(MODULE + '.time')
+    def test_get(self, time):
+        time.return_value = 10
+        key = Mock()
+        policy = Policy('/content', 20)
+        cache = PolicyCache()
+        cache.add(key, 'p1', 's1', policy)
+
+        # test and validation
+        self.assertEqual(cache.get(key, 'p1', 's1'), policy)
+        self.assertEqual(cache.get(key, 'p1', 's2'), None)
+        self.assertEqual(cache.get(Mock(), 'p1', 's1'), None)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertAlmostEqual(cache.hit_ratio, 1 / 3.0)
+
+    @patch(MODULE + '.time')
+    def test_get_expired(self, time):
+        time.return_value = 20
+        key = Mock()
+        cache = PolicyCache()
+        cache.add(key, 'p1', 's1', Policy('/content', 20))
+
+        # test
+        policy = cache.get(key, 'p1', 's1')
+
+        # validation
+        self.assertEqual(policy, None)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 1)
+
+    @patch(MODULE + '.time', Mock(return_value=10))
+    def test_add_evicts_least_recently_used(self):
+        key = Mock()
+        cache = PolicyCache(size=2)
+        cache.add(key, 'p1', 's1', Policy('/1', 20))
+        cache.add(key, 'p2', 's2', Policy('/2', 20))
+        cache.get(key, 'p1', 's1')
+
+        # test
+        cache.add(key, 'p3', 's3', Policy('/3', 20))
+
+        # validation
+        self.assertEqual(len(cache), 2)
+        self.assertNotEqual(cache.get(key, 'p1', 's1'), None)
+        self.assertEqual(cache.get(key, 'p2', 's2'), None)
+        self.assertNotEqual(cache.get(key, 'p3', 's3'), None)
+
+    def test_hit_ratio_without_lookups(self):
+        self.assertEqual(PolicyCache().hit_ratio, 0.0)
+
+
 class TestQuery(TestCase):
 
     def test_decode(self):
@@ -281,6 +365,32 @@ class TestQuery(TestCase):
 
 class TestKey(TestCase):
 
+    def setUp(self):
+        Key._cache.clear()
+
+    def tearDown(self):
+        Key._cache.clear()
+
+    @patch(MODULE + '.Key.load')
+    @patch(MODULE + '.os.stat')
+    def test_load_cached(self, stat, load):
+        path = '/tmp/key.pem'
+        load.side_effect = [Mock(), Mock()]
+        stat.return_value.st_mtime = 10.0
+
+        # test
+        first = Key.load_cached(path)
+        second = Key.load_cached(path)
+        stat.return_value.st_mtime = 20.0
+        third = Key.load_cached(path)
+
+        # validation
+        stat.assert_called_with(path)
+        self.assertEqual(load.call_count, 2)
+        load.assert_called_with(path=path)
+        self.assertTrue(first is second)
+        self.assertFalse(first is third)
+
     @patch(MODULE + '.RSA')
     @patch(MODULE + '.BIO')
     @patch('__builtin__.open')
@@ -433,7 +543,7 @@ class TestSignedURL(TestCase):
 
         # validation
         policy.validate.assert_called_once_with(
-            key, bundle.return_value[0], bundle.return_value[1])
+            key, bundle.return_value[0], bundle.return_value[1], None)
         self.assertEqual(_resource, resource)
 
     @patch(MODULE + '.Policy')
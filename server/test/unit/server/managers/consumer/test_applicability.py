@@ -1,12 +1,17 @@
+import unittest
+
 import mock
+from pymongo.errors import BulkWriteError
 
 from .... import base
 from pulp.devel import mock_plugins
 from pulp.devel.skip import skip_broken
 from pulp.plugins.loader import api as plugins
+from pulp.plugins.profiler import Profiler
 from pulp.server.controllers import distributor as dist_controller
 from pulp.server.db import model
-from pulp.server.db.model.consumer import (Bind, Consumer, RepoProfileApplicability,
+from pulp.server.db.model.consumer import (ApplicabilityResult, Bind, Consumer,
+                                           RepoProfileApplicability,
                                            UnitProfile)
 from pulp.server.db.model.criteria import Criteria
 from pulp.server.db.model import Repository
@@ -15,12 +20,17 @@ from pulp.server.managers.consumer.applicability import (
     _add_consumers_to_applicability_map, _add_profiles_to_consumer_map_and_get_hashes,
     _add_repo_ids_to_consumer_map, _format_report, _get_applicability_map,
     _get_consumer_applicability_map, DoesNotExist, MultipleObjectsReturned,
-    retrieve_consumer_applicability, ApplicabilityRegenerationManager)
+    retrieve_consumer_applicability, ApplicabilityRegenerationManager,
+    APPLICABILITY_PAGE_SIZE, APPLICABILITY_RESULT_GRACE, RepoProfileApplicabilityManager,
+    retrieve_consumer_applicability_page)
 from pulp.server.managers.consumer.bind import BindManager
 from pulp.server.managers.consumer.cud import ConsumerManager
 from pulp.server.managers.consumer.profile import ProfileManager
 
 
+MODULE = 'pulp.server.managers.consumer.applicability.'
+
+
 class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
 
     CONSUMER_IDS = ['consumer-1', 'consumer-2']
@@ -40,6 +50,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
         RepoProfileApplicability.get_collection().remove()
+        ApplicabilityResult.get_collection().remove()
         plugins._create_manager()
         mock_plugins.install()
 
@@ -54,6 +65,10 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         self.old_get_existing = ApplicabilityRegenerationManager._get_existing_repo_content_types
         ApplicabilityRegenerationManager._get_existing_repo_content_types = mock.Mock(
             return_value=['rpm', 'erratum'])
+        self.old_get_existing_repos = \
+            ApplicabilityRegenerationManager._get_existing_repos_content_types
+        ApplicabilityRegenerationManager._get_existing_repos_content_types = mock.Mock(
+            side_effect=lambda repo_ids: dict((r, ['rpm', 'erratum']) for r in repo_ids))
 
     def tearDown(self):
         base.PulpServerTests.tearDown(self)
@@ -63,9 +78,12 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
         RepoProfileApplicability.get_collection().remove()
+        ApplicabilityResult.get_collection().remove()
         mock_plugins.reset()
         ApplicabilityRegenerationManager._get_existing_repo_content_types = staticmethod(
             self.old_get_existing)
+        ApplicabilityRegenerationManager._get_existing_repos_content_types = staticmethod(
+            self.old_get_existing_repos)
 
     def populate_consumers(self):
         # Register consumers with rpm profiles
@@ -110,12 +128,12 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         # Test without bindings
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 0)
         # Test with bindings
         self.populate_bindings()
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 0)
 
     # Applicability regeneration with consumer criteria
@@ -127,7 +145,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 4)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -142,7 +160,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 2)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -157,7 +175,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_consumers(Criteria())
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 2)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -172,7 +190,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(applicability_list, [])
 
     @skip_broken
@@ -185,7 +203,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 0)
 
     # Applicability regeneration with repo criteria
@@ -199,7 +217,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         manager.queue_regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 4)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -215,7 +233,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         manager.queue_regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 2)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -231,7 +249,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         manager.queue_regenerate_applicability_for_repos(Criteria())
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 2)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -245,7 +263,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.queue_regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(applicability_list, [])
 
     @mock.patch('pulp.server.managers.consumer.bind.model.Repository.objects')
@@ -258,7 +276,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.queue_regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 0)
 
     @skip_broken
@@ -280,7 +298,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         # Request applicability regeneration for the repo and assert that no exception is raised
         applicability_manager.queue_regenerate_applicability_for_repos(self.REPO_CRITERIA)
 
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 1)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', 'errata-2']}
         self.assertEqual(applicability_list[0]['profile'], self.PROFILE1)
@@ -346,7 +364,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         manager.regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 4)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -365,7 +383,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         manager.regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 2)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -383,7 +401,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager.regenerate_applicability_for_consumers(self.CONSUMER_CRITERIA)
         manager.regenerate_applicability_for_repos(Criteria())
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 2)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', u'errata-2']}
         for applicability in applicability_list:
@@ -399,7 +417,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(applicability_list, [])
 
     @skip_broken
@@ -414,7 +432,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         manager = factory.applicability_regeneration_manager()
         manager.regenerate_applicability_for_repos(self.REPO_CRITERIA)
         # Verify
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 0)
 
     @skip_broken
@@ -443,7 +461,7 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         # Request applicability regeneration for the repo and assert that no exception is raised
         applicability_manager.regenerate_applicability_for_repos(self.REPO_CRITERIA)
 
-        applicability_list = list(RepoProfileApplicability.get_collection().find())
+        applicability_list = RepoProfileApplicability.objects.filter({})
         self.assertEqual(len(applicability_list), 1)
         expected_applicability = {'rpm': ['rpm-1', 'rpm-2'], 'erratum': ['errata-1', 'errata-2']}
         self.assertEqual(applicability_list[0]['profile'], self.PROFILE1)
@@ -467,6 +485,171 @@ class ApplicabilityRegenerationManagerTests(base.PulpServerTests):
         mock_get_collection.return_value.find.return_value.batch_size.assert_called_with(5)
 
 
+class TestBatchRegenerateApplicability(unittest.TestCase):
+    """
+    Tests for ApplicabilityRegenerationManager.batch_regenerate_applicability.
+    """
+
+    def setUp(self):
+        self.profiler = mock.MagicMock()
+        self.profiler.metadata.return_value = {'types': ['rpm', 'erratum']}
+        self.profiler.calculate_applicable_units_batch.side_effect = \
+            lambda unit_profiles, repo_id, config, conduit: dict(
+                (h, {'rpm': [repo_id]}) for h in unit_profiles)
+
+        patches = [
+            mock.patch(MODULE + 'ApplicabilityRegenerationManager._profiler',
+                       return_value=(self.profiler, {})),
+            mock.patch(MODULE + 'ApplicabilityRegenerationManager._get_unit_profiles',
+                       return_value={'p1': ('hash-1', 'rpm', ['a']),
+                                     'p2': ('hash-2', 'rpm', ['b'])}),
+            mock.patch(MODULE + 'ApplicabilityRegenerationManager.'
+                                '_get_existing_repos_content_types',
+                       return_value={'repo-1': ['rpm'], 'repo-2': ['rpm'], 'iso': ['iso']}),
+            mock.patch(MODULE + 'RepoProfileApplicability.get_collection'),
+            mock.patch(MODULE + 'ApplicabilityResult.get_collection'),
+        ]
+        mocks = [p.start() for p in patches]
+        for p in patches:
+            self.addCleanup(p.stop)
+        self.mock_profiler, self.mock_unit_profiles, self.mock_repos = mocks[:3]
+        self.collection = mocks[3].return_value
+        self.results_collection = mocks[4].return_value
+
+    def written(self, collection=None):
+        """
+        :return: the (query, update) of every upsert passed to bulk_write
+        :rtype:  list
+        """
+        collection = collection or self.collection
+        return [(op._filter, op._doc) for c in collection.bulk_write.call_args_list
+                for op in c[0][0]]
+
+    def test_groups_by_repo(self):
+        """
+        Assert that shared data is loaded once and the profiler is called once per repository.
+        """
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('repo-1', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+            ('repo-1', 'hash-2', [('hash-2', 'rpm', 'p2')]),
+            ('repo-2', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+        ])
+
+        self.mock_repos.assert_called_once_with(mock.ANY)
+        self.assertEqual(set(self.mock_repos.call_args[0][0]), set(['repo-1', 'repo-2']))
+        self.mock_unit_profiles.assert_called_once_with(set(['p1', 'p2']))
+        self.mock_profiler.assert_called_once_with('rpm')
+
+        calls = self.profiler.calculate_applicable_units_batch.call_args_list
+        self.assertEqual(len(calls), 2)
+        profile_sets = dict((c[0][1], c[0][0]) for c in calls)
+        self.assertEqual(profile_sets['repo-1'], {'hash-1': [('hash-1', 'rpm', ['a'])],
+                                                  'hash-2': [('hash-2', 'rpm', ['b'])]})
+        self.assertEqual(profile_sets['repo-2'], {'hash-1': [('hash-1', 'rpm', ['a'])]})
+
+        self.assertEqual(self.collection.bulk_write.call_count, 1)
+        self.assertFalse(self.collection.bulk_write.call_args[1]['ordered'])
+        written = self.written()
+        self.assertEqual(len(written), 3)
+        digest = ApplicabilityResult.calculate_digest({'rpm': ['repo-1']})
+        self.assertTrue(({'repo_id': 'repo-1', 'all_profiles_hash': 'hash-2',
+                          'profile_hash': 'hash-2'},
+                         {'$set': {'applicability_digest': digest},
+                          '$setOnInsert': {'profile': []}}) in written)
+
+        # Identical applicability is only stored once
+        results = dict((query['_id'], update['$setOnInsert']['applicability'])
+                       for query, update in self.written(self.results_collection))
+        self.assertEqual(results, {digest: {'rpm': ['repo-1']},
+                                   ApplicabilityResult.calculate_digest({'rpm': ['repo-2']}):
+                                   {'rpm': ['repo-2']}})
+
+    def test_skips_repo_without_profiler_types(self):
+        """
+        Assert that repositories without any of the profiler's types are not calculated.
+        """
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('iso', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+            ('missing', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+        ])
+
+        self.assertFalse(self.profiler.calculate_applicable_units_batch.called)
+        self.assertFalse(self.collection.bulk_write.called)
+        self.assertFalse(self.results_collection.bulk_write.called)
+
+    def test_skips_removed_profiles(self):
+        """
+        Assert that profile sets with a profile that no longer exists are skipped.
+        """
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('repo-1', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+            ('repo-1', 'hash-3', [('hash-1', 'rpm', 'p1'), ('hash-3', 'rpm', 'p3')]),
+        ])
+
+        unit_profiles = self.profiler.calculate_applicable_units_batch.call_args[0][0]
+        self.assertEqual(unit_profiles.keys(), ['hash-1'])
+        self.assertEqual(len(self.written()), 1)
+
+    def test_not_implemented(self):
+        """
+        Assert that nothing is saved when the profiler does not support applicability.
+        """
+        self.profiler.calculate_applicable_units_batch.side_effect = NotImplementedError
+
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('repo-1', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+        ])
+
+        self.assertFalse(self.collection.bulk_write.called)
+
+    def test_empty(self):
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([])
+
+        self.assertFalse(self.mock_repos.called)
+        self.assertFalse(self.collection.bulk_write.called)
+
+    def test_retries_duplicate_upserts(self):
+        """
+        Assert that upserts which lost a race on the unique index are retried.
+        """
+        error = BulkWriteError({'writeErrors': [{'index': 1, 'code': 11000}]})
+        self.collection.bulk_write.side_effect = [error, None]
+
+        ApplicabilityRegenerationManager.batch_regenerate_applicability([
+            ('repo-1', 'hash-1', [('hash-1', 'rpm', 'p1')]),
+            ('repo-1', 'hash-2', [('hash-2', 'rpm', 'p2')]),
+        ])
+
+        first, retry = self.collection.bulk_write.call_args_list
+        self.assertEqual(retry[0][0], [first[0][0][1]])
+
+    def test_other_write_errors_raise(self):
+        error = BulkWriteError({'writeErrors': [{'index': 0, 'code': 2}]})
+        self.collection.bulk_write.side_effect = error
+
+        self.assertRaises(BulkWriteError,
+                          ApplicabilityRegenerationManager.batch_regenerate_applicability,
+                          [('repo-1', 'hash-1', [('hash-1', 'rpm', 'p1')])])
+
+
+class TestProfilerBatch(unittest.TestCase):
+
+    def test_default_calls_each_profile_set(self):
+        """
+        Assert that the base class implementation calculates each profile set separately.
+        """
+        profiler = Profiler()
+        profiler.calculate_applicable_units = mock.MagicMock(
+            side_effect=lambda unit_profile, repo_id, config, conduit: len(unit_profile))
+
+        result = profiler.calculate_applicable_units_batch(
+            {'hash-1': ['a'], 'hash-2': ['a', 'b']}, 'repo', 'config', 'conduit')
+
+        self.assertEqual(result, {'hash-1': 1, 'hash-2': 2})
+        profiler.calculate_applicable_units.assert_any_call(['a', 'b'], 'repo', 'config',
+                                                            'conduit')
+
+
 class TestRepoProfileApplicabilityManager(base.PulpServerTests):
     """
     Test the RepoProfileApplicabilityManager.
@@ -485,6 +668,7 @@ class TestRepoProfileApplicabilityManager(base.PulpServerTests):
         """
         super(TestRepoProfileApplicabilityManager, self).tearDown()
         self.collection.drop()
+        ApplicabilityResult.get_collection().drop()
         model.Repository.objects.delete()
         Consumer.get_collection().drop()
         UnitProfile.get_collection().drop()
@@ -513,7 +697,8 @@ class TestRepoProfileApplicabilityManager(base.PulpServerTests):
         self.assertEqual(document['profile_hash'], profile_hash)
         self.assertEqual(document['repo_id'], repo_id)
         self.assertEqual(document['profile'], profile)
-        self.assertEqual(document['applicability'], applicability_data)
+        self.assertEqual(document['applicability_digest'],
+                         ApplicabilityResult.calculate_digest(applicability_data))
 
         # Our applicability object should now have the correct _id attribute
         self.assertEqual(applicability._id, document['_id'])
@@ -724,6 +909,28 @@ class TestRepoProfileApplicabilityManager(base.PulpServerTests):
         existing_rpa = RepoProfileApplicability.objects.get({})
         self.assertEqual(rpa._id, existing_rpa._id)
 
+    @mock.patch(MODULE + 'time.time', return_value=10000)
+    @mock.patch(MODULE + 'ApplicabilityResult.get_collection')
+    @mock.patch(MODULE + 'RepoProfileApplicability.get_collection')
+    def test_remove_orphaned_results(self, m_rpa_collection, m_results_collection, m_time):
+        """
+        Assert that only stale results that nothing references are removed.
+        """
+        results_collection = m_results_collection.return_value
+        results_collection.find.return_value.batch_size.return_value = [
+            {'_id': 'used'}, {'_id': 'orphan'}]
+        m_rpa_collection.return_value.distinct.return_value = ['used']
+
+        RepoProfileApplicabilityManager.remove_orphaned_results()
+
+        cutoff = 10000 - APPLICABILITY_RESULT_GRACE
+        results_collection.find.assert_called_once_with({'updated': {'$lt': cutoff}},
+                                                        projection=['_id'])
+        m_rpa_collection.return_value.distinct.assert_called_once_with(
+            'applicability_digest', {'applicability_digest': {'$in': ['used', 'orphan']}})
+        results_collection.delete_many.assert_called_once_with(
+            {'_id': {'$in': ['orphan']}, 'updated': {'$lt': cutoff}})
+
 
 @mock.patch('pulp.server.managers.consumer.bind.factory.consumer_history_manager')
 @mock.patch('pulp.server.managers.consumer.bind.BindManager._validate_consumer_repo')
@@ -740,6 +947,7 @@ class TestRetrieveConsumerApplicability(base.PulpServerTests,
         Consumer.get_collection().remove()
         UnitProfile.get_collection().remove()
         RepoProfileApplicability.get_collection().drop()
+        ApplicabilityResult.get_collection().drop()
         Bind.get_collection().drop()
 
     @skip_broken
@@ -1223,6 +1431,57 @@ class TestRetrieveConsumerApplicability(base.PulpServerTests,
         self.assert_equal_ignoring_list_order(applicability, expected_applicability)
 
 
+class TestRetrieveConsumerApplicabilityPage(unittest.TestCase):
+    """
+    Test the retrieve_consumer_applicability_page() function.
+    """
+
+    @mock.patch(MODULE + '_get_consumers_applicability')
+    @mock.patch(MODULE + 'ConsumerQueryManager.find_by_criteria')
+    def test_first_page(self, m_find, m_applicability):
+        """
+        Assert that a full page reports the last consumer as the next page token.
+        """
+        m_find.return_value = [{'id': 'c1'}, {'id': 'c2'}]
+        criteria = Criteria(filters={'notes.env': 'prod'}, sort=[('id', -1)])
+
+        page = retrieve_consumer_applicability_page(criteria, ['rpm'], page_size=2)
+
+        page_criteria = m_find.call_args[0][0]
+        self.assertEqual(page_criteria.filters, {'notes.env': 'prod'})
+        self.assertEqual(page_criteria.sort, [('id', 1)])
+        self.assertEqual(page_criteria.limit, 2)
+        self.assertEqual(page_criteria.fields, ['id'])
+        m_applicability.assert_called_once_with(['c1', 'c2'], ['rpm'])
+        self.assertEqual(page, {'applicability': m_applicability.return_value,
+                                'next_page': 'c2'})
+
+    @mock.patch(MODULE + '_get_consumers_applicability')
+    @mock.patch(MODULE + 'ConsumerQueryManager.find_by_criteria')
+    def test_last_page(self, m_find, m_applicability):
+        """
+        Assert that the page token restricts the window and a short page is the last one.
+        """
+        m_find.return_value = [{'id': 'c3'}]
+
+        page = retrieve_consumer_applicability_page(
+            Criteria(filters={'notes.env': 'prod'}), page_size=2, page_token='c2')
+
+        self.assertEqual(m_find.call_args[0][0].filters,
+                         {'$and': [{'notes.env': 'prod'}, {'id': {'$gt': 'c2'}}]})
+        m_applicability.assert_called_once_with(['c3'], None)
+        self.assertTrue(page['next_page'] is None)
+
+    @mock.patch(MODULE + '_get_consumers_applicability')
+    @mock.patch(MODULE + 'ConsumerQueryManager.find_by_criteria', return_value=[])
+    def test_no_filters(self, m_find, m_applicability):
+        retrieve_consumer_applicability_page(Criteria(), page_token='c2')
+
+        page_criteria = m_find.call_args[0][0]
+        self.assertEqual(page_criteria.filters, {'id': {'$gt': 'c2'}})
+        self.assertEqual(page_criteria.limit, APPLICABILITY_PAGE_SIZE)
+
+
 class TestAddConsumersToApplicabilityMap(base.PulpServerTests,
                                          base.RecursiveUnorderedListComparisonMixin):
     """
@@ -1439,6 +1698,34 @@ class TestGetApplicabilityMap(base.PulpServerTests):
         """
         super(TestGetApplicabilityMap, self).tearDown()
         RepoProfileApplicability.get_collection().remove()
+        ApplicabilityResult.get_collection().remove()
+
+    @mock.patch(MODULE + 'ApplicabilityResult.get_collection')
+    @mock.patch(MODULE + 'RepoProfileApplicability.get_collection')
+    def test__get_applicability_map_shared_results(self, m_rpa_collection,
+                                                   m_results_collection):
+        """
+        Assert that results are loaded with one query and that filtering the data of one record
+        does not change the data of another record that shares the result.
+        """
+        m_rpa_collection.return_value.find.return_value = [
+            {'all_profiles_hash': 'hash_1', 'repo_id': 'repo_1', 'applicability_digest': 'd_1'},
+            {'all_profiles_hash': 'hash_2', 'repo_id': 'repo_1', 'applicability_digest': 'd_1'},
+            {'all_profiles_hash': 'hash_2', 'repo_id': 'repo_2', 'applicability_digest': 'gone'}]
+        m_results_collection.return_value.find.return_value = [
+            {'_id': 'd_1', 'applicability': {'type_1': ['a_1'], 'type_2': ['a_2']}}]
+
+        a_map = _get_applicability_map(['hash_1', 'hash_2'], ['type_1'])
+
+        self.assertEqual(m_results_collection.return_value.find.call_count, 1)
+        query = m_results_collection.return_value.find.call_args[0][0]
+        self.assertEqual(sorted(query['_id']['$in']), ['d_1', 'gone'])
+        expected_a_map = {
+            ('hash_1', 'repo_1'): {'applicability': {'type_1': ['a_1']}, 'consumers': []},
+            ('hash_2', 'repo_1'): {'applicability': {'type_1': ['a_1']}, 'consumers': []}}
+        self.assertEqual(a_map, expected_a_map)
+        self.assertFalse(a_map[('hash_1', 'repo_1')]['applicability'] is
+                         a_map[('hash_2', 'repo_1')]['applicability'])
 
     @skip_broken
     def test__get_applicability_map_content_types_none(self):
@@ -10,12 +10,14 @@ import traceback
 from mock import call, patch, Mock
 
 from .... import base
+from pulp.common import error_codes
 from pulp.plugins.types import database as content_type_db
 from pulp.plugins.types.model import TypeDefinition
 from pulp.server import exceptions as pulp_exceptions
+from pulp.server.db import model
 from pulp.server.db.model.repository import RepoContentUnit
 from pulp.server.managers import factory as manager_factory
-from pulp.server.managers.content.orphan import OrphanManager
+from pulp.server.managers.content.orphan import OrphanFileRemover, OrphanManager
 
 
 MODULE_PATH = 'pulp.server.managers.content.orphan.'
@@ -62,6 +64,11 @@ def gen_buttload_of_content_units(content_type_id, content_root, num_units):
         gen_content_unit(content_type_id, content_root, unit_name)
 
 
+def age_content_unit(content_unit):
+    collection = content_type_db.type_units_collection(content_unit['_content_type_id'])
+    collection.update_one({'_id': content_unit['_id']}, {'$set': {'_last_updated': 1}})
+
+
 def associate_content_unit_with_repo(content_unit):
     repo_content_unit = RepoContentUnit(PHONY_REPO_ID,
                                         content_unit['_id'],
@@ -102,6 +109,8 @@ class OrphanManagerTests(base.PulpServerTests):
     def tearDown(self):
         super(OrphanManagerTests, self).tearDown()
         RepoContentUnit.get_collection().remove()
+        model.OrphanCandidate.objects.delete()
+        model.OrphanScanWatermark.objects.delete()
         content_type_db.clean()
         if os.path.exists(self.content_root):  # can be removed by delete operations
             shutil.rmtree(self.content_root)
@@ -154,6 +163,81 @@ class OrphanManagerGeneratorTests(OrphanManagerTests):
         orphans_2 = list(self.orphan_manager.generate_orphans_by_type(PHONY_TYPE_2.id))
         self.assertEqual(len(orphans_2), 1)
 
+    def test_generate_orphan_pages_by_type(self):
+        units = [gen_content_unit(PHONY_TYPE_1.id, self.content_root, 'unit-%d' % i)
+                 for i in range(5)]
+        associate_content_unit_with_repo(units[0])
+        associate_content_unit_with_repo(units[3])
+
+        pages = list(self.orphan_manager.generate_orphan_pages_by_type(PHONY_TYPE_1.id,
+                                                                       page_size=2))
+
+        self.assertTrue(all(0 < len(page) <= 2 for page in pages))
+        orphan_ids = set(unit['_id'] for page in pages for unit in page)
+        self.assertEqual(orphan_ids, set([units[1]['_id'], units[2]['_id'], units[4]['_id']]))
+
+    def test_generate_orphan_pages_by_type_filtered(self):
+        unit_1 = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        unit_2 = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        associate_content_unit_with_repo(unit_2)
+
+        pages = list(self.orphan_manager.generate_orphan_pages_by_type(
+            PHONY_TYPE_1.id, fields=['name'], content_unit_ids=[unit_1['_id'], unit_2['_id']]))
+
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(len(pages[0]), 1)
+        self.assertEqual(pages[0][0]['_id'], unit_1['_id'])
+        self.assertEqual(pages[0][0]['name'], unit_1['name'])
+
+    def test_orphan_candidates_recorded(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        age_content_unit(unit)
+        associate_content_unit_with_repo(unit)
+
+        # a complete scan moves the watermark past the unit
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id), 0)
+        self.assertTrue(OrphanManager._get_watermark(PHONY_TYPE_1.id) > 0)
+        self.assertEqual(model.OrphanCandidate.objects.count(), 0)
+
+        unassociate_content_unit_from_repo(unit)
+        model.OrphanCandidate.objects.add(PHONY_TYPE_1.id, [unit['_id']])
+
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id), 1)
+
+    def test_orphan_candidates_pruned(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        model.OrphanCandidate.objects(unit_type_id=PHONY_TYPE_1.id, unit_id=unit['_id']).\
+            update_one(set__updated=0, upsert=True)
+        associate_content_unit_with_repo(unit)
+
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id), 0)
+        self.assertEqual(model.OrphanCandidate.objects.count(), 0)
+
+    def test_unrecorded_orphan_not_scanned(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        age_content_unit(unit)
+        associate_content_unit_with_repo(unit)
+        self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id)
+
+        # disassociating behind the back of the index leaves the unit out of the scan...
+        unassociate_content_unit_from_repo(unit)
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id), 0)
+
+        # ...until the index is verified
+        self.assertEqual(OrphanManager.verify_orphan_index(PHONY_TYPE_1.id), [unit['_id']])
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id), 1)
+        self.assertEqual(OrphanManager.verify_orphan_index(PHONY_TYPE_1.id), [])
+
+    def test_orphans_count_by_type(self):
+        unit = gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        gen_content_unit(PHONY_TYPE_1.id, self.content_root)
+        gen_content_unit(PHONY_TYPE_2.id, self.content_root)
+        associate_content_unit_with_repo(unit)
+
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_1.id), 1)
+        self.assertEqual(self.orphan_manager.orphans_count_by_type(PHONY_TYPE_2.id), 1)
+
     @patch('pulp.server.controllers.units.get_unit_key_fields_for_type', spec_set=True)
     def test_generate_orphans_by_type_with_unit_keys_invalid_type(self, mock_get_unit_key_fields):
         """
@@ -273,32 +357,44 @@ class OrphanManagerGeneratorTests(OrphanManagerTests):
         self.assertEqual(len(orphans), 0)
         self.assertEqual(self.number_of_files_in_content_root(), 0)
         mock_lazy_catalog_objects.assert_called_once_with(
-            unit_id=unit['_id'],
+            unit_id__in=[unit['_id']],
             unit_type_id=unit['_content_type_id']
         )
         mock_lazy_catalog_objects.return_value.delete.assert_called_once_with()
 
+    @patch(MODULE_PATH + 'model.OrphanCandidate.objects')
+    @patch(MODULE_PATH + 'OrphanManager.generate_orphan_pages_by_type')
     @patch(MODULE_PATH + 'model.LazyCatalogEntry.objects')
-    @patch(MODULE_PATH + 'OrphanManager.delete_orphaned_file')
+    @patch(MODULE_PATH + 'OrphanFileRemover')
     @patch(MODULE_PATH + 'model.RepositoryContentUnit.objects')
     @patch(MODULE_PATH + 'plugin_api.get_unit_model_by_id')
     def test_delete_content_unit_by_type(
-            self, m_get_model, m_rcu_objects, m_del_orphan, mock_lazy_catalog_objects):
+            self, m_get_model, m_rcu_objects, m_remover, mock_lazy_catalog_objects,
+            m_generate_pages, m_candidate_objects):
         orphan = Mock(_storage_path='test_foo_path', id='orphan')
         non_orphan = Mock(_storage_path='test_foo_path', id='non_orphan')
-        m_get_model.return_value.objects.only.return_value = [
+        m_generate_pages.return_value = [[{'_id': 'orphan'}, {'_id': 'non_orphan'}]]
+        m_get_model.return_value.objects.return_value.only.return_value = [
             orphan,
             non_orphan
         ]
         m_rcu_objects.return_value.distinct.return_value = ['non_orphan']
 
-        self.orphan_manager.delete_orphan_content_units_by_type('foo_type')
+        count = self.orphan_manager.delete_orphan_content_units_by_type('foo_type')
+        self.assertEqual(count, 1)
+        m_generate_pages.assert_called_once_with('foo_type')
+        self.assertEqual(m_get_model.return_value.objects.call_args_list,
+                         [call(id__in=('orphan', 'non_orphan')), call(id__in=['orphan'])])
+        m_get_model.return_value.objects.return_value.delete.assert_called_once_with()
+        m_candidate_objects.assert_called_once_with(unit_type_id='foo_type',
+                                                    unit_id__in=['orphan'])
         mock_lazy_catalog_objects.assert_called_once_with(
-            unit_id='orphan',
+            unit_id__in=['orphan'],
             unit_type_id='foo_type'
         )
         mock_lazy_catalog_objects.return_value.delete.assert_called_once_with()
-        m_del_orphan.assert_called_once_with('test_foo_path')
+        file_remover = m_remover.return_value.__enter__.return_value
+        file_remover.remove.assert_called_once_with('test_foo_path')
 
     @patch(MODULE_PATH + 'plugin_api.get_unit_model_by_id')
     def test_delete_content_unit_by_type_filtered(self, mock_get_model):
@@ -624,3 +720,116 @@ class TestDeleteOrphanedFile(TestCase):
 
         OrphanManager.delete_orphaned_file(path)
         self.assertFalse(rmdir.called)
+
+
+class TestPruneEmptyDirectories(TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp(prefix='orphan_prune_unittests-')
+        self.type_dir = os.path.join(self.storage_dir, 'content', 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir)
+
+    def test_prune(self):
+        """
+        Ensure that directories are pruned deepest first, so parents shared by several of the
+        given directories are removed once all of their children are.
+        """
+        dirs = [os.path.join(self.type_dir, 'a', 'b', 'c'),
+                os.path.join(self.type_dir, 'a', 'd'),
+                os.path.join(self.type_dir, 'e')]
+        for path in dirs:
+            os.makedirs(path)
+        with open(os.path.join(self.type_dir, 'e', 'keep'), 'w'):
+            pass
+
+        OrphanManager.prune_empty_directories(dirs + [os.path.join(self.type_dir, 'gone')],
+                                              self.storage_dir)
+
+        self.assertEqual(os.listdir(self.type_dir), ['e'])
+
+    @patch('pulp.server.managers.content.orphan.os.listdir')
+    def test_prune_lists_each_directory_once(self, listdir):
+        listdir.return_value = ['some-file']
+        dirs = [os.path.join(self.type_dir, 'a', 'b'), os.path.join(self.type_dir, 'a', 'c')]
+
+        OrphanManager.prune_empty_directories(dirs, self.storage_dir)
+
+        self.assertEqual(sorted(c[0][0] for c in listdir.call_args_list), sorted(dirs))
+
+
+class TestOrphanFileRemover(TestCase):
+
+    def setUp(self):
+        self.storage_dir = tempfile.mkdtemp(prefix='orphan_remover_unittests-')
+        self.type_dir = os.path.join(self.storage_dir, 'content', 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.storage_dir)
+
+    @patch('pulp.server.managers.content.orphan.pulp_config.config')
+    def test_remove(self, config):
+        config.get.return_value = self.storage_dir
+        paths = []
+        for i in range(20):
+            directory = os.path.join(self.type_dir, str(i % 3), str(i))
+            os.makedirs(directory)
+            path = os.path.join(directory, 'file')
+            with open(path, 'w'):
+                pass
+            paths.append(path)
+
+        with OrphanFileRemover(concurrency=4) as file_remover:
+            for path in paths:
+                file_remover.remove(path)
+
+        self.assertEqual(os.listdir(self.type_dir), [])
+
+    @patch('pulp.server.managers.content.orphan.OrphanManager.prune_empty_directories')
+    @patch('pulp.server.managers.content.orphan.OrphanManager.remove_orphaned_file')
+    @patch('pulp.server.managers.content.orphan.pulp_config.config')
+    def test_remove_failure(self, config, remove_orphaned_file, prune):
+        config.get.return_value = self.storage_dir
+        remove_orphaned_file.side_effect = [ValueError(), '/parent', OSError()]
+
+        try:
+            with OrphanFileRemover(concurrency=1) as file_remover:
+                file_remover.remove('path-1')
+                file_remover.remove('/parent/path-2')
+                file_remover.remove('path-3')
+        except pulp_exceptions.PulpCodedException, e:
+            self.assertEqual(e.error_code, error_codes.PLP0050)
+            self.assertEqual(e.error_data, {'count': 2, 'paths': 'path-1, path-3'})
+        else:
+            self.fail('PulpCodedException not raised')
+
+        prune.assert_called_once_with(set(['/parent']), self.storage_dir)
+        self.assertEqual(file_remover._failed, [])
+
+    @patch('pulp.server.managers.content.orphan.OrphanManager.prune_empty_directories')
+    @patch('pulp.server.managers.content.orphan.OrphanManager.remove_orphaned_file')
+    @patch('pulp.server.managers.content.orphan.pulp_config.config')
+    def test_remove_failure_in_failed_block(self, config, remove_orphaned_file, prune):
+        config.get.return_value = self.storage_dir
+        remove_orphaned_file.side_effect = ValueError()
+
+        def remove_and_fail():
+            with OrphanFileRemover(concurrency=1) as file_remover:
+                file_remover.remove('path-1')
+                raise KeyError()
+
+        # the exception raised by the block is not masked by the failed removal
+        self.assertRaises(KeyError, remove_and_fail)
+
+    @patch('pulp.server.managers.content.orphan.OrphanManager.prune_empty_directories')
+    @patch('pulp.server.managers.content.orphan.pulp_config.config')
+    def test_no_threads_without_files(self, config, prune):
+        config.getint.return_value = 4
+
+        with OrphanFileRemover() as file_remover:
+            pass
+
+        self.assertEqual(file_remover.concurrency, 4)
+        self.assertEqual(file_remover._threads, [])
+        config.getint.assert_called_once_with('server', 'orphan_delete_concurrency')
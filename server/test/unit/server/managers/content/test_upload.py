@@ -1,4 +1,6 @@
+from cStringIO import StringIO
 import errno
+import hashlib
 import os
 import shutil
 
@@ -10,13 +12,27 @@ from pulp.common import dateutils
 from pulp.devel import mock_plugins
 from pulp.plugins.conduits.upload import UploadConduit
 from pulp.server.controllers import importer as importer_controller
+from pulp.server import config as pulp_config
 from pulp.server.db import model
 from pulp.server.exceptions import (MissingResource, PulpDataException, PulpExecutionException,
                                     InvalidValue, PulpCodedException)
+from pulp.server.managers.content import upload
 from pulp.server.managers.content.upload import ContentUploadManager
 import pulp.server.managers.factory as manager_factory
 
 
+_config_get = pulp_config.config.get
+
+
+def sha256_upload_checksum(section, key):
+    """
+    Stands in for the server configuration with running upload checksums of type sha256.
+    """
+    if (section, key) == ('server', 'upload_checksum_type'):
+        return 'sha256'
+    return _config_get(section, key)
+
+
 class ContentUploadManagerTests(base.PulpServerTests):
 
     def setUp(self):
@@ -31,6 +47,7 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         upload_storage_dir = self.upload_manager._upload_storage_dir()
         shutil.rmtree(upload_storage_dir)
+        upload._running_checksums.clear()
 
     def clean(self):
         base.PulpServerTests.clean(self)
@@ -87,6 +104,68 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         self.assertEqual(expected_size, found_size)
 
+    @mock.patch('pulp.server.managers.content.upload.SEGMENT_BUFFER_SIZE', 4)
+    def test_save_stream(self):
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_stream(upload_id, 0, StringIO('0123456789'))
+        self.upload_manager.save_stream(upload_id, 4, StringIO('abc'))
+
+        self.assertEqual(self.upload_manager.read_upload(upload_id), '0123abc789')
+        self.assertEqual(self.upload_manager.get_upload_checksum(upload_id), None)
+
+    @mock.patch('pulp.server.managers.content.upload.pulp_config.config.get',
+                side_effect=sha256_upload_checksum)
+    def test_save_stream_running_checksum(self, mock_config_get):
+        upload_id = self.upload_manager.initialize_upload()
+
+        self.assertEqual(self.upload_manager.get_upload_checksum(upload_id), None)
+
+        written = ''
+        for w in ['abc', 'de', 'fghi', 'jkl']:
+            self.upload_manager.save_stream(upload_id, len(written), StringIO(w))
+            written += w
+            self.assertEqual(self.upload_manager.get_upload_checksum(upload_id),
+                             ('sha256', hashlib.sha256(written).hexdigest()))
+
+    @mock.patch('pulp.server.managers.content.upload.pulp_config.config.get',
+                side_effect=sha256_upload_checksum)
+    def test_save_stream_running_checksum_other_process(self, mock_config_get):
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_stream(upload_id, 0, StringIO('abc'))
+        self.upload_manager.save_stream(upload_id, 3, StringIO('de'))
+        # The segments were written by a process this one does not know the checksum object of
+        upload._running_checksums.clear()
+
+        self.upload_manager.save_stream(upload_id, 5, StringIO('fgh'))
+
+        self.assertEqual(self.upload_manager.get_upload_checksum(upload_id),
+                         ('sha256', hashlib.sha256('abcdefgh').hexdigest()))
+
+    @mock.patch('pulp.server.managers.content.upload.pulp_config.config.get',
+                side_effect=sha256_upload_checksum)
+    def test_save_stream_running_checksum_out_of_order(self, mock_config_get):
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_stream(upload_id, 3, StringIO('def'))
+        self.upload_manager.save_stream(upload_id, 0, StringIO('abc'))
+
+        self.assertEqual(self.upload_manager.read_upload(upload_id), 'abcdef')
+        self.assertEqual(self.upload_manager.get_upload_checksum(upload_id), None)
+
+    @mock.patch('pulp.server.managers.content.upload.pulp_config.config.get',
+                side_effect=sha256_upload_checksum)
+    def test_save_stream_running_checksum_failed_segment(self, mock_config_get):
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_stream(upload_id, 0, StringIO('abc'))
+        stream = mock.MagicMock()
+        stream.read.side_effect = ['xyz', IOError()]
+        self.assertRaises(IOError, self.upload_manager.save_stream, upload_id, 3, stream)
+
+        # The client sends the segment again
+        self.upload_manager.save_stream(upload_id, 3, StringIO('def'))
+
+        self.assertEqual(self.upload_manager.get_upload_checksum(upload_id),
+                         ('sha256', hashlib.sha256('abcdef').hexdigest()))
+
     def test_save_no_init(self):
 
         # Test
@@ -96,7 +175,9 @@ class ContentUploadManagerTests(base.PulpServerTests):
         except MissingResource, e:
             self.assertEqual(e.resources['upload_request'], 'foo')
 
-    def test_delete_upload(self):
+    @mock.patch('pulp.server.managers.content.upload.pulp_config.config.get',
+                side_effect=sha256_upload_checksum)
+    def test_delete_upload(self, mock_config_get):
 
         # Setup
         upload_id = self.upload_manager.initialize_upload()
@@ -110,6 +191,7 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
         # Verify
         self.assertTrue(not os.path.exists(uploaded_filename))
+        self.assertTrue(not os.path.exists(self.upload_manager._checksum_file_path(upload_id)))
 
     def test_delete_non_existent_upload(self):
 
@@ -196,6 +278,7 @@ class ContentUploadManagerTests(base.PulpServerTests):
         conduit = call_args[5]
         self.assertTrue(isinstance(conduit, UploadConduit))
         self.assertEqual(call_args[5].repo_id, 'repo-u')
+        self.assertEqual(conduit.get_upload_checksum(), None)
 
         # It is now platform's responsibility to update plugin content unit counts
         self.assertTrue(mock_rebuild.called, "rebuild_content_unit_counts must be called")
@@ -207,6 +290,50 @@ class ContentUploadManagerTests(base.PulpServerTests):
         mock_plugins.MOCK_IMPORTER.upload_unit.return_value = None
         manager_factory.principal_manager().set_principal(principal=None)
 
+    @mock.patch('pulp.server.managers.content.upload.pulp_config.config.get',
+                side_effect=sha256_upload_checksum)
+    @mock.patch('pulp.server.controllers.repository.rebuild_content_unit_counts')
+    @mock.patch('pulp.server.controllers.importer.model.Repository.objects')
+    def test_import_uploaded_unit_checksum(self, mock_repo_qs, mock_rebuild,
+                                           mock_config_get):
+        importer_controller.set_importer('repo-u', 'mock-importer', {})
+        importer_return_report = {'success_flag': True, 'summary': '', 'details': {}}
+        mock_plugins.MOCK_IMPORTER.upload_unit.side_effect = None
+        mock_plugins.MOCK_IMPORTER.upload_unit.return_value = importer_return_report
+        upload_id = self.upload_manager.initialize_upload()
+        self.upload_manager.save_data(upload_id, 0, 'fus ro dah')
+
+        self.upload_manager.import_uploaded_unit('repo-u', 'mock-type', {}, {}, upload_id)
+
+        conduit = mock_plugins.MOCK_IMPORTER.upload_unit.call_args[0][5]
+        self.assertEqual(conduit.get_upload_checksum(),
+                         ('sha256', hashlib.sha256('fus ro dah').hexdigest()))
+        mock_plugins.MOCK_IMPORTER.upload_unit.return_value = None
+
+    @mock.patch('pulp.server.managers.content.upload.UploadConduit.flush_units')
+    @mock.patch('pulp.server.controllers.repository.rebuild_content_unit_counts')
+    @mock.patch('pulp.server.controllers.importer.model.Repository.objects')
+    def test_import_uploaded_unit_flushes_batch(self, mock_repo_qs, mock_rebuild, mock_flush):
+        """
+        Test that the units an importer left buffered in batch mode are saved.
+        """
+        importer_controller.set_importer('repo-u', 'mock-importer', {})
+        importer_return_report = {'success_flag': True, 'summary': '', 'details': {}}
+
+        def upload_unit(repo, type_id, unit_key, metadata, file_path, conduit, config):
+            conduit.enable_batch_mode()
+            self.assertFalse(mock_flush.called)
+            return importer_return_report
+
+        mock_plugins.MOCK_IMPORTER.upload_unit.side_effect = upload_unit
+        upload_id = self.upload_manager.initialize_upload()
+
+        self.upload_manager.import_uploaded_unit('repo-u', 'mock-type', {}, {}, upload_id)
+
+        mock_flush.assert_called_once_with()
+        self.assertTrue(mock_rebuild.called)
+        mock_plugins.MOCK_IMPORTER.upload_unit.side_effect = None
+
     def test_import_uploaded_unit_missing_repo(self):
         # Test
         self.assertRaises(MissingResource, self.upload_manager.import_uploaded_unit, 'fake',
@@ -258,14 +385,20 @@ class ContentUploadManagerTests(base.PulpServerTests):
 
 class TestContentUploadManager(unittest.TestCase):
 
+    @mock.patch.object(ContentUploadManager, '_checksum_file_path')
     @mock.patch.object(ContentUploadManager, '_upload_file_path')
     @mock.patch('pulp.server.managers.content.upload.os')
-    def test_delete_upload_removes_file(self, mock_os, mock__upload_file_path):
+    def test_delete_upload_removes_file(self, mock_os, mock__upload_file_path,
+                                        mock__checksum_file_path):
         my_upload_id = 'asdf'
         ContentUploadManager().delete_upload(my_upload_id)
         mock__upload_file_path.assert_called_once_with(my_upload_id)
-        mock_os.remove.assert_called_once_with(mock__upload_file_path.return_value)
+        mock__checksum_file_path.assert_called_once_with(my_upload_id)
+        self.assertEqual(mock_os.remove.call_args_list,
+                         [mock.call(mock__upload_file_path.return_value),
+                          mock.call(mock__checksum_file_path.return_value)])
 
+    @mock.patch.object(ContentUploadManager, '_checksum_file_path', mock.MagicMock())
     @mock.patch.object(ContentUploadManager, '_upload_file_path')
     @mock.patch('pulp.server.managers.content.upload.os')
     def test_delete_upload_silences_ENOENT_error(self, mock_os, mock__upload_file_path):
@@ -276,6 +409,7 @@ class TestContentUploadManager(unittest.TestCase):
         except Exception:
             self.fail('An Exception should not have been raised.')
 
+    @mock.patch.object(ContentUploadManager, '_checksum_file_path', mock.MagicMock())
     @mock.patch.object(ContentUploadManager, '_upload_file_path')
     @mock.patch('pulp.server.managers.content.upload.os')
     def test_delete_upload_allows_non_ENOENT_OSErrors_to_raise(self, mock_os,
@@ -284,6 +418,7 @@ class TestContentUploadManager(unittest.TestCase):
         mock_os.remove.side_effect = OSError(errno.EISDIR, os.strerror(errno.EISDIR))
         self.assertRaises(OSError, ContentUploadManager().delete_upload, my_upload_id)
 
+    @mock.patch.object(ContentUploadManager, '_checksum_file_path', mock.MagicMock())
     @mock.patch.object(ContentUploadManager, '_upload_file_path')
     @mock.patch('pulp.server.managers.content.upload.os')
     def test_delete_upload_allows_non_OSErrors_to_raise(self, mock_os, mock__upload_file_path):
@@ -9,7 +9,7 @@ import mock
 from pulp.common.compat import json
 from pulp.server.config import config
 from pulp.server.event import data
-from pulp.server.managers.event.remote import TopicPublishManager
+from pulp.server.managers.event.remote import TopicPublisher, TopicPublishManager
 
 
 class TestTopicPublishManager(unittest.TestCase):
@@ -19,6 +19,7 @@ class TestTopicPublishManager(unittest.TestCase):
 
     def tearDown(self):
         TopicPublishManager._logged_disabled = False
+        TopicPublishManager._publisher = None
         if TopicPublishManager._connection:
             TopicPublishManager._connection.close()
             TopicPublishManager._connection = None
@@ -61,13 +62,18 @@ class TestTopicPublishManager(unittest.TestCase):
         self.manager.connection()
         self.assertEqual(mock_debug.call_count, 1)
 
-    @mock.patch.object(TopicPublishManager, 'connection', return_value=None)
-    def test_publish_no_connection(self, mock_connection):
+    @mock.patch.object(TopicPublishManager, 'publisher')
+    @mock.patch.object(TopicPublishManager._logger, 'debug')
+    @mock.patch.object(config, 'get', return_value='')
+    def test_publish_no_address_configured(self, mock_config_get, mock_debug, mock_publisher):
         # make sure this just fails silently.
         self.manager.publish(mock.MagicMock())
 
-    @mock.patch.object(TopicPublishManager, 'connection')
-    def test_publish(self, mock_connection):
+        self.assertEqual(mock_debug.call_count, 1)
+        self.assertFalse(mock_publisher.called)
+
+    @mock.patch.object(TopicPublishManager, 'publisher')
+    def test_publish(self, mock_publisher):
         mock_event = mock.MagicMock()
         mock_event.data.return_value = {}
         mock_event.event_type = data.TYPE_REPO_PUBLISH_FINISHED
@@ -77,26 +83,14 @@ class TestTopicPublishManager(unittest.TestCase):
         expected_destination = '%s/%s' % (
             config.get('messaging', 'topic_exchange'), expected_topic)
 
-        sender = mock_connection.return_value.session.return_value.sender
-        self.assertEqual(sender.call_count, 1)
-        self.assertTrue(sender.call_args[0][0].startswith(expected_destination))
-        sender.return_value.send.assert_called_once_with(
-            json.dumps(mock_event.data.return_value))
+        put = mock_publisher.return_value.put
+        self.assertEqual(put.call_count, 1)
+        destination, message = put.call_args[0][0]
+        self.assertTrue(destination.startswith(expected_destination))
+        self.assertEqual(message, json.dumps(mock_event.data.return_value))
 
-    @mock.patch('qpid.messaging.Connection.open')
-    @mock.patch('qpid.messaging.Connection.session', side_effect=MessagingError)
-    @mock.patch.object(TopicPublishManager._logger, 'exception')
-    def test_publish_failed(self, mock_error, mock_session, mock_open):
-        # make sure this just logs the error
-        mock_event = mock.MagicMock()
-        mock_event.data.return_value = {}
-        mock_event.event_type = data.TYPE_REPO_PUBLISH_FINISHED
-        self.manager.publish(mock_event)
-
-        self.assertEqual(mock_error.call_count, 1)
-
-    @mock.patch.object(TopicPublishManager, 'connection')
-    def test_publish_specify_exchange(self, mock_connection):
+    @mock.patch.object(TopicPublishManager, 'publisher')
+    def test_publish_specify_exchange(self, mock_publisher):
         mock_event = mock.MagicMock()
         mock_event.data.return_value = {}
         mock_event.event_type = data.TYPE_REPO_PUBLISH_FINISHED
@@ -104,15 +98,87 @@ class TestTopicPublishManager(unittest.TestCase):
 
         expected_topic = 'pulp.server.' + data.TYPE_REPO_PUBLISH_FINISHED
         expected_destination = '%s/%s' % ('pulp', expected_topic)
-        sender = mock_connection.return_value.session.return_value.sender
-        self.assertEqual(sender.call_count, 1)
-        self.assertTrue(sender.call_args[0][0].startswith(expected_destination))
+        put = mock_publisher.return_value.put
+        self.assertEqual(put.call_count, 1)
+        self.assertTrue(put.call_args[0][0][0].startswith(expected_destination))
 
     # test for bz 1099945
-    @mock.patch.object(TopicPublishManager, 'connection')
-    def test_publish_serialize_objectid(self, mock_connection):
+    @mock.patch.object(TopicPublishManager, 'publisher')
+    def test_publish_serialize_objectid(self, mock_publisher):
         mock_event = mock.MagicMock()
         mock_event.data.return_value = {'foo': _test_objid()}
         mock_event.event_type = data.TYPE_REPO_PUBLISH_FINISHED
         # no TypeError = success
         self.manager.publish(mock_event, 'pulp')
+
+    @mock.patch('pulp.server.managers.event.remote.os.getpid')
+    def test_publisher(self, mock_getpid):
+        # each process has a publisher of its own, and does not share the connection of
+        # the parent process
+        mock_getpid.return_value = 1
+        first = TopicPublishManager.publisher()
+        TopicPublishManager._connection = mock.MagicMock()
+        second = TopicPublishManager.publisher()
+        mock_getpid.return_value = 2
+        third = TopicPublishManager.publisher()
+
+        self.assertTrue(isinstance(first, TopicPublisher))
+        self.assertTrue(first is second)
+        self.assertFalse(first is third)
+        self.assertTrue(TopicPublishManager._connection is None)
+
+
+class TestTopicPublisher(unittest.TestCase):
+    def setUp(self):
+        self.publisher = TopicPublisher(10)
+
+    def tearDown(self):
+        TopicPublishManager._connection = None
+
+    @mock.patch.object(TopicPublishManager, 'connection')
+    def test_publish(self, mock_connection):
+        # one session, and one sender per destination
+        self.publisher._publish(('amq.topic/a', '1'))
+        self.publisher._publish(('amq.topic/b', '2'))
+        self.publisher._publish(('amq.topic/a', '3'))
+
+        session = mock_connection.return_value.session
+        session.assert_called_once_with()
+        sender = session.return_value.sender
+        self.assertEqual(sender.call_args_list,
+                         [mock.call('amq.topic/a'), mock.call('amq.topic/b')])
+        self.assertEqual(sender.return_value.send.call_args_list,
+                         [mock.call('1'), mock.call('2'), mock.call('3')])
+
+    @mock.patch.object(TopicPublishManager, 'connection', return_value=None)
+    def test_publish_no_connection(self, mock_connection):
+        self.assertRaises(ConnectionError, self.publisher._publish, ('amq.topic/a', '1'))
+
+    @mock.patch.object(TopicPublishManager, 'connection')
+    def test_close(self, mock_connection):
+        connection = mock.MagicMock()
+        TopicPublishManager._connection = connection
+        self.publisher._publish(('amq.topic/a', '1'))
+        session = mock_connection.return_value.session.return_value
+        session.close.side_effect = MessagingError
+
+        self.publisher._close()
+
+        session.close.assert_called_once_with()
+        connection.close.assert_called_once_with()
+        self.assertTrue(TopicPublishManager._connection is None)
+        self.assertTrue(self.publisher._session is None)
+        self.assertEqual(self.publisher._senders, {})
+
+    @mock.patch('pulp.server.async.emit.RECONNECT_INTERVAL', 0)
+    @mock.patch('pulp.server.async.emit._logger')
+    @mock.patch.object(TopicPublishManager, 'connection')
+    def test_publish_failed(self, mock_connection, mock_logger):
+        # make sure the message is dropped and the error logged
+        mock_connection.return_value.session.side_effect = MessagingError
+
+        self.publisher._send(('amq.topic/a', '1'))
+
+        self.assertEqual(mock_connection.return_value.session.call_count, 2)
+        self.assertEqual(self.publisher.stats()['dropped'], 1)
+        self.assertEqual(mock_logger.warn.call_count, 1)
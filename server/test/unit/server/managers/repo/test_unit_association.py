@@ -136,8 +136,9 @@ class RepoUnitAssociationManagerTests(base.PulpServerTests):
         self.assertEqual(1, len(repo_units))
         self.assertEqual('unit-1', repo_units[0]['unit_id'])
 
-    @mock.patch('pulp.server.managers.repo.unit_association.repo_controller')
-    def test_associate_all(self, mock_ctrl, mock_repo):
+    @mock.patch('pulp.server.controllers.repository.update_last_unit_added')
+    @mock.patch('pulp.server.controllers.repository.update_unit_count')
+    def test_associate_all(self, mock_update_count, mock_update_last, mock_repo):
         """
         Tests making multiple associations in a single call.
         """
@@ -254,6 +255,27 @@ class RepoUnitAssociationManagerTests(base.PulpServerTests):
         self.assertEqual(ret.get('units_successful'), [])
         self.assertEqual(ret.get('units_failed_signature_filter'), [])
 
+    @mock.patch('pulp.server.managers.repo.unit_association.ImportUnitConduit')
+    @mock.patch('pulp.server.controllers.repository.rebuild_content_unit_counts', spec_set=True)
+    @mock.patch('pulp.server.managers.repo.unit_association.UnitAssociationCriteria')
+    @mock.patch('pulp.server.managers.repo.unit_association.plugin_api')
+    @mock.patch('pulp.server.managers.repo.unit_association.model.Importer')
+    def test_associate_from_repo_flushes_batch(self, mock_importer, mock_plugin, mock_repo,
+                                               mock_crit, mock_rebuild_count, mock_conduit):
+        mock_imp_inst = mock.MagicMock()
+        mock_plugin.get_importer_by_id.return_value = (mock_imp_inst, mock.MagicMock())
+        source_repo = mock.MagicMock(repo_id='source-repo')
+        dest_repo = mock.MagicMock(repo_id='dest-repo')
+
+        with mock.patch('pulp.server.controllers.importer.remove_importer'):
+            importer_controller.set_importer(source_repo, 'mock-importer', {})
+            importer_controller.set_importer(dest_repo, 'mock-importer', {})
+
+        mock_imp_inst.import_units.return_value = []
+        self.manager.associate_from_repo('source_repo', 'dest_repo', mock_crit)
+
+        mock_conduit.return_value.flush_units.assert_called_once_with()
+
     @mock.patch('pulp.server.managers.repo.unit_association.UnitAssociationCriteria')
     def test_associate_from_repo_missing_source(self, mock_repo, mock_crit):
         importer_controller.set_importer('dest_repo', 'mock-importer', {})
@@ -305,19 +327,23 @@ class RepoUnitAssociationManagerTests(base.PulpServerTests):
         self.manager.associate_unit_by_id(self.repo_id, 'type-1', 'unit-1')
         self.assertEqual(mock_ctrl.update_unit_count.call_count, 1)  # only from first associate
 
-    @mock.patch('pulp.server.managers.repo.unit_association.repo_controller')
-    def test_associate_all_by_ids_calls_update_unit_count(self, mock_ctrl, mock_repo):
+    @mock.patch('pulp.server.controllers.repository.update_last_unit_added')
+    @mock.patch('pulp.server.controllers.repository.update_unit_count')
+    def test_associate_all_by_ids_calls_update_unit_count(self, mock_update_count,
+                                                          mock_update_last, mock_repo):
         IDS = ('foo', 'bar', 'baz')
         self.manager.associate_all_by_ids(self.repo_id, 'type-1', IDS)
-        mock_ctrl.update_unit_count.assert_called_once_with(self.repo_id, 'type-1', len(IDS))
+        mock_update_count.assert_called_once_with(self.repo_id, 'type-1', len(IDS))
+        mock_update_last.assert_called_once_with(self.repo_id)
 
     @mock.patch('pulp.server.managers.repo.unit_association.repo_controller')
     def test_associate_all_by_id_calls_update_last_unit_added(self, mock_ctrl, mock_repo_qs):
         self.manager.associate_unit_by_id(self.repo_id, 'type-1', 'unit-1')
         mock_ctrl.update_last_unit_added.assert_called_once_with(self.repo_id)
 
-    @mock.patch('pulp.server.managers.repo.unit_association.repo_controller')
-    def test_associate_all_non_unique(self, mock_ctrl, mock_repo):
+    @mock.patch('pulp.server.controllers.repository.update_last_unit_added')
+    @mock.patch('pulp.server.controllers.repository.update_unit_count')
+    def test_associate_all_non_unique(self, mock_update_count, mock_update_last, mock_repo):
         """
         Makes sure when two identical associations are requested, they only
         get counted once.
@@ -325,7 +351,11 @@ class RepoUnitAssociationManagerTests(base.PulpServerTests):
         IDS = ('foo', 'bar', 'foo')
 
         self.manager.associate_all_by_ids(self.repo_id, 'type-1', IDS)
-        mock_ctrl.update_unit_count.assert_called_once_with(self.repo_id, 'type-1', 2)
+        mock_update_count.assert_called_once_with(self.repo_id, 'type-1', 2)
+
+        # associating them again adds nothing
+        self.assertEqual(self.manager.associate_all_by_ids(self.repo_id, 'type-1', IDS), 0)
+        self.assertEqual(mock_update_count.call_count, 1)
 
     # This test is skipped for now because it needs to be reworked to reflect the changes from this
     # commit, and we don't have time to do that at the moment.
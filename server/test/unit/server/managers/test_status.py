@@ -1,6 +1,7 @@
 from mock import patch, Mock
 
 from ...base import PulpServerTests
+from pulp.server.async import worker_selection
 from pulp.server.managers import status as status_manager
 
 
@@ -25,6 +26,22 @@ class StatusManagerTests(PulpServerTests):
                                                          {"last_heartbeat": "123456",
                                                           "name": "some_worker_2"}])
 
+    @patch('pulp.server.managers.status.worker_selection.get_policy_name')
+    def test_get_worker_selection_policy(self, mock_get_policy_name):
+        self.assertTrue(status_manager.get_worker_selection_policy() is
+                        mock_get_policy_name.return_value)
+
+    @patch('pulp.server.managers.status.worker_selection.get_worker_loads')
+    def test_get_worker_loads(self, mock_get_worker_loads):
+        mock_get_worker_loads.return_value = {
+            'some_worker_1': worker_selection.WorkerLoad(2, 3.5),
+            'some_worker_2': worker_selection.WorkerLoad(0, None)}
+
+        self.assertEquals(status_manager.get_worker_loads(['some_worker_1', 'some_worker_2']),
+                          {'some_worker_1': {'reserved_tasks': 2, 'mean_runtime': 3.5},
+                           'some_worker_2': {'reserved_tasks': 0, 'mean_runtime': None}})
+        mock_get_worker_loads.assert_called_once_with(['some_worker_1', 'some_worker_2'])
+
     @patch('pulp.server.managers.status.celery')
     def test_get_broker_conn_status(self, mock_celery):
         mock_celery.connection = Mock()
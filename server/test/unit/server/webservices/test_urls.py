@@ -567,6 +567,14 @@ class TestDjangoTasksUrls(unittest.TestCase):
         url_name = 'task_search'
         assert_url_match(url, url_name)
 
+    def test_match_task_watch(self):
+        """
+        Test the matching for task_watch.
+        """
+        url = '/v2/tasks/watch/'
+        url_name = 'task_watch'
+        assert_url_match(url, url_name)
+
 
 class TestDjangoRolesUrls(unittest.TestCase):
     """
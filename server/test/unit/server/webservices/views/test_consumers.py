@@ -7,7 +7,9 @@ from django.http import HttpResponseBadRequest
 from base import assert_auth_CREATE, assert_auth_DELETE, assert_auth_READ, assert_auth_UPDATE
 from pulp.server.exceptions import (InvalidValue, MissingResource, MissingValue,
                                     OperationPostponed, UnsupportedValue)
+from pulp.server.db.model.criteria import Criteria
 from pulp.server.managers.consumer import bind
+from pulp.server.managers.consumer.applicability import APPLICABILITY_PAGE_SIZE
 from pulp.server.managers.consumer import profile
 from pulp.server.managers.consumer import query
 from pulp.server.webservices.views import consumers
@@ -1230,6 +1232,82 @@ class TestConsumerQueryContentApplicabilityView(unittest.TestCase):
         self.assertEqual(response.error_data['property_names'],
                          ['content_types must index an array.'])
 
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch(
+        'pulp.server.webservices.views.consumers.generate_json_response_with_pulp_encoder')
+    @mock.patch('pulp.server.webservices.views.consumers.retrieve_consumer_applicability_page')
+    def test_query_consumer_content_applic_page(self, mock_applic, mock_resp):
+        """
+        Test query consumer content applicability one page at a time
+        """
+        resp = {'applicability': [{'consumers': ['c2'],
+                                   'applicability': {'content_type_1': ['unit_1']}}],
+                'next_page': 'c2'}
+        mock_applic.return_value = resp
+
+        request = mock.MagicMock()
+        request.body = json.dumps({'criteria': {'filters': {}}, 'content_types': ['type1'],
+                                   'page_size': 1, 'page_token': 'c1'})
+        consumer_applic = ConsumerContentApplicabilityView()
+        response = consumer_applic.post(request)
+
+        mock_applic.assert_called_once_with(mock.ANY, ['type1'], 1, 'c1')
+        mock_resp.assert_called_once_with(resp)
+        self.assertTrue(response is mock_resp.return_value)
+
+    def test_get_page_not_requested(self):
+        """
+        Test that no page is returned when the caller did not ask for one.
+        """
+        request = mock.MagicMock()
+        request.body_as_json = {'criteria': {}}
+        consumer_applic = ConsumerContentApplicabilityView()
+
+        page = consumer_applic._get_page(request, Criteria())
+
+        self.assertTrue(page is None)
+
+    def test_get_page_default_size(self):
+        """
+        Test that the default page size is used when only a page token is given.
+        """
+        request = mock.MagicMock()
+        request.body_as_json = {'criteria': {}, 'page_token': None}
+        consumer_applic = ConsumerContentApplicabilityView()
+
+        page = consumer_applic._get_page(request, Criteria())
+
+        self.assertEqual(page, (APPLICABILITY_PAGE_SIZE, None))
+
+    def test_get_page_invalid_size(self):
+        """
+        Test that page sizes other than positive integers are rejected.
+        """
+        consumer_applic = ConsumerContentApplicabilityView()
+        for page_size in (0, -1, 'ten', 1.5, True):
+            request = mock.MagicMock()
+            request.body_as_json = {'criteria': {}, 'page_size': page_size}
+            self.assertRaises(InvalidValue, consumer_applic._get_page, request, Criteria())
+
+    def test_get_page_invalid_token(self):
+        request = mock.MagicMock()
+        request.body_as_json = {'criteria': {}, 'page_token': 10}
+        consumer_applic = ConsumerContentApplicabilityView()
+
+        self.assertRaises(InvalidValue, consumer_applic._get_page, request, Criteria())
+
+    def test_get_page_criteria_limit(self):
+        """
+        Test that limit and skip cannot be combined with pagination.
+        """
+        request = mock.MagicMock()
+        request.body_as_json = {'criteria': {}, 'page_size': 10}
+        consumer_applic = ConsumerContentApplicabilityView()
+
+        self.assertRaises(InvalidValue, consumer_applic._get_page, request, Criteria(limit=5))
+        self.assertRaises(InvalidValue, consumer_applic._get_page, request, Criteria(skip=5))
+
 
 class TestConsumerContentApplicabilityView(unittest.TestCase):
     """
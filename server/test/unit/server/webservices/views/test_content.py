@@ -642,12 +642,11 @@ class TestUploadSegmentResourceView(unittest.TestCase):
         mock_upload_manager = mock.MagicMock()
         mock_factory.content_upload_manager.return_value = mock_upload_manager
         request = mock.MagicMock()
-        request.body = 'upload these bits'
 
         upload_segment_resource = UploadSegmentResourceView()
         response = upload_segment_resource.put(request, 'mock_id', 4)
 
-        mock_upload_manager.save_data.assert_called_once_with('mock_id', 4, 'upload these bits')
+        mock_upload_manager.save_stream.assert_called_once_with('mock_id', 4, request)
         mock_resp.assert_called_once_with(None)
         self.assertTrue(response is mock_resp.return_value)
 
@@ -19,11 +19,15 @@ class TestStatusView(unittest.TestCase):
         mock_status.get_version.return_value = {"platform_version": '2.6.1'}
         mock_status.get_mongo_conn_status.return_value = {'connected': True}
         mock_status.get_broker_conn_status.return_value = {'connected': True}
+        mock_status.get_worker_selection_policy.return_value = 'unreserved'
         mock_worker = mock.MagicMock()
         mock_worker.to_mongo.return_value.to_dict.return_value = {
             "last_heartbeat": "2015-03-19T13:55:36Z",
             "name": "reserved_resource_worker-0@example.com"}
+        mock_worker.name = 'reserved_resource_worker-0@example.com'
         mock_status.get_workers.return_value = [mock_worker]
+        mock_status.get_worker_loads.return_value = {
+            'reserved_resource_worker-0@example.com': {'reserved_tasks': 1, 'mean_runtime': 2.0}}
 
         request = mock.MagicMock()
         status = StatusView()
@@ -32,6 +36,10 @@ class TestStatusView(unittest.TestCase):
                                             'name': 'reserved_resource_worker-0@example.com'}],
                          'messaging_connection': {'connected': True},
                          'database_connection': {'connected': True},
+                         'worker_selection': {
+                             'policy': 'unreserved',
+                             'worker_loads': {'reserved_resource_worker-0@example.com': {
+                                 'reserved_tasks': 1, 'mean_runtime': 2.0}}},
                          'api_version': '2',
                          'versions': {"platform_version": '2.6.1'}}
         mock_resp.assert_called_once_with(expected_cont)
@@ -46,13 +54,16 @@ class TestStatusView(unittest.TestCase):
         mock_status.get_version.return_value = {"platform_version": '2.6.1'}
         mock_status.get_mongo_conn_status.return_value = {'connected': False}
         mock_status.get_broker_conn_status.return_value = {'connected': True}
+        mock_status.get_worker_selection_policy.return_value = 'unreserved'
 
         request = mock.MagicMock()
         status = StatusView()
         response = status.get(request)
+        self.assertFalse(mock_status.get_worker_loads.called)
         expected_cont = {'known_workers': [],
                          'messaging_connection': {'connected': True},
                          'database_connection': {'connected': False},
+                         'worker_selection': {'policy': 'unreserved', 'worker_loads': {}},
                          'api_version': '2',
                          'versions': {"platform_version": '2.6.1'}}
         mock_resp.assert_called_once_with(expected_cont)
@@ -67,11 +78,15 @@ class TestStatusView(unittest.TestCase):
         mock_status.get_version.return_value = {"platform_version": '2.6.1'}
         mock_status.get_mongo_conn_status.return_value = {'connected': True}
         mock_status.get_broker_conn_status.return_value = {'connected': False}
+        mock_status.get_worker_selection_policy.return_value = 'unreserved'
         mock_worker = mock.MagicMock()
         mock_worker.to_mongo.return_value.to_dict.return_value = {
             "last_heartbeat": "2015-03-19T13:55:36Z",
             "name": "reserved_resource_worker-0@example.com"}
+        mock_worker.name = 'reserved_resource_worker-0@example.com'
         mock_status.get_workers.return_value = [mock_worker]
+        mock_status.get_worker_loads.return_value = {
+            'reserved_resource_worker-0@example.com': {'reserved_tasks': 1, 'mean_runtime': 2.0}}
 
         request = mock.MagicMock()
         status = StatusView()
@@ -80,6 +95,10 @@ class TestStatusView(unittest.TestCase):
                                             'name': 'reserved_resource_worker-0@example.com'}],
                          'messaging_connection': {'connected': False},
                          'database_connection': {'connected': True},
+                         'worker_selection': {
+                             'policy': 'unreserved',
+                             'worker_loads': {'reserved_resource_worker-0@example.com': {
+                                 'reserved_tasks': 1, 'mean_runtime': 2.0}}},
                          'api_version': '2',
                          'versions': {"platform_version": '2.6.1'}}
         mock_resp.assert_called_once_with(expected_cont)
@@ -1,6 +1,9 @@
 """
 This module contains tests for the pulp.server.webservices.views.tasks module.
 """
+import json
+import threading
+
 import mock
 
 from mongoengine.queryset import DoesNotExist
@@ -9,10 +12,12 @@ from .base import assert_auth_DELETE, assert_auth_READ
 from pulp.common.compat import unittest
 from pulp.server import exceptions as pulp_exceptions
 from pulp.server.db import model
-from pulp.server.exceptions import MissingResource
+from pulp.server.exceptions import InvalidValue, MissingResource, MissingValue
 from pulp.server.webservices.views import util
 from pulp.server.webservices.views.tasks import (TaskCollectionView, TaskResourceView,
-                                                 TaskSearchView, task_serializer)
+                                                 TaskSearchView, TaskWatchView, task_changes,
+                                                 task_serializer, valid_watch_token,
+                                                 watch_token)
 
 
 @mock.patch('pulp.server.webservices.views.tasks.serial_dispatch')
@@ -203,3 +208,222 @@ class TestTaskResource(unittest.TestCase):
         mock_task.cancel.assert_called_once_with('mock_task_id')
         mock_resp.assert_called_once_with(None)
         self.assertTrue(response is mock_resp.return_value)
+
+
+class TestTaskChanges(unittest.TestCase):
+    """
+    Tests for the watch_token and task_changes helpers.
+    """
+
+    def test_no_token(self):
+        """
+        All fields changed since no token was handed out.
+        """
+        task = {'task_id': 't1', 'state': 'waiting'}
+
+        token, changes = task_changes(task, None)
+
+        self.assertEqual(token, watch_token(task))
+        self.assertEqual(changes, task)
+
+    def test_unchanged(self):
+        """
+        No fields changed since the token was handed out.
+        """
+        task = {'task_id': 't1', 'state': 'running', 'progress_report': {'a': {'b': 1}}}
+
+        token, changes = task_changes(task, watch_token(task))
+
+        self.assertEqual(token, watch_token(task))
+        self.assertEqual(changes, {})
+
+    def test_changed(self):
+        """
+        Only the changed, added and removed fields are returned.
+        """
+        old = {'task_id': 't1', 'state': 'running', 'progress_report': {'a': 1}, 'queue': 'q'}
+        new = {'task_id': 't1', 'state': 'running', 'progress_report': {'a': 2}, 'result': 3}
+
+        token, changes = task_changes(new, watch_token(old))
+
+        self.assertEqual(token, watch_token(new))
+        self.assertEqual(changes, {'progress_report': {'a': 2}, 'result': 3, 'queue': None})
+
+
+class TestTaskWatch(unittest.TestCase):
+    """
+    Tests for TaskWatchView.
+    """
+
+    def request(self, body):
+        request = mock.MagicMock()
+        request.body = json.dumps(body)
+        return request
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.tasks.time')
+    @mock.patch('pulp.server.webservices.views.tasks.task_report')
+    @mock.patch('pulp.server.webservices.views.tasks.TaskStatus')
+    @mock.patch('pulp.server.webservices.views.tasks.generate_json_response_with_pulp_encoder')
+    def test_post_changed(self, mock_resp, mock_task_status, mock_report, mock_time):
+        """
+        The changed tasks are returned as soon as they change.
+        """
+        reports = {'t1': {'task_id': 't1', 'state': 'running'},
+                   't2': {'task_id': 't2', 'state': 'waiting'}}
+        tokens = {'t1': watch_token(reports['t1']), 't2': watch_token(reports['t2'])}
+        mock_task_status.objects.return_value = [mock.Mock(task_id='t1'),
+                                                 mock.Mock(task_id='t2')]
+        mock_report.side_effect = lambda task: reports[task.task_id]
+        mock_time.time.return_value = 0
+
+        def finish(seconds):
+            reports['t1'] = {'task_id': 't1', 'state': 'finished'}
+        mock_time.sleep.side_effect = finish
+
+        response = TaskWatchView().post(self.request({'tasks': tokens, 'timeout': 10}))
+
+        mock_time.sleep.assert_called_once_with(0.5)
+        self.assertEqual(sorted(mock_task_status.objects.call_args[1]['task_id__in']),
+                         ['t1', 't2'])
+        mock_resp.assert_called_once_with(
+            {'t1': {'changes': {'state': 'finished'}, 'token': watch_token(reports['t1'])}})
+        self.assertTrue(response is mock_resp.return_value)
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.tasks.time')
+    @mock.patch('pulp.server.webservices.views.tasks.task_report')
+    @mock.patch('pulp.server.webservices.views.tasks.TaskStatus')
+    @mock.patch('pulp.server.webservices.views.tasks.generate_json_response_with_pulp_encoder')
+    def test_post_timeout(self, mock_resp, mock_task_status, mock_report, mock_time):
+        """
+        Nothing is returned when no task changed before the timeout, which is capped by the
+        watch_timeout setting.
+        """
+        report = {'task_id': 't1', 'state': 'running'}
+        mock_task_status.objects.return_value = [mock.Mock(task_id='t1')]
+        mock_report.return_value = report
+        mock_time.time.side_effect = [100, 100, 129, 130]
+
+        TaskWatchView().post(self.request({'tasks': {'t1': watch_token(report)},
+                                           'timeout': 3600}))
+
+        self.assertEqual(mock_time.sleep.call_count, 2)
+        mock_resp.assert_called_once_with({})
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.tasks.Worker')
+    @mock.patch('pulp.server.webservices.views.tasks.task_serializer')
+    @mock.patch('pulp.server.webservices.views.tasks.TaskStatus')
+    @mock.patch('pulp.server.webservices.views.tasks.generate_json_response_with_pulp_encoder')
+    def test_post_first(self, mock_resp, mock_task_status, mock_task_serial, mock_worker):
+        """
+        The whole task report is returned for tasks without a token.
+        """
+        mock_task_status.objects.return_value = [mock.Mock(task_id='t1')]
+        mock_task_serial.return_value = {'task_id': 't1', 'worker_name': 'w'}
+        mock_worker.return_value.queue_name = 'q'
+
+        TaskWatchView().post(self.request({'tasks': {'t1': None}}))
+
+        report = {'task_id': 't1', 'worker_name': 'w', 'queue': 'q'}
+        mock_resp.assert_called_once_with(
+            {'t1': {'changes': report, 'token': watch_token(report)}})
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.tasks.TaskStatus')
+    def test_post_missing_task(self, mock_task_status):
+        """
+        Watching tasks that do not exist raises MissingResource.
+        """
+        mock_task_status.objects.return_value = [mock.Mock(task_id='t1')]
+
+        try:
+            TaskWatchView().post(self.request({'tasks': {'t1': None, 't2': None}}))
+        except MissingResource, response:
+            pass
+        else:
+            raise AssertionError('MissingResource should be raised with non-existing task.')
+
+        self.assertEqual(response.error_data, {'resources': {'task_ids': ['t2']}})
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    def test_post_invalid(self):
+        """
+        Invalid parameters are rejected.
+        """
+        view = TaskWatchView()
+
+        self.assertRaises(MissingValue, view.post, self.request({'timeout': 1}))
+        self.assertRaises(InvalidValue, view.post, self.request({'tasks': ['t1']}))
+        self.assertRaises(InvalidValue, view.post,
+                          self.request({'tasks': {'t1': None}, 'timeout': 'soon'}))
+        self.assertRaises(InvalidValue, view.post,
+                          self.request({'tasks': {'t1': None}, 'since': 1}))
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    def test_post_invalid_token(self):
+        """
+        Malformed watch tokens are rejected.
+        """
+        view = TaskWatchView()
+
+        for token in ['bogus', '', 'state:abc,bogus', 42, ['state:abc']]:
+            self.assertRaises(InvalidValue, view.post, self.request({'tasks': {'t1': token}}))
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.tasks._watchers', threading.Semaphore(0))
+    @mock.patch('pulp.server.webservices.views.tasks.time')
+    @mock.patch('pulp.server.webservices.views.tasks.task_report')
+    @mock.patch('pulp.server.webservices.views.tasks.TaskStatus')
+    @mock.patch('pulp.server.webservices.views.tasks.generate_json_response_with_pulp_encoder')
+    def test_post_too_many_watchers(self, mock_resp, mock_task_status, mock_report, mock_time):
+        """
+        The tasks are not waited for when too many requests are waiting already.
+        """
+        report = {'task_id': 't1', 'state': 'running'}
+        mock_task_status.objects.return_value = [mock.Mock(task_id='t1')]
+        mock_report.return_value = report
+
+        TaskWatchView().post(self.request({'tasks': {'t1': watch_token(report)}}))
+
+        self.assertFalse(mock_time.sleep.called)
+        mock_resp.assert_called_once_with({})
+
+    @mock.patch('pulp.server.webservices.views.decorators._verify_auth',
+                new=assert_auth_READ())
+    @mock.patch('pulp.server.webservices.views.tasks.TaskStatus')
+    def test_post_releases_watcher(self, mock_task_status):
+        """
+        A watch request lets another one wait once it returned, even when it failed.
+        """
+        mock_task_status.objects.return_value = []
+        watchers = threading.Semaphore(1)
+
+        with mock.patch('pulp.server.webservices.views.tasks._watchers', watchers):
+            self.assertRaises(MissingResource, TaskWatchView().post,
+                              self.request({'tasks': {'t1': None}}))
+
+        self.assertTrue(watchers.acquire(False))
+
+
+class TestValidWatchToken(unittest.TestCase):
+    """
+    Tests for valid_watch_token.
+    """
+
+    def test_valid(self):
+        self.assertTrue(valid_watch_token(None))
+        self.assertTrue(valid_watch_token(watch_token({'task_id': 't1', 'state': 'running'})))
+        self.assertTrue(valid_watch_token(u'state:abc'))
+
+    def test_invalid(self):
+        for token in ['bogus', '', 'state:abc,', 42, {'state': 'abc'}]:
+            self.assertFalse(valid_watch_token(token))
@@ -1,13 +1,25 @@
+import errno
+import json
+import os
 import sys
+import tempfile
 
 from gettext import gettext as _
+from hashlib import sha256
 from logging import getLogger
 from threading import RLock
 from datetime import datetime, timedelta
 
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+
 log = getLogger(__name__)
 
 
+# How often, in seconds, the disk cache evicts the files that were not requested recently.
+EVICT_INTERVAL = 60
+
+
 class NotCached(Exception):
     """
     Requested object is not found in the cache.
@@ -21,31 +33,45 @@ class Cache(object):
 
     Attributes:
         eviction_threshold (timedelta): How long an unrequested item will be cached.
+        max_size (int): The maximum total size of the cached objects, or None
+            for no limit. When exceeded, the least recently requested objects
+            that are not busy are evicted.
+        size (int): The total size of the cached objects.
         _lock (RLock): The object mutex.
         _inventory (dict): The inventory of cached objects.
             Each value is an Item.
     """
 
-    def __init__(self, eviction_threshold=None):
+    def __init__(self, eviction_threshold=None, max_size=None):
         """
         Args:
             eviction_threshold (timedelta): How long an unrequested item will be cached.
+            max_size (int): The maximum total size of the cached objects.
 
         """
         self.eviction_threshold = eviction_threshold or timedelta(hours=4)
+        self.max_size = max_size
+        self.size = 0
         self._lock = RLock()
         self._inventory = {}
 
-    def add(self, key, object_):
+    def add(self, key, object_, size=1):
         """
         Add an object to the cache.
 
         Args:
             key (hashable): The caching key.
             object_ (object): An object to be cached.
+            size (int): The size of the object, counted against max_size.
         """
         with self._lock:
-            self._inventory[key] = Item(object_)
+            replaced = self._inventory.get(key)
+            if replaced is not None:
+                self.size -= replaced.size
+            self._inventory[key] = Item(object_, size)
+            self.size += size
+            if self.max_size is not None and self.size > self.max_size:
+                self.evict(expired=False)
 
     def purge(self, key):
         """
@@ -55,12 +81,32 @@ class Cache(object):
             key (hashable): The caching key.
         """
         with self._lock:
-            return self._inventory.pop(key)
+            item = self._inventory.pop(key)
+            self.size -= item.size
+            return item
 
     def get(self, key):
         """
         Get a cached object by key.
 
+        Args:
+            key (hashable): The caching key.
+
+        Returns:
+            object: The requested cached object.
+
+        Raises:
+            NotCached: When not found in the cache.
+        """
+        with self._lock:
+            object_ = self._touch(key)
+            self.evict()
+            return object_
+
+    def _touch(self, key):
+        """
+        Get a cached object by key, updating the time it was last requested.
+
         Args:
             key (hashable): The caching key.
 
@@ -76,12 +122,16 @@ class Cache(object):
             except KeyError:
                 raise NotCached()
             item.touch()
-            self.evict()
             return item.object
 
-    def evict(self):
+    def evict(self, expired=True):
         """
-        Evict all unused cached objects.
+        Evict all unused cached objects and, while the cache is larger than
+        max_size, the least recently requested objects that are not busy.
+
+        Args:
+            expired (bool): Whether the unused objects are evicted. Otherwise,
+                objects are only evicted to fit within max_size.
 
         Returns:
             list: The evicted objects.
@@ -90,7 +140,7 @@ class Cache(object):
         evicted = []
         now = Item.now()
         with self._lock:
-            for key, item in self._inventory.items():
+            for key, item in (self._inventory.items() if expired else []):
                 duration = (now - item.last_requested)
                 if item.busy:
                     busy.append(item.object)
@@ -99,6 +149,14 @@ class Cache(object):
                     continue
                 self.purge(key)
                 evicted.append(item.object)
+            if self.max_size is not None and self.size > self.max_size:
+                unused = sorted(
+                    (item.last_requested, key) for key, item in self._inventory.items()
+                    if not item.busy)
+                for last_requested, key in unused:
+                    if self.size <= self.max_size:
+                        break
+                    evicted.append(self.purge(key).object)
         log.debug(
             _('Cache.evict(): %(t)d total, %(e)d evicted, %(b)d busy'),
             {
@@ -122,6 +180,7 @@ class Item(object):
         last_requested (datetime): The last UTC naive time
             the object was requested.
         object (object): The actual cached object.
+        size (int): The size of the object.
     """
 
     @staticmethod
@@ -134,13 +193,15 @@ class Item(object):
         """
         return datetime.utcnow()
 
-    def __init__(self, object_):
+    def __init__(self, object_, size=1):
         """
         Args:
             object_ (object): The actual cached object.
+            size (int): The size of the object.
         """
         self.last_requested = None
         self.object = object_
+        self.size = size
         self.touch()
 
     @property
@@ -174,3 +235,220 @@ class Item(object):
         Update the last_requested timestamp.
         """
         self.last_requested = self.now()
+
+
+class DiskCache(Cache):
+    """
+    A cache of downloaded files.
+
+    Each file is stored in the cache directory under the SHA-256 digest of its
+    key, next to a <digest>.json file holding the key and the response headers.
+    The cache is size-bounded: the least recently requested files are deleted
+    when a file is stored and their total size exceeds max_size. Files that
+    were not requested for eviction_threshold are deleted every EVICT_INTERVAL
+    seconds, by a looping call in the reactor thread pool, see start(). The
+    inventory is rebuilt from the directory when the cache is created, with
+    files ordered by modification time, which is updated when they are
+    requested.
+
+    Attributes:
+        directory (str): The cache directory.
+    """
+
+    # The prefix of the files that are being downloaded into the directory.
+    PARTIAL_PREFIX = '.partial-'
+
+    def __init__(self, directory, max_size, eviction_threshold=None):
+        """
+        Args:
+            directory (str): The cache directory.
+            max_size (int): The maximum total size of the cached files in bytes.
+            eviction_threshold (timedelta): How long an unrequested file will be cached.
+        """
+        super(DiskCache, self).__init__(eviction_threshold, max_size)
+        self.directory = directory
+        self._loop = None
+        try:
+            os.makedirs(directory)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        self._load()
+
+    def start(self):
+        """
+        Start evicting the files that were not requested recently every
+        EVICT_INTERVAL seconds.
+        """
+        self._loop = LoopingCall(deferToThread, self.expire)
+        self._loop.start(EVICT_INTERVAL, now=False)
+
+    def expire(self):
+        """
+        Evict the files that were not requested for eviction_threshold.
+        """
+        try:
+            self.evict()
+        except Exception:
+            # Keep the looping call running.
+            log.exception(_('Evicting files from the disk cache failed.'))
+
+    def _load(self):
+        """
+        Rebuild the inventory from the cache directory and evict files
+        as needed to fit within max_size.
+
+        Returns:
+            list: The evicted files.
+        """
+        with self._lock:
+            self._scan()
+            evicted = self.evict()
+        log.info(
+            _('Loaded %(n)d files (%(s)d bytes) into the disk cache at %(d)s.'),
+            {'n': len(self._inventory), 's': self.size, 'd': self.directory})
+        return evicted
+
+    def _scan(self):
+        """
+        Add the files in the cache directory to the inventory.
+        Partially downloaded files and files without metadata are deleted.
+        """
+        names = set(os.listdir(self.directory))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.startswith(self.PARTIAL_PREFIX):
+                _unlink(path)
+                continue
+            if not name.endswith('.json'):
+                if name + '.json' not in names:
+                    _unlink(path)
+                continue
+            try:
+                with open(path) as fp:
+                    metadata = json.load(fp)
+                stat = os.stat(path[:-len('.json')])
+            except (OSError, IOError, ValueError):
+                _unlink(path)
+                continue
+            item = Item(CachedFile(path[:-len('.json')], metadata['headers'], stat.st_size),
+                        stat.st_size)
+            item.last_requested = datetime.utcfromtimestamp(stat.st_mtime)
+            self._inventory[metadata['key']] = item
+            self.size += item.size
+
+    def partial_file(self):
+        """
+        Create a file to download into, which can be stored by store().
+
+        Returns:
+            file: A named temporary file in the cache directory, deleted when closed.
+        """
+        return tempfile.NamedTemporaryFile(dir=self.directory, prefix=self.PARTIAL_PREFIX)
+
+    def store(self, key, path, headers):
+        """
+        Store a downloaded file.
+        The file is hard linked into the cache, so it must be in the cache directory.
+
+        Args:
+            key (str): The caching key.
+            path (str): The path of the downloaded file.
+            headers (list): The response headers, as (name, value) tuples.
+
+        Returns:
+            CachedFile: The cached file.
+        """
+        digest = sha256(key).hexdigest()
+        cached = CachedFile(os.path.join(self.directory, digest), headers, os.stat(path).st_size)
+        with self._lock:
+            if key in self:
+                self.purge(key).delete()
+            metadata = cached.path + '.json'
+            with open(metadata + '.tmp', 'w') as fp:
+                json.dump({'key': key, 'headers': headers}, fp)
+            os.rename(metadata + '.tmp', metadata)
+            os.link(path, cached.path)
+            super(DiskCache, self).add(key, cached, cached.size)
+        return cached
+
+    def get(self, key):
+        """
+        Get a cached file by key.
+        The caller must keep a reference to the file while it reads it, so
+        that it is not evicted.
+
+        Args:
+            key (str): The caching key.
+
+        Returns:
+            CachedFile: The requested cached file.
+
+        Raises:
+            NotCached: When not found in the cache.
+        """
+        cached = self._touch(key)
+        try:
+            os.utime(cached.path, None)
+        except OSError:
+            pass
+        return cached
+
+    def evict(self, expired=True):
+        """
+        Evict cached files, deleting them.
+
+        Args:
+            expired (bool): Whether the unused files are evicted. Otherwise,
+                files are only evicted to fit within max_size.
+
+        Returns:
+            list: The evicted files.
+        """
+        evicted = super(DiskCache, self).evict(expired)
+        for cached in evicted:
+            cached.delete()
+        return evicted
+
+
+class CachedFile(object):
+    """
+    A file stored in a DiskCache.
+
+    Attributes:
+        path (str): The path of the file.
+        headers (list): The response headers, as (name, value) tuples.
+        size (int): The size of the file in bytes.
+    """
+
+    def __init__(self, path, headers, size):
+        """
+        Args:
+            path (str): The path of the file.
+            headers (list): The response headers, as (name, value) tuples.
+            size (int): The size of the file in bytes.
+        """
+        self.path = path
+        self.headers = [tuple(header) for header in headers]
+        self.size = size
+
+    def delete(self):
+        """
+        Delete the file and its metadata.
+        """
+        _unlink(self.path + '.json')
+        _unlink(self.path)
+
+
+def _unlink(path):
+    """
+    Delete a file if it exists.
+
+    Args:
+        path (str): The path of the file.
+    """
+    try:
+        os.unlink(path)
+    except OSError, e:
+        if e.errno != errno.ENOENT:
+            raise
@@ -0,0 +1,200 @@
+import time
+
+from collections import OrderedDict
+from gettext import gettext as _
+from logging import getLogger
+from threading import RLock
+
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+
+from pulp.server.db.model import Importer
+
+log = getLogger(__name__)
+
+
+# How often, in seconds, the cached lookups are validated against the database.
+VALIDATE_INTERVAL = 10
+
+
+class CatalogCache(object):
+    """
+    A TTL cache of the lookups the streamer makes to serve a path: the catalog
+    entries of the path, the units they reference and the importers that
+    contributed them, with their downloader configuration built, and the enabled
+    alternate content sources.
+
+    The catalog entries of an importer are revised when it is synchronized, so the
+    importers the cached entries refer to are validated against the database every
+    VALIDATE_INTERVAL seconds, by a looping call in the reactor thread pool. When an
+    importer was synchronized, updated or deleted since the previous validation, it
+    and the cached entries it contributed are invalidated. Requests for cached paths
+    are otherwise resolved without querying the database.
+
+    Attributes:
+        ttl (int): How long, in seconds, a lookup is cached.
+        max_items (int): The maximum number of lookups of each kind that are cached.
+        stats (dict): The number of hits and misses of each kind of lookup.
+        _lock (RLock): The object mutex.
+        _tables (dict): The cached lookups of each kind, by key. Each value is
+            a tuple of: (expiration, value).
+        _stamps (dict): The (last_sync, last_updated) of the importers seen by the
+            previous validation, by ID.
+    """
+
+    def __init__(self, ttl, max_items=10000):
+        """
+        Args:
+            ttl (int): How long, in seconds, a lookup is cached.
+            max_items (int): The maximum number of lookups of each kind that are cached.
+        """
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = RLock()
+        self._tables = {
+            'entries': OrderedDict(),
+            'units': OrderedDict(),
+            'importers': OrderedDict(),
+            'sources': OrderedDict(),
+        }
+        self.stats = dict((name, {'hits': 0, 'misses': 0}) for name in self._tables)
+        self._stamps = {}
+        self._loop = None
+
+    def start(self):
+        """
+        Start validating the cached lookups every VALIDATE_INTERVAL seconds.
+        """
+        self._loop = LoopingCall(deferToThread, self.validate)
+        self._loop.start(VALIDATE_INTERVAL, now=False)
+
+    def entries(self, path, load):
+        """
+        Get the catalog entries of a path.
+        Paths without entries are not cached, so that content is served as soon
+        as it is added to the catalog.
+
+        Args:
+            path (str): The requested path.
+            load (callable): Called with *path* to load the entries on a miss.
+
+        Returns:
+            list: The catalog entries, in the order they are tried.
+        """
+        return self._get('entries', path, load, path)
+
+    def unit(self, entry, load):
+        """
+        Get the unit a catalog entry references.
+
+        Args:
+            entry (pulp.server.db.model.LazyCatalogEntry): A catalog entry.
+            load (callable): Called with *entry* to load the unit on a miss.
+
+        Returns:
+            pulp.server.db.model.FileContentUnit: The unit.
+        """
+        return self._get('units', (entry.unit_type_id, entry.unit_id), load, entry)
+
+    def importer(self, importer_id, load):
+        """
+        Get an importer, with its downloader configuration built.
+
+        Args:
+            importer_id (str): The ID of the importer document.
+            load (callable): Called with *importer_id* to load the importer on a miss.
+
+        Returns:
+            tuple: The importer as returned by *load*.
+        """
+        return self._get('importers', importer_id, load, importer_id)
+
+    def content_sources(self, load):
+        """
+        Get the enabled alternate content sources.
+
+        Args:
+            load (callable): Called without arguments to load the content sources on a miss.
+
+        Returns:
+            dict: The content sources as returned by *load*.
+        """
+        return self._get('sources', None, load)
+
+    def invalidate(self, path):
+        """
+        Invalidate the catalog entries of a path.
+
+        Args:
+            path (str): The requested path.
+        """
+        with self._lock:
+            self._tables['entries'].pop(path, None)
+
+    def _get(self, table, key, load, *args):
+        """
+        Get a cached lookup, loading and caching it on a miss.
+
+        Args:
+            table (str): The kind of lookup.
+            key (hashable): The key of the lookup.
+            load (callable): Called with *args* to load the value on a miss.
+
+        Returns:
+            object: The value.
+        """
+        now = time.time()
+        with self._lock:
+            items = self._tables[table]
+            cached = items.pop(key, None)
+            if cached is not None and cached[0] > now:
+                items[key] = cached
+                self.stats[table]['hits'] += 1
+                return cached[1]
+            self.stats[table]['misses'] += 1
+        value = load(*args)
+        if table == 'entries' and not value:
+            return value
+        with self._lock:
+            items[key] = (now + self.ttl, value)
+            while len(items) > self.max_items:
+                items.popitem(last=False)
+        return value
+
+    def validate(self):
+        """
+        Invalidate the importers that were synchronized, updated or deleted since the
+        previous validation, and the catalog entries they contributed. Expired lookups
+        are dropped.
+        """
+        try:
+            with self._lock:
+                importer_ids = set(self._tables['importers'])
+                for expiration, entries in self._tables['entries'].values():
+                    importer_ids.update(entry.importer_id for entry in entries)
+            stamps = dict(
+                (str(importer.id), (importer.last_sync, importer.last_updated))
+                for importer in Importer.objects(id__in=list(importer_ids)).only(
+                    'id', 'last_sync', 'last_updated'))
+            stale = set(importer_id for importer_id in importer_ids
+                        if importer_id in self._stamps and
+                        self._stamps[importer_id] != stamps.get(importer_id))
+            self._stamps = stamps
+            now = time.time()
+            with self._lock:
+                for importer_id in stale:
+                    self._tables['importers'].pop(importer_id, None)
+                for items in self._tables.values():
+                    for key, (expiration, value) in items.items():
+                        if expiration <= now:
+                            del items[key]
+                entries = self._tables['entries']
+                for path, (expiration, value) in entries.items():
+                    if any(entry.importer_id in stale for entry in value):
+                        del entries[path]
+            log.debug(
+                _('CatalogCache.validate(): %(s)d importers invalidated, stats: %(t)s'),
+                {'s': len(stale), 't': self.stats})
+        except Exception:
+            # Keep the looping call running.
+            log.exception(_('Validating the catalog cache failed.'))
@@ -9,6 +9,10 @@ DEFAULT_VALUES = {
         'port': '8751',
         'interfaces': 'localhost',
         'cache_timeout': '86400',
+        'async_streaming': 'true',
+        'disk_cache_dir': '',
+        'disk_cache_size': '10240',
+        'catalog_cache_ttl': '60',
     },
 }
 
@@ -0,0 +1,272 @@
+import tempfile
+
+from gettext import gettext as _
+from logging import getLogger
+
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
+
+log = getLogger(__name__)
+
+
+# The size of the chunks read from the shared buffer and written to the clients.
+CHUNK_SIZE = 64 * 1024
+
+
+class Flight(object):
+    """
+    A download shared by concurrent requests for the same content.
+
+    The flight stands in for the twisted request while the content is downloaded:
+    the response code, headers and content written to it are recorded, the content
+    in a temporary file, and replayed to each of the attached client requests as
+    fast as that client reads them. Clients can be attached until the download
+    finishes.
+
+    Attributes:
+        key (hashable): The key of the flight in *flights*.
+        flights (dict): The flights in progress, by key.
+        request (twisted.web.server.Request): The request that started the flight.
+        uri (str): The URI of that request.
+        code (int): The response code.
+        headers (list): The response headers, as (name, value) tuples.
+        size (int): The number of bytes downloaded so far.
+        done (bool): The download finished.
+        followers (list): The attached Follower objects.
+        producer (twisted.internet.interfaces.IPushProducer): The producer of the download.
+        buffer_path (str): The path of the file the content is written to, or None.
+    """
+
+    def __init__(self, key, flights, request, buffer_=None):
+        """
+        Args:
+            key (hashable): The key of the flight in *flights*.
+            flights (dict): The flights in progress, by key. The flight is added to it
+                and removed when it finishes or is abandoned.
+            request (twisted.web.server.Request): The request that started the flight.
+            buffer_ (file): The file the content is written to, closed when the flight
+                is over. Defaults to an anonymous temporary file.
+        """
+        self.key = key
+        self.flights = flights
+        self.request = request
+        self.uri = request.uri
+        self.code = None
+        self.headers = []
+        self.size = 0
+        self.done = False
+        self.followers = []
+        self.producer = None
+        self._buffer = buffer_ or tempfile.TemporaryFile()
+        self.buffer_path = getattr(buffer_, 'name', None)
+        flights[key] = self
+
+    def attach(self, request):
+        """
+        Attach a client request to the flight.
+
+        Args:
+            request (twisted.web.server.Request): A client request.
+        """
+        follower = Follower(self, request)
+        self.followers.append(follower)
+        follower.start()
+
+    def detach(self, follower):
+        """
+        Detach a client request from the flight.
+        The download is abandoned when no client requests remain.
+
+        Args:
+            follower (Follower): A client request follower.
+        """
+        self.followers.remove(follower)
+        if self.followers:
+            return
+        if not self.done:
+            self.abandon()
+        else:
+            self._buffer.close()
+
+    def abandon(self):
+        """
+        Stop the download because nobody wants it anymore.
+        """
+        log.debug(_('Flight abandoned: %(u)s'), {'u': self.uri})
+        self.flights.pop(self.key, None)
+        if self.producer is not None:
+            self.producer.stopProducing()
+
+    def read(self, offset):
+        """
+        Read downloaded content.
+
+        Args:
+            offset (int): The offset of the content to read.
+
+        Returns:
+            str: Up to CHUNK_SIZE bytes of content.
+        """
+        self._buffer.seek(offset)
+        return self._buffer.read(min(CHUNK_SIZE, self.size - offset))
+
+    def getHeader(self, name):
+        """
+        Get a header of the request that started the flight.
+
+        Args:
+            name (str): The header name.
+
+        Returns:
+            str: The header value, or None.
+        """
+        return self.request.getHeader(name)
+
+    def setResponseCode(self, code):
+        """
+        Set the response code of the client requests.
+
+        Args:
+            code (int): The response code.
+        """
+        self.code = code
+
+    def setHeader(self, name, value):
+        """
+        Set a response header of the client requests.
+
+        Args:
+            name (str): The header name.
+            value (str): The header value.
+        """
+        self.headers.append((name, value))
+
+    def write(self, data):
+        """
+        Add downloaded content and pass it on to the client requests.
+
+        Args:
+            data (str): The content.
+        """
+        self._buffer.seek(0, 2)
+        self._buffer.write(data)
+        self._buffer.flush()
+        self.size += len(data)
+        for follower in list(self.followers):
+            follower.pump()
+
+    def registerProducer(self, producer, streaming):
+        """
+        Register the producer of the download, so it can be stopped.
+
+        Args:
+            producer (twisted.internet.interfaces.IPushProducer): The producer.
+            streaming (bool): The producer is a push producer.
+        """
+        self.producer = producer
+
+    def unregisterProducer(self):
+        """
+        Unregister the producer of the download.
+        """
+        self.producer = None
+
+    def finish(self):
+        """
+        The download finished.
+        The client requests are finished once they have been sent all the content.
+        """
+        self.done = True
+        if self.flights.get(self.key) is self:
+            del self.flights[self.key]
+        if not self.followers:
+            self._buffer.close()
+            return
+        for follower in list(self.followers):
+            follower.pump()
+
+
+@implementer(IPushProducer)
+class Follower(object):
+    """
+    Sends the content of a flight to a client request.
+
+    Attributes:
+        flight (Flight): The flight.
+        request (twisted.web.server.Request): The client request.
+        offset (int): The number of bytes sent to the client.
+        started (bool): The response code and headers have been sent.
+        paused (bool): The client connection is not writable.
+        stopped (bool): The client request is finished or disconnected.
+    """
+
+    def __init__(self, flight, request):
+        """
+        Args:
+            flight (Flight): The flight.
+            request (twisted.web.server.Request): The client request.
+        """
+        self.flight = flight
+        self.request = request
+        self.offset = 0
+        self.started = False
+        self.paused = False
+        self.stopped = False
+
+    def start(self):
+        """
+        Start sending the content to the client.
+        """
+        self.request.registerProducer(self, True)
+        self.request.notifyFinish().addErrback(lambda failure: self.stopProducing())
+        self.pump()
+
+    def pump(self):
+        """
+        Send the content downloaded so far, until the client connection is not writable.
+        Finish the request once all of it was sent and the download finished.
+        """
+        if self.stopped:
+            return
+        if not self.started:
+            if not (self.flight.size or self.flight.done):
+                return
+            if self.flight.code is not None:
+                self.request.setResponseCode(self.flight.code)
+            for name, value in self.flight.headers:
+                self.request.setHeader(name, value)
+            self.started = True
+        while not self.paused and self.offset < self.flight.size:
+            data = self.flight.read(self.offset)
+            self.offset += len(data)
+            self.request.write(data)
+        if self.flight.done and self.offset >= self.flight.size:
+            self.stopped = True
+            self.request.unregisterProducer()
+            try:
+                self.request.finish()
+            except RuntimeError as e:
+                log.debug(str(e))
+            self.flight.detach(self)
+
+    def pauseProducing(self):
+        """
+        The client connection is not writable.
+        """
+        self.paused = True
+
+    def resumeProducing(self):
+        """
+        The client connection is writable again.
+        """
+        self.paused = False
+        self.pump()
+
+    def stopProducing(self):
+        """
+        The client disconnected.
+        """
+        if self.stopped:
+            return
+        self.stopped = True
+        self.flight.detach(self)
@@ -1,24 +1,44 @@
 import logging
 
+from base64 import b64encode
 from gettext import gettext as _
-from httplib import NOT_FOUND, INTERNAL_SERVER_ERROR
-from urlparse import urlparse
+from httplib import (OK, NOT_FOUND, INTERNAL_SERVER_ERROR, MOVED_PERMANENTLY, FOUND, SEE_OTHER,
+                     TEMPORARY_REDIRECT)
+from urlparse import urljoin, urlparse
 
 from mongoengine import DoesNotExist, NotUniqueError
 from nectar.listener import AggregatingEventListener
 from requests import Session
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.protocol import Protocol
+from twisted.internet.threads import deferToThread
+from twisted.protocols.basic import FileSender
+from twisted.web.client import Agent, HTTPConnectionPool, ResponseDone
+from twisted.web.http import PotentialDataLoss
+from twisted.web.http_headers import Headers
 from twisted.web.resource import Resource
 from twisted.web.server import NOT_DONE_YET
+from zope.interface import implementer
 
 from pulp.plugins.loader import api as plugin_api
 from pulp.server.constants import PULP_STREAM_REQUEST_HEADER
 from pulp.server.content.sources.container import ContentContainer
-from pulp.server.content.sources.model import Request as ContainerRequest
+from pulp.server.content.sources.model import ContentSource, Request as ContainerRequest
 from pulp.server.db.model import DeferredDownload, LazyCatalogEntry
 from pulp.server.controllers import repository as repo_controller
 from pulp.plugins.loader.exceptions import PluginNotFound
 from pulp.streamer.cache import Cache, NotCached
+from pulp.streamer.flight import Flight
+
+try:
+    # The HTTP agent verifies the certificates of HTTPS servers only with twisted 14 and later,
+    # and their hostnames only when service_identity is installed.
+    from twisted.web.client import BrowserLikePolicyForHTTPS
+    import service_identity  # noqa
+except ImportError:
+    BrowserLikePolicyForHTTPS = None
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +60,15 @@ HOP_BY_HOP_HEADERS = [
     'upgrade',
 ]
 
+# The maximum number of idle connections kept open to each upstream host
+# by the asynchronous streaming path.
+MAX_PERSISTENT_PER_HOST = 10
+
+# The redirects followed by the asynchronous streaming path, and the
+# maximum number of them followed for a single download.
+REDIRECT_CODES = (MOVED_PERMANENTLY, FOUND, SEE_OTHER, TEMPORARY_REDIRECT)
+MAX_REDIRECTS = 20
+
 
 class DownloadFailed(Exception):
     """
@@ -47,6 +76,35 @@ class DownloadFailed(Exception):
     """
 
 
+class StreamInterrupted(Exception):
+    """
+    Streaming stopped after part of the content was sent to the client.
+    """
+
+
+def forward_headers(config, request, headers):
+    """
+    Forward upstream response headers to the original client HTTP request.
+    This includes adding the cache-control header with the max-age
+    which is loaded from the configuration.
+
+    :param config: The streamer configuration.
+    :type  config: ConfigParser.SafeConfigParser
+    :param request: The original twisted client HTTP request being handled by the streamer.
+    :type  request: twisted.web.server.Request
+    :param headers: The upstream response headers as (name, value) tuples.
+    :type  headers: list
+    """
+    # forward
+    for key, value in headers:
+        if key.lower() not in HOP_BY_HOP_HEADERS:
+            request.setHeader(key, value)
+    # additions
+    max_age = config.get('streamer', 'cache_timeout')
+    cache_control = 'public, s-maxage={m}, max-age={m}'.format(m=max_age)
+    request.setHeader('Cache-Control', cache_control)
+
+
 class DownloadListener(AggregatingEventListener):
     """
     Nectar download listener.
@@ -73,14 +131,7 @@ class DownloadListener(AggregatingEventListener):
         :type  report: nectar.report.DownloadReport
         """
         super(DownloadListener, self).download_headers(report)
-        # forward
-        for key, value in report.headers.items():
-            if key.lower() not in HOP_BY_HOP_HEADERS:
-                self.request.setHeader(key, value)
-        # additions
-        max_age = self.streamer.config.get('streamer', 'cache_timeout')
-        cache_control = 'public, s-maxage={m}, max-age={m}'.format(m=max_age)
-        self.request.setHeader('Cache-Control', cache_control)
+        forward_headers(self.streamer.config, self.request, report.headers.items())
 
     def download_failed(self, report):
         """
@@ -103,16 +154,29 @@ class Streamer(Resource):
     # Ensure self.getChild isn't called as this has no child resources
     isLeaf = True
 
-    def __init__(self, config):
+    def __init__(self, config, disk_cache=None, catalog=None):
         """
         Initialize a streamer instance.
 
         :param config: The configuration for this streamer instance.
         :type  config: ConfigParser.SafeConfigParser
+        :param disk_cache: An optional cache of the downloaded files, used
+            when async_streaming is enabled.
+        :type  disk_cache: pulp.streamer.cache.DiskCache
+        :param catalog: An optional cache of the catalog, unit and importer lookups.
+        :type  catalog: pulp.streamer.catalog.CatalogCache
         """
         Resource.__init__(self)
         self.config = config
+        self.disk_cache = disk_cache
+        self.catalog = catalog
         self.session_cache = SessionCache()
+        self.flights = {}
+        self.pool = HTTPConnectionPool(reactor)
+        self.pool.maxPersistentPerHost = MAX_PERSISTENT_PER_HOST
+        self.https_policy = None
+        if BrowserLikePolicyForHTTPS is not None:
+            self.https_policy = BrowserLikePolicyForHTTPS()
 
     def render_GET(self, request):
         """
@@ -128,10 +192,16 @@ class Streamer(Resource):
             * The file is downloaded using the Nectar downloader and the content
               is streamed to the client as it is received.
 
+        When async_streaming is enabled, the download is made by the reactor
+        rather than in a thread of its pool, see _handle_get_async().
+
         :param request: The original twisted client HTTP request being handled by the streamer.
         :type  request: twisted.web.server.Request
         """
-        reactor.callInThread(self._handle_get, request)
+        if self.config.getboolean('streamer', 'async_streaming'):
+            self._handle_get_async(request)
+        else:
+            reactor.callInThread(self._handle_get, request)
         return NOT_DONE_YET
 
     def _handle_get(self, request):
@@ -168,6 +238,356 @@ class Streamer(Resource):
                 request.setResponseCode(INTERNAL_SERVER_ERROR)
                 request.setHeader('Content-Length', '0')
 
+    def _handle_get_async(self, request):
+        """
+        Download the requested content using the content unit catalog without
+        holding a thread for the duration of the download.
+
+        Concurrent requests for the same path share a single download: the first
+        one starts a Flight, which stands in for the request in _fetch_async(),
+        and the others are attached to it until it finishes. So the content is
+        downloaded, and its deferred download requested, only once.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        """
+        path = urlparse(request.uri).path
+        if self.disk_cache is not None and self._send_cached(request, path):
+            return
+        key = (path, bool(request.getHeader(PULP_STREAM_REQUEST_HEADER)))
+        flight = self.flights.get(key)
+        if flight is not None:
+            logger.debug('Joining download in progress: {p}'.format(p=path))
+            flight.attach(request)
+            return
+        buffer_ = None
+        if self.disk_cache is not None:
+            buffer_ = self.disk_cache.partial_file()
+        flight = Flight(key, self.flights, request, buffer_)
+        flight.attach(request)
+        self._fetch_async(flight)
+
+    def _send_cached(self, request, path):
+        """
+        Send a file stored in the disk cache.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param path: The requested path.
+        :type  path: str
+        :return: True if the file was cached and is being sent.
+        :rtype:  bool
+        """
+        try:
+            cached = self.disk_cache.get(path)
+            fp = open(cached.path, 'rb')
+        except NotCached:
+            return False
+        except IOError:
+            logger.warning(_('Cached file for {p} is missing.').format(p=path))
+            self.disk_cache.purge(path)
+            return False
+        logger.debug('Serving {p} from the disk cache.'.format(p=path))
+        headers = [(name, value) for name, value in cached.headers
+                   if name.lower() not in ('cache-control', 'content-length')]
+        forward_headers(self.config, request, headers)
+        request.setHeader('Content-Length', str(cached.size))
+
+        def finished(result):
+            # Referencing cached keeps it from being evicted while it is sent.
+            fp.close()
+            logger.debug('Sent {p} ({n} bytes).'.format(p=path, n=cached.size))
+            Responder(request).finish()
+
+        FileSender().beginFileTransfer(fp, request).addBoth(finished)
+        return True
+
+    @inlineCallbacks
+    def _fetch_async(self, request):
+        """
+        Download the requested content using the content unit catalog without
+        holding a thread for the duration of the download.
+
+        The database lookups are deferred to the reactor thread pool and only
+        hold a thread while they run. The content is then fetched by a twisted
+        HTTP agent and written to the client as it is received, pausing the
+        upstream connection while the client does not keep up. Catalog entries
+        this cannot download, see _get_stream_config(), are downloaded by
+        Nectar in a thread as _handle_get() does.
+
+        :param request: The flight of the requests being handled by the streamer.
+        :type  request: pulp.streamer.flight.Flight
+        """
+        try:
+            path = urlparse(request.uri).path
+            entries = yield deferToThread(self._get_entries, path)
+            if not entries:
+                logger.error(_('No catalog entry found. path={p}'.format(p=path)))
+                request.setResponseCode(NOT_FOUND)
+                return
+            for entry in entries:
+                logger.info('Trying URL: {url}'.format(url=entry.url))
+                try:
+                    report = yield self._download_async(request, entry)
+                    yield deferToThread(self._on_succeeded, entry, request, report)
+                    self._store(request)
+                    return
+                except (DownloadFailed, DoesNotExist, PluginNotFound):
+                    # try another
+                    continue
+            # Failed
+            if self.catalog is not None:
+                self.catalog.invalidate(path)
+            self._on_all_failed(request)
+        except StreamInterrupted, e:
+            logger.info(_('Streaming interrupted: {url}: {e}').format(url=request.uri, e=e))
+        except Exception:
+            logger.exception(_('An unexpected error occurred: {url}').format(url=request.uri))
+            request.setResponseCode(INTERNAL_SERVER_ERROR)
+            request.setHeader('Content-Length', '0')
+        finally:
+            Responder(request).finish()
+
+    def _store(self, flight):
+        """
+        Store the content downloaded by a flight in the disk cache.
+
+        :param flight: A flight that completed a download.
+        :type  flight: pulp.streamer.flight.Flight
+        """
+        if self.disk_cache is None or flight.buffer_path is None:
+            return
+        if flight.code not in (None, OK):
+            return
+        path = urlparse(flight.uri).path
+        try:
+            self.disk_cache.store(path, flight.buffer_path, flight.headers)
+        except (OSError, IOError):
+            logger.exception(_('Could not store {p} in the disk cache.').format(p=path))
+
+    def _get_entries(self, path):
+        """
+        Get the catalog entries for a path, in the order they are tried.
+
+        :param path: The requested path.
+        :type  path: str
+        :return: The catalog entries.
+        :rtype:  list of LazyCatalogEntry
+        """
+        if self.catalog is not None:
+            return self.catalog.entries(path, self._query_entries)
+        return self._query_entries(path)
+
+    @staticmethod
+    def _query_entries(path):
+        """
+        Query the catalog entries for a path, in the order they are tried.
+
+        :param path: The requested path.
+        :type  path: str
+        :return: The catalog entries.
+        :rtype:  list of LazyCatalogEntry
+        """
+        q_set = LazyCatalogEntry.objects.filter(path=path)
+        q_set = q_set.order_by('-_id', '-revision')
+        return list(q_set)
+
+    @inlineCallbacks
+    def _download_async(self, request, entry):
+        """
+        Download the file, streaming it with the HTTP agent when possible.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param entry: The catalog entry to download.
+        :type  entry: pulp.server.db.model.LazyCatalogEntry
+        :return: A deferred firing with the Nectar download report, or None
+            when the file was streamed by the HTTP agent.
+        :rtype:  twisted.internet.defer.Deferred
+        :raise DownloadFailed: when the download failed before any content was streamed.
+        :raise StreamInterrupted: when the download failed afterwards.
+        """
+        config = yield deferToThread(self._get_stream_config, request, entry)
+        if config is None:
+            report = yield deferToThread(self._download, request, entry, Responder(request))
+            returnValue(report)
+        try:
+            yield self._stream(request, entry.url, config)
+        finally:
+            try:
+                config.finalize()
+            except Exception:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.exception(_('finalize() failed.'))
+
+    def _get_stream_config(self, request, entry):
+        """
+        Get the configuration for streaming a catalog entry with the HTTP agent.
+
+        The HTTP agent only supports plain HTTP and HTTPS validated against the
+        system trust store, with optional basic authentication and headers.
+        Entries that need a proxy, custom CA or client certificates, or that
+        could be served by an alternate content source are left to Nectar, as
+        are HTTPS entries when the HTTP agent cannot verify the server, see
+        BrowserLikePolicyForHTTPS.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param entry: A catalog entry.
+        :type  entry: LazyCatalogEntry
+        :return: The downloader configuration, or None when Nectar must be used.
+        :rtype:  nectar.config.DownloaderConfig
+        :raise: PluginNotFound: when plugin not found.
+        :raise: DoesNotExist: when the unit or importer is not found.
+        """
+        self._get_unit(entry)
+        if self._get_content_sources():
+            return None
+        config = self._get_downloader(request, entry).config
+        scheme = urlparse(entry.url).scheme
+        unsupported = (
+            scheme not in ('http', 'https'),
+            scheme == 'https' and self.https_policy is None,
+            config.proxy_url,
+            config.ssl_ca_cert,
+            config.ssl_ca_cert_path,
+            config.ssl_client_cert,
+            config.ssl_client_cert_path,
+            config.ssl_client_key,
+            config.ssl_client_key_path,
+            config.ssl_validation is False,
+            config.max_speed,
+        )
+        if any(unsupported):
+            config.finalize()
+            return None
+        return config
+
+    @inlineCallbacks
+    def _stream(self, request, url, config):
+        """
+        Stream the file to the client using the HTTP agent.
+
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param url: The URL of the file.
+        :type  url: str
+        :param config: The downloader configuration.
+        :type  config: nectar.config.DownloaderConfig
+        :return: A deferred firing when the file has been streamed.
+        :rtype:  twisted.internet.defer.Deferred
+        :raise DownloadFailed: when the download failed before any content was streamed.
+        :raise StreamInterrupted: when the download failed afterwards.
+        """
+        headers = Headers()
+        for name, value in (config.headers or {}).items():
+            headers.addRawHeader(name, value)
+        if config.basic_auth_username:
+            credentials = '{u}:{p}'.format(
+                u=config.basic_auth_username, p=config.basic_auth_password or '')
+            headers.addRawHeader('Authorization', 'Basic ' + b64encode(credentials))
+        response = yield self._get_response(url, headers, config)
+        if response.code != OK:
+            # discard the body so the connection can be reused.
+            response.deliverBody(Protocol())
+            logger.info(_('Download failed [{code}]: {url}').format(code=response.code, url=url))
+            raise DownloadFailed()
+        forward_headers(
+            self.config,
+            request,
+            [(name, ', '.join(values)) for name, values in response.headers.getAllRawHeaders()])
+        finished = Deferred()
+        response.deliverBody(StreamProtocol(request, finished))
+        yield finished
+
+    @inlineCallbacks
+    def _get_response(self, url, headers, config):
+        """
+        Request a file using the HTTP agent, following redirects.
+
+        The Authorization header is not sent on once a redirect leaves the
+        scheme and host it was sent to, so the upstream credentials are not
+        disclosed to other hosts.
+
+        :param url: The URL of the file.
+        :type  url: str
+        :param headers: The request headers.
+        :type  headers: twisted.web.http_headers.Headers
+        :param config: The downloader configuration.
+        :type  config: nectar.config.DownloaderConfig
+        :return: A deferred firing with the response, which is not a redirect.
+        :rtype:  twisted.internet.defer.Deferred
+        :raise DownloadFailed: when the request failed.
+        """
+        agent = self._get_agent(config)
+        for _redirects in range(MAX_REDIRECTS + 1):
+            if urlparse(url).scheme == 'https' and self.https_policy is None:
+                logger.info(_('Download failed [HTTPS not supported]: {url}').format(url=url))
+                raise DownloadFailed()
+            try:
+                response = yield self._request(agent, url, headers, config.read_timeout)
+            except Exception, e:
+                logger.info(_('Download failed [{e!r}]: {url}').format(e=e, url=url))
+                raise DownloadFailed()
+            location = response.headers.getRawHeaders('location')
+            if response.code not in REDIRECT_CODES or not location:
+                returnValue(response)
+            # discard the body so the connection can be reused.
+            response.deliverBody(Protocol())
+            redirect = urljoin(url, location[0])
+            if urlparse(redirect)[:2] != urlparse(url)[:2]:
+                headers.removeHeader('Authorization')
+            logger.debug('Redirected to {r}: {url}'.format(r=redirect, url=url))
+            url = redirect
+        logger.info(_('Download failed [too many redirects]: {url}').format(url=url))
+        raise DownloadFailed()
+
+    def _get_agent(self, config):
+        """
+        Get an HTTP agent for a downloader configuration.
+
+        The agents share the connection pool of the streamer.
+
+        :param config: The downloader configuration.
+        :type  config: nectar.config.DownloaderConfig
+        :return: An HTTP agent.
+        :rtype:  twisted.web.client.Agent
+        """
+        kwargs = dict(connectTimeout=config.connect_timeout, pool=self.pool)
+        if self.https_policy is not None:
+            kwargs['contextFactory'] = self.https_policy
+        return Agent(reactor, **kwargs)
+
+    @staticmethod
+    def _request(agent, url, headers, timeout):
+        """
+        Send a GET request using an HTTP agent.
+
+        :param agent: An HTTP agent.
+        :type  agent: twisted.web.client.Agent
+        :param url: The URL requested.
+        :type  url: str
+        :param headers: The request headers.
+        :type  headers: twisted.web.http_headers.Headers
+        :param timeout: The number of seconds to wait for the response, or
+            None to wait for as long as it takes.
+        :type  timeout: float
+        :return: A deferred firing with the response. It fails with a
+            CancelledError when the response did not come in time.
+        :rtype:  twisted.internet.defer.Deferred
+        """
+        d = agent.request('GET', url, headers)
+        if timeout:
+            call = reactor.callLater(timeout, d.cancel)
+
+            def cancel_timeout(result):
+                if call.active():
+                    call.cancel()
+                return result
+
+            d.addBoth(cancel_timeout)
+        return d
+
     def _on_succeeded(self, entry, request, report):
         """
         The download succeeded.
@@ -246,9 +666,10 @@ class Streamer(Resource):
         :raise: DoesNotExist: when importer not found.
         """
         try:
-            importer, config, model = \
-                repo_controller.get_importer_by_id(entry.importer_id)
-            model.config = config.flatten()
+            if self.catalog is not None:
+                importer, model = self.catalog.importer(entry.importer_id, self._query_importer)
+            else:
+                importer, model = self._query_importer(entry.importer_id)
             downloader = importer.get_downloader_for_db_importer(
                 model, entry.url, working_dir='/tmp', stream=True)
             listener = DownloadListener(self, request)
@@ -261,10 +682,38 @@ class Streamer(Resource):
             raise
 
     @staticmethod
-    def _get_unit(entry):
+    def _query_importer(importer_id):
+        """
+        Query an importer, with its configuration flattened into the document.
+
+        :param importer_id: The ID of the importer document.
+        :type  importer_id: str
+        :return: A tuple of: (pulp.plugins.importer.Importer, pulp.server.db.model.Importer)
+        :rtype:  tuple
+        :raise: PluginNotFound: when plugin not found.
+        """
+        importer, config, model = repo_controller.get_importer_by_id(importer_id)
+        model.config = config.flatten()
+        return importer, model
+
+    def _get_unit(self, entry):
         """
         Get the content unit referenced by the catalog entry.
 
+        :param entry: A catalog entry.
+        :type  entry: LazyCatalogEntry
+        :return: The unit.
+        :raises DoesNotExist: when not found.
+        """
+        if self.catalog is not None:
+            return self.catalog.unit(entry, self._query_unit)
+        return self._query_unit(entry)
+
+    @staticmethod
+    def _query_unit(entry):
+        """
+        Query the content unit referenced by the catalog entry.
+
         :param entry: A catalog entry.
         :type  entry: LazyCatalogEntry
         :return: The unit.
@@ -283,6 +732,17 @@ class Streamer(Resource):
                 id=entry.unit_id))
             raise
 
+    def _get_content_sources(self):
+        """
+        Get the enabled alternate content sources.
+
+        :return: Dictionary of: ContentSource keyed by source_id.
+        :rtype:  dict
+        """
+        if self.catalog is not None:
+            return self.catalog.content_sources(ContentSource.load_all)
+        return ContentSource.load_all()
+
     @staticmethod
     def _insert_deferred(entry):
         """
@@ -376,6 +836,81 @@ class Responder(object):
         reactor.callFromThread(self.request.write, data)
 
 
+@implementer(IPushProducer)
+class StreamProtocol(Protocol):
+    """
+    Writes an upstream response body to the original client HTTP request.
+    It is registered as the producer of the request so that the upstream
+    connection is paused while the client connection is not writable, and
+    dropped when the client disconnects.
+
+    :ivar request: The original twisted client HTTP request being handled by the streamer.
+    :type request: twisted.web.server.Request
+    :ivar finished: Fired when the body has been streamed, or failed with StreamInterrupted.
+    :type finished: twisted.internet.defer.Deferred
+    """
+
+    def __init__(self, request, finished):
+        """
+        :param request: The original twisted client HTTP request being handled by the streamer.
+        :type  request: twisted.web.server.Request
+        :param finished: Fired when the body has been streamed.
+        :type  finished: twisted.internet.defer.Deferred
+        """
+        self.request = request
+        self.finished = finished
+        self.stopped = False
+
+    def connectionMade(self):
+        """
+        Start producing the content of the request.
+        """
+        self.request.registerProducer(self, True)
+
+    def dataReceived(self, data):
+        """
+        Forward received content to the client.
+
+        :param data: Part of the upstream response body.
+        :type  data: str
+        """
+        self.request.write(data)
+
+    def connectionLost(self, reason):
+        """
+        The upstream response body has been received, or the download failed.
+
+        :param reason: Why the connection was lost.
+        :type  reason: twisted.python.failure.Failure
+        """
+        self.request.unregisterProducer()
+        if self.stopped:
+            self.finished.errback(StreamInterrupted(_('client disconnected')))
+        elif reason.check(ResponseDone, PotentialDataLoss):
+            self.finished.callback(None)
+        else:
+            self.finished.errback(StreamInterrupted(reason.getErrorMessage()))
+
+    def pauseProducing(self):
+        """
+        The client is not keeping up; pause the upstream connection.
+        """
+        self.transport.pauseProducing()
+
+    def resumeProducing(self):
+        """
+        The client caught up; resume the upstream connection.
+        """
+        self.transport.resumeProducing()
+
+    def stopProducing(self):
+        """
+        The client disconnected; drop the upstream connection.
+        """
+        self.stopped = True
+        self.transport.stopProducing()
+
+
 class SessionCache(Cache):
     """
     Session cache.
@@ -1,8 +1,13 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
 from unittest import TestCase
 
 from mock import Mock, patch
 
-from pulp.streamer.cache import Cache, Item, NotCached
+from pulp.streamer.cache import Cache, CachedFile, DiskCache, EVICT_INTERVAL, Item, NotCached
 
 MODULE = 'pulp.streamer.cache'
 
@@ -76,6 +81,205 @@ class TestCache(TestCase):
         cache.evict()
         self.assertTrue('t1' in cache)
 
+    def test_evict_size(self):
+        cache = Cache(max_size=10)
+        cache.add('t1', Mock(), 4)
+        cache.add('t2', Mock(), 4)
+        cache.get('t1')
+        self.assertEqual(cache.size, 8)
+
+        # test
+        cache.add('t3', Mock(), 4)
+
+        # validation
+        self.assertEqual(cache.size, 8)
+        self.assertTrue('t1' in cache)
+        self.assertFalse('t2' in cache)
+        self.assertTrue('t3' in cache)
+
+    def test_evict_size_busy(self):
+        cache = Cache(max_size=4)
+        t1 = Mock()  # hold ref to make it busy.
+        cache.add('t1', t1, 4)
+
+        # test
+        cache.add('t2', Mock(), 4)
+        cache.evict()
+
+        # validation
+        self.assertTrue('t1' in cache)
+        self.assertFalse('t2' in cache)
+        self.assertEqual(cache.size, 4)
+
+    def test_add_replaces_size(self):
+        cache = Cache()
+        cache.add('t1', Mock(), 4)
+        cache.add('t1', Mock(), 6)
+        self.assertEqual(cache.size, 6)
+        cache.purge('t1')
+        self.assertEqual(cache.size, 0)
+
+
+class TestDiskCache(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def download(self, cache, content):
+        fp = cache.partial_file()
+        fp.write(content)
+        fp.flush()
+        return fp
+
+    def test_store(self):
+        cache = DiskCache(self.directory, 100)
+        headers = [('Content-Type', 'application/x-rpm')]
+
+        # test
+        fp = self.download(cache, 'abc')
+        cached = cache.store('/content/bear.rpm', fp.name, headers)
+        fp.close()
+
+        # validation
+        self.assertEqual(cache.get('/content/bear.rpm'), cached)
+        self.assertEqual(cached.size, 3)
+        self.assertEqual(cached.headers, headers)
+        with open(cached.path) as stored:
+            self.assertEqual(stored.read(), 'abc')
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted([os.path.basename(cached.path),
+                                 os.path.basename(cached.path) + '.json']))
+
+    def test_evict_deletes(self):
+        cache = DiskCache(self.directory, 5)
+        fp = self.download(cache, 'abc')
+        path = cache.store('/1', fp.name, []).path
+        fp.close()
+
+        # test
+        fp = self.download(cache, 'def')
+        cache.store('/2', fp.name, [])
+        fp.close()
+
+        # validation
+        self.assertFalse('/1' in cache)
+        self.assertTrue('/2' in cache)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + '.json'))
+
+    def test_get_does_not_evict(self):
+        cache = DiskCache(self.directory, 100, timedelta(seconds=60))
+        for key in ('/1', '/2'):
+            fp = self.download(cache, 'abc')
+            cache.store(key, fp.name, [])
+            fp.close()
+        cache._inventory['/2'].last_requested -= timedelta(seconds=60)
+
+        # test
+        cache.get('/1')
+        fp = self.download(cache, 'def')
+        cache.store('/3', fp.name, [])
+        fp.close()
+
+        # validation
+        self.assertTrue('/2' in cache)
+        self.assertEqual(len(os.listdir(self.directory)), 6)
+
+    def test_expire(self):
+        cache = DiskCache(self.directory, 100, timedelta(seconds=60))
+        fp = self.download(cache, 'abc')
+        path = cache.store('/1', fp.name, []).path
+        fp.close()
+        cache._inventory['/1'].last_requested -= timedelta(seconds=60)
+
+        # test
+        cache.expire()
+
+        # validation
+        self.assertFalse('/1' in cache)
+        self.assertEqual(cache.size, 0)
+        self.assertFalse(os.path.exists(path))
+
+    @patch(MODULE + '.log')
+    def test_expire_failed(self, log):
+        cache = DiskCache(self.directory, 100)
+        cache.evict = Mock(side_effect=OSError())
+
+        # test
+        cache.expire()
+
+        # validation
+        self.assertTrue(log.exception.called)
+
+    @patch(MODULE + '.deferToThread')
+    @patch(MODULE + '.LoopingCall')
+    def test_start(self, looping_call, defer_to_thread):
+        cache = DiskCache(self.directory, 100)
+
+        # test
+        cache.start()
+
+        # validation
+        looping_call.assert_called_once_with(defer_to_thread, cache.expire)
+        looping_call.return_value.start.assert_called_once_with(EVICT_INTERVAL, now=False)
+
+    def test_load(self):
+        cache = DiskCache(self.directory, 100)
+        fp = self.download(cache, 'abc')
+        cache.store('/content/bear.rpm', fp.name, [['Content-Type', 'text/plain']])
+        fp.close()
+        # left behind by a crash.
+        self.download(cache, 'partial').close()
+        open(os.path.join(self.directory, 'orphan'), 'w').close()
+        with open(os.path.join(self.directory, 'lost.json'), 'w') as metadata:
+            json.dump({'key': '/lost', 'headers': []}, metadata)
+
+        # test
+        loaded = DiskCache(self.directory, 100, timedelta(days=1))
+
+        # validation
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertFalse('/lost' in loaded)
+        self.assertEqual(loaded.size, 3)
+        cached = loaded.get('/content/bear.rpm')
+        self.assertEqual(cached.headers, [('Content-Type', 'text/plain')])
+
+    def test_load_evicts(self):
+        cache = DiskCache(self.directory, 100)
+        for key in ('/1', '/2'):
+            fp = self.download(cache, 'abc')
+            cache.store(key, fp.name, [])
+            fp.close()
+
+        # test
+        loaded = DiskCache(self.directory, 3)
+
+        # validation
+        self.assertEqual(len(loaded._inventory), 1)
+        self.assertEqual(loaded.size, 3)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+
+class TestCachedFile(TestCase):
+
+    def test_delete(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'file')
+            open(path, 'w').close()
+            cached = CachedFile(path, [], 0)
+
+            # test
+            cached.delete()
+
+            # validation
+            self.assertEqual(os.listdir(directory), [])
+        finally:
+            shutil.rmtree(directory)
+
 
 class TestItem(TestCase):
 
@@ -0,0 +1,161 @@
+from unittest import TestCase
+
+from mock import Mock, patch
+
+from pulp.streamer.catalog import CatalogCache, VALIDATE_INTERVAL
+
+
+MODULE = 'pulp.streamer.catalog'
+
+
+class TestCatalogCache(TestCase):
+
+    @patch(MODULE + '.time.time')
+    def test_entries(self, now):
+        now.return_value = 100
+        entries = [Mock(importer_id='i1')]
+        load = Mock(return_value=entries)
+        cache = CatalogCache(60)
+
+        # test
+        first = cache.entries('/a', load)
+        now.return_value = 159
+        second = cache.entries('/a', load)
+        now.return_value = 160
+        third = cache.entries('/a', load)
+
+        # validation
+        self.assertEqual(first, entries)
+        self.assertEqual(second, entries)
+        self.assertEqual(third, entries)
+        self.assertEqual(load.call_count, 2)
+        load.assert_called_with('/a')
+        self.assertEqual(cache.stats['entries'], {'hits': 1, 'misses': 2})
+
+    def test_entries_not_found(self):
+        load = Mock(return_value=[])
+        cache = CatalogCache(60)
+
+        # test
+        cache.entries('/a', load)
+        cache.entries('/a', load)
+
+        # validation
+        self.assertEqual(load.call_count, 2)
+
+    def test_unit_and_importer(self):
+        entry = Mock(unit_type_id='rpm', unit_id='u1')
+        load_unit = Mock()
+        load_importer = Mock()
+        cache = CatalogCache(60)
+
+        # test
+        for i in range(2):
+            unit = cache.unit(entry, load_unit)
+            importer = cache.importer('i1', load_importer)
+
+        # validation
+        load_unit.assert_called_once_with(entry)
+        load_importer.assert_called_once_with('i1')
+        self.assertEqual(unit, load_unit.return_value)
+        self.assertEqual(importer, load_importer.return_value)
+        self.assertEqual(cache.stats['units'], {'hits': 1, 'misses': 1})
+        self.assertEqual(cache.stats['importers'], {'hits': 1, 'misses': 1})
+
+    def test_content_sources(self):
+        load = Mock(return_value={})
+        cache = CatalogCache(60)
+
+        # test
+        first = cache.content_sources(load)
+        second = cache.content_sources(load)
+
+        # validation
+        self.assertEqual(first, {})
+        self.assertEqual(second, {})
+        load.assert_called_once_with()
+        self.assertEqual(cache.stats['sources'], {'hits': 1, 'misses': 1})
+
+    def test_max_items(self):
+        load = Mock(side_effect=lambda path: [Mock(importer_id='i1')])
+        cache = CatalogCache(60, max_items=2)
+
+        # test
+        cache.entries('/a', load)
+        cache.entries('/b', load)
+        cache.entries('/a', load)
+        cache.entries('/c', load)
+
+        # validation
+        self.assertEqual(cache._tables['entries'].keys(), ['/a', '/c'])
+
+    def test_invalidate(self):
+        load = Mock(return_value=[Mock(importer_id='i1')])
+        cache = CatalogCache(60)
+        cache.entries('/a', load)
+
+        # test
+        cache.invalidate('/a')
+        cache.invalidate('/b')
+        cache.entries('/a', load)
+
+        # validation
+        self.assertEqual(load.call_count, 2)
+
+    @patch(MODULE + '.Importer')
+    def test_validate(self, importer):
+        cache = CatalogCache(60)
+        cache.entries('/a', Mock(return_value=[Mock(importer_id='i1')]))
+        cache.entries('/b', Mock(return_value=[Mock(importer_id='i2')]))
+        cache.importer('i1', Mock())
+        cache.importer('i2', Mock())
+        query = importer.objects.return_value.only
+        query.return_value = [Mock(id='i1', last_sync='s1', last_updated='u1'),
+                              Mock(id='i2', last_sync='s1', last_updated='u1')]
+        cache.validate()
+
+        # test
+        query.return_value = [Mock(id='i1', last_sync='s2', last_updated='u1')]
+        cache.validate()
+
+        # validation
+        self.assertEqual(sorted(importer.objects.call_args[1]['id__in']), ['i1', 'i2'])
+        query.assert_called_with('id', 'last_sync', 'last_updated')
+        self.assertEqual(cache._tables['entries'].keys(), [])
+        self.assertEqual(cache._tables['importers'].keys(), [])
+
+    @patch(MODULE + '.time.time')
+    @patch(MODULE + '.Importer')
+    def test_validate_expired(self, importer, now):
+        now.return_value = 100
+        cache = CatalogCache(60)
+        cache.unit(Mock(unit_type_id='rpm', unit_id='u1'), Mock())
+        importer.objects.return_value.only.return_value = []
+
+        # test
+        now.return_value = 160
+        cache.validate()
+
+        # validation
+        self.assertEqual(cache._tables['units'].keys(), [])
+
+    @patch(MODULE + '.log')
+    @patch(MODULE + '.Importer')
+    def test_validate_failed(self, importer, log):
+        importer.objects.side_effect = ValueError()
+
+        # test
+        CatalogCache(60).validate()
+
+        # validation
+        self.assertTrue(log.exception.called)
+
+    @patch(MODULE + '.LoopingCall')
+    def test_start(self, looping_call):
+        cache = CatalogCache(60)
+
+        # test
+        cache.start()
+
+        # validation
+        looping_call.return_value.start.assert_called_once_with(VALIDATE_INTERVAL, now=False)
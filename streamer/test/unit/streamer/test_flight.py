@@ -0,0 +1,145 @@
+from mock import Mock, patch
+
+from pulp.common.compat import unittest
+from pulp.streamer.flight import Flight, Follower
+
+
+MODULE_PREFIX = 'pulp.streamer.flight.'
+
+
+class TestFlight(unittest.TestCase):
+
+    def request(self):
+        request = Mock(uri='http://content-world.com/content/bear.rpm', written=[])
+        request.write.side_effect = request.written.append
+        return request
+
+    def test_init(self):
+        flights = {}
+        request = self.request()
+
+        # test
+        flight = Flight('k', flights, request)
+
+        # validation
+        self.assertEqual(flights, {'k': flight})
+        self.assertEqual(flight.uri, request.uri)
+        self.assertEqual(flight.getHeader('h'), request.getHeader.return_value)
+        request.getHeader.assert_called_once_with('h')
+
+    def test_replay(self):
+        flights = {}
+        first = self.request()
+        flight = Flight('k', flights, first)
+        flight.attach(first)
+
+        # test
+        flight.setHeader('Content-Length', '6')
+        flight.write('abc')
+        second = self.request()
+        flight.attach(second)
+        flight.write('def')
+        flight.finish()
+
+        # validation
+        for request in (first, second):
+            request.setHeader.assert_called_once_with('Content-Length', '6')
+            self.assertEqual(''.join(request.written), 'abcdef')
+            request.finish.assert_called_once_with()
+            request.unregisterProducer.assert_called_once_with()
+        self.assertEqual(second.written, ['abc', 'def'])
+        self.assertEqual(flights, {})
+        self.assertEqual(flight.followers, [])
+        self.assertTrue(flight._buffer.closed)
+
+    def test_response_code(self):
+        request = self.request()
+        flight = Flight('k', {}, request)
+        flight.attach(request)
+
+        # test
+        flight.setResponseCode(404)
+        flight.setHeader('Content-Length', '0')
+        self.assertFalse(request.setResponseCode.called)
+        flight.finish()
+
+        # validation
+        request.setResponseCode.assert_called_once_with(404)
+        request.setHeader.assert_called_once_with('Content-Length', '0')
+        request.finish.assert_called_once_with()
+
+    def test_paused_follower(self):
+        request = self.request()
+        flight = Flight('k', {}, request)
+        flight.attach(request)
+        follower = flight.followers[0]
+
+        # test
+        follower.pauseProducing()
+        flight.write('abc')
+        flight.finish()
+        self.assertEqual(request.written, [])
+        self.assertFalse(request.finish.called)
+        follower.resumeProducing()
+
+        # validation
+        self.assertEqual(request.written, ['abc'])
+        request.finish.assert_called_once_with()
+
+    def test_abandon(self):
+        flights = {}
+        first = self.request()
+        second = self.request()
+        flight = Flight('k', flights, first)
+        flight.attach(first)
+        flight.attach(second)
+        producer = Mock()
+        flight.registerProducer(producer, True)
+
+        # test
+        flight.followers[0].stopProducing()
+        self.assertFalse(producer.stopProducing.called)
+        flight.followers[0].stopProducing()
+
+        # validation
+        producer.stopProducing.assert_called_once_with()
+        self.assertEqual(flights, {})
+        self.assertFalse(first.finish.called)
+
+    @patch(MODULE_PREFIX + 'CHUNK_SIZE', 2)
+    def test_read(self):
+        flight = Flight('k', {}, self.request())
+        flight.write('abcde')
+
+        # test and validation
+        self.assertEqual(flight.read(0), 'ab')
+        self.assertEqual(flight.read(4), 'e')
+
+
+class TestFollower(unittest.TestCase):
+
+    def test_start(self):
+        flight = Mock(size=0, done=False)
+        request = Mock()
+
+        # test
+        follower = Follower(flight, request)
+        follower.start()
+
+        # validation
+        request.registerProducer.assert_called_once_with(follower, True)
+        self.assertTrue(request.notifyFinish.return_value.addErrback.called)
+        self.assertFalse(follower.started)
+
+    def test_finish_after_disconnect(self):
+        flight = Mock(size=0, done=True, code=None, headers=[])
+        request = Mock()
+        request.finish.side_effect = RuntimeError()
+
+        # test
+        follower = Follower(flight, request)
+        follower.pump()
+
+        # validation
+        self.assertTrue(follower.stopped)
+        flight.detach.assert_called_once_with(follower)
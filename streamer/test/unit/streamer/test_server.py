@@ -3,13 +3,19 @@ from httplib import NOT_FOUND, INTERNAL_SERVER_ERROR
 from mock import Mock, patch, call
 from mongoengine import DoesNotExist, NotUniqueError
 from nectar.report import DownloadReport
+from twisted.internet.defer import CancelledError, Deferred, fail, succeed
+from twisted.python.failure import Failure
+from twisted.web.client import ResponseDone
+from twisted.web.http_headers import Headers
 
 from pulp.common.compat import unittest
 from pulp.devel.unit.util import SideEffect
 from pulp.plugins.loader.exceptions import PluginNotFound
 from pulp.server import constants
+from pulp.streamer.cache import NotCached
 from pulp.streamer.server import (
-    Responder, SessionCache, Streamer, DownloadListener, DownloadFailed, HOP_BY_HOP_HEADERS
+    Responder, SessionCache, Streamer, DownloadListener, DownloadFailed, HOP_BY_HOP_HEADERS,
+    MAX_REDIRECTS, StreamInterrupted
 )
 
 
@@ -78,14 +84,503 @@ class TestStreamer(unittest.TestCase):
     @patch(MODULE_PREFIX + 'reactor')
     def test_render_GET(self, reactor):
         request = Mock()
+        config = Mock()
+        config.getboolean.return_value = False
 
         # test
-        streamer = Streamer(Mock())
+        streamer = Streamer(config)
         streamer.render_GET(request)
 
         # validation
+        config.getboolean.assert_called_once_with('streamer', 'async_streaming')
         reactor.callInThread.assert_called_once_with(streamer._handle_get, request)
 
+    @patch(MODULE_PREFIX + 'Streamer._handle_get_async')
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_render_GET_async(self, reactor, _handle_get_async):
+        request = Mock()
+        config = Mock()
+        config.getboolean.return_value = True
+
+        # test
+        streamer = Streamer(config)
+        streamer.render_GET(request)
+
+        # validation
+        _handle_get_async.assert_called_once_with(request)
+        self.assertFalse(reactor.callInThread.called)
+
+    @patch(MODULE_PREFIX + 'Streamer._fetch_async')
+    @patch(MODULE_PREFIX + 'Flight')
+    def test_handle_get_async(self, flight, _fetch_async):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        request.getHeader.return_value = None
+        key = ('/content/bear.rpm', False)
+
+        # test
+        streamer = Streamer(Mock())
+        streamer._handle_get_async(request)
+
+        # validation
+        request.getHeader.assert_called_once_with(constants.PULP_STREAM_REQUEST_HEADER)
+        flight.assert_called_once_with(key, streamer.flights, request, None)
+        flight.return_value.attach.assert_called_once_with(request)
+        _fetch_async.assert_called_once_with(flight.return_value)
+
+    @patch(MODULE_PREFIX + 'Streamer._fetch_async')
+    @patch(MODULE_PREFIX + 'Flight')
+    def test_handle_get_async_in_flight(self, flight, _fetch_async):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        request.getHeader.return_value = None
+        in_flight = Mock()
+
+        # test
+        streamer = Streamer(Mock())
+        streamer.flights[('/content/bear.rpm', False)] = in_flight
+        streamer._handle_get_async(request)
+
+        # validation
+        in_flight.attach.assert_called_once_with(request)
+        self.assertFalse(flight.called)
+        self.assertFalse(_fetch_async.called)
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
+    @patch(MODULE_PREFIX + 'Streamer._download_async')
+    @patch(MODULE_PREFIX + 'Streamer._get_entries')
+    @patch(MODULE_PREFIX + 'deferToThread', lambda f, *args: succeed(f(*args)))
+    def test_fetch_async(self, _get_entries, _download_async, _on_succeeded, responder):
+        """
+         Three catalog entries.
+         The 1st download fails but succeeds on the 2nd.
+         The 3rd is not tried.
+        """
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        catalog = [
+            Mock(url='url-a'),
+            Mock(url='url-b'),
+            Mock(url='url-c'),  # not tried.
+        ]
+        _get_entries.return_value = catalog
+        _download_async.side_effect = SideEffect(fail(DownloadFailed()), succeed(None))
+
+        # test
+        streamer = Streamer(Mock())
+        streamer._fetch_async(request)
+
+        # validation
+        _get_entries.assert_called_once_with('/content/bear.rpm')
+        self.assertEqual(
+            _download_async.call_args_list,
+            [
+                call(request, catalog[0]),
+                call(request, catalog[1])
+            ])
+        _on_succeeded.assert_called_once_with(catalog[1], request, None)
+        responder.assert_called_once_with(request)
+        responder.return_value.finish.assert_called_once_with()
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'Streamer._on_all_failed')
+    @patch(MODULE_PREFIX + 'Streamer._download_async')
+    @patch(MODULE_PREFIX + 'Streamer._get_entries')
+    @patch(MODULE_PREFIX + 'deferToThread', lambda f, *args: succeed(f(*args)))
+    def test_fetch_async_interrupted(self, _get_entries, _download_async, _on_all_failed,
+                                     responder):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        _get_entries.return_value = [Mock(url='url-a'), Mock(url='url-b')]
+        _download_async.return_value = fail(StreamInterrupted())
+
+        # test
+        streamer = Streamer(Mock())
+        streamer._fetch_async(request)
+
+        # validation
+        self.assertEqual(_download_async.call_count, 1)
+        self.assertFalse(_on_all_failed.called)
+        self.assertFalse(request.setResponseCode.called)
+        responder.return_value.finish.assert_called_once_with()
+
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'Streamer._get_entries')
+    @patch(MODULE_PREFIX + 'deferToThread', lambda f, *args: succeed(f(*args)))
+    def test_fetch_async_no_catalog_matched(self, _get_entries, responder):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        _get_entries.return_value = []
+
+        # test
+        streamer = Streamer(Mock())
+        streamer._fetch_async(request)
+
+        # validation
+        request.setResponseCode.assert_called_once_with(NOT_FOUND)
+        responder.return_value.finish.assert_called_once_with()
+
+    @patch(MODULE_PREFIX + 'Streamer._fetch_async')
+    @patch(MODULE_PREFIX + 'Flight')
+    @patch(MODULE_PREFIX + 'Streamer._send_cached')
+    def test_handle_get_async_disk_cache(self, _send_cached, flight, _fetch_async):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        request.getHeader.return_value = None
+        disk_cache = Mock()
+        _send_cached.side_effect = [True, False]
+
+        # test
+        streamer = Streamer(Mock(), disk_cache)
+        streamer._handle_get_async(request)
+        self.assertFalse(flight.called)
+        streamer._handle_get_async(request)
+
+        # validation
+        _send_cached.assert_called_with(request, '/content/bear.rpm')
+        flight.assert_called_once_with(('/content/bear.rpm', False), streamer.flights, request,
+                                       disk_cache.partial_file.return_value)
+        _fetch_async.assert_called_once_with(flight.return_value)
+
+    @patch('__builtin__.open')
+    @patch(MODULE_PREFIX + 'Responder')
+    @patch(MODULE_PREFIX + 'FileSender')
+    @patch(MODULE_PREFIX + 'forward_headers')
+    def test_send_cached(self, forward_headers, file_sender, responder, _open):
+        request = Mock()
+        disk_cache = Mock()
+        cached = disk_cache.get.return_value
+        cached.size = 3
+        cached.headers = [('Content-Type', 'text/plain'), ('Cache-Control', 'no-cache'),
+                          ('Content-Length', '5')]
+        file_sender.return_value.beginFileTransfer.return_value = succeed(None)
+
+        # test
+        streamer = Streamer(Mock(), disk_cache)
+        sent = streamer._send_cached(request, '/content/bear.rpm')
+
+        # validation
+        self.assertTrue(sent)
+        disk_cache.get.assert_called_once_with('/content/bear.rpm')
+        _open.assert_called_once_with(cached.path, 'rb')
+        forward_headers.assert_called_once_with(
+            streamer.config, request, [('Content-Type', 'text/plain')])
+        request.setHeader.assert_called_once_with('Content-Length', '3')
+        file_sender.return_value.beginFileTransfer.assert_called_once_with(
+            _open.return_value, request)
+        _open.return_value.close.assert_called_once_with()
+        responder.return_value.finish.assert_called_once_with()
+
+    def test_send_cached_not_cached(self):
+        disk_cache = Mock()
+        disk_cache.get.side_effect = NotCached()
+
+        # test
+        streamer = Streamer(Mock(), disk_cache)
+        sent = streamer._send_cached(Mock(), '/content/bear.rpm')
+
+        # validation
+        self.assertFalse(sent)
+
+    @patch('__builtin__.open')
+    def test_send_cached_missing(self, _open):
+        disk_cache = Mock()
+        _open.side_effect = IOError()
+
+        # test
+        streamer = Streamer(Mock(), disk_cache)
+        sent = streamer._send_cached(Mock(), '/content/bear.rpm')
+
+        # validation
+        self.assertFalse(sent)
+        disk_cache.purge.assert_called_once_with('/content/bear.rpm')
+
+    def test_store(self):
+        disk_cache = Mock()
+        flight = Mock(uri='http://content-world.com/content/bear.rpm', code=None)
+
+        # test
+        streamer = Streamer(Mock(), disk_cache)
+        streamer._store(flight)
+        flight.code = NOT_FOUND
+        streamer._store(flight)
+
+        # validation
+        disk_cache.store.assert_called_once_with(
+            '/content/bear.rpm', flight.buffer_path, flight.headers)
+
+    @patch(MODULE_PREFIX + 'BrowserLikePolicyForHTTPS', Mock())
+    @patch(MODULE_PREFIX + 'Streamer._get_unit')
+    @patch(MODULE_PREFIX + 'Streamer._get_downloader')
+    @patch(MODULE_PREFIX + 'ContentSource')
+    def test_get_stream_config(self, content_source, _get_downloader, _get_unit):
+        content_source.load_all.return_value = {}
+        config = Mock(
+            proxy_url=None, ssl_ca_cert=None, ssl_ca_cert_path=None, ssl_client_cert=None,
+            ssl_client_cert_path=None, ssl_client_key=None, ssl_client_key_path=None,
+            ssl_validation=True, max_speed=None)
+        _get_downloader.return_value.config = config
+        request = Mock()
+        entry = Mock(url='https://content-world.com/content/bear.rpm')
+
+        # test
+        streamer = Streamer(Mock())
+        supported = streamer._get_stream_config(request, entry)
+        config.proxy_url = 'http://proxy.example.com'
+        unsupported = streamer._get_stream_config(request, entry)
+
+        # validation
+        _get_unit.assert_called_with(entry)
+        _get_downloader.assert_called_with(request, entry)
+        self.assertEqual(supported, config)
+        self.assertEqual(unsupported, None)
+        config.finalize.assert_called_once_with()
+
+    @patch(MODULE_PREFIX + 'BrowserLikePolicyForHTTPS', None)
+    @patch(MODULE_PREFIX + 'Streamer._get_unit', Mock())
+    @patch(MODULE_PREFIX + 'Streamer._get_downloader')
+    @patch(MODULE_PREFIX + 'ContentSource')
+    def test_get_stream_config_https_unverified(self, content_source, _get_downloader):
+        content_source.load_all.return_value = {}
+        config = Mock(
+            proxy_url=None, ssl_ca_cert=None, ssl_ca_cert_path=None, ssl_client_cert=None,
+            ssl_client_cert_path=None, ssl_client_key=None, ssl_client_key_path=None,
+            ssl_validation=True, max_speed=None)
+        _get_downloader.return_value.config = config
+
+        # test
+        streamer = Streamer(Mock())
+        https = streamer._get_stream_config(Mock(), Mock(url='https://content-world.com/a.rpm'))
+        http = streamer._get_stream_config(Mock(), Mock(url='http://content-world.com/a.rpm'))
+
+        # validation
+        self.assertEqual(https, None)
+        self.assertEqual(http, config)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_unit', Mock())
+    @patch(MODULE_PREFIX + 'Streamer._get_downloader')
+    @patch(MODULE_PREFIX + 'ContentSource')
+    def test_get_stream_config_content_sources(self, content_source, _get_downloader):
+        content_source.load_all.return_value = {'a-source': Mock()}
+
+        # test
+        streamer = Streamer(Mock())
+        config = streamer._get_stream_config(Mock(), Mock())
+
+        # validation
+        self.assertEqual(config, None)
+        self.assertFalse(_get_downloader.called)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_downloader')
+    @patch(MODULE_PREFIX + 'ContentSource')
+    def test_get_stream_config_content_sources_cached(self, content_source, _get_downloader):
+        content_source.load_all.return_value = {'a-source': Mock()}
+        catalog = Mock()
+        catalog.content_sources.return_value = {}
+
+        # test
+        streamer = Streamer(Mock(), catalog=catalog)
+        streamer._get_stream_config(Mock(), Mock(url='ftp://content-world.com/bear.rpm'))
+
+        # validation
+        catalog.content_sources.assert_called_once_with(content_source.load_all)
+        self.assertFalse(content_source.load_all.called)
+        self.assertTrue(_get_downloader.called)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_downloader')
+    @patch(MODULE_PREFIX + 'Streamer._get_unit')
+    def test_get_stream_config_unit_not_found(self, _get_unit, _get_downloader):
+        _get_unit.side_effect = DoesNotExist()
+
+        # test
+        streamer = Streamer(Mock())
+        self.assertRaises(DoesNotExist, streamer._get_stream_config, Mock(), Mock())
+
+        # validation
+        self.assertFalse(_get_downloader.called)
+
+    @patch(MODULE_PREFIX + 'forward_headers')
+    def test_stream(self, forward_headers):
+        request = Mock()
+        url = 'https://content-world.com/content/bear.rpm'
+        config = Mock(headers={'X-A': '1'}, basic_auth_username='u', basic_auth_password='p',
+                      read_timeout=None)
+        response = Mock(code=200, headers=Headers({'content-length': ['3']}))
+        transport = Mock()
+
+        def deliver_body(protocol):
+            protocol.makeConnection(transport)
+            protocol.dataReceived('abc')
+            protocol.connectionLost(Failure(ResponseDone()))
+
+        response.deliverBody.side_effect = deliver_body
+        streamer = Streamer(Mock())
+        streamer.https_policy = Mock()
+        agent = Mock()
+        agent.request.return_value = succeed(response)
+        result = []
+
+        # test
+        with patch.object(streamer, '_get_agent', return_value=agent):
+            streamer._stream(request, url, config).addBoth(result.append)
+
+        # validation
+        self.assertEqual(result, [None])
+        method, _url, headers = agent.request.call_args[0]
+        self.assertEqual((method, _url), ('GET', url))
+        self.assertEqual(headers.getRawHeaders('X-A'), ['1'])
+        self.assertEqual(headers.getRawHeaders('Authorization'), ['Basic dTpw'])
+        forward_headers.assert_called_once_with(
+            streamer.config, request, [('Content-Length', '3')])
+        request.registerProducer.assert_called_once_with(
+            response.deliverBody.call_args[0][0], True)
+        request.write.assert_called_once_with('abc')
+        request.unregisterProducer.assert_called_once_with()
+
+    @patch(MODULE_PREFIX + 'Streamer._get_agent')
+    def test_stream_not_ok(self, _get_agent):
+        response = Mock(code=404, headers=Headers())
+        _get_agent.return_value.request.return_value = succeed(response)
+        streamer = Streamer(Mock())
+        result = []
+
+        # test
+        config = Mock(headers={}, basic_auth_username=None, read_timeout=None)
+        streamer._stream(Mock(), 'http://content-world.com/bear.rpm', config).addBoth(
+            result.append)
+
+        # validation
+        self.assertTrue(result[0].check(DownloadFailed))
+        self.assertTrue(response.deliverBody.called)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_agent')
+    def test_get_response_redirects(self, _get_agent):
+        url = 'http://content-world.com/content/bear.rpm'
+        redirects = [
+            Mock(code=302, headers=Headers({'location': ['/moved/bear.rpm']})),
+            Mock(code=301, headers=Headers({'location': ['http://cdn.com/bear.rpm']})),
+        ]
+        response = Mock(code=200, headers=Headers())
+        sent = []
+
+        def request(method, url, headers):
+            sent.append((url, headers.getRawHeaders('Authorization')))
+            return succeed((redirects + [response])[len(sent) - 1])
+
+        _get_agent.return_value.request.side_effect = request
+        headers = Headers({'Authorization': ['Basic dTpw']})
+        streamer = Streamer(Mock())
+        result = []
+
+        # test
+        streamer._get_response(url, headers, Mock(read_timeout=None)).addBoth(result.append)
+
+        # validation
+        self.assertEqual(result, [response])
+        # the credentials are not sent to another host
+        self.assertEqual(sent, [
+            (url, ['Basic dTpw']),
+            ('http://content-world.com/moved/bear.rpm', ['Basic dTpw']),
+            ('http://cdn.com/bear.rpm', None),
+        ])
+        for redirect in redirects:
+            self.assertTrue(redirect.deliverBody.called)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_agent')
+    def test_get_response_too_many_redirects(self, _get_agent):
+        response = Mock(code=302, headers=Headers({'location': ['/bear.rpm']}))
+        _get_agent.return_value.request.side_effect = lambda *args: succeed(response)
+        streamer = Streamer(Mock())
+        result = []
+
+        # test
+        streamer._get_response('http://content-world.com/bear.rpm', Headers(),
+                               Mock(read_timeout=None)).addBoth(result.append)
+
+        # validation
+        self.assertTrue(result[0].check(DownloadFailed))
+        self.assertEqual(_get_agent.return_value.request.call_count, MAX_REDIRECTS + 1)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_agent')
+    def test_get_response_https_unverified(self, _get_agent):
+        response = Mock(code=302, headers=Headers({'location': ['https://cdn.com/bear.rpm']}))
+        _get_agent.return_value.request.return_value = succeed(response)
+        streamer = Streamer(Mock())
+        streamer.https_policy = None
+        result = []
+
+        # test
+        streamer._get_response('http://content-world.com/bear.rpm', Headers(),
+                               Mock(read_timeout=None)).addBoth(result.append)
+
+        # validation
+        self.assertTrue(result[0].check(DownloadFailed))
+        self.assertEqual(_get_agent.return_value.request.call_count, 1)
+
+    @patch(MODULE_PREFIX + 'Streamer._get_agent')
+    def test_get_response_failed(self, _get_agent):
+        _get_agent.return_value.request.return_value = fail(ValueError())
+        streamer = Streamer(Mock())
+        result = []
+
+        # test
+        streamer._get_response('http://content-world.com/bear.rpm', Headers(),
+                               Mock(read_timeout=None)).addBoth(result.append)
+
+        # validation
+        self.assertTrue(result[0].check(DownloadFailed))
+
+    @patch(MODULE_PREFIX + 'BrowserLikePolicyForHTTPS')
+    @patch(MODULE_PREFIX + 'Agent')
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_get_agent(self, reactor, agent, policy):
+        streamer = Streamer(Mock())
+
+        # test
+        _agent = streamer._get_agent(Mock(connect_timeout=5))
+
+        # validation
+        self.assertEqual(_agent, agent.return_value)
+        agent.assert_called_once_with(
+            reactor, connectTimeout=5, pool=streamer.pool, contextFactory=policy.return_value)
+
+    @patch(MODULE_PREFIX + 'BrowserLikePolicyForHTTPS', None)
+    @patch(MODULE_PREFIX + 'Agent')
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_get_agent_https_unverified(self, reactor, agent):
+        streamer = Streamer(Mock())
+
+        # test
+        streamer._get_agent(Mock(connect_timeout=5))
+
+        # validation
+        self.assertEqual(streamer.https_policy, None)
+        agent.assert_called_once_with(reactor, connectTimeout=5, pool=streamer.pool)
+
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_request_timeout(self, reactor):
+        agent = Mock()
+        agent.request.return_value = Deferred()
+        headers = Headers()
+        result = []
+
+        # test
+        d = Streamer._request(agent, 'url', headers, 10)
+        d.addErrback(result.append)
+        reactor.callLater.assert_called_once_with(10, d.cancel)
+        d.cancel()
+
+        # validation
+        agent.request.assert_called_once_with('GET', 'url', headers)
+        self.assertTrue(result[0].check(CancelledError))
+        self.assertTrue(reactor.callLater.return_value.cancel.called)
+
+    @patch(MODULE_PREFIX + 'reactor')
+    def test_request_no_timeout(self, reactor):
+        agent = Mock()
+
+        # test
+        d = Streamer._request(agent, 'url', Headers(), None)
+
+        # validation
+        self.assertEqual(d, agent.request.return_value)
+        self.assertFalse(reactor.callLater.called)
+
     @patch(MODULE_PREFIX + 'Responder')
     @patch(MODULE_PREFIX + 'Streamer._on_succeeded')
     @patch(MODULE_PREFIX + 'Streamer._download')
@@ -360,6 +855,97 @@ class TestStreamer(unittest.TestCase):
         self.assertEqual(downloader.event_listener, listener.return_value)
         self.assertEqual(downloader.session, session.return_value)
 
+    @patch(MODULE_PREFIX + 'SessionCache.get_or_create', Mock())
+    @patch(MODULE_PREFIX + 'DownloadListener', Mock())
+    @patch(MODULE_PREFIX + 'repo_controller')
+    def test_get_downloader_cached(self, controller):
+        importer = Mock()
+        model = Mock()
+        catalog = Mock()
+        catalog.importer.return_value = (importer, model)
+        entry = Mock(importer_id='123')
+
+        # test
+        streamer = Streamer(Mock(), catalog=catalog)
+        downloader = streamer._get_downloader(Mock(), entry)
+
+        # validation
+        catalog.importer.assert_called_once_with(entry.importer_id, streamer._query_importer)
+        self.assertFalse(controller.get_importer_by_id.called)
+        importer.get_downloader_for_db_importer.assert_called_once_with(
+            model, entry.url, working_dir='/tmp', stream=True)
+        self.assertEqual(downloader, importer.get_downloader_for_db_importer.return_value)
+
+    @patch(MODULE_PREFIX + 'repo_controller')
+    def test_query_importer(self, controller):
+        importer, config, model = Mock(), Mock(), Mock()
+        controller.get_importer_by_id.return_value = (importer, config, model)
+
+        # test
+        queried = Streamer._query_importer('123')
+
+        # validation
+        controller.get_importer_by_id.assert_called_once_with('123')
+        self.assertEqual(queried, (importer, model))
+        self.assertEqual(model.config, config.flatten.return_value)
+
+    def test_get_unit_cached(self):
+        catalog = Mock()
+        entry = Mock()
+
+        # test
+        streamer = Streamer(Mock(), catalog=catalog)
+        unit = streamer._get_unit(entry)
+
+        # validation
+        catalog.unit.assert_called_once_with(entry, streamer._query_unit)
+        self.assertEqual(unit, catalog.unit.return_value)
+
+    @patch(MODULE_PREFIX + 'LazyCatalogEntry')
+    def test_get_entries(self, model):
+        catalog = [Mock(), Mock()]
+        model.objects.filter.return_value.order_by.return_value = catalog
+
+        # test
+        streamer = Streamer(Mock())
+        entries = streamer._get_entries('/content/bear.rpm')
+
+        # validation
+        model.objects.filter.assert_called_once_with(path='/content/bear.rpm')
+        model.objects.filter.return_value.order_by.assert_called_once_with('-_id', '-revision')
+        self.assertEqual(entries, catalog)
+
+    def test_get_entries_cached(self):
+        catalog = Mock()
+
+        # test
+        streamer = Streamer(Mock(), catalog=catalog)
+        entries = streamer._get_entries('/content/bear.rpm')
+
+        # validation
+        catalog.entries.assert_called_once_with('/content/bear.rpm', streamer._query_entries)
+        self.assertEqual(entries, catalog.entries.return_value)
+
+    @patch(MODULE_PREFIX + 'Responder', Mock())
+    @patch(MODULE_PREFIX + 'Streamer._on_all_failed')
+    @patch(MODULE_PREFIX + 'Streamer._download_async')
+    @patch(MODULE_PREFIX + 'Streamer._get_entries')
+    @patch(MODULE_PREFIX + 'deferToThread', lambda f, *args: succeed(f(*args)))
+    def test_fetch_async_all_failed_invalidates(self, _get_entries, _download_async,
+                                                _on_all_failed):
+        request = Mock(uri='http://content-world.com/content/bear.rpm')
+        _get_entries.return_value = [Mock(url='url-a')]
+        _download_async.return_value = fail(DownloadFailed())
+        catalog = Mock()
+
+        # test
+        streamer = Streamer(Mock(), catalog=catalog)
+        streamer._fetch_async(request)
+
+        # validation
+        catalog.invalidate.assert_called_once_with('/content/bear.rpm')
+        _on_all_failed.assert_called_once_with(request)
+
     @patch(MODULE_PREFIX + 'AggregatingEventListener')
     @patch(MODULE_PREFIX + 'repo_controller')
     def test_get_downloader_not_found(self, controller, listener):